@@ -0,0 +1,7 @@
+import sys
+
+# Sublime Text loads every module in the package as a plugin, so the command
+# line tool only runs when started with python -m YetAnotherCodeSearch.
+if __name__ == '__main__':
+    from YetAnotherCodeSearch import cli
+    sys.exit(cli.main())
@@ -0,0 +1,148 @@
+import os
+import platform
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+# Windows' BELOW_NORMAL_PRIORITY_CLASS, which subprocess only names since
+# Python 3.7.
+_BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+
+# The nice value to run low priority processes with.
+_NICENESS = 19
+
+# The processes that are paused right now.
+_paused = set()
+_paused_lock = threading.Lock()
+
+
+def low_priority_command(cmd):
+    """Wraps a command so that it uses the CPU and disk when nothing else does.
+
+    Outside of Windows, this runs it with nice, and on Linux with the idle IO
+    class of ionice too, if they are installed. Both exec the command, so
+    every thread it starts gets the priority. Windows gets the command as is;
+    see low_priority_popen_args.
+
+    Args:
+        cmd: The command, as a list.
+    Returns:
+        The command to run.
+    """
+    cmd = list(cmd)
+    if platform.system() == 'Windows':
+        return cmd
+    nice = shutil.which('nice')
+    if nice:
+        cmd = [nice, '-n', str(_NICENESS)] + cmd
+    if platform.system() == 'Linux':
+        ionice = shutil.which('ionice')
+        if ionice:
+            cmd = [ionice, '-c', '3'] + cmd
+    return cmd
+
+
+def low_priority_popen_args():
+    """Returns the subprocess.Popen arguments that lower the CPU priority."""
+    if platform.system() == 'Windows':
+        return {'creationflags': getattr(subprocess,
+                                         'BELOW_NORMAL_PRIORITY_CLASS',
+                                         _BELOW_NORMAL_PRIORITY_CLASS)}
+    # Elsewhere the command is run with nice, by low_priority_command. Using
+    # preexec_fn instead isn't safe with the threads the plugin runs.
+    return {}
+
+
+class ProcessPauser(object):
+    """Pauses and resumes a running process.
+
+    This sends SIGSTOP and SIGCONT, so it does nothing on Windows.
+    """
+
+    def __init__(self, proc, state=None):
+        """Initializes the ProcessPauser.
+
+        Args:
+            proc: The subprocess.Popen to pause.
+            state: An optional progress.IndexProgress to tell when the process
+                is paused, so that the time paused isn't counted.
+        """
+        self._proc = proc
+        self._state = state
+        self._paused = False
+        self._lock = threading.Lock()
+
+    @property
+    def supported(self):
+        """If the process can be paused on this platform."""
+        return hasattr(signal, 'SIGSTOP')
+
+    @property
+    def paused(self):
+        return self._paused
+
+    def pause(self):
+        """Stops the process until resume is called."""
+        self._signal(True, getattr(signal, 'SIGSTOP', None))
+
+    def resume(self):
+        """Lets a paused process carry on."""
+        self._signal(False, getattr(signal, 'SIGCONT', None))
+
+    def _signal(self, paused, signum):
+        with self._lock:
+            if self._proc.poll() is not None:
+                with _paused_lock:
+                    _paused.discard(self)
+                return
+            if signum is None or self._paused == paused:
+                return
+            try:
+                os.kill(self._proc.pid, signum)
+            except OSError:
+                return
+            self._paused = paused
+            with _paused_lock:
+                if paused:
+                    _paused.add(self)
+                else:
+                    _paused.discard(self)
+            if self._state is not None:
+                if paused:
+                    self._state.pause()
+                else:
+                    self._state.resume()
+
+
+def resume_all():
+    """Resumes every paused process, so none are left stopped."""
+    with _paused_lock:
+        pausers = list(_paused)
+    for pauser in pausers:
+        pauser.resume()
+
+
+class IdleTracker(object):
+    """Keeps track of how long it has been since the editor was used."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._last = clock()
+
+    def touch(self):
+        """Marks the editor as being used now."""
+        self._last = self._clock()
+
+    def idle_seconds(self):
+        """Returns the seconds since the editor was last used."""
+        return self._clock() - self._last
+
+
+_idle_tracker = IdleTracker()
+
+
+def get_idle_tracker():
+    """Gets the IdleTracker shared by the whole editor."""
+    return _idle_tracker
@@ -0,0 +1,91 @@
+import sublime
+import sublime_plugin
+
+import collections
+import time
+
+from YetAnotherCodeSearch import background
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import settings
+
+# How often to check if a scheduled indexing is due, in milliseconds.
+_SCHEDULE_POLL_MS = 30 * 1000
+
+# The files saved in each window since it was last indexed, by window id.
+_saves = collections.Counter()
+
+# When each index was last indexed in the background, by index file.
+_last_run = {}
+
+_running = False
+
+
+def _index_key(window):
+    try:
+        s = settings.get_window_settings(window)
+    except Exception:
+        return None
+    return index.index_path(s.index_filename)
+
+
+def _start(window):
+    _saves[window.id()] = 0
+    key = _index_key(window)
+    if key is None:
+        return
+    _last_run[key] = time.monotonic()
+    window.run_command('cindex', {'background': True})
+
+
+def _check_schedule():
+    if not _running:
+        return
+    minutes = settings.get('background_index_minutes', 0)
+    if minutes:
+        now = time.monotonic()
+        for window in sublime.windows():
+            key = _index_key(window)
+            if key is None:
+                continue
+            if now - _last_run.setdefault(key, now) >= minutes * 60:
+                _start(window)
+    sublime.set_timeout(_check_schedule, _SCHEDULE_POLL_MS)
+
+
+def plugin_loaded():
+    global _running
+    _running = True
+    sublime.set_timeout(_check_schedule, _SCHEDULE_POLL_MS)
+
+
+def plugin_unloaded():
+    global _running
+    _running = False
+    # A stopped cindex would otherwise never finish.
+    background.resume_all()
+
+
+class CodeSearchBackgroundIndexListener(sublime_plugin.EventListener):
+    """Tracks editor activity for background indexing.
+
+    Background indexing pauses while the editor is in use, and can be started
+    once enough files have been saved.
+    """
+
+    def on_modified(self, view):
+        background.get_idle_tracker().touch()
+
+    def on_selection_modified(self, view):
+        background.get_idle_tracker().touch()
+
+    def on_activated(self, view):
+        background.get_idle_tracker().touch()
+
+    def on_post_save(self, view):
+        threshold = settings.get('background_index_after_saves', 0)
+        window = view.window()
+        if not threshold or not window:
+            return
+        _saves[window.id()] += 1
+        if _saves[window.id()] >= threshold:
+            _start(window)
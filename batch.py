@@ -0,0 +1,132 @@
+import re
+
+from YetAnotherCodeSearch import parser
+
+# Backreferences, by number or name, and group conditionals. These refer to
+# groups by their place in the term, so the term can't be combined with others.
+# An escaped backslash before a digit also matches, which only costs a check.
+_GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+# Inline global flags, like (?i). They are only allowed at the start of a
+# regex, which a term isn't once combined with others.
+_GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+def chunk_terms(terms, max_length):
+    """Splits the terms into groups that can each be run as one query.
+
+    Each group ORs its terms together into one regex, so the groups are kept
+    under a maximum regex length. A term that is too long on its own still
+    gets a group by itself.
+
+    Args:
+        terms: A list of regex terms.
+        max_length: The maximum length of the combined regex for a group.
+    Returns:
+        A list of lists of terms.
+    """
+    chunks = []
+    chunk = []
+    length = len('()')
+    for term in terms:
+        if chunk and length + len(term) + 1 > max_length:
+            chunks.append(chunk)
+            chunk = []
+            length = len('()')
+        chunk.append(term)
+        length += len(term) + 1
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class TermMatcher(object):
+    """Finds which of several regex terms match a line.
+
+    All of the terms are compiled into a single pattern with a named group
+    per term, so one pass over a line finds most of the terms on it. Since an
+    alternation only reports one term per position, terms that overlap
+    another term's match are checked on their own, but only on lines that
+    already matched something. Terms with their own named groups or with
+    backreferences would break the combined pattern, so they are always
+    checked on their own, as are terms with inline global flags like (?i).
+
+    Attributes:
+        terms: The list of regex terms.
+    """
+
+    def __init__(self, terms, case=True):
+        self.terms = terms
+        flags = 0 if case else re.IGNORECASE
+        self._singles = [re.compile(term, flags) for term in terms]
+        self._separate = [i for (i, single) in enumerate(self._singles)
+                          if single.groupindex or
+                          _GROUP_REFERENCE.search(single.pattern) or
+                          _GLOBAL_FLAGS.search(single.pattern)]
+        combined = [i for i in range(len(terms)) if i not in self._separate]
+        self._combined = None
+        if combined:
+            self._combined = re.compile('|'.join(
+                '(?P<t{0}>{1})'.format(i, terms[i]) for i in combined), flags)
+        self._num_combined = len(combined)
+
+    def match(self, line):
+        """Finds the terms that match the line.
+
+        Args:
+            line: The line of text to match.
+        Returns:
+            A sorted list of the indexes of the matching terms.
+        """
+        found = set()
+        if self._combined:
+            found.update(int(m.lastgroup[1:])
+                         for m in self._combined.finditer(line))
+        if found and len(found) != self._num_combined:
+            found.update(i for (i, single) in enumerate(self._singles)
+                         if i not in found and i not in self._separate and
+                         single.search(line))
+        found.update(i for i in self._separate
+                     if self._singles[i].search(line))
+        return sorted(found)
+
+
+def demultiplex(results, matcher):
+    """Splits the results of a combined query by the term that matched.
+
+    Args:
+        results: A list of parser.FileResults from the combined query.
+        matcher: The TermMatcher for the terms in the combined query.
+    Returns:
+        A list with an entry per term, in the same order as the terms, each a
+        list of parser.FileResults with just that term's matches.
+    """
+    per_term = [[] for unused_term in matcher.terms]
+    for file_results in results:
+        matches = [[] for unused_term in matcher.terms]
+        for match in file_results.matches:
+            for i in matcher.match(match[1]):
+                matches[i].append(match)
+        for (i, term_matches) in enumerate(matches):
+            if term_matches:
+                per_term[i].append(parser.FileResults(
+                    file_results.filename, term_matches,
+                    duplicates=file_results.duplicates))
+    return per_term
+
+
+def batch_searches(search, max_length):
+    """Splits a search with many terms into combined searches.
+
+    Args:
+        search: A parser.Search where every query term is searched for.
+        max_length: The maximum length of each search's regex.
+    Returns:
+        A list of parser.Search objects, one per chunk of terms.
+    """
+    return [parser.Search(query=terms, files=search.files,
+                          exclude_files=search.exclude_files,
+                          langs=search.langs, kinds=search.kinds,
+                          exclude_kinds=search.exclude_kinds,
+                          case=search.case)
+            for terms in chunk_terms(search.query, max_length)]
@@ -0,0 +1,419 @@
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import pathclass
+from YetAnotherCodeSearch import stats
+
+# The version of the report format.
+REPORT_VERSION = 1
+
+# The phases of a search that are timed, in the order they run. "render" is
+# the work done for the results view besides appending the text, which is
+# finding the matches to highlight.
+PHASES = ('csearch', 'parse', 'format', 'render', 'total')
+
+# An identifier only put in a few files, so a search for it is selective.
+NEEDLE = 'zqxNeedleMarker'
+
+# The searches each run times, as (kind, query) pairs. The synthetic files are
+# written so that each kind behaves the same way on every tree.
+QUERIES = (
+    ('selective', NEEDLE),
+    ('selective', NEEDLE + ' lang:go'),
+    ('broad', 'return'),
+    ('broad', 'value lang:python'),
+    ('full-scan', r'\d\d\d\d'),
+)
+
+# The share of the files that get the NEEDLE.
+_NEEDLE_RATE = 0.002
+
+# The lines of each language, filled in with identifiers and numbers.
+_TEMPLATES = {
+    'py': ('def {a}({b}, value={n}):',
+           '    """Computes the {a} of {b}."""',
+           '    {a} = {b}.{c}(value)',
+           '    if {a} > {n}:',
+           '        return {b}',
+           '    return {a} + {n}',
+           'class {A}({B}):',
+           'import {a}'),
+    'go': ('func {A}({b} int) ({c} error) {{',
+           '\t{a} := {b} + {n}',
+           '\tif {a} != nil {{',
+           '\t\treturn {c}',
+           '\t}}',
+           '}}',
+           'type {A} struct {{ {b} int }}',
+           'import "{a}/{b}"'),
+    'js': ('function {a}({b}, {c}) {{',
+           '  const {a} = {b}.{c}({n});',
+           '  if ({a} > {n}) {{ return {b}; }}',
+           '  return {a} + {c};',
+           '}}',
+           'export default {A};'),
+    'java': ('public class {A} extends {B} {{',
+             '  private int {a} = {n};',
+             '  public int {b}(int {c}) {{',
+             '    return {a} + {c};',
+             '  }}',
+             '}}',
+             'import com.{a}.{B};'),
+    'c': ('static int {a}(int {b}, int {c}) {{',
+          '  int value = {b} * {n};',
+          '  if (value > {c}) return {b};',
+          '  return value + {n};',
+          '}}',
+          '#include "{a}.h"'),
+}
+
+# The extension each language's files get.
+_EXTENSIONS = {'py': 'py', 'go': 'go', 'js': 'js', 'java': 'java', 'c': 'c'}
+
+_SYLLABLES = ('ba', 'co', 'de', 'fi', 'ga', 'hu', 'ki', 'lo', 'mu', 'ne',
+              'po', 'ra', 'si', 'tu', 've', 'wo', 'xa', 'yu', 'ze')
+
+
+class RepoSpec(object):
+    """What the synthetic tree looks like.
+
+    Attributes:
+        files: The number of source files.
+        median_bytes: The median size of a source file. Sizes follow a
+            log-normal distribution, like in real trees.
+        languages: The languages of the files, from the keys of _TEMPLATES.
+        max_depth: The most directories a file is nested in.
+        minified: The number of huge minified JavaScript files, each a single
+            line.
+        minified_bytes: The size of each minified file.
+        seed: The seed for the random choices, so the same spec always makes
+            the same tree.
+    """
+
+    def __init__(self, files=2000, median_bytes=4096,
+                 languages=('py', 'go', 'js', 'java', 'c'), max_depth=8,
+                 minified=2, minified_bytes=2 * 1024 * 1024, seed=1):
+        self.files = files
+        self.median_bytes = median_bytes
+        self.languages = tuple(languages)
+        self.max_depth = max_depth
+        self.minified = minified
+        self.minified_bytes = minified_bytes
+        self.seed = seed
+        for lang in self.languages:
+            if lang not in _TEMPLATES:
+                raise ValueError('Unknown language: {0}'.format(lang))
+
+    def to_json(self):
+        return {'files': self.files,
+                'median_bytes': self.median_bytes,
+                'languages': list(self.languages),
+                'max_depth': self.max_depth,
+                'minified': self.minified,
+                'minified_bytes': self.minified_bytes,
+                'seed': self.seed}
+
+
+def _identifiers(rng, count):
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(_SYLLABLES)
+                          for unused in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _source(rng, lang, words, size, needle):
+    templates = _TEMPLATES[lang]
+    lines = []
+    length = 0
+    while length < size:
+        (a, b, c) = (rng.choice(words) for unused in range(3))
+        line = rng.choice(templates).format(
+            a=a, b=b, c=c, A=a.capitalize(), B=b.capitalize(),
+            n=rng.randint(0, 99999))
+        lines.append(line)
+        length += len(line) + 1
+    if needle:
+        lines.insert(rng.randrange(len(lines) + 1),
+                     _TEMPLATES[lang][0].format(
+                         a=NEEDLE, b='b', c='c', A=NEEDLE, B='B', n=1))
+    return '\n'.join(lines) + '\n'
+
+
+def _minified(rng, words, size):
+    parts = []
+    length = 0
+    while length < size:
+        part = 'var {0}={1}({2},{3});'.format(
+            rng.choice(words), rng.choice(words), rng.choice(words),
+            rng.randint(0, 9999))
+        parts.append(part)
+        length += len(part)
+    return ''.join(parts) + '\n'
+
+
+def _directories(rng, spec, words):
+    # About 10 files a directory, at every depth up to max_depth.
+    dirs = []
+    for unused in range(max(1, spec.files // 10)):
+        depth = rng.randint(1, max(1, spec.max_depth))
+        dirs.append(os.path.join(*[rng.choice(words[:50])
+                                   for unused in range(depth)]))
+    return dirs
+
+
+def generate_repo(root, spec):
+    """Writes a synthetic source tree.
+
+    Args:
+        root: The directory to write the tree in.
+        spec: The RepoSpec of the tree.
+    Returns:
+        A (files, bytes) tuple with the number of files written and their
+        total size.
+    """
+    rng = random.Random(spec.seed)
+    words = _identifiers(rng, 2000)
+    dirs = _directories(rng, spec, words)
+    sizes = {'files': 0, 'bytes': 0}
+
+    def write(name, text):
+        filename = os.path.join(root, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        data = text.encode('utf-8')
+        with open(filename, 'wb') as f:
+            f.write(data)
+        sizes['files'] += 1
+        sizes['bytes'] += len(data)
+
+    for i in range(spec.files):
+        lang = spec.languages[i % len(spec.languages)]
+        size = min(int(rng.lognormvariate(0, 1) * spec.median_bytes),
+                   64 * spec.median_bytes)
+        # The first file of each language always has the NEEDLE.
+        needle = i < len(spec.languages) or rng.random() < _NEEDLE_RATE
+        text = _source(rng, lang, words, size, needle)
+        write(os.path.join(dirs[i % len(dirs)], '{0}{1}.{2}'.format(
+            rng.choice(words), i, _EXTENSIONS[lang])), text)
+    for i in range(spec.minified):
+        write(os.path.join('static', 'bundle{0}.min.js'.format(i)),
+              _minified(rng, words, spec.minified_bytes))
+    return (sizes['files'], sizes['bytes'])
+
+
+def touch_repo(root, count, seed=1):
+    """Changes some files of a tree, for timing an incremental index.
+
+    Args:
+        root: The directory of the tree.
+        count: The number of files to change.
+        seed: The seed for picking the files.
+    Returns:
+        The number of files changed.
+    """
+    names = []
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        dirnames.sort()
+        names.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+    rng = random.Random(seed)
+    changed = rng.sample(names, min(count, len(names)))
+    for filename in changed:
+        with open(filename, 'a') as f:
+            f.write('// changed\n')
+    return len(changed)
+
+
+def _summarize(values):
+    return {'min': min(values),
+            'p50': stats.percentile(values, 50),
+            'max': max(values)}
+
+
+def time_search(search, path_csearch='csearch', index_filename=None):
+    """Runs a search the way the search command does, timing each phase.
+
+    Args:
+        search: The parser.Search to run.
+        path_csearch: The location of the csearch command.
+        index_filename: An optional csearchindex file location to use.
+    Returns:
+        A (results, highlights, timings) tuple, with the list of
+        parser.FileResults, the number of matches highlighted in the text and
+        the seconds each of the PHASES took.
+    Raises:
+        subprocess.CalledProcessError: If csearch failed.
+    """
+    timings = {}
+    with stats.timed(timings, 'total'):
+        (path_filter, candidates) = pathclass.scope(
+            search, index.index_path(index_filename))
+        results = []
+        with stats.timed(timings, 'csearch'):
+            output = b''
+            if candidates != 0:
+                output = engine.run_csearch(search,
+                                            path_csearch=path_csearch,
+                                            index_filename=index_filename)
+        with stats.timed(timings, 'parse'):
+            results = parser.parse_search_output(output,
+                                                 path_filter=path_filter)
+        with stats.timed(timings, 'format'):
+            text = ''.join(engine.format_results(results)) if results else ''
+        with stats.timed(timings, 'render'):
+            flags = 0 if search.case else re.IGNORECASE
+            # The header isn't searched, as in the results view.
+            highlights = sum(1 for unused
+                             in re.finditer(search.query_re(), text, flags))
+    return (results, highlights, timings)
+
+
+def run_benchmark(root, spec, path_csearch='csearch', path_cindex='cindex',
+                  repeat=5, changed_files=10, queries=QUERIES, out=None):
+    """Builds a synthetic tree, indexes it and times the searches in it.
+
+    Args:
+        root: An empty directory to work in. The tree and its index are
+            written there.
+        spec: The RepoSpec of the tree.
+        path_csearch: The location of the csearch command.
+        path_cindex: The location of the cindex command.
+        repeat: The number of times to run each search.
+        changed_files: The number of files to change before the incremental
+            index.
+        queries: The (kind, query) pairs to time.
+        out: An optional text stream to write progress to.
+    Returns:
+        The report, as a dict that can be written as JSON.
+    Raises:
+        subprocess.CalledProcessError: If csearch or cindex failed.
+    """
+    def log(text):
+        if out:
+            out.write(text)
+            out.flush()
+
+    repo = os.path.join(root, 'repo')
+    index_filename = os.path.join(root, 'csearchindex')
+    log('Writing {0} files...\n'.format(spec.files + spec.minified))
+    (num_files, num_bytes) = generate_repo(repo, spec)
+
+    log('Indexing...\n')
+    start = time.perf_counter()
+    engine.run_cindex(path_cindex=path_cindex, index_filename=index_filename,
+                      paths_to_index=[repo])
+    full_seconds = time.perf_counter() - start
+    changed = touch_repo(repo, changed_files, seed=spec.seed)
+    start = time.perf_counter()
+    engine.run_cindex(path_cindex=path_cindex, index_filename=index_filename)
+    incremental_seconds = time.perf_counter() - start
+    try:
+        index_bytes = os.path.getsize(index_filename)
+    except OSError:
+        index_bytes = None
+
+    query_reports = []
+    for (kind, query) in queries:
+        log('{0}: {1}\n'.format(kind, query))
+        search = parser.parse_query(query)
+        runs = []
+        for unused in range(repeat):
+            runs.append(time_search(search, path_csearch=path_csearch,
+                                    index_filename=index_filename))
+        (results, highlights, unused) = runs[-1]
+        query_reports.append({
+            'kind': kind,
+            'query': query,
+            'matches': sum(len(r.matches) for r in results),
+            'files': len(results),
+            'highlights': highlights,
+            'timings': dict(
+                (phase, _summarize([timings[phase]
+                                    for (unused, unused, timings) in runs]))
+                for phase in PHASES)})
+
+    return {'version': REPORT_VERSION,
+            'created': time.time(),
+            'platform': platform.platform(),
+            'python': sys.version.split()[0],
+            'csearch': path_csearch,
+            'cindex': path_cindex,
+            'spec': spec.to_json(),
+            'repeat': repeat,
+            'repo': {'files': num_files, 'bytes': num_bytes},
+            'index': {'full_seconds': full_seconds,
+                      'incremental_seconds': incremental_seconds,
+                      'changed_files': changed,
+                      'index_bytes': index_bytes},
+            'queries': query_reports}
+
+
+def _ms(seconds):
+    return '{0:.0f}ms'.format(seconds * 1000)
+
+
+def format_report(report):
+    """Formats a benchmark report for reading.
+
+    Args:
+        report: A report from run_benchmark.
+    Yields:
+        The lines of the report.
+    """
+    repo = report['repo']
+    yield '{0} files, {1:.1f} MB\n'.format(
+        repo['files'], repo['bytes'] / (1024 * 1024))
+    idx = report['index']
+    yield 'index: full {0}, incremental {1} ({2} files changed)\n\n'.format(
+        _ms(idx['full_seconds']), _ms(idx['incremental_seconds']),
+        idx['changed_files'])
+    yield '{0: <10}{1: <28}{2: >8}'.format('kind', 'query', 'matches')
+    yield ''.join('{0: >10}'.format(phase) for phase in PHASES)
+    yield '\n'
+    for q in report['queries']:
+        yield '{0: <10}{1: <28}{2: >8}'.format(
+            q['kind'], q['query'][:27], q['matches'])
+        yield ''.join('{0: >10}'.format(_ms(q['timings'][phase]['p50']))
+                      for phase in PHASES)
+        yield '\n'
+
+
+def compare(old, new):
+    """Compares two benchmark reports.
+
+    Args:
+        old: The report to compare against.
+        new: The report of this run.
+    Yields:
+        The lines of the comparison, with the median times of the new run as
+        a share of the old run's, for each search in both.
+    """
+    if old.get('spec') != new.get('spec'):
+        yield 'The reports are for different trees\n'
+
+    def ratio(before, after):
+        if not before:
+            return '     n/a'
+        return '{0: >7.2f}x'.format(after / before)
+
+    yield 'index: full {0}, incremental {1}\n'.format(
+        ratio(old['index']['full_seconds'], new['index']['full_seconds']),
+        ratio(old['index']['incremental_seconds'],
+              new['index']['incremental_seconds']))
+    yield '{0: <28}{1}\n'.format('query', ''.join(
+        '{0: >8}'.format(phase) for phase in PHASES))
+    old_queries = dict((q['query'], q) for q in old['queries'])
+    for q in new['queries']:
+        before = old_queries.get(q['query'])
+        if before is None:
+            continue
+        yield '{0: <28}{1}\n'.format(q['query'][:27], ''.join(
+            ratio(before['timings'][phase]['p50'],
+                  q['timings'][phase]['p50'])
+            for phase in PHASES))
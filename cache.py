@@ -0,0 +1,240 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import parser
+
+_MAGIC = b'YACSRES2'
+_SUFFIX = '.res'
+
+_UINT32 = struct.Struct('>I')
+_MATCH = struct.Struct('>II')
+
+
+def _encode(text):
+    return text.encode('utf-8', 'surrogateescape')
+
+
+def _decode(data):
+    return data.decode('utf-8', 'surrogateescape')
+
+
+def dump_results(results):
+    """Serializes search results into a compact binary form.
+
+    Args:
+        results: A list of parser.FileResults.
+    Returns:
+        The compressed bytes.
+    """
+    parts = [_UINT32.pack(len(results))]
+    for file_results in results:
+        filename = _encode(file_results.filename)
+        parts.append(_UINT32.pack(len(filename)))
+        parts.append(filename)
+        parts.append(_UINT32.pack(len(file_results.matches)))
+        for (linenum, line) in file_results.matches:
+            line = _encode(line)
+            parts.append(_MATCH.pack(linenum, len(line)))
+            parts.append(line)
+        parts.append(_UINT32.pack(len(file_results.duplicates)))
+        for name in file_results.duplicates:
+            name = _encode(name)
+            parts.append(_UINT32.pack(len(name)))
+            parts.append(name)
+    return _MAGIC + zlib.compress(b''.join(parts), 1)
+
+
+def load_results(data):
+    """Deserializes search results written by dump_results.
+
+    Args:
+        data: The compressed bytes.
+    Returns:
+        A list of parser.FileResults.
+    Raises:
+        ValueError: If the data is not a set of results.
+    """
+    if not data.startswith(_MAGIC):
+        raise ValueError('Not a cached result set')
+    data = zlib.decompress(data[len(_MAGIC):])
+    (num_files,) = _UINT32.unpack_from(data, 0)
+    pos = _UINT32.size
+    results = []
+    for unused_i in range(num_files):
+        (length,) = _UINT32.unpack_from(data, pos)
+        pos += _UINT32.size
+        filename = _decode(data[pos:pos + length])
+        pos += length
+        (num_matches,) = _UINT32.unpack_from(data, pos)
+        pos += _UINT32.size
+        matches = []
+        for unused_j in range(num_matches):
+            (linenum, length) = _MATCH.unpack_from(data, pos)
+            pos += _MATCH.size
+            matches.append((linenum, _decode(data[pos:pos + length])))
+            pos += length
+        (num_duplicates,) = _UINT32.unpack_from(data, pos)
+        pos += _UINT32.size
+        duplicates = []
+        for unused_j in range(num_duplicates):
+            (length,) = _UINT32.unpack_from(data, pos)
+            pos += _UINT32.size
+            duplicates.append(_decode(data[pos:pos + length]))
+            pos += length
+        results.append(parser.FileResults(filename, matches,
+                                          duplicates=duplicates))
+    return results
+
+
+def _hash(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(_encode(repr(part)))
+        h.update(b'\0')
+    return h.hexdigest()[:16]
+
+
+class ResultCache(object):
+    """An on-disk cache of parsed search results.
+
+    Entries are keyed by the normalized search and by the generation (mtime
+    and size) of the index file, so rebuilding the index makes every old entry
+    miss. Entries for older generations of an index are removed as soon as a
+    newer one is written, and the least recently used entries are removed when
+    the cache grows past its size budget.
+
+    Attributes:
+        directory: Where the cache entries are stored.
+        max_bytes: The size budget for all of the entries.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry_prefix(self, index_filename):
+        return _hash(os.path.abspath(index_filename))
+
+    def _entry_name(self, search, index_filename, generation):
+        # The order of the terms doesn't change what matches.
+        key = (sorted(set(search.query)), search.path_flags(), search.case)
+        return '{0}-{1}-{2}{3}'.format(self._entry_prefix(index_filename),
+                                       _hash(generation), _hash(key), _SUFFIX)
+
+    def get(self, search, index_filename, group=False):
+        """Gets the cached results for a search.
+
+        Args:
+            search: The parser.Search that was run.
+            index_filename: The csearchindex file that was searched.
+            group: If files with the same matches are grouped together. The
+                cached results are grouped or expanded to match.
+        Returns:
+            A list of parser.FileResults, or None if nothing was cached for
+            the search with the current index.
+        """
+        generation = index.index_generation(index_filename)
+        if generation is None:
+            return None
+        path = os.path.join(self.directory,
+                            self._entry_name(search, index_filename,
+                                             generation))
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path, None)  # Mark it as recently used.
+            results = load_results(data)
+        except (OSError, IOError, ValueError, zlib.error, struct.error):
+            return None
+        if group:
+            return parser.group_duplicates(results)
+        return parser.expand_duplicates(results)
+
+    def put(self, search, index_filename, results):
+        """Caches the results of a search.
+
+        The cache is only an optimization, so failing to write the entry, like
+        when the disk is full, leaves it out instead of raising.
+
+        Args:
+            search: The parser.Search that was run.
+            index_filename: The csearchindex file that was searched.
+            results: The list of parser.FileResults found.
+        """
+        generation = index.index_generation(index_filename)
+        if generation is None:
+            return
+        data = dump_results(results)
+        if len(data) > self.max_bytes:
+            return
+        name = self._entry_name(search, index_filename, generation)
+        with self._lock:
+            tmp = None
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                (fd, tmp) = tempfile.mkstemp(dir=self.directory)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, os.path.join(self.directory, name))
+            except (OSError, IOError):
+                if tmp is not None:
+                    _remove(tmp)
+                return
+            self._evict(name)
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            for (path, unused_st) in self._entries():
+                _remove(path)
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((path, os.stat(path)))
+            except OSError:
+                pass
+        return entries
+
+    def _evict(self, newest):
+        """Removes stale entries and keeps the cache under its budget.
+
+        Args:
+            newest: The name of the entry that was just written.
+        """
+        (index_key, generation_key, unused_key) = newest.split('-', 2)
+        live = []
+        for (path, st) in self._entries():
+            name = os.path.basename(path)
+            (other_index, other_generation, unused_key) = name.split('-', 2)
+            if other_index == index_key and other_generation != generation_key:
+                _remove(path)
+            else:
+                live.append((st.st_mtime, st.st_size, path))
+        total = sum(size for (unused_mtime, size, unused_path) in live)
+        for (unused_mtime, size, path) in sorted(live):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -3,27 +3,34 @@ import sublime_plugin
 
 import functools
 import os
-import re
 import subprocess
-import threading
 import time
 
+from YetAnotherCodeSearch import background
+from YetAnotherCodeSearch import daemon
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import profiling
+from YetAnotherCodeSearch import scheduler
 from YetAnotherCodeSearch import settings
+from YetAnotherCodeSearch import symbols
+from YetAnotherCodeSearch import vocab
 
-# Matches a verbose file name line, like:
-#     2014/10/11 19:26:32 3556 1018 file.name
-_FILE_LINE_RE = re.compile(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2} \d+ \d+ .+')
+# How often to check if background indexing should pause, in milliseconds.
+_IDLE_POLL_MS = 500
 
 
 class _CindexListener(object):
     """A listener interface for handling callbacks while processing cindex."""
 
-    def on_files_processed(self, count):
+    def on_progress(self, state):
         """Callback when some files are processed.
 
+        This is called from the worker thread, so the state should be read
+        right away.
+
         Args:
-            count: The number of files that have been processed since last
-                called.
+            state: The progress.IndexProgress so far.
         """
         pass
 
@@ -41,9 +48,10 @@ class CindexCommand(sublime_plugin.WindowCommand, _CindexListener):
 
     def __init__(self, *args, **kwargs):
         super(CindexCommand, self).__init__(*args, **kwargs)
-        self._is_running = False
+        self._job = None
+        self._background = False
 
-    def run(self, index_project=False):
+    def run(self, index_project=False, background=False):
         """Runs the cindex command.
 
         Once this starts running, it will not listen to other calls until the
@@ -53,56 +61,106 @@ class CindexCommand(sublime_plugin.WindowCommand, _CindexListener):
             index_project: If true, the index will be generated from folders
                 used by the project. The csearchindex file location must be set
                 in the project settings when set to True.
+            background: If true, cindex runs with a low CPU and IO priority,
+                and is paused while the editor is being used. Errors are
+                printed to the console instead of shown in a dialog.
         """
-        if self._is_running:
+        if self._job:
             return
-        self._is_running = True
+        self._background = background
         self.window.active_view().set_status('YetAnotherCodeSearch',
                                              'cindex (starting)')
-        self._total_indexed = 0
 
         try:
-            s = settings.get_project_settings(
-                self.window.project_data(),
-                self.window.project_file_name(),
-                index_project_folders=index_project)
-            _CindexListThread(self,
-                              path_cindex=s.cindex_path,
-                              index_filename=s.index_filename,
-                              paths_to_index=s.paths_to_index).start()
+            s = settings.get_window_settings(
+                self.window, index_project_folders=index_project)
+            index_filename = index.index_path(s.index_filename)
+            paths_to_index = s.paths_to_index or []
+            job = scheduler.get_scheduler().submit(
+                _CindexJob(self,
+                           path_cindex=s.cindex_path,
+                           index_filename=s.index_filename,
+                           paths_to_index=paths_to_index,
+                           build_symbols=settings.get('symbol_index',
+                                                      False),
+                           build_vocabulary=settings.get('query_completion',
+                                                         False),
+                           low_priority=background,
+                           profiler=settings.get_profiler()),
+                key=('cindex', index_filename, tuple(paths_to_index)),
+                pool=scheduler.INDEX,
+                priority=scheduler.BACKGROUND,
+                index_filename=index_filename,
+                # Indexing new paths resets the index, which rewrites the index
+                # file in place.
+                access=(scheduler.REBUILD if paths_to_index
+                        else scheduler.UPDATE))
+            self._job = job
+            if job.runnable._listener is not self:
+                # Another window already queued the same indexing.
+                self.window.active_view().set_status('YetAnotherCodeSearch',
+                                                     'cindex (queued)')
+            job.add_done_callback(lambda job: self.on_finished(err=job.error))
+            if background:
+                self._poll_idle()
         except Exception as e:
             self._finish(err=e)
 
-    def _increment_total_indexed(self, count):
-        if not self._is_running:
+    def _poll_idle(self):
+        """Pauses background indexing while the editor is being used."""
+        job = self._job
+        if not job or job.done:
+            return
+        pauser = job.runnable.pauser
+        idle_seconds = settings.get('background_index_idle_seconds', 5)
+        if pauser and pauser.supported and idle_seconds:
+            idle = (background.get_idle_tracker().idle_seconds() >=
+                    idle_seconds)
+            if idle == pauser.paused:
+                if idle:
+                    pauser.resume()
+                else:
+                    pauser.pause()
+                self._show_progress(job.runnable.state.describe())
+        sublime.set_timeout(self._poll_idle, _IDLE_POLL_MS)
+
+    def _show_progress(self, text):
+        if not self._job:
             return
-        self._total_indexed += count
-        self.window.active_view().set_status(
-            'YetAnotherCodeSearch', 'cindex ({} files)'.format(
-                self._total_indexed))
+        self.window.active_view().set_status('YetAnotherCodeSearch', text)
 
     def _finish(self, err=None):
-        self._is_running = False
+        self._job = None
         for view in self.window.views():
             view.erase_status('YetAnotherCodeSearch')
-        if err:
+        if err and self._background:
+            print('Code Search: background indexing failed: {0}'.format(err))
+            sublime.status_message('Code Search: background indexing failed')
+        elif err:
             sublime.error_message(str(err))
 
-    def on_files_processed(self, count):
-        sublime.set_timeout(functools.partial(self._increment_total_indexed,
-                                              count),
+    def on_progress(self, state):
+        sublime.set_timeout(functools.partial(self._show_progress,
+                                              state.describe()),
                             0)
 
     def on_finished(self, err=None):
         sublime.set_timeout(functools.partial(self._finish, err=err), 0)
 
 
-class _CindexListThread(threading.Thread):
-    """Runs the cindex command in a thread."""
+class _CindexJob(object):
+    """Runs the cindex command as a scheduler job.
+
+    Attributes:
+        state: The progress.IndexProgress, once cindex has started.
+        pauser: A background.ProcessPauser for cindex, once it has started,
+            if it runs with a low priority.
+    """
 
     def __init__(self, listener, path_cindex='cindex', index_filename=None,
-                 paths_to_index=None):
-        """Initializes the _CindexListThread.
+                 paths_to_index=None, build_symbols=False,
+                 build_vocabulary=False, low_priority=False, profiler=None):
+        """Initializes the _CindexJob.
 
         Args:
             listener: A _CindexListener object to send events to.
@@ -110,61 +168,193 @@ class _CindexListThread(threading.Thread):
             index_filename: An optional csearchindex file location to use.
             paths_to_index: An optional list of paths to index. If supplied,
                 replaces the paths currently used in the csearchindex file.
+            build_symbols: If the symbol table should be built after indexing.
+            build_vocabulary: If the identifier table should be built after
+                indexing.
+            low_priority: If cindex should run with a low CPU and IO priority,
+                and be able to be paused.
+            profiler: An optional profiling.Profiler. If set, cindex always
+                runs here, and its CPU profile is kept.
         """
-        super(_CindexListThread, self).__init__()
+        self.state = None
+        self.pauser = None
         self._listener = listener
         self._path_cindex = path_cindex
         self._index_filename = index_filename
         self._paths_to_index = paths_to_index or []
+        self._build_symbols = build_symbols
+        self._build_vocabulary = build_vocabulary
+        self._low_priority = low_priority
+        self._profiler = profiler
 
-    def run(self):
-        try:
-            self._start_indexing()
-            self._listener.on_finished()
-        except Exception as e:
-            self._listener.on_finished(err=e)
+    def run(self, job):
+        summary = None
+        profile = None
+        # Background indexing runs here, where it can be paused while the
+        # editor is being used.
+        client = None
+        if not self._profiler and not self._low_priority:
+            client = settings.get_daemon()
+        if client:
+            try:
+                # Windows indexing the same paths share the daemon's run.
+                summary = client.index(
+                    index_filename=self._index_filename,
+                    path_cindex=self._path_cindex,
+                    paths_to_index=self._paths_to_index,
+                    low_priority=self._low_priority,
+                    on_progress=self._on_daemon_progress)
+            except daemon.DaemonError as e:
+                print('Code Search: indexing without the daemon: '
+                      '{0}'.format(e))
+                settings.forget_daemon()
+        if summary is None:
+            if self._profiler:
+                profile = self._profiler.start('cindex')
+            summary = engine.run_cindex(
+                path_cindex=self._path_cindex,
+                index_filename=self._index_filename,
+                paths_to_index=self._paths_to_index,
+                on_progress=self._listener.on_progress,
+                job=job,
+                low_priority=self._low_priority,
+                on_start=self._on_start,
+                profile=profile).summary()
+        summary = 'Code Search: {0}'.format(summary)
+        print(summary)
+        if profile:
+            print(profiling.format_findings(profile), end='')
+        sublime.set_timeout(functools.partial(sublime.status_message,
+                                              summary), 0)
+        if self._build_symbols and not job.cancelled:
+            python = None
+            if settings.get('search_worker', False):
+                python = settings.get('search_worker_python', 'python3')
+            _submit_table_job(_SymbolTableJob(self._index_filename,
+                                              python=python),
+                              'symbol', self._index_filename)
+        if self._build_vocabulary and not job.cancelled:
+            _submit_table_job(_IdentifierTableJob(self._index_filename),
+                              'identifier', self._index_filename)
 
-    def _get_proc(self, cmd):
-        env = os.environ.copy()
-        if self._index_filename:
-            env['CSEARCHINDEX'] = self._index_filename
-        try:
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        except:
-            startupinfo = None
-        return subprocess.Popen(cmd,
+    def _on_daemon_progress(self, state):
+        # The daemon's cindex can't be paused from here.
+        self.state = state
+        self._listener.on_progress(state)
+
+    def _on_start(self, proc, state):
+        self.state = state
+        if self._low_priority:
+            self.pauser = background.ProcessPauser(proc, state)
+
+
+class _SymbolTableJob(object):
+    """Builds the symbol table of an index as a scheduler job.
+
+    The definitions are found with regexes, which hold the GIL. Given a
+    Python to run, the table is built by the command line tool in another
+    process, with a process per CPU, so the editor's plugins aren't slowed
+    down.
+    """
+
+    def __init__(self, index_filename=None, python=None):
+        """Initializes the _SymbolTableJob.
+
+        Args:
+            index_filename: An optional csearchindex file location to use.
+            python: An optional Python 3 command to build the table with. The
+                package has to be installed unpacked for it to run.
+        """
+        self._index_filename = index_filename
+        self._python = python
+
+    def run(self, job):
+        start = time.perf_counter()
+        index_filename = index.index_path(self._index_filename)
+        if self._python:
+            count = self._build_in_process(job, index_filename)
+            if count is None:
+                return
+        else:
+            count = symbols.build_table(
+                symbols.table_path(index_filename),
+                index.open_index(index_filename).names())
+        print('Code Search: found {0} symbols in {1:.3f}s'.format(
+              count, time.perf_counter() - start))
+
+    def _build_in_process(self, job, index_filename):
+        """Builds the table with the command line tool.
+
+        Returns:
+            The number of symbols found, or None if the job was cancelled.
+        Raises:
+            subprocess.CalledProcessError: If the command failed.
+        """
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        cmd = background.low_priority_command(
+            [self._python, '-m', os.path.basename(package_dir),
+             '--index', index_filename, 'symbols'])
+        proc = subprocess.Popen(cmd, cwd=os.path.dirname(package_dir),
                                 stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT,
-                                env=env, startupinfo=startupinfo)
-
-    def _start_indexing(self):
-        cmd = [self._path_cindex, '-verbose']
-        if self._paths_to_index:
-            cmd.append('-reset')
-            cmd.extend(self._paths_to_index)
-        proc = self._get_proc(cmd)
-        overall_start = time.perf_counter()
-        total_count = 0
-        start = time.time()
-        count = 0
-        for line in iter(proc.stdout.readline, b''):
-            if _FILE_LINE_RE.match(line.decode('utf-8')):
-                count += 1
-            # Call the listener every so often with an update on what was
-            # processed.
-            tick = time.time()
-            if tick - start > .1:
-                self._listener.on_files_processed(count)
-                total_count += count
-                count = 0
-                start = tick
-        total_count += count
-        self._listener.on_files_processed(count)
-        print('Code Search: indexed {0} files in {1:.3f}s'.format(
-              total_count, time.perf_counter() - overall_start))
-        proc.stdout.close()
-        retcode = proc.poll()
-        if retcode:
-            error = subprocess.CalledProcessError(retcode, cmd)
-            raise error
+                                stderr=subprocess.PIPE,
+                                **background.low_priority_popen_args())
+        job.add_cancel_callback(proc.kill)
+        (output, errors) = proc.communicate()
+        if job.cancelled:
+            return None
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd,
+                                                output=errors)
+        return int(output)
+
+
+class _IdentifierTableJob(object):
+    """Builds the identifier table of an index as a scheduler job."""
+
+    def __init__(self, index_filename=None):
+        """Initializes the _IdentifierTableJob.
+
+        Args:
+            index_filename: An optional csearchindex file location to use.
+        """
+        self._index_filename = index_filename
+
+    def run(self, job):
+        start = time.perf_counter()
+        index_filename = index.index_path(self._index_filename)
+        count = vocab.build_table(
+            vocab.table_path(index_filename),
+            index.open_index(index_filename).names())
+        print('Code Search: found {0} identifiers in {1:.3f}s'.format(
+              count, time.perf_counter() - start))
+
+
+def _submit_table_job(runnable, name, index_filename):
+    """Queues a job that builds a table from the files of an index.
+
+    The table is built in its own job once cindex is done, so it only reads
+    the index and doesn't hold the lock that keeps other indexing out.
+
+    Args:
+        runnable: The job to run.
+        name: The name of the table, for the job's key and errors.
+        index_filename: An optional csearchindex file location to use.
+    """
+    index_filename = index.index_path(index_filename)
+    job = scheduler.get_scheduler().submit(
+        runnable,
+        key=(name, index_filename),
+        pool=scheduler.INDEX,
+        priority=scheduler.BACKGROUND,
+        index_filename=index_filename,
+        access=scheduler.READ)
+    job.add_done_callback(functools.partial(_on_table_done, name))
+
+
+def _on_table_done(name, job):
+    if job.error:
+        print('Code Search: could not build the {0} table: {1}'.format(
+            name, job.error))
+        output = getattr(job.error, 'output', None)
+        if output:
+            print(output.decode('utf-8', 'replace'), end='')
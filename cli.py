@@ -0,0 +1,408 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from YetAnotherCodeSearch import bench
+from YetAnotherCodeSearch import daemon
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import profiling
+from YetAnotherCodeSearch import stats
+from YetAnotherCodeSearch import symbols
+from YetAnotherCodeSearch import worker
+
+
+def write_text(results, out):
+    """Writes search results the way they are shown in the editor.
+
+    Args:
+        results: A list of parser.FileResults.
+        out: The text stream to write to.
+    """
+    if not results:
+        out.write('No matches found\n')
+        return
+    for text in engine.format_results(results):
+        out.write(text)
+
+
+def write_json_lines(results, out):
+    """Writes search results as one JSON object per line.
+
+    Each line has the file name, line number and text of a matched line.
+    Lines around the matches are written too, with "match" set to false. The
+    lines of a file grouped with others for having the same matches list the
+    other files in "duplicates".
+
+    Args:
+        results: A list of parser.FileResults.
+        out: The text stream to write to.
+    """
+    for file_results in results:
+        lines = [(linenum, line, True)
+                 for (linenum, line) in file_results.matches]
+        lines.extend((linenum, line, False)
+                     for (linenum, line) in file_results.context)
+        lines.sort(key=lambda line: line[0])
+        for (linenum, line, match) in lines:
+            obj = {'file': file_results.filename,
+                   'line': linenum,
+                   'text': line,
+                   'match': match}
+            if file_results.duplicates:
+                obj['duplicates'] = file_results.duplicates
+            out.write(json.dumps(obj))
+            out.write('\n')
+
+
+def _search(args, out):
+    if args.profile:
+        return _profile_search(args, out)
+    if args.daemon is not None:
+        (results, unused_cached, unused_timings) = daemon.Client(
+            args.daemon).search(parser.parse_query(' '.join(args.query)),
+                                index_filename=args.index,
+                                path_csearch=args.csearch,
+                                context_lines=args.context,
+                                group=args.group)
+    else:
+        results = engine.search(' '.join(args.query),
+                                path_csearch=args.csearch,
+                                index_filename=args.index,
+                                context_lines=args.context,
+                                group=args.group)
+    if args.json:
+        write_json_lines(results, out)
+    else:
+        write_text(results, out)
+    return 0 if results else 1
+
+
+def _profile_search(args, out):
+    # Profiling runs csearch here, so it never goes through the daemon.
+    profiler = profiling.Profiler(args.profile, brute=args.brute)
+    search = parser.parse_query(' '.join(args.query))
+    profile = profiler.start('csearch')
+    results = engine.search(search, path_csearch=args.csearch,
+                            index_filename=args.index,
+                            context_lines=args.context, group=args.group,
+                            profile=profile)
+    brute = None
+    if args.brute:
+        brute = profiler.start('csearch-brute')
+        engine.run_csearch(search, path_csearch=args.csearch,
+                           index_filename=args.index, profile=brute,
+                           brute=True)
+    if args.json:
+        write_json_lines(results, out)
+        # The JSON lines are left for other tools to read.
+        sys.stderr.write(profiling.format_findings(profile, brute))
+    else:
+        write_text(results, out)
+        out.write(profiling.format_findings(profile, brute))
+    return 0 if results else 1
+
+
+def _index(args, out):
+    # Profiling runs cindex here, so it never goes through the daemon.
+    if args.daemon is not None and not args.profile:
+        summary = daemon.Client(args.daemon).index(
+            index_filename=args.index, path_cindex=args.cindex,
+            paths_to_index=args.paths)
+    else:
+        profile = None
+        if args.profile:
+            profile = profiling.Profiler(args.profile).start('cindex')
+        summary = engine.run_cindex(path_cindex=args.cindex,
+                                    index_filename=args.index,
+                                    paths_to_index=args.paths,
+                                    profile=profile).summary()
+        if profile:
+            summary += '\n' + profiling.format_findings(profile).rstrip()
+    out.write('{0}: {1}\n'.format(index.index_path(args.index), summary))
+    return 0
+
+
+def _symbols(args, out):
+    index_filename = index.index_path(args.index)
+    count = symbols.build_table(symbols.table_path(index_filename),
+                                index.open_index(index_filename).names(),
+                                max_workers=args.workers, processes=True)
+    out.write('{0}\n'.format(count))
+    return 0
+
+
+def _daemon(args, out):
+    if args.stop:
+        daemon.Client(args.socket).shutdown()
+        return 0
+    daemon.serve(socket_path=args.socket, cache_dir=args.cache_dir,
+                 cache_mb=args.cache_mb, idle_minutes=args.idle_minutes)
+    return 0
+
+
+def _stats(args, out):
+    records = stats.StatsLog(args.log).records()
+    for line in stats.format_report(records, limit=args.slowest):
+        out.write(line)
+    return 0
+
+
+def _replay(args, out):
+    records = stats.StatsLog(args.log).records()
+    saved = None
+    if args.save:
+        saved = stats.StatsLog(
+            args.save, max_records=max(1, len(records) * args.repeat))
+        saved.clear()
+    try:
+        index_bytes = os.path.getsize(index.index_path(args.index))
+    except OSError:
+        index_bytes = None
+    replayed = []
+    for unused_i in range(args.repeat):
+        for record in records:
+            search = stats.record_search(record)
+            timings = {}
+            try:
+                results = engine.search(search, path_csearch=args.csearch,
+                                        index_filename=args.index,
+                                        context_lines=args.context,
+                                        timings=timings)
+            except subprocess.CalledProcessError as e:
+                out.write('{0}  {1}\n'.format(record['query'], e))
+                continue
+            record = stats.make_record(search, results, timings,
+                                       index_bytes=index_bytes)
+            out.write('{0: >8.0f}ms  {1}\n'.format(
+                timings['total'] * 1000, record['query']))
+            replayed.append(record)
+            if saved:
+                saved.add(record)
+    out.write('\n')
+    for line in stats.format_report(replayed, limit=args.slowest):
+        out.write(line)
+    return 0
+
+
+def _worker(args, out):
+    worker.serve()
+    return 0
+
+
+def _bench(args, out):
+    spec = bench.RepoSpec(files=args.files, median_bytes=args.median_kb * 1024,
+                          languages=args.languages.split(','),
+                          max_depth=args.depth, minified=args.minified,
+                          minified_bytes=args.minified_kb * 1024,
+                          seed=args.seed)
+    root = args.dir or tempfile.mkdtemp()
+    try:
+        report = bench.run_benchmark(
+            root, spec, path_csearch=args.csearch, path_cindex=args.cindex,
+            repeat=args.repeat, changed_files=args.changed, out=sys.stderr)
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+    for line in bench.format_report(report):
+        out.write(line)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        out.write('\nCompared to {0}:\n'.format(args.compare))
+        for line in bench.compare(old, report):
+            out.write(line)
+    return 0
+
+
+def _make_parser():
+    arg_parser = argparse.ArgumentParser(
+        prog='python -m YetAnotherCodeSearch',
+        description='Search and index code with csearch and cindex.')
+    arg_parser.add_argument('--index',
+                            help='the csearchindex file to use; defaults to '
+                                 '$CSEARCHINDEX or ~/.csearchindex')
+    arg_parser.add_argument('--daemon', nargs='?', const='', metavar='SOCKET',
+                            help='search and index in a running daemon, '
+                                 'listening on SOCKET or the default socket')
+    commands = arg_parser.add_subparsers(dest='command')
+
+    search = commands.add_parser(
+        'search', help='search the index',
+        description='Search the index. The query is written the same way as '
+                    'in the editor, so file: and case: work, and quotes '
+                    'group words.')
+    search.add_argument('query', nargs='+', help='the search query')
+    search.add_argument('--json', action='store_true',
+                        help='write a JSON object per matched line')
+    search.add_argument('--context', type=int, default=0, metavar='N',
+                        help='show N lines around each match')
+    search.add_argument('--group', action='store_true',
+                        help='show files with the same matches once')
+    search.add_argument('--csearch', default='csearch',
+                        help='the csearch command')
+    search.add_argument('--profile', metavar='DIR',
+                        help='keep the CPU profile of csearch, with the '
+                             'command and environment it ran with, in DIR')
+    search.add_argument('--brute', action='store_true',
+                        help='with --profile, run the search again with '
+                             '-brute, to see how much time the index saves')
+    search.set_defaults(run=_search)
+
+    reindex = commands.add_parser(
+        'index', help='update the index',
+        description='Update the index, or replace it with new paths.')
+    reindex.add_argument('paths', nargs='*',
+                         help='paths to index instead of the current ones')
+    reindex.add_argument('--cindex', default='cindex',
+                         help='the cindex command')
+    reindex.add_argument('--profile', metavar='DIR',
+                         help='keep the CPU profile of cindex, with the '
+                              'command and environment it ran with, in DIR')
+    reindex.set_defaults(run=_index)
+
+    symbol_table = commands.add_parser(
+        'symbols', help='build the symbol table',
+        description='Build the table of definitions in the indexed files, '
+                    'for Go to Symbol, with a process per CPU, and print the '
+                    'number of symbols found.')
+    symbol_table.add_argument('--workers', type=int, metavar='N',
+                              help='use N processes')
+    symbol_table.set_defaults(run=_symbols)
+
+    report = commands.add_parser(
+        'stats', help='show search latencies',
+        description='Show the latency percentiles and the slowest searches '
+                    'in a stats log.')
+    report.add_argument('log', help='the stats log, a JSON lines file')
+    report.add_argument('--slowest', type=int, default=10, metavar='N',
+                        help='list the N slowest searches')
+    report.set_defaults(run=_stats)
+
+    replay = commands.add_parser(
+        'replay', help='run the searches in a stats log again',
+        description='Run the searches in a stats log again, against the '
+                    'index and csearch given, and report how long they '
+                    'took.')
+    replay.add_argument('log', help='the stats log, a JSON lines file')
+    replay.add_argument('--repeat', type=int, default=1, metavar='N',
+                        help='run every search N times')
+    replay.add_argument('--context', type=int, default=0, metavar='N',
+                        help='add N lines around each match')
+    replay.add_argument('--csearch', default='csearch',
+                        help='the csearch command')
+    replay.add_argument('--save', metavar='LOG',
+                        help='write the new timings to a stats log, to '
+                             'compare with later runs')
+    replay.add_argument('--slowest', type=int, default=10, metavar='N',
+                        help='list the N slowest searches')
+    replay.set_defaults(run=_replay)
+
+    serve = commands.add_parser(
+        'daemon', help='run a search daemon',
+        description='Serve searches and indexing over a Unix socket, sharing '
+                    'the index tables, result cache and indexing between '
+                    'clients.')
+    serve.add_argument('--socket',
+                       help='where to listen; defaults to a socket in a '
+                            'directory only the user can use')
+    serve.add_argument('--cache-dir',
+                       help='a directory to cache search results in')
+    serve.add_argument('--cache-mb', type=int, default=64, metavar='N',
+                       help='the size of the result cache, in megabytes')
+    serve.add_argument('--idle-minutes', type=int, default=0, metavar='N',
+                       help='exit after N minutes without requests')
+    serve.add_argument('--stop', action='store_true',
+                       help='stop the daemon listening on the socket')
+    serve.set_defaults(run=_daemon)
+
+    benchmark = commands.add_parser(
+        'bench', help='time indexing and searching a synthetic tree',
+        description='Write a synthetic source tree, the same for the same '
+                    'options, then time indexing it and a fixed mix of '
+                    'selective, broad and full scan searches in it, through '
+                    'parsing, formatting and highlighting the results.')
+    benchmark.add_argument('--files', type=int, default=2000, metavar='N',
+                           help='the number of source files')
+    benchmark.add_argument('--median-kb', type=int, default=4, metavar='N',
+                           help='the median size of a source file')
+    benchmark.add_argument('--languages', default='py,go,js,java,c',
+                           help='the languages of the files, separated by '
+                                'commas')
+    benchmark.add_argument('--depth', type=int, default=8, metavar='N',
+                           help='the most directories a file is nested in')
+    benchmark.add_argument('--minified', type=int, default=2, metavar='N',
+                           help='the number of huge minified files')
+    benchmark.add_argument('--minified-kb', type=int, default=2048,
+                           metavar='N', help='the size of each minified file')
+    benchmark.add_argument('--seed', type=int, default=1,
+                           help='the seed the tree is made from')
+    benchmark.add_argument('--repeat', type=int, default=5, metavar='N',
+                           help='run every search N times')
+    benchmark.add_argument('--changed', type=int, default=10, metavar='N',
+                           help='change N files before indexing again')
+    benchmark.add_argument('--dir',
+                           help='an empty directory to write the tree and '
+                                'its index to, and keep; defaults to a '
+                                'temporary directory')
+    benchmark.add_argument('--save', metavar='REPORT',
+                           help='write the report as JSON, to compare with '
+                                'later runs')
+    benchmark.add_argument('--compare', metavar='REPORT',
+                           help='compare with a report saved by an earlier '
+                                'run')
+    benchmark.add_argument('--csearch', default='csearch',
+                           help='the csearch command')
+    benchmark.add_argument('--cindex', default='cindex',
+                           help='the cindex command')
+    benchmark.set_defaults(run=_bench)
+
+    serve_worker = commands.add_parser(
+        'worker', help='run searches for the editor',
+        description='Run searches and format their results for the editor, '
+                    'reading requests from stdin and writing frames to '
+                    'stdout.')
+    serve_worker.set_defaults(run=_worker)
+    return arg_parser
+
+
+def main(argv=None, out=None):
+    """Runs the command line tool.
+
+    Args:
+        argv: The arguments, not counting the program name. Defaults to
+            sys.argv.
+        out: The text stream to write to. Defaults to stdout.
+    Returns:
+        The exit status; 0 if anything matched, 1 if nothing did and 2 on
+        errors.
+    """
+    arg_parser = _make_parser()
+    args = arg_parser.parse_args(argv)
+    if not getattr(args, 'run', None):
+        arg_parser.print_usage(sys.stderr)
+        return 2
+    if out is None:
+        # File names that aren't UTF-8 are kept as they were.
+        out = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8',
+                               errors='surrogateescape')
+    try:
+        return args.run(args, out)
+    except subprocess.CalledProcessError as e:
+        output = e.output or b''
+        sys.stderr.write('{0}\n{1}'.format(
+            e, output.decode('utf-8', 'replace')))
+    except Exception as e:
+        sys.stderr.write('{0}\n'.format(e))
+    finally:
+        out.flush()
+    return 2
@@ -0,0 +1,186 @@
+import array
+import collections
+import concurrent.futures
+import mmap
+import os
+import re
+import threading
+
+# How many files to keep the line offsets of.
+_MAX_CACHED_FILES = 256
+
+# How many files to read at once.
+_MAX_WORKERS = 4
+
+# Matches the posix form of a Windows path, like /C/Users/..., as written by
+# csearch.fix_windows_output.
+_WINDOWS_PATH_RE = re.compile(r'^/([A-Za-z])/')
+
+
+class _LineOffsets(object):
+    """The start offsets of a file's lines, as far as they have been found.
+
+    Attributes:
+        generation: The (mtime, size) of the file the offsets are for.
+        offsets: An array with the offset of the start of each line found so
+            far. Line n starts at offsets[n - 1].
+        complete: If the whole file has been scanned.
+        lock: Held while the offsets are extended.
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.offsets = array.array('Q', [0])
+        self.complete = False
+        self.lock = threading.Lock()
+
+    def extend(self, data, linenum):
+        """Finds line starts until the end of the line is known.
+
+        Args:
+            data: The contents of the file, as an mmap.
+            linenum: The last line number that's needed.
+        """
+        offsets = self.offsets
+        pos = offsets[-1]
+        while not self.complete and len(offsets) <= linenum:
+            newline = data.find(b'\n', pos)
+            if newline < 0:
+                self.complete = True
+                break
+            pos = newline + 1
+            offsets.append(pos)
+
+
+class LineCache(object):
+    """Reads lines out of files by line number.
+
+    Each file is mmap'd and only scanned as far as the lines that are asked
+    for. The line offsets are kept for the most recently used files, until
+    the file changes, so asking for more lines later doesn't scan it again.
+    The cache's lock only guards which files are kept; each file's offsets
+    have their own lock, so files are scanned in parallel.
+    """
+
+    def __init__(self, max_files=_MAX_CACHED_FILES):
+        self._max_files = max_files
+        self._files = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def lines(self, filename, linenums):
+        """Reads lines from a file.
+
+        Args:
+            filename: The file to read.
+            linenums: A sorted list of line numbers to read.
+        Returns:
+            A list of (line number, bytes) pairs for the lines that are in the
+            file.
+        Raises:
+            OSError: If the file could not be read.
+        """
+        if not linenums:
+            return []
+        with open(filename, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if not st.st_size:
+                return []
+            generation = (st.st_mtime, st.st_size)
+            with self._lock:
+                offsets = self._files.pop(filename, None)
+                if offsets is None or offsets.generation != generation:
+                    offsets = _LineOffsets(generation)
+                self._files[filename] = offsets
+                while len(self._files) > self._max_files:
+                    self._files.popitem(last=False)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                # Another thread could be reading the same file, so the
+                # offsets are only extended while holding the file's lock.
+                with offsets.lock:
+                    offsets.extend(data, linenums[-1])
+                    starts = offsets.offsets
+                    num_found = len(starts)
+                res = []
+                for linenum in linenums:
+                    start = starts[linenum - 1] if linenum <= num_found else 0
+                    if linenum < num_found:
+                        end = starts[linenum] - 1
+                    elif linenum == num_found and start < st.st_size:
+                        # The last line, without a newline after it.
+                        end = st.st_size
+                    else:
+                        break
+                    if end > start and data[end - 1:end] == b'\r':
+                        end -= 1
+                    res.append((linenum, data[start:end]))
+                return res
+            finally:
+                data.close()
+
+
+def context_linenums(linenums, num_lines):
+    """Finds the line numbers around the matched lines.
+
+    Args:
+        linenums: A sorted list of the matched line numbers.
+        num_lines: The number of lines to show before and after each match.
+    Returns:
+        A sorted list of the line numbers around the matches, not counting the
+        matches themselves. Overlapping ranges are merged.
+    """
+    matched = set(linenums)
+    res = set()
+    for linenum in linenums:
+        res.update(range(max(1, linenum - num_lines),
+                         linenum + num_lines + 1))
+    return sorted(res - matched)
+
+
+def local_path(filename):
+    """Turns a file name from the search results into one that can be opened.
+
+    Args:
+        filename: The file name from the results.
+    Returns:
+        The local file name.
+    """
+    if os.name == 'nt':
+        return _WINDOWS_PATH_RE.sub(r'\1:/', filename)
+    return filename
+
+
+_line_cache = LineCache()
+
+
+def _file_context(line_cache, num_lines, file_results):
+    linenums = context_linenums(file_results.linenums(), num_lines)
+    try:
+        return line_cache.lines(local_path(file_results.filename), linenums)
+    except (OSError, IOError, ValueError):
+        return []
+
+
+def add_context(results, num_lines, line_cache=None,
+                max_workers=_MAX_WORKERS):
+    """Adds the lines around each match to the search results.
+
+    The files are read in parallel, and only the files in the results are
+    read.
+
+    Args:
+        results: A list of parser.FileResults. Their context is set in place.
+        num_lines: The number of lines to show before and after each match.
+        line_cache: An optional LineCache to read the lines with.
+        max_workers: The number of files to read at once.
+    """
+    if not results or num_lines <= 0:
+        return
+    line_cache = line_cache or _line_cache
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        contexts = executor.map(
+            lambda file_results: _file_context(line_cache, num_lines,
+                                               file_results),
+            results)
+        for (file_results, context) in zip(results, contexts):
+            file_results.context = context
@@ -3,25 +3,131 @@ import sublime_plugin
 
 import bisect
 import functools
-import operator
+import itertools
 import os
-import platform
 import re
 import subprocess
-import threading
+import time
 
+from YetAnotherCodeSearch import batch
+from YetAnotherCodeSearch import cache
+from YetAnotherCodeSearch import context
+from YetAnotherCodeSearch import daemon
+from YetAnotherCodeSearch import delta
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import index
 from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import pathclass
+from YetAnotherCodeSearch import plan
+from YetAnotherCodeSearch import profiling
+from YetAnotherCodeSearch import refine
+from YetAnotherCodeSearch import render
+from YetAnotherCodeSearch import replace
+from YetAnotherCodeSearch import scheduler
 from YetAnotherCodeSearch import settings
+from YetAnotherCodeSearch import stats
+from YetAnotherCodeSearch import vocab
+from YetAnotherCodeSearch import worker
+
+_result_cache = None
+_stats_log = None
+
+# The most completions to show while a query is typed.
+_MAX_COMPLETIONS = 8
+
+# The identifier being typed at the end of a query. Values of flags like
+# file:, and escapes like \b, aren't completed.
+_TYPED_WORD_RE = re.compile(r'(?:^|[^\w:\\])([A-Za-z_]\w*)$')
+
+# The lines of batch results that aren't results: the title, the header of
+# each term and the footer. They quote the terms, so they'd be highlighted.
+_BATCH_HEADING_RE = re.compile(
+    r'Searching for \d+ terms$|Term ".*": \d+ matches across \d+ files$|'
+    r'\d+ terms, \d+ matches across \d+ files$')
+
+# The search and results last shown in each window, by window id.
+_last_results = {}
+
+# The refinements of the last results in each window, by window id. Each is a
+# list of (refinement, results) pairs, starting with (None, the results of the
+# search itself).
+_refinements = {}
+
+# What the results view of each window shows, by window id, as a (search,
+# results, delta.Layout) tuple. Missing when the view doesn't show results a
+# file at a time, like after an error or a batch search.
+_shown = {}
+
+# How many times the results of each window were replaced, or started to be,
+# by window id. A refinement checks it when it finishes, to drop its results
+# if a newer search or refinement was started in the meantime.
+_generations = {}
+
+# The ChunkedRenderer showing a refinement in each window, by window id.
+_refine_renderers = {}
+
+
+def _get_result_cache():
+    """Gets the shared on-disk result cache.
+
+    Returns:
+        A cache.ResultCache, or None if caching is turned off.
+    """
+    global _result_cache
+    max_mb = settings.get('result_cache_size_mb', 64)
+    if not max_mb:
+        return None
+    if _result_cache is None:
+        _result_cache = cache.ResultCache(
+            os.path.join(sublime.cache_path(), 'YetAnotherCodeSearch',
+                         'results'),
+            max_mb * 1024 * 1024)
+    _result_cache.max_bytes = max_mb * 1024 * 1024
+    return _result_cache
+
+
+def _get_stats_log():
+    """Gets the shared log of search stats.
+
+    Returns:
+        A stats.StatsLog, or None if stats are turned off.
+    """
+    global _stats_log
+    max_records = settings.get('stats_max_searches', 1000)
+    if not max_records:
+        return None
+    if _stats_log is None:
+        _stats_log = stats.StatsLog(
+            os.path.join(sublime.cache_path(), 'YetAnotherCodeSearch',
+                         'stats.jsonl'),
+            max_records)
+    _stats_log.max_records = max_records
+    return _stats_log
+
+
+def plugin_unloaded():
+    worker.shutdown()
 
 
 class _CsearchListener(object):
     """A listener interface for handling callbacks while processing csearch."""
 
-    def on_finished(self, output, err=None):
+    def on_finished(self, matches, err=None, output=None, cached=False):
         """Callback for when everything is finished.
 
         Args:
-            output: The raw output of the csearch command.
+            matches: The list of FileResults that were found.
+            err: An optional error object if something unexpected happened.
+            output: The raw output of the csearch command, if it was run.
+            cached: If the matches came from the result cache.
+        """
+        pass
+
+    def on_batch_finished(self, per_term, err=None):
+        """Callback for when a batch search is finished.
+
+        Args:
+            per_term: A list with a list of FileResults for each term.
             err: An optional error object if something unexpected happened.
         """
         pass
@@ -32,8 +138,15 @@ class CsearchCommand(sublime_plugin.WindowCommand, _CsearchListener):
 
     def __init__(self, *args, **kwargs):
         super(CsearchCommand, self).__init__(*args, **kwargs)
-        self._is_running = False
+        self._job = None
         self._last_search = 'file:* case:yes "'
+        self._search = None
+        self._results_view = None
+        self._renderer = None
+        self._started = None
+        self._render_started = None
+        self._finished_job = None
+        self._panel = None
 
     def run(self, query=None):
         """Runs the search command.
@@ -41,16 +154,100 @@ class CsearchCommand(sublime_plugin.WindowCommand, _CsearchListener):
         Args:
             query: An optional search query.
         """
-        if self._is_running:
-            return
-        self._is_running = True
-
         if query:
             self._on_search(query)
             return
-        self.window.show_input_panel(
-            'csearch', self._last_search, self._on_search, None,
-            functools.partial(self._finish, None, None, cancel=True))
+        self._panel = self.window.show_input_panel(
+            'csearch', self._last_search, self._on_done, self._on_change,
+            None)
+
+    def _make_plan(self, text):
+        """Plans the query, for showing while it is typed.
+
+        Returns:
+            A plan.Plan, or None if the query can't be parsed.
+        """
+        try:
+            search = parser.parse_query(text)
+            search.args()
+        except Exception:
+            return None
+        reader = None
+        try:
+            s = settings.get_window_settings(self.window)
+            reader = index.open_index(index.index_path(s.index_filename))
+        except Exception:
+            pass
+        return plan.make_plan(search, reader)
+
+    def _on_change(self, text):
+        query_plan = self._make_plan(text)
+        if query_plan:
+            sublime.status_message(query_plan.describe())
+        if settings.get('query_completion', False):
+            self._show_completions(text)
+
+    def _open_vocabulary(self):
+        try:
+            s = settings.get_window_settings(self.window)
+            return vocab.open_table(vocab.table_path(
+                index.index_path(s.index_filename)))
+        except Exception:
+            return None
+
+    def _show_completions(self, text):
+        """Shows the identifiers that complete the word being typed.
+
+        If none do, and the word isn't an identifier in the index, the ones
+        spelled most like it are shown instead.
+        """
+        panel = self._panel
+        if not panel or not hasattr(panel, 'show_popup'):
+            return
+        m = _TYPED_WORD_RE.search(text)
+        vocabulary = self._open_vocabulary() if m else None
+        if not vocabulary or len(m.group(1)) < 2:
+            panel.hide_popup()
+            return
+        word = m.group(1)
+        found = vocabulary.complete(word, limit=_MAX_COMPLETIONS + 1)
+        known = any(token.lower() == word.lower() for (token, unused) in found)
+        found = [(token, count) for (token, count) in found
+                 if token != word][:_MAX_COMPLETIONS]
+        title = ''
+        if not found and not known:
+            found = vocabulary.suggest(word, limit=_MAX_COMPLETIONS)
+            title = '<p>Did you mean</p>'
+        if not found:
+            panel.hide_popup()
+            return
+        content = title + ''.join(
+            '<div><a href="{0}">{0}</a> {1} files</div>'.format(token, count)
+            for (token, count) in found)
+        panel.show_popup(content, location=panel.size(),
+                         on_navigate=functools.partial(self._on_complete,
+                                                       m.start(1)))
+
+    def _on_complete(self, start, token):
+        panel = self._panel
+        panel.hide_popup()
+        panel.sel().clear()
+        panel.sel().add(sublime.Region(start, panel.size()))
+        panel.run_command('insert', {'characters': token})
+
+    def _on_done(self, result):
+        query_plan = self._make_plan(result)
+        if (query_plan and query_plan.needs_confirmation and
+                settings.get('confirm_full_scan', True) and
+                not sublime.ok_cancel_dialog(
+                    'This search reads every indexed file, since no file '
+                    'has to contain any part of it.\n\nTo make it faster, '
+                    '{0}.'.format(query_plan.suggestion()),
+                    'Search Anyway')):
+            self._last_search = result
+            self.run()
+            return
+        self._on_search(result)
 
     def _get_results_view(self):
         view = next((view for view in self.window.views()
@@ -67,26 +264,98 @@ class CsearchCommand(sublime_plugin.WindowCommand, _CsearchListener):
                                   'Code Search Results.hidden-tmLanguage'))
         return view
 
+    def _cancel(self):
+        """Stops the previous search, if it is still going."""
+        if self._job:
+            self._job.cancel()
+            self._job = None
+        renderer = self._renderer
+        if renderer and not renderer.cancelled:
+            renderer.cancel()
+        self._renderer = None
+
+    def _submit(self, runnable, searches, index_filename):
+        """Queues a search job with the shared scheduler.
+
+        Args:
+            runnable: The job to run.
+            searches: The list of parser.Search objects the job runs, used to
+                find identical searches that are already waiting to run.
+            index_filename: An optional csearchindex file location to use.
+        """
+        index_filename = index.index_path(index_filename)
+        job = scheduler.get_scheduler().submit(
+            runnable,
+            key=(type(runnable).__name__, index_filename,
+                 tuple((tuple(search.args()), tuple(search.path_flags()))
+                       for search in searches)),
+            pool=scheduler.SEARCH,
+            priority=scheduler.INTERACTIVE,
+            index_filename=index_filename,
+            access=scheduler.READ)
+        self._job = job
+        job.add_done_callback(self._on_job_done)
+
+    def _on_job_done(self, job):
+        if job is not self._job or job.cancelled:
+            return
+        self._finished_job = job.runnable
+        self.on_finished(job.result, err=job.error,
+                         output=job.runnable.output,
+                         cached=job.runnable.cached)
+
+    def _render(self, texts, on_done):
+        """Appends text to the results view a chunk at a time.
+
+        This is called from a worker thread, so the formatting happens off of
+        the main thread too.
+
+        Args:
+            texts: An iterable of strings to append.
+            on_done: The callback for when all of the text is appended.
+        """
+        renderer = render.ChunkedRenderer(self._results_view, on_done=on_done)
+        self._renderer = renderer
+        for text in texts:
+            if not renderer.write(text):
+                return
+        renderer.close()
+
     def _on_search(self, result):
+        self._cancel()
         self._last_search = result
+        self._started = time.perf_counter()
+        self._finished_job = None
+        _next_generation(self.window.id())
+        _shown.pop(self.window.id(), None)
 
-        view = self._get_results_view()
+        view = self._results_view = self._get_results_view()
         self._write_message('Searching for "{0}"\n\n'.format(result),
                             view=view, erase=True)
         view.set_status('YetAnotherCodeSearch', 'Searching...')
         try:
-            s = settings.get_project_settings(self.window.project_data(),
-                                              self.window.project_file_name())
-            _CsearchThread(parser.parse_query(result), self,
-                           path_csearch=s.csearch_path,
-                           index_filename=s.index_filename).start()
+            s = settings.get_window_settings(self.window)
+            search = self._search = parser.parse_query(result)
+            profiler = settings.get_profiler()
+            job_class = _CsearchJob
+            if settings.get('search_worker', False) and not profiler:
+                job_class = _WorkerSearchJob
+            self._submit(job_class(search,
+                                   path_csearch=s.csearch_path,
+                                   index_filename=s.index_filename,
+                                   result_cache=_get_result_cache(),
+                                   context_lines=settings.get(
+                                       'context_lines', 0),
+                                   group=settings.get('group_duplicates',
+                                                      False),
+                                   profiler=profiler),
+                         [search], s.index_filename)
         except Exception as e:
-            self._finish(None, err=e)
+            self._finish(None, None, err=e)
 
-    def _finish(self, output, matches, err=None, cancel=False):
-        self._is_running = False
-        if cancel:
-            return
+    def _finish(self, output, matches, err=None):
+        self._job = None
+        self._renderer = None
 
         view = self._get_results_view()
         view.erase_status('YetAnotherCodeSearch')
@@ -95,31 +364,53 @@ class CsearchCommand(sublime_plugin.WindowCommand, _CsearchListener):
             self._print_error(err, output)
             return
 
+        self._record_stats(matches)
+
         if not matches:
             self._write_message('No matches found\n', view=view)
             return
 
-        query = parser.parse_query(self._last_search)
-        result = '\n\n'.join((str(f) for f in matches))
-        num_files = len(matches)
-        num_matches = functools.reduce(operator.add,
-                                       (len(r.matches) for r in matches))
-        result += '\n\n{0} matches across {1} files\n'.format(num_matches,
-                                                              num_files)
-        self._write_message(result, view=view)
-
-        flags = 0
-        if not query.case:
-            flags = sublime.IGNORECASE
-        reg = view.find_all(query.query_re(), flags)
-        reg = reg[1:]  # Skip the first match, it's the "title"
+        # The results themselves have already been rendered.
+        reply = getattr(self._finished_job, 'reply', None)
+        if reply and reply.highlights is not None:
+            # The worker found the matches, in the text after the title.
+            start = view.size() - reply.text_length
+            reg = [sublime.Region(start + begin, start + end)
+                   for (begin, end) in reply.highlights]
+        else:
+            query = parser.parse_query(self._last_search)
+            flags = 0
+            if not query.case:
+                flags = sublime.IGNORECASE
+            reg = view.find_all(query.query_re(), flags)
+            reg = reg[1:]  # Skip the first match, it's the "title"
         view.add_regions('YetAnotherCodeSearch', reg, 'text.csearch', '',
                          sublime.HIDE_ON_MINIMAP | sublime.DRAW_NO_FILL)
+        _fold_duplicates(view)
         self.window.focus_view(view)
 
+    def _record_stats(self, matches):
+        log = _get_stats_log()
+        runnable = self._finished_job
+        if not log or not runnable:
+            return
+        now = time.perf_counter()
+        timings = dict(runnable.timings)
+        if matches:
+            timings['render'] = now - self._render_started
+        timings['total'] = now - self._started
+        try:
+            log.add(stats.make_record(self._search, matches, timings,
+                                      index_bytes=runnable.index_bytes,
+                                      cached=runnable.cached))
+        except (OSError, IOError) as e:
+            print('Code Search: could not record stats: {0}'.format(e))
+
     def _print_error(self, err, output):
         if isinstance(err, subprocess.CalledProcessError):
             output = err.output
+        if isinstance(output, bytes):
+            output = output.decode('utf-8', 'replace')
         view = self._get_results_view()
         msg = '{0}\n\n{1}\n'.format(err, output)
         self._write_message(msg, view=view)
@@ -135,77 +426,929 @@ class CsearchCommand(sublime_plugin.WindowCommand, _CsearchListener):
         view.run_command('append', {'characters': msg})
         view.set_read_only(True)
 
-    def on_finished(self, output, err=None):
-        matches = None
-        if output:
+    def on_finished(self, matches, err=None, output=None, cached=False):
+        if cached:
+            sublime.status_message('Code Search: results from cache')
+        if err or not matches:
+            _shown.pop(self.window.id(), None)
+            sublime.set_timeout(
+                functools.partial(self._finish, output, matches, err=err))
+            return
+        _last_results[self.window.id()] = (self._search, matches)
+        _refinements.pop(self.window.id(), None)
+        self._render_started = time.perf_counter()
+        reply = getattr(self._finished_job, 'reply', None)
+        texts = reply.texts if reply else engine.format_results(matches)
+        findings = getattr(self._finished_job, 'findings', None)
+        layout = delta.Layout(matches)
+        if findings:
+            # The profile findings go after the footer of the results.
+            texts = itertools.chain(texts, [findings])
+            layout = delta.Layout(matches,
+                                  footer_text=delta.footer(matches) + findings)
+        _shown[self.window.id()] = (self._search, matches, layout)
+        self._render(texts, functools.partial(self._finish, output, matches))
+
+
+class CsearchBatchCommand(CsearchCommand):
+    """A window command to search for many terms at once.
+
+    All of the terms are ORed together so csearch only needs to be run once,
+    or a few times if the regex gets too long, and then each match is
+    attributed to the terms that it matches. The results are grouped by term.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CsearchBatchCommand, self).__init__(*args, **kwargs)
+        self._last_search = 'file:* case:yes '
+        self._batch_search = None
+
+    def run(self, terms=None, file=None, case=True):
+        """Runs the batch search command.
+
+        Args:
+            terms: An optional list of regex terms to search for. If not set,
+                the terms are read from an input panel, as a query.
+            file: An optional pattern for files to limit the search to.
+            case: If the search is case sensitive.
+        """
+        if terms:
+            self._run_batch(parser.Search(query=terms, file=file, case=case))
+            return
+        self.window.show_input_panel(
+            'csearch batch', self._last_search, self._on_done,
+            self._on_change, None)
+
+    def _on_search(self, result):
+        self._last_search = result
+        self._run_batch(parser.parse_query(result))
+
+    def _on_job_done(self, job):
+        if job is not self._job or job.cancelled:
+            return
+        self.on_batch_finished(job.result, err=job.error)
+
+    def _run_batch(self, search):
+        self._cancel()
+        self._batch_search = search
+        _next_generation(self.window.id())
+        _shown.pop(self.window.id(), None)
+        view = self._results_view = self._get_results_view()
+        self._write_message(
+            'Searching for {0} terms\n\n'.format(len(search.query)),
+            view=view, erase=True)
+        view.set_status('YetAnotherCodeSearch', 'Searching...')
+        try:
+            s = settings.get_window_settings(self.window)
+            searches = batch.batch_searches(
+                search, settings.get('batch_max_regex_length', 2000))
+            self._submit(_CsearchBatchJob(searches,
+                                          path_csearch=s.csearch_path,
+                                          index_filename=s.index_filename,
+                                          context_lines=settings.get(
+                                              'context_lines', 0),
+                                          group=settings.get(
+                                              'group_duplicates', False)),
+                         searches, s.index_filename)
+        except Exception as e:
+            self._finish_batch(None, err=e)
+
+    def _finish_batch(self, per_term, err=None):
+        self._job = None
+        self._renderer = None
+
+        view = self._get_results_view()
+        view.erase_status('YetAnotherCodeSearch')
+
+        if err:
+            self._print_error(err, None)
+            return
+
+        search = self._batch_search
+        flags = 0
+        if not search.case:
+            flags = sublime.IGNORECASE
+        reg = [r for r in view.find_all(search.query_re(), flags)
+               if not _BATCH_HEADING_RE.match(view.substr(view.line(r)))]
+        view.add_regions('YetAnotherCodeSearch', reg, 'text.csearch', '',
+                         sublime.HIDE_ON_MINIMAP | sublime.DRAW_NO_FILL)
+        _fold_duplicates(view)
+        self.window.focus_view(view)
+
+    def on_batch_finished(self, per_term, err=None):
+        if err:
+            sublime.set_timeout(
+                functools.partial(self._finish_batch, None, err=err))
+            return
+        self._render(engine.format_batch(self._batch_search.query,
+                                         per_term),
+                     functools.partial(self._finish_batch, per_term))
+
+
+class CodeSearchReplaceInResultsCommand(sublime_plugin.WindowCommand):
+    """A window command to replace what the last search matched.
+
+    Only the matched lines of the files in the last results are changed. The
+    changes are shown first, like a diff, and only made once confirmed.
+    """
+
+    def run(self, replacement=None):
+        """Runs the replace command.
+
+        Args:
+            replacement: An optional replacement for the matches, as for
+                re.sub. If not set, it is read from an input panel.
+        """
+        last = _last_results.get(self.window.id())
+        if not last:
+            sublime.status_message('Code Search: no results to replace in')
+            return
+        (search, unused_matches) = last
+        if replacement is not None:
+            self._on_replacement(replacement)
+            return
+        self.window.show_input_panel(
+            'Replace "{0}" with'.format(search.query_re()), '',
+            self._on_replacement, None, None)
+
+    def _on_replacement(self, replacement):
+        # The results could be gone by the time the replacement is entered.
+        last = _last_results.get(self.window.id())
+        if not last:
+            sublime.status_message('Code Search: no results to replace in')
+            return
+        (search, matches) = last
+        try:
+            regex = replace.compile_pattern(search.query_re(), search.case)
+        except Exception as e:
+            sublime.error_message(str(e))
+            return
+        replacement = replacement.encode('utf-8')
+        view = self._get_preview_view()
+        view.set_status('YetAnotherCodeSearch', 'Finding changes...')
+        job = scheduler.get_scheduler().submit(
+            _ReplacePlanJob(matches, regex, replacement),
+            pool=scheduler.RESULTS)
+        job.add_done_callback(functools.partial(self._on_planned, view,
+                                                regex, replacement))
+
+    def _get_preview_view(self):
+        view = next((view for view in self.window.views()
+                     if view.name() == 'Code Search Replace'), None)
+        if not view:
+            view = self.window.new_file()
+            view.set_name('Code Search Replace')
+            view.set_scratch(True)
+            view.settings().set('spell_check', False)
+            view.set_syntax_file('Packages/Diff/Diff.tmLanguage')
+        view.set_read_only(False)
+        view.run_command('select_all')
+        view.run_command('right_delete')
+        view.set_read_only(True)
+        self.window.focus_view(view)
+        return view
+
+    def _on_planned(self, view, regex, replacement, job):
+        # Called from the worker thread.
+        if job.error:
+            sublime.set_timeout(functools.partial(
+                self._on_error, view, job.error))
+            return
+        (edits, errors) = job.result
+        renderer = render.ChunkedRenderer(view, on_done=functools.partial(
+            self._confirm, view, edits, regex, replacement))
+        for text in replace.format_preview(edits, errors):
+            if not renderer.write(text):
+                return
+        renderer.close()
+
+    def _on_error(self, view, err):
+        view.erase_status('YetAnotherCodeSearch')
+        sublime.error_message(str(err))
+
+    def _confirm(self, view, edits, regex, replacement):
+        view.erase_status('YetAnotherCodeSearch')
+        if not edits:
+            return
+        num_changes = sum(len(edit.changes) for edit in edits)
+        if not sublime.ok_cancel_dialog(
+                'Replace {0} lines across {1} files?'.format(num_changes,
+                                                             len(edits)),
+                'Replace'):
+            return
+        view.set_status('YetAnotherCodeSearch', 'Replacing...')
+        job = scheduler.get_scheduler().submit(
+            _ReplaceApplyJob(edits, regex, replacement),
+            pool=scheduler.RESULTS)
+        job.add_done_callback(lambda job: sublime.set_timeout(
+            functools.partial(self._on_applied, view, job)))
+
+    def _on_applied(self, view, job):
+        view.erase_status('YetAnotherCodeSearch')
+        if job.error:
+            sublime.error_message(str(job.error))
+            return
+        (written, errors) = job.result
+        # The files changed, so the results no longer match them.
+        _next_generation(self.window.id())
+        _last_results.pop(self.window.id(), None)
+        _refinements.pop(self.window.id(), None)
+        result_cache = _get_result_cache()
+        if result_cache:
+            result_cache.clear()
+        for results_view in self.window.views():
+            if results_view.name() == 'Code Search Results':
+                results_view.set_status('YetAnotherCodeSearch',
+                                        'Results are out of date')
+        msg = 'Changed {0} files'.format(len(written))
+        if errors:
+            msg += '\n\n' + '\n'.join('{0}: {1}'.format(filename, err)
+                                      for (filename, err) in errors)
+            sublime.error_message(msg)
+        else:
+            sublime.status_message('Code Search: ' + msg)
+
+
+class CodeSearchRefineResultsCommand(sublime_plugin.WindowCommand):
+    """A window command to filter the last results without searching again.
+
+    Refinements stack, so the results can be narrowed a step at a time, and
+    can be undone one at a time. Each refinement works on the results that are
+    already in memory, in a worker thread.
+    """
+
+    def run(self, refinement=None, undo=False):
+        """Runs the refine command.
+
+        Args:
+            refinement: An optional refinement, as for
+                refine.parse_refinement. If not set, it is read from an input
+                panel.
+            undo: If true, drops the last refinement instead.
+        """
+        if not _last_results.get(self.window.id()):
+            sublime.status_message('Code Search: no results to refine')
+            return
+        if undo:
+            self._undo()
+            return
+        if refinement is not None:
+            self._on_refinement(refinement)
+            return
+        self.window.show_input_panel(
+            'Refine results (-pattern to drop, path:pattern for files)', '',
+            self._on_refinement, None, None)
+
+    def _on_refinement(self, text):
+        (search, unused_matches) = _last_results.get(self.window.id())
+        try:
+            refinement = refine.parse_refinement(text, case=search.case)
+            refinement.compile()
+        except (ValueError, re.error) as e:
+            sublime.error_message(str(e))
+            return
+        self._submit(refinement)
+
+    def _undo(self):
+        stack = _refinements.get(self.window.id())
+        if not stack or len(stack) < 2:
+            sublime.status_message('Code Search: no refinements to undo')
+            return
+        self._submit(None)
+
+    def _submit(self, refinement):
+        view = next((view for view in self.window.views()
+                     if view.name() == 'Code Search Results'), None)
+        if not view:
+            return
+        view.set_status('YetAnotherCodeSearch', 'Refining...')
+        (search, matches) = _last_results.get(self.window.id())
+        stack = _refinements.get(self.window.id()) or [(None, matches)]
+        generation = _next_generation(self.window.id())
+        job = scheduler.get_scheduler().submit(_RefineJob(
+            stack, refinement, settings.get('context_lines', 0)),
+            pool=scheduler.RESULTS)
+        job.add_done_callback(functools.partial(self._on_refined, view,
+                                                search, generation))
+
+    def _is_current(self, generation):
+        return _generations.get(self.window.id()) == generation
+
+    def _on_refined(self, view, search, generation, job):
+        # Called from the worker thread. A newer search or refinement makes
+        # these results stale, and they are dropped.
+        if not self._is_current(generation):
+            return
+        if job.error:
+            sublime.set_timeout(functools.partial(
+                self._on_error, view, job.error))
+            return
+        stack = job.result
+        matches = stack[-1][1]
+        header = 'Searching for "{0}"\n'.format(search.query_re())
+        if len(stack) > 1:
+            header += 'Refined to {0}\n'.format(', then '.join(
+                refinement.describe() for (refinement, unused) in stack[1:]))
+        header += '\n'
+        renderer = render.ChunkedRenderer(view, on_done=functools.partial(
+            self._on_rendered, view, search, len(header)))
+        # Registered before checking again, so a newer search either sees it
+        # and stops it, or is seen here.
+        _refine_renderers[self.window.id()] = renderer
+        if not self._is_current(generation):
+            renderer.cancel()
+            return
+        # Runs on the main thread before any of the text is appended.
+        sublime.set_timeout(functools.partial(
+            self._show_refined, view, search, generation, stack))
+        renderer.write(header)
+        texts = (engine.format_results(matches) if matches
+                 else ['No matches left\n'])
+        for text in texts:
+            if not renderer.write(text):
+                return
+        renderer.close()
+
+    def _show_refined(self, view, search, generation, stack):
+        if not self._is_current(generation):
+            return
+        matches = stack[-1][1]
+        _last_results[self.window.id()] = (search, matches)
+        _refinements[self.window.id()] = stack
+        if matches:
+            _shown[self.window.id()] = (search, matches,
+                                        delta.Layout(matches))
+        else:
+            _shown.pop(self.window.id(), None)
+        _erase_view(view)
+
+    def _on_error(self, view, err):
+        view.erase_status('YetAnotherCodeSearch')
+        sublime.error_message(str(err))
+
+    def _on_rendered(self, view, search, header_size):
+        view.erase_status('YetAnotherCodeSearch')
+        flags = 0
+        if not search.case:
+            flags = sublime.IGNORECASE
+        reg = [r for r in view.find_all(search.query_re(), flags)
+               if r.begin() >= header_size]
+        view.add_regions('YetAnotherCodeSearch', reg, 'text.csearch', '',
+                         sublime.HIDE_ON_MINIMAP | sublime.DRAW_NO_FILL)
+        _fold_duplicates(view)
+        self.window.focus_view(view)
+
+
+class CodeSearchRefreshResultsCommand(sublime_plugin.WindowCommand):
+    """A window command to run the search again and show what changed.
+
+    Only the blocks of the files whose results changed are rewritten, so the
+    rest of the results view keeps its place and its highlights. The matches
+    that are new are marked, and the ones that are gone are kept and marked
+    until the next refresh. Refinements are applied to the new results too.
+    """
+
+    def run(self):
+        shown = _shown.get(self.window.id())
+        view = next((view for view in self.window.views()
+                     if view.name() == 'Code Search Results'), None)
+        if not shown or not view:
+            sublime.status_message('Code Search: no results to refresh')
+            return
+        (search, results, layout) = shown
+        _next_generation(self.window.id())
+        stack = _refinements.get(self.window.id()) or []
+        context_lines = settings.get('context_lines', 0)
+        s = settings.get_window_settings(self.window)
+        index_filename = index.index_path(s.index_filename)
+        view.set_status('YetAnotherCodeSearch', 'Refreshing...')
+        runnable = _RefreshJob(
+            _CsearchJob(search, path_csearch=s.csearch_path,
+                        index_filename=s.index_filename,
+                        context_lines=context_lines,
+                        group=settings.get('group_duplicates', False)),
+            results, layout,
+            [refinement for (refinement, unused) in stack[1:]],
+            context_lines)
+        job = scheduler.get_scheduler().submit(
+            runnable,
+            key=('_RefreshJob', index_filename, self.window.id()),
+            pool=scheduler.SEARCH,
+            priority=scheduler.INTERACTIVE,
+            index_filename=index_filename,
+            access=scheduler.READ)
+        job.add_done_callback(lambda job: sublime.set_timeout(
+            functools.partial(self._on_refreshed, view, search, job)))
+
+    def _on_refreshed(self, view, search, job):
+        view.erase_status('YetAnotherCodeSearch')
+        if job.error:
+            sublime.error_message(str(job.error))
+            return
+        if job.cancelled or job.result is None or not view.is_valid():
+            return
+        (stack, results, patch) = job.result
+        start = view.size() - len(patch.old_text)
+        if (start < 0 or view.substr(sublime.Region(start, view.size())) !=
+                patch.old_text):
+            # The view changed since the last run, so it is written again.
+            self.window.run_command('csearch', {
+                'query': stats.normalize_query(search)})
+            return
+
+        top = view.visible_region().begin()
+        shift = sum(len(text) - (end - begin)
+                    for (begin, end, text) in patch.edits
+                    if start + end <= top)
+        view.run_command('code_search_patch_results', {
+            'edits': [(start + begin, start + end, text)
+                      for (begin, end, text) in patch.edits]})
+        if shift:
+            (x, unused_y) = view.viewport_position()
+            view.set_viewport_position(
+                (x, view.text_to_layout(top + shift)[1]), False)
+
+        _last_results[self.window.id()] = (search, results)
+        if len(stack) > 1:
+            _refinements[self.window.id()] = stack
+        else:
+            _refinements.pop(self.window.id(), None)
+        _shown[self.window.id()] = (search, results, patch.layout)
+
+        changed = [sublime.Region(start + begin, start + end)
+                   for (begin, end) in patch.changed]
+        flags = 0
+        if not search.case:
+            flags = sublime.IGNORECASE
+        regions = _outside(view.get_regions('YetAnotherCodeSearch'), changed)
+        for region in changed:
+            regions.extend(_find_in(view, search.query_re(), flags, region))
+        regions.sort()
+        view.add_regions('YetAnotherCodeSearch', regions, 'text.csearch', '',
+                         sublime.HIDE_ON_MINIMAP | sublime.DRAW_NO_FILL)
+        view.add_regions('YetAnotherCodeSearchAdded',
+                         [sublime.Region(start + begin, start + end)
+                          for (begin, end) in patch.added],
+                         'markup.inserted', '',
+                         sublime.HIDE_ON_MINIMAP | sublime.DRAW_NO_OUTLINE)
+        view.add_regions('YetAnotherCodeSearchRemoved',
+                         [sublime.Region(start + begin, start + end)
+                          for (begin, end) in patch.removed],
+                         'markup.deleted', '',
+                         sublime.HIDE_ON_MINIMAP | sublime.DRAW_NO_OUTLINE)
+        _fold_duplicates(view)
+        sublime.status_message(
+            'Code Search: {0} matches added, {1} removed'.format(
+                patch.num_added, patch.num_removed))
+
+
+def _fold_duplicates(view):
+    """Folds the lists of files with the same matches as the file above.
+
+    Each list is folded into the end of the line before it, so it can be
+    unfolded to see the other files.
+    """
+    view.fold([sublime.Region(region.begin() - 1, region.end() - 1)
+               for region in view.find_by_selector('meta.duplicates.csearch')])
+
+
+def _outside(regions, ranges):
+    """Returns the regions that aren't in any of the sorted ranges."""
+    kept = []
+    i = 0
+    for region in regions:
+        while i < len(ranges) and ranges[i].end() < region.begin():
+            i += 1
+        if region.empty():
+            continue
+        if i < len(ranges) and ranges[i].intersects(region):
+            continue
+        kept.append(region)
+    return kept
+
+
+def _find_in(view, pattern, flags, region):
+    """Finds every match of a pattern in a region of the view."""
+    found = []
+    pos = region.begin()
+    while pos < region.end():
+        match = view.find(pattern, pos, flags)
+        if match is None or match.begin() < 0 or match.end() > region.end():
+            break
+        if match.empty():
+            pos = match.end() + 1
+            continue
+        found.append(match)
+        pos = match.end()
+    return found
+
+
+class CodeSearchPatchResultsCommand(sublime_plugin.TextCommand):
+    """A text command to make edits to the read only results view."""
+
+    def run(self, edit, edits):
+        """Makes the edits.
+
+        Args:
+            edits: A list of (begin, end, text) edits, in order and not
+                overlapping, with the offsets from before any of them.
+        """
+        self.view.set_read_only(False)
+        for (begin, end, text) in reversed(edits):
+            self.view.replace(edit, sublime.Region(begin, end), text)
+        self.view.set_read_only(True)
+
+
+class _RefreshJob(object):
+    """Runs a search again and works out what changed, as a scheduler job."""
+
+    def __init__(self, search_job, old_results, old_layout, refinements,
+                 context_lines):
+        """Initializes the _RefreshJob.
+
+        Args:
+            search_job: The _CsearchJob to run the search with.
+            old_results: The list of FileResults that the view shows.
+            old_layout: The delta.Layout that the view shows.
+            refinements: The refine.Refinements to apply to the new results.
+            context_lines: The number of lines of context the results have.
+        """
+        self._search_job = search_job
+        self._old_results = old_results
+        self._old_layout = old_layout
+        self._refinements = refinements
+        self._context_lines = context_lines
+
+    def run(self, job):
+        """Runs the search and compares the results.
+
+        Returns:
+            A (refinements, results, patch) tuple, with the new refinement
+            stack, the new results and the delta.Patch to show them with, or
+            None if cancelled.
+        """
+        results = self._search_job.run(job)
+        if job.cancelled:
+            return None
+        results = results or []
+        stack = [(None, results)]
+        for refinement in self._refinements:
+            results = refine.refine(results, refinement, self._context_lines)
+            stack.append((refinement, results))
+        patch = delta.make_patch(
+            self._old_layout, delta.diff_results(self._old_results, results),
+            results)
+        return (stack, results, patch)
+
+
+def _next_generation(window_id):
+    """Marks the results of a window as being replaced.
+
+    Called from the main thread. A refinement that is still being shown in
+    the window is stopped.
+
+    Args:
+        window_id: The id of the window.
+    Returns:
+        The new generation of the window's results.
+    """
+    _generations[window_id] = _generations.get(window_id, 0) + 1
+    renderer = _refine_renderers.pop(window_id, None)
+    if renderer:
+        renderer.cancel()
+    return _generations[window_id]
+
+
+def _erase_view(view):
+    view.set_read_only(False)
+    view.run_command('select_all')
+    view.run_command('right_delete')
+    view.set_read_only(True)
+
+
+class _RefineJob(object):
+    """Applies or undoes a refinement as a scheduler job."""
+
+    def __init__(self, stack, refinement, context_lines):
+        """Initializes the _RefineJob.
+
+        Args:
+            stack: The list of (refinement, results) pairs for the window. It
+                is not changed; a new list is made.
+            refinement: The refine.Refinement to apply to the newest results,
+                or None to drop the newest refinement.
+            context_lines: The number of lines of context the results have.
+        """
+        self._stack = stack
+        self._refinement = refinement
+        self._context_lines = context_lines
+
+    def run(self, job):
+        """Makes the new stack.
+
+        Returns:
+            The new stack, with the newest results last.
+        """
+        if self._refinement is None:
+            return self._stack[:-1] if len(self._stack) > 1 else self._stack
+        results = refine.refine(self._stack[-1][1], self._refinement,
+                                self._context_lines)
+        return self._stack + [(self._refinement, results)]
+
+
+class _ReplacePlanJob(object):
+    """Finds the changes a replacement would make as a scheduler job."""
+
+    def __init__(self, matches, regex, replacement):
+        self._matches = matches
+        self._regex = regex
+        self._replacement = replacement
+
+    def run(self, job):
+        return replace.plan(self._matches, self._regex, self._replacement)
+
+
+class _ReplaceApplyJob(object):
+    """Makes the changes of a replacement as a scheduler job."""
+
+    def __init__(self, edits, regex, replacement):
+        self._edits = edits
+        self._regex = regex
+        self._replacement = replacement
+
+    def run(self, job):
+        res = replace.apply(self._edits, self._regex, self._replacement)
+        # The daemon's result cache has the results of the old files too.
+        client = settings.get_daemon()
+        if client:
             try:
-                matches = parser.parse_search_output(output)
-            except Exception as e:
-                err = e
-        sublime.set_timeout(
-            functools.partial(self._finish, output, matches, err=err))
-
-
-def fix_windows_output(output):
-    """Normalize file paths in csearch output on windows platform."""
-
-    result = []
-    # replace ntpaths to posix
-    r = re.compile(r"^([^:]*):([^:]*):([^:]*):(.*)$")
-    for line in output.splitlines():
-        m = r.match(line)
-        if m:
-            line = '/{0}{1}:{2}:{3}'.format(m.group(1),
-                                            m.group(2).replace('\\', '/'),
-                                            m.group(3),
-                                            m.group(4))
-        result.append(line)
-    return '\n'.join(result)
-
-
-class _CsearchThread(threading.Thread):
-    """Runs the csearch command in a thread."""
-
-    def __init__(self, search, listener, path_csearch='csearch',
-                 index_filename=None):
-        super(_CsearchThread, self).__init__()
+                client.invalidate()
+            except daemon.DaemonError as e:
+                print('Code Search: could not clear the daemon\'s result '
+                      'cache: {0}'.format(e))
+                settings.forget_daemon()
+        return res
+
+
+class _CsearchJob(object):
+    """Runs the csearch command as a scheduler job.
+
+    Attributes:
+        output: The raw output of the csearch command, if it was run.
+        cached: If the matches came from the result cache.
+        timings: The seconds each phase of the search took, keyed by the
+            phase names in stats.PHASES.
+        index_bytes: The size of the index file, or None if it is missing.
+        findings: What profiling csearch found, to show after the results, or
+            None if it wasn't profiled.
+    """
+
+    def __init__(self, search, path_csearch='csearch', index_filename=None,
+                 result_cache=None, context_lines=0, group=False,
+                 profiler=None):
+        """Initializes the _CsearchJob.
+
+        Args:
+            search: The parser.Search to run.
+            path_csearch: The location of the csearch command.
+            index_filename: An optional csearchindex file location to use.
+            result_cache: An optional cache.ResultCache to look the search up
+                in before running csearch, and to save the results to.
+            context_lines: The number of lines to show around each match.
+            group: If files with the same matches are grouped together.
+            profiler: An optional profiling.Profiler. If set, csearch is
+                always run, and its CPU profile kept.
+        """
+        self.output = None
+        self.cached = False
+        self.timings = {}
+        self.index_bytes = None
+        self.findings = None
         self._search = search
-        self._listener = listener
         self._path_csearch = path_csearch
         self._index_filename = index_filename
+        self._result_cache = result_cache
+        self._context_lines = context_lines
+        self._group = group
+        self._profiler = profiler
 
-    def run(self):
+    def run(self, job):
+        """Runs the search.
+
+        Args:
+            job: The scheduler.Job for this search.
+        Returns:
+            The list of FileResults that were found.
+        """
+        matches = self._search_or_cached(job)
+        if matches and not job.cancelled:
+            # The context comes from the files as they are now, so it isn't
+            # cached with the results.
+            with stats.timed(self.timings, 'context'):
+                context.add_context(matches, self._context_lines)
+        return matches
+
+    def _search_or_cached(self, job):
+        index_filename = index.index_path(self._index_filename)
         try:
-            output = self._do_search()
-            self._listener.on_finished(output)
-        except Exception as e:
-            self._listener.on_finished(None, err=e)
+            self.index_bytes = os.path.getsize(index_filename)
+        except OSError:
+            pass
+        # A profiled search always runs csearch itself.
+        client = None if self._profiler else settings.get_daemon()
+        if client:
+            try:
+                return self._search_in_daemon(client)
+            except daemon.DaemonError as e:
+                print('Code Search: searching without the daemon: '
+                      '{0}'.format(e))
+                settings.forget_daemon()
+        if self._result_cache and not self._profiler:
+            matches = self._result_cache.get(self._search, index_filename,
+                                             group=self._group)
+            if matches is not None:
+                self.cached = True
+                return matches
+        (path_filter, candidates) = pathclass.scope(self._search,
+                                                    index_filename)
+        if candidates == 0:
+            # No indexed file passes the file flags.
+            return []
+        profile = self._profiler.start('csearch') if self._profiler else None
+        with stats.timed(self.timings, 'csearch'):
+            self.output = engine.run_csearch(
+                self._search, path_csearch=self._path_csearch,
+                index_filename=self._index_filename, job=job,
+                profile=profile)
+        if job.cancelled:
+            return None
+        if profile:
+            self.findings = self._compare_brute(job, profile)
+        with stats.timed(self.timings, 'parse'):
+            matches = parser.parse_search_output(self.output,
+                                                 path_filter=path_filter,
+                                                 group=self._group)
+        if self._result_cache:
+            self._result_cache.put(self._search, index_filename, matches)
+        return matches
+
+    def _compare_brute(self, job, profile):
+        brute = None
+        if self._profiler.brute:
+            # The same search, reading every indexed file, shows how much
+            # time the index saves.
+            brute = self._profiler.start('csearch-brute')
+            try:
+                engine.run_csearch(self._search,
+                                   path_csearch=self._path_csearch,
+                                   index_filename=self._index_filename,
+                                   job=job, profile=brute, brute=True)
+            except subprocess.CalledProcessError as e:
+                print('Code Search: -brute search failed: {0}'.format(e))
+                brute = None
+        return profiling.format_findings(profile, brute)
+
+    def _search_in_daemon(self, client):
+        # The daemon has its own result cache, shared by every window. A job
+        # without a result cache, like a refresh, doesn't use it either.
+        (matches, self.cached, timings) = client.search(
+            self._search, index_filename=self._index_filename,
+            path_csearch=self._path_csearch, group=self._group,
+            use_cache=self._result_cache is not None)
+        for phase in ('csearch', 'parse'):
+            if phase in timings:
+                self.timings[phase] = timings[phase]
+        return matches
+
+
+class _WorkerSearchJob(_CsearchJob):
+    """Runs a search in a worker process as a scheduler job.
+
+    The worker runs csearch, parses its output and formats the results, so
+    the plugin host only appends the text to the view. If the worker can't be
+    started, the search runs here as a _CsearchJob.
 
-    def _do_search(self):
-        env = os.environ.copy()
-        if self._index_filename:
-            env['CSEARCHINDEX'] = self._index_filename
+    Attributes:
+        reply: The worker.Reply, if the search ran in the worker.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_WorkerSearchJob, self).__init__(*args, **kwargs)
+        self.reply = None
+
+    def run(self, job):
         try:
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            proc = worker.acquire(settings.get('search_worker_python',
+                                               'python3'))
+        except worker.WorkerError as e:
+            print('Code Search: searching without a worker: {0}'.format(e))
+            return super(_WorkerSearchJob, self).run(job)
+        job.add_cancel_callback(proc.kill)
+        try:
+            reply = proc.search(self._search,
+                                path_csearch=self._path_csearch,
+                                index_filename=self._index_filename,
+                                context_lines=self._context_lines,
+                                result_cache=self._result_cache,
+                                group=self._group)
         except:
-            startupinfo = None
-        cmd = [self._path_csearch, '-n']
-        cmd.extend(self._search.args())
-        proc = subprocess.Popen(cmd,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                env=env, startupinfo=startupinfo)
-        output, stderr = proc.communicate()
-        retcode = proc.poll()
-        if retcode and stderr:
-            error = subprocess.CalledProcessError(retcode, cmd)
-            error.output = stderr
-            raise error
-        u8 = output.decode('utf-8')
-        if platform.system() == 'Windows':
-            return fix_windows_output(u8)
-        return u8
+            proc.kill()
+            if job.cancelled:
+                return None
+            raise
+        try:
+            self.index_bytes = os.path.getsize(
+                index.index_path(self._index_filename))
+        except OSError:
+            pass
+        self.reply = reply
+        self.cached = reply.cached
+        for phase in ('csearch', 'parse', 'context'):
+            if phase in reply.timings:
+                self.timings[phase] = reply.timings[phase]
+        # Once released, the worker can be running another search, which
+        # cancelling this one must not kill.
+        if not job.remove_cancel_callback(proc.kill):
+            # Cancelled as the search finished; the callback kills it.
+            return None
+        worker.release(proc)
+        return reply.results
+
+
+class _CsearchBatchJob(object):
+    """Runs the csearches for a batch as a scheduler job."""
+
+    def __init__(self, searches, path_csearch='csearch', index_filename=None,
+                 context_lines=0, group=False):
+        """Initializes the _CsearchBatchJob.
+
+        Args:
+            searches: A list of parser.Search objects, each ORing together a
+                chunk of the batch's terms.
+            path_csearch: The location of the csearch command.
+            index_filename: An optional csearchindex file location to use.
+            context_lines: The number of lines to show around each match.
+            group: If files with the same matches are grouped together.
+        """
+        self._searches = searches
+        self._path_csearch = path_csearch
+        self._index_filename = index_filename
+        self._context_lines = context_lines
+        self._group = group
+
+    def run(self, job):
+        """Runs the searches.
+
+        Args:
+            job: The scheduler.Job for this batch.
+        Returns:
+            A list with a list of FileResults for each term.
+        """
+        per_term = []
+        index_filename = index.index_path(self._index_filename)
+        for search in self._searches:
+            (path_filter, candidates) = pathclass.scope(search, index_filename)
+            if candidates == 0:
+                per_term.extend([] for unused in search.query)
+                continue
+            output = engine.run_csearch(search,
+                                        path_csearch=self._path_csearch,
+                                        index_filename=self._index_filename,
+                                        job=job)
+            if job.cancelled:
+                return None
+            results = parser.parse_search_output(output,
+                                                 path_filter=path_filter,
+                                                 group=self._group)
+            matcher = batch.TermMatcher(search.query, case=search.case)
+            per_term.extend(batch.demultiplex(results, matcher))
+        for results in per_term:
+            context.add_context(results, self._context_lines)
+        return per_term
+
+
+class CodeSearchShowStatsCommand(sublime_plugin.WindowCommand):
+    """A window command to show how long recent searches took."""
+
+    def run(self):
+        log = _get_stats_log()
+        if not log:
+            sublime.status_message('Code Search: stats are turned off')
+            return
+        view = next((view for view in self.window.views()
+                     if view.name() == 'Code Search Stats'), None)
+        if not view:
+            view = self.window.new_file()
+            view.set_name('Code Search Stats')
+            view.set_scratch(True)
+            view.settings().set('spell_check', False)
+        view.set_read_only(False)
+        view.run_command('select_all')
+        view.run_command('right_delete')
+        view.run_command('append', {'characters': ''.join(
+            stats.format_report(log.records()))})
+        view.set_read_only(True)
+        self.window.focus_view(view)
 
 
 class CodeSearchResultsGoToFileCommand(sublime_plugin.WindowCommand):
@@ -220,12 +1363,16 @@ class CodeSearchResultsGoToFileCommand(sublime_plugin.WindowCommand):
 
         line_nums = view.find_by_selector(
             'constant.numeric.line-number.match.csearch')
+        file_names = view.find_by_selector('entity.name.filename.csearch')
+        if view.match_selector(line.end() - 1,
+                               'entity.name.filename.duplicate.csearch'):
+            self._open_duplicate(view, line, line_nums, file_names)
+            return
         i = bisect.bisect(line_nums, line)
         if not line.contains(line_nums[i]):
             return
         linenum = view.substr(line_nums[i])
 
-        file_names = view.find_by_selector('entity.name.filename.csearch')
         i = bisect.bisect_left(file_names, line)
         if not i:
             return
@@ -241,6 +1388,18 @@ class CodeSearchResultsGoToFileCommand(sublime_plugin.WindowCommand):
                               sublime.ENCODED_POSITION)
         # TODO(pope): Consider highlighting the match
 
+    def _open_duplicate(self, view, line, line_nums, file_names):
+        # A file with the same matches as the file it is listed under is
+        # opened at the first of them.
+        i = bisect.bisect_left(file_names, line)
+        if not i:
+            return
+        linenum = view.substr(
+            line_nums[bisect.bisect(line_nums, file_names[i - 1])])
+        self.window.open_file(
+            '{0}:{1}:0'.format(view.substr(line).strip(), linenum),
+            sublime.ENCODED_POSITION)
+
 
 class DoubleClickCallback(sublime_plugin.WindowCommand):
     def run(self):
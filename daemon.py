@@ -0,0 +1,640 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+
+from YetAnotherCodeSearch import cache
+from YetAnotherCodeSearch import context
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import progress
+from YetAnotherCodeSearch import scheduler
+from YetAnotherCodeSearch import stats
+
+# The version of the protocol. A client only talks to a daemon with the same
+# version.
+PROTOCOL_VERSION = 4
+
+# How often a running index sends its progress, in seconds.
+_PROGRESS_INTERVAL = .25
+
+# How often a line is sent while a request has nothing else to send yet, in
+# seconds, so clients can tell a slow request from a hung daemon.
+_KEEPALIVE_INTERVAL = 1
+
+# How long to wait for a daemon that was just started, in seconds.
+_START_TIMEOUT = 5
+
+
+class DaemonError(Exception):
+    """Exception class when the daemon can't be reached, or fails."""
+    pass
+
+
+def supported():
+    """If the daemon can run on this platform, which needs Unix sockets."""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def _socket_dir():
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'yetanothercodesearch')
+    return os.path.join(tempfile.gettempdir(),
+                        'yetanothercodesearch-{0}'.format(os.getuid()))
+
+
+def default_socket_path():
+    """Returns where the daemon listens unless told otherwise.
+
+    There is one daemon per user, shared by every window and script. The
+    socket is kept in a directory only the user can use, in $XDG_RUNTIME_DIR
+    if it is set and in the temp directory otherwise.
+    """
+    return os.path.join(_socket_dir(), 'daemon.sock')
+
+
+def _make_private_dir(directory):
+    """Creates a directory only this user can use, or checks the existing one.
+
+    Raises:
+        DaemonError: If the directory belongs to another user, is a symlink or
+            can be used by others.
+    """
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        raise DaemonError('Could not create {0}: {1}'.format(directory, e))
+    st = os.lstat(directory)
+    if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or
+            st.st_mode & 0o077):
+        raise DaemonError('{0} can be used by other users'.format(directory))
+
+
+def search_to_json(search):
+    """Turns a parser.Search into a dict that can be written as JSON."""
+    return {'query': search.query,
+            'files': search.files,
+            'exclude_files': search.exclude_files,
+            'langs': search.langs,
+            'kinds': search.kinds,
+            'exclude_kinds': search.exclude_kinds,
+            'case': search.case}
+
+
+def search_from_json(data):
+    """Turns a dict from search_to_json back into a parser.Search."""
+    return parser.Search(query=list(data['query']),
+                         files=data.get('files'),
+                         exclude_files=data.get('exclude_files'),
+                         langs=data.get('langs'),
+                         kinds=data.get('kinds'),
+                         exclude_kinds=data.get('exclude_kinds'),
+                         case=data.get('case', True))
+
+
+def _progress_to_json(state):
+    return {'files': state.files,
+            'bytes': state.bytes,
+            'total_files': state.total_files,
+            'total_bytes': state.total_bytes,
+            'paused': state.paused}
+
+
+class _SearchJob(object):
+    """Runs a search for a client as a scheduler job.
+
+    Attributes:
+        cached: If the results came from the result cache.
+        timings: The seconds each phase of the search took, keyed by the
+            phase names in stats.PHASES.
+    """
+
+    def __init__(self, search, path_csearch, index_filename, result_cache,
+                 context_lines, group=False, use_cache=True):
+        self.cached = False
+        self.timings = {}
+        self._search = search
+        self._path_csearch = path_csearch
+        self._index_filename = index_filename
+        self._result_cache = result_cache
+        self._context_lines = context_lines
+        self._group = group
+        self._use_cache = use_cache
+
+    def run(self, job):
+        index_filename = index.index_path(self._index_filename)
+        results = None
+        # Without the cache, csearch runs again and its results replace the
+        # cached ones.
+        if self._result_cache and self._use_cache:
+            results = self._result_cache.get(self._search, index_filename,
+                                             group=self._group)
+            self.cached = results is not None
+        if results is None:
+            results = engine.search(self._search,
+                                    path_csearch=self._path_csearch,
+                                    index_filename=self._index_filename,
+                                    timings=self.timings, group=self._group)
+            if self._result_cache:
+                self._result_cache.put(self._search, index_filename, results)
+        with stats.timed(self.timings, 'context'):
+            context.add_context(results, self._context_lines)
+        return results
+
+
+class _IndexJob(object):
+    """Runs cindex for the clients that asked, as a scheduler job.
+
+    Attributes:
+        state: The progress.IndexProgress, once cindex has started.
+    """
+
+    def __init__(self, path_cindex, index_filename, paths_to_index,
+                 low_priority):
+        self.state = None
+        self._path_cindex = path_cindex
+        self._index_filename = index_filename
+        self._paths_to_index = paths_to_index
+        self._low_priority = low_priority
+
+    def run(self, job):
+        return engine.run_cindex(path_cindex=self._path_cindex,
+                                 index_filename=self._index_filename,
+                                 paths_to_index=self._paths_to_index,
+                                 job=job,
+                                 low_priority=self._low_priority,
+                                 on_start=self._on_start)
+
+    def _on_start(self, proc, state):
+        self.state = state
+
+
+class Daemon(object):
+    """Serves searches and indexing to every editor window and script.
+
+    The index readers, path bitsets, result cache and indexing queue live in
+    this one process, so every client shares them. A client connects to the
+    Unix socket, writes one JSON request on a line, and reads JSON lines back
+    until one has "done" or "error" set. Requests are:
+
+        {"op": "ping"}
+        {"op": "search", "search": {...}, "index": ..., "csearch": ...,
+         "context": N, "group": false, "cache": true}
+            Replies with a line per file, with "file", "matches" and
+            "context", each a list of [line number, line], and the
+            "duplicates" with the same matches, if they are grouped. With
+            "cache" false, the result cache isn't looked in. Until the
+            search is done, a line with "waiting" is sent every second.
+        {"op": "invalidate"}
+            Empties the result cache, once files were changed.
+        {"op": "index", "index": ..., "cindex": ..., "paths": [...],
+         "low_priority": false}
+            Replies with "progress" lines while cindex runs, and "waiting"
+            lines while it waits to start. A client that asks for the same
+            indexing while it runs shares the run.
+        {"op": "shutdown"}
+
+    Attributes:
+        socket_path: Where the daemon listens.
+    """
+
+    def __init__(self, socket_path, result_cache=None, idle_seconds=0):
+        """Initializes the Daemon.
+
+        Args:
+            socket_path: Where to listen.
+            result_cache: An optional cache.ResultCache for the results.
+            idle_seconds: If set, the daemon exits once no request has come
+                in for this long.
+        """
+        self.socket_path = socket_path
+        self._result_cache = result_cache
+        self._idle_seconds = idle_seconds
+        self._indexing = {}
+        self._lock = threading.Lock()
+        self._last_request = time.monotonic()
+        self._server = None
+
+    def serve_forever(self):
+        """Listens for clients until shut down.
+
+        Raises:
+            DaemonError: If another daemon is already listening.
+        """
+        try:
+            Client(self.socket_path).ping()
+        except DaemonError:
+            pass
+        else:
+            raise DaemonError('A daemon is already listening on {0}'.format(
+                self.socket_path))
+        if os.path.dirname(self.socket_path) == _socket_dir():
+            _make_private_dir(_socket_dir())
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+        # Only this user can connect.
+        umask = os.umask(0o077)
+        try:
+            self._server = _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.owner = self
+        if self._idle_seconds:
+            threading.Thread(target=self._exit_when_idle,
+                             daemon=True).start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        """Stops serving. Must not be called from the serving thread."""
+        if self._server:
+            self._server.shutdown()
+
+    def _exit_when_idle(self):
+        while True:
+            idle = time.monotonic() - self._last_request
+            if idle >= self._idle_seconds:
+                with self._lock:
+                    busy = bool(self._indexing)
+                if not busy:
+                    self.shutdown()
+                    return
+                idle = 0
+            time.sleep(self._idle_seconds - idle)
+
+    def handle(self, request, write):
+        """Serves a request.
+
+        Args:
+            request: The request, as a dict.
+            write: A function to send a reply line, as a dict.
+        """
+        self._last_request = time.monotonic()
+        op = request.get('op')
+        try:
+            if op == 'ping':
+                write({'done': True, 'version': PROTOCOL_VERSION,
+                       'pid': os.getpid()})
+            elif op == 'search':
+                self._search(request, write)
+            elif op == 'index':
+                self._index(request, write)
+            elif op == 'invalidate':
+                if self._result_cache:
+                    self._result_cache.clear()
+                write({'done': True})
+            elif op == 'shutdown':
+                write({'done': True})
+                threading.Thread(target=self.shutdown, daemon=True).start()
+            else:
+                write({'error': 'Unknown request: {0}'.format(op)})
+        except (OSError, IOError):
+            raise  # The client went away.
+        except Exception as e:
+            write({'error': str(e)})
+        self._last_request = time.monotonic()
+
+    def _search(self, request, write):
+        search = search_from_json(request['search'])
+        index_filename = index.index_path(request.get('index'))
+        context_lines = request.get('context', 0)
+        group = request.get('group', False)
+        use_cache = request.get('cache', True)
+        runnable = _SearchJob(search, request.get('csearch', 'csearch'),
+                              request.get('index'), self._result_cache,
+                              context_lines, group=group, use_cache=use_cache)
+        job = scheduler.get_scheduler().submit(
+            runnable,
+            key=('daemon-search', index_filename, tuple(search.args()),
+                 tuple(search.path_flags()), context_lines, group,
+                 use_cache),
+            pool=scheduler.SEARCH,
+            priority=scheduler.INTERACTIVE,
+            index_filename=index_filename,
+            access=scheduler.READ)
+        while not job.wait(_KEEPALIVE_INTERVAL):
+            write({'waiting': True})
+        if job.error:
+            raise job.error
+        for file_results in job.result:
+            write({'file': file_results.filename,
+                   'matches': file_results.matches,
+                   'context': file_results.context,
+                   'duplicates': file_results.duplicates})
+        write({'done': True, 'cached': job.runnable.cached,
+               'timings': job.runnable.timings,
+               'skipped': getattr(job.result, 'skipped', 0)})
+
+    def _index(self, request, write):
+        index_filename = index.index_path(request.get('index'))
+        paths_to_index = request.get('paths') or []
+        key = ('daemon-index', index_filename, tuple(paths_to_index))
+        with self._lock:
+            job = self._indexing.get(key)
+            shared = job is not None
+            if not shared:
+                job = scheduler.get_scheduler().submit(
+                    _IndexJob(request.get('cindex', 'cindex'),
+                              request.get('index'), paths_to_index,
+                              request.get('low_priority', False)),
+                    key=key,
+                    pool=scheduler.INDEX,
+                    priority=scheduler.BACKGROUND,
+                    index_filename=index_filename,
+                    access=(scheduler.REBUILD if paths_to_index
+                            else scheduler.UPDATE))
+                self._indexing[key] = job
+                job.add_done_callback(
+                    lambda job: self._forget_index(key, job))
+        waited = 0
+        while not job.wait(_PROGRESS_INTERVAL):
+            state = job.runnable.state
+            if state is not None:
+                write({'progress': _progress_to_json(state)})
+                continue
+            waited += _PROGRESS_INTERVAL
+            if waited >= _KEEPALIVE_INTERVAL:
+                write({'waiting': True})
+                waited = 0
+        if job.error:
+            raise job.error
+        state = job.result
+        write({'done': True, 'shared': shared,
+               'progress': _progress_to_json(state),
+               'summary': state.summary()})
+
+    def _forget_index(self, key, job):
+        with self._lock:
+            if self._indexing.get(key) is job:
+                del self._indexing[key]
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line.decode('utf-8'))
+        except ValueError:
+            self._write({'error': 'Bad request'})
+            return
+        try:
+            self.server.owner.handle(request, self._write)
+        except (OSError, IOError):
+            pass  # The client went away.
+
+    def _write(self, reply):
+        # Lines that aren't valid UTF-8 are kept as escaped surrogates.
+        self.wfile.write(json.dumps(reply).encode('ascii') + b'\n')
+        self.wfile.flush()
+
+
+class Client(object):
+    """Talks to a Daemon over its Unix socket.
+
+    Only a socket that belongs to the user is connected to, so another user
+    can't stand in for the daemon.
+    """
+
+    def __init__(self, socket_path=None, timeout=None):
+        """Initializes the Client.
+
+        Args:
+            socket_path: Where the daemon listens. Defaults to
+                default_socket_path().
+            timeout: An optional number of seconds to wait for each reply.
+                The daemon sends a line at least every second while it
+                works, so this only runs out if it hangs.
+        """
+        self.socket_path = socket_path or default_socket_path()
+        self._timeout = timeout
+
+    def _request(self, request):
+        """Sends a request and reads the replies.
+
+        Yields:
+            Each reply, as a dict, up to and including the last.
+        Raises:
+            DaemonError: If the daemon can't be reached, or replies with an
+                error.
+        """
+        if not supported():
+            raise DaemonError('Unix sockets are not supported here')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            try:
+                if os.stat(self.socket_path).st_uid != os.getuid():
+                    raise DaemonError('{0} belongs to another user'.format(
+                        self.socket_path))
+                sock.connect(self.socket_path)
+                sock.sendall(json.dumps(request).encode('ascii') + b'\n')
+                replies = sock.makefile('rb')
+            except (OSError, IOError) as e:
+                raise DaemonError('Could not reach the daemon at {0}: '
+                                  '{1}'.format(self.socket_path, e))
+            while True:
+                try:
+                    line = replies.readline()
+                except (OSError, IOError) as e:
+                    raise DaemonError('Lost the daemon: {0}'.format(e))
+                if not line:
+                    raise DaemonError('The daemon hung up')
+                reply = json.loads(line.decode('ascii'))
+                if 'error' in reply:
+                    raise DaemonError(reply['error'])
+                if reply.get('waiting'):
+                    continue
+                yield reply
+                if reply.get('done'):
+                    return
+        finally:
+            sock.close()
+
+    def ping(self):
+        """Checks that the daemon is up.
+
+        Returns:
+            The process id of the daemon.
+        Raises:
+            DaemonError: If the daemon can't be reached, or talks a different
+                protocol.
+        """
+        for reply in self._request({'op': 'ping'}):
+            if reply.get('version') != PROTOCOL_VERSION:
+                raise DaemonError('The daemon talks protocol {0}, not '
+                                  '{1}'.format(reply.get('version'),
+                                               PROTOCOL_VERSION))
+            return reply.get('pid')
+
+    def search(self, search, index_filename=None, path_csearch='csearch',
+               context_lines=0, group=False, use_cache=True):
+        """Runs a search in the daemon.
+
+        Args:
+            search: The parser.Search to run.
+            index_filename: An optional csearchindex file location to use.
+            path_csearch: The location of the csearch command.
+            context_lines: The number of lines to add around each match.
+            group: If files with the same matches are grouped together.
+            use_cache: If the results can come from the daemon's result
+                cache.
+        Returns:
+            A (results, cached, timings) tuple, with the list of
+            parser.FileResults, if they came from the daemon's result cache,
+            and the seconds each phase took in the daemon.
+        Raises:
+            DaemonError: If the daemon can't be reached, or the search failed.
+        """
+        results = parser.SearchResults()
+        for reply in self._request({'op': 'search',
+                                    'search': search_to_json(search),
+                                    'index': index_filename,
+                                    'csearch': path_csearch,
+                                    'context': context_lines,
+                                    'group': group,
+                                    'cache': use_cache}):
+            if reply.get('done'):
+                results.skipped = reply.get('skipped', 0)
+                return (results, reply.get('cached', False),
+                        reply.get('timings', {}))
+            results.append(parser.FileResults(
+                reply['file'],
+                [(linenum, line) for (linenum, line) in reply['matches']],
+                context=[(linenum, line)
+                         for (linenum, line) in reply.get('context', [])],
+                duplicates=reply.get('duplicates')))
+
+    def index(self, index_filename=None, path_cindex='cindex',
+              paths_to_index=None, low_priority=False, on_progress=None):
+        """Runs cindex in the daemon, or joins the same run if it is going.
+
+        Args:
+            index_filename: An optional csearchindex file location to use.
+            path_cindex: The location of the cindex command.
+            paths_to_index: An optional list of paths to index instead of the
+                current ones.
+            low_priority: If cindex should run with a low priority.
+            on_progress: An optional callback, given a progress.IndexProgress
+                as it is updated.
+        Returns:
+            A description of the finished indexing.
+        Raises:
+            DaemonError: If the daemon can't be reached, or cindex failed.
+        """
+        state = progress.IndexProgress()
+        for reply in self._request({'op': 'index',
+                                    'index': index_filename,
+                                    'cindex': path_cindex,
+                                    'paths': paths_to_index or [],
+                                    'low_priority': low_priority}):
+            for (name, value) in reply.get('progress', {}).items():
+                setattr(state, name, value)
+            if reply.get('done'):
+                return reply['summary']
+            if on_progress:
+                on_progress(state)
+
+    def invalidate(self):
+        """Empties the daemon's result cache, once files were changed."""
+        for unused_reply in self._request({'op': 'invalidate'}):
+            pass
+
+    def shutdown(self):
+        """Stops the daemon."""
+        for unused_reply in self._request({'op': 'shutdown'}):
+            pass
+
+
+def start(python, socket_path=None, cache_dir=None, cache_mb=64,
+          idle_minutes=0, log_filename=None, timeout=None):
+    """Starts a daemon in the background, unless one is already up.
+
+    Args:
+        python: The Python 3 command to run the daemon with.
+        socket_path: Where the daemon listens. Defaults to
+            default_socket_path().
+        cache_dir: An optional directory for the daemon's result cache.
+        cache_mb: The size of the result cache, in megabytes.
+        idle_minutes: If set, the daemon exits after this long without
+            requests.
+        log_filename: An optional file to write the daemon's output to.
+        timeout: An optional number of seconds the Client waits for each
+            reply.
+    Returns:
+        A Client for the daemon.
+    Raises:
+        DaemonError: If the daemon didn't come up.
+    """
+    client = Client(socket_path, timeout=timeout)
+    try:
+        client.ping()
+        return client
+    except DaemonError:
+        pass
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    cmd = [python, '-m', os.path.basename(package_dir), 'daemon',
+           '--socket', client.socket_path,
+           '--idle-minutes', str(idle_minutes)]
+    if cache_dir:
+        cmd.extend(['--cache-dir', cache_dir, '--cache-mb', str(cache_mb)])
+    log = subprocess.DEVNULL
+    if log_filename:
+        log = open(log_filename, 'ab')
+    try:
+        subprocess.Popen(cmd, cwd=os.path.dirname(package_dir),
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                         start_new_session=True)
+    except OSError as e:
+        raise DaemonError('Could not start the daemon: {0}'.format(e))
+    finally:
+        if log_filename:
+            log.close()
+    deadline = time.monotonic() + _START_TIMEOUT
+    while True:
+        try:
+            client.ping()
+            return client
+        except DaemonError:
+            if time.monotonic() > deadline:
+                raise
+        time.sleep(.05)
+
+
+def serve(socket_path=None, cache_dir=None, cache_mb=64, idle_minutes=0):
+    """Runs a daemon in this process until it is shut down.
+
+    Args:
+        socket_path: Where to listen. Defaults to default_socket_path().
+        cache_dir: An optional directory for the result cache.
+        cache_mb: The size of the result cache, in megabytes.
+        idle_minutes: If set, exit after this long without requests.
+    Raises:
+        DaemonError: If another daemon is already listening.
+    """
+    result_cache = None
+    if cache_dir and cache_mb:
+        result_cache = cache.ResultCache(cache_dir, cache_mb * 1024 * 1024)
+    Daemon(socket_path or default_socket_path(), result_cache=result_cache,
+           idle_seconds=idle_minutes * 60).serve_forever()
@@ -0,0 +1,320 @@
+import collections
+
+from YetAnotherCodeSearch import parser
+
+# The ways a file's results can change between two runs of a search.
+SAME, ADDED, REMOVED, CHANGED = range(4)
+
+# How the lines of a file's results are written, as in
+# parser.FileResults.__str__, and how the lines that are gone are written.
+_MATCH_TMPL = '{0: >5}: {1}'
+_CONTEXT_TMPL = '{0: >5}  {1}'
+_REMOVED_TMPL = '{0: >5}- {1}'
+_DUPLICATES_TMPL = '  (same matches in {0} more files)'
+_DUPLICATE_TMPL = '      {0}'
+
+
+def block(file_results):
+    """Returns a file's results as engine.format_results writes them."""
+    return str(file_results) + '\n\n'
+
+
+def footer(results, added=None, removed=None):
+    """Returns the line engine.format_results writes after the results.
+
+    Args:
+        results: The list of parser.FileResults, or a parser.SearchResults
+            with the number of output lines that were skipped.
+        added: The number of matches that are new, if known.
+        removed: The number of matches that are gone, if known.
+    """
+    (num_files, num_matches) = parser.count_results(results)
+    text = '{0} matches across {1} files'.format(num_matches, num_files)
+    if num_files > len(results):
+        text += ' ({0} identical files collapsed)'.format(
+            num_files - len(results))
+    skipped = getattr(results, 'skipped', 0)
+    if skipped:
+        text += ' ({0} unreadable output lines skipped)'.format(skipped)
+    if added is not None:
+        text += ' ({0} added, {1} removed since the last run)'.format(
+            added, removed)
+    return text + '\n'
+
+
+class Layout(object):
+    """The text of the results shown in the results view.
+
+    The results are shown as a block of text per file, followed by a footer.
+    The blocks of results that were written by engine.format_results are only
+    worked out when they are first used.
+    """
+
+    def __init__(self, results=None, blocks=None, footer_text=None):
+        """Initializes the Layout.
+
+        Args:
+            results: The list of parser.FileResults that were written by
+                engine.format_results.
+            blocks: A list of (filename, text) pairs, instead of results.
+            footer_text: The footer, with blocks.
+        """
+        self._results = results
+        self._blocks = blocks
+        self._footer = footer_text
+
+    @property
+    def blocks(self):
+        if self._blocks is None:
+            self._blocks = [(r.filename, block(r)) for r in self._results]
+        return self._blocks
+
+    @property
+    def footer(self):
+        if self._footer is None:
+            self._footer = footer(self._results)
+        return self._footer
+
+    def text(self):
+        """Returns the text of the whole layout."""
+        return ''.join(text for (unused, text) in self.blocks) + self.footer
+
+
+class FileDelta(object):
+    """How a file's results changed between two runs.
+
+    Attributes:
+        filename: The file the results are for.
+        old: The parser.FileResults of the last run, or None.
+        new: The parser.FileResults of this run, or None.
+    """
+
+    def __init__(self, filename, old, new):
+        self.filename = filename
+        self.old = old
+        self.new = new
+
+    @property
+    def status(self):
+        if self.old is None:
+            return ADDED
+        if self.new is None:
+            return REMOVED
+        if (self.old.matches == self.new.matches and
+                self.old.context == self.new.context and
+                self.old.duplicates == self.new.duplicates):
+            return SAME
+        return CHANGED
+
+    def changed_lines(self):
+        """Works out which matched lines are new, and which are gone.
+
+        Lines are compared by their text, so lines that only moved because
+        lines were added above them aren't counted as changed.
+
+        Returns:
+            An (added, removed) tuple. added is the set of the new line
+            numbers that didn't match before, and removed is the list of
+            (line number, line) pairs that no longer match.
+        """
+        old = self.old.matches if self.old else []
+        new = self.new.matches if self.new else []
+        counts = collections.Counter(line for (unused, line) in old)
+        added = set()
+        for (linenum, line) in new:
+            if counts[line]:
+                counts[line] -= 1
+            else:
+                added.add(linenum)
+        removed = []
+        for (linenum, line) in reversed(old):
+            if counts[line]:
+                counts[line] -= 1
+                removed.append((linenum, line))
+        removed.reverse()
+        return (added, removed)
+
+
+def diff_results(old, new):
+    """Compares two runs of a search, file by file.
+
+    The files are matched up by name with a dict, in a single pass over each
+    run, so this takes linear time.
+
+    Args:
+        old: The list of parser.FileResults from the last run.
+        new: The list of parser.FileResults from this run.
+    Yields:
+        A FileDelta for every file in either run. The files are in the order
+        of the new run, with files that are gone where they were in the last
+        run.
+    """
+    new_names = set(r.filename for r in new)
+    old_by_name = dict((r.filename, r) for r in old)
+    old_iter = iter(old)
+    for new_results in new:
+        old_results = old_by_name.pop(new_results.filename, None)
+        if old_results is not None:
+            # The files that are gone, up to this one.
+            for r in old_iter:
+                if r.filename == new_results.filename:
+                    break
+                if r.filename not in new_names:
+                    old_by_name.pop(r.filename, None)
+                    yield FileDelta(r.filename, r, None)
+        yield FileDelta(new_results.filename, old_results, new_results)
+    for r in old_iter:
+        if r.filename in old_by_name:
+            yield FileDelta(r.filename, r, None)
+
+
+def format_delta(file_delta):
+    """Formats a file's results, with the lines that changed marked.
+
+    The lines that no longer match are shown where they were, with a "-"
+    instead of a ":" after the line number, so they can't be opened like a
+    match.
+
+    Args:
+        file_delta: The FileDelta.
+    Returns:
+        A (text, added, removed) tuple. added and removed are lists of the
+        (start, end) offsets in text of the lines that are new, and gone.
+    """
+    if file_delta.status == SAME:
+        return (block(file_delta.new), [], [])
+    (added_linenums, removed) = file_delta.changed_lines()
+    # Each row is (line number, line, kind), where kind is 'added',
+    # 'removed' or None.
+    rows = []
+    if file_delta.new is not None:
+        rows.extend((linenum, _MATCH_TMPL.format(linenum, line),
+                     'added' if linenum in added_linenums else None)
+                    for (linenum, line) in file_delta.new.matches)
+        rows.extend((linenum, _CONTEXT_TMPL.format(linenum, line), None)
+                    for (linenum, line) in file_delta.new.context)
+    rows.extend((linenum, _REMOVED_TMPL.format(linenum, line), 'removed')
+                for (linenum, line) in removed)
+    # A stable sort keeps a removed line after a new line of the same number.
+    rows.sort(key=lambda row: row[0])
+    text = [file_delta.filename + ':\n']
+    offset = len(text[0])
+    added = []
+    removed_offsets = []
+    prev_linenum = None
+    for (linenum, line, kind) in rows:
+        if prev_linenum is not None and linenum > prev_linenum + 1:
+            gap = '{0: >5}\n'.format('.' * len(str(prev_linenum)))
+            text.append(gap)
+            offset += len(gap)
+        if kind == 'added':
+            added.append((offset, offset + len(line)))
+        elif kind == 'removed':
+            removed_offsets.append((offset, offset + len(line)))
+        text.append(line + '\n')
+        offset += len(line) + 1
+        prev_linenum = linenum
+    if file_delta.new is not None and file_delta.new.duplicates:
+        text.append(_DUPLICATES_TMPL.format(len(file_delta.new.duplicates)) +
+                    '\n')
+        text.extend(_DUPLICATE_TMPL.format(name) + '\n'
+                    for name in file_delta.new.duplicates)
+    text.append('\n')
+    return (''.join(text), added, removed_offsets)
+
+
+class Patch(object):
+    """The edits that turn the results view from one run into the next.
+
+    Offsets are relative to the start of the first block, since the header
+    before it isn't part of the Layout.
+
+    Attributes:
+        old_text: The text of the old Layout, to check the view still shows
+            it.
+        edits: A list of (begin, end, text) edits, in the old offsets, in
+            order and not overlapping.
+        layout: The Layout after the edits.
+        changed: The (begin, end) ranges of the new text, in the new offsets.
+        added: The (begin, end) ranges of the lines that are new.
+        removed: The (begin, end) ranges of the lines that are gone.
+        num_added: The number of matched lines that are new.
+        num_removed: The number of matched lines that are gone.
+    """
+
+    def __init__(self, old_text):
+        self.old_text = old_text
+        self.edits = []
+        self.layout = None
+        self.changed = []
+        self.added = []
+        self.removed = []
+        self.num_added = 0
+        self.num_removed = 0
+
+    def _edit(self, begin, end, text):
+        if self.edits and self.edits[-1][1] == begin:
+            # Joins edits that touch, so the view is changed fewer times.
+            (prev_begin, unused, prev_text) = self.edits[-1]
+            self.edits[-1] = (prev_begin, end, prev_text + text)
+        elif begin != end or text:
+            self.edits.append((begin, end, text))
+
+
+def make_patch(old_layout, deltas, results):
+    """Works out how to change the results view to show a new run.
+
+    The blocks of files whose results didn't change are left alone, so only
+    the blocks that changed are written.
+
+    Args:
+        old_layout: The Layout the view shows.
+        deltas: The FileDeltas from diff_results.
+        results: The list of parser.FileResults of the new run.
+    Returns:
+        A Patch.
+    """
+    patch = Patch(old_layout.text())
+    old_blocks = old_layout.blocks
+    old_starts = []
+    offset = 0
+    for (unused, text) in old_blocks:
+        old_starts.append(offset)
+        offset += len(text)
+    old_end = offset
+    old_index = dict((name, i) for (i, (name, unused))
+                     in enumerate(old_blocks))
+
+    new_blocks = []
+    new_offset = 0
+    pos = 0  # The next old block that hasn't been kept or dropped.
+    for file_delta in deltas:
+        (text, added, removed) = format_delta(file_delta)
+        patch.num_added += len(added)
+        patch.num_removed += len(removed)
+        i = old_index.get(file_delta.filename)
+        if i is not None and i >= pos:
+            # The old blocks before this one are gone.
+            patch._edit(old_starts[pos], old_starts[i], '')
+            if old_blocks[i][1] != text:
+                patch._edit(old_starts[i],
+                            old_starts[i] + len(old_blocks[i][1]), text)
+                patch.changed.append((new_offset, new_offset + len(text)))
+            pos = i + 1
+        else:
+            at = old_starts[pos] if pos < len(old_blocks) else old_end
+            patch._edit(at, at, text)
+            patch.changed.append((new_offset, new_offset + len(text)))
+        patch.added.extend((new_offset + b, new_offset + e)
+                           for (b, e) in added)
+        patch.removed.extend((new_offset + b, new_offset + e)
+                             for (b, e) in removed)
+        new_blocks.append((file_delta.filename, text))
+        new_offset += len(text)
+    if pos < len(old_blocks):
+        patch._edit(old_starts[pos], old_end, '')
+    footer_text = footer(results, patch.num_added, patch.num_removed)
+    patch._edit(old_end, old_end + len(old_layout.footer), footer_text)
+    patch.changed.append((new_offset, new_offset + len(footer_text)))
+    patch.layout = Layout(blocks=new_blocks, footer_text=footer_text)
+    return patch
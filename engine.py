@@ -0,0 +1,300 @@
+import concurrent.futures
+import os
+import platform
+import re
+import subprocess
+import time
+
+from YetAnotherCodeSearch import background
+from YetAnotherCodeSearch import context
+from YetAnotherCodeSearch import delta
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import pathclass
+from YetAnotherCodeSearch import progress
+from YetAnotherCodeSearch import stats
+
+# Matches a verbose file name line, with the size of the file in bytes and
+# its number of trigrams, like:
+#     2014/10/11 19:26:32 3556 1018 file.name
+_FILE_LINE_RE = re.compile(
+    br'^\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2} (\d+) \d+ ', re.MULTILINE)
+
+# How often to report progress while indexing, in seconds.
+_PROGRESS_INTERVAL = .1
+
+# How much cindex output to read at a time.
+_READ_SIZE = 64 * 1024
+
+
+def _environ(index_filename):
+    env = os.environ.copy()
+    if index_filename:
+        env['CSEARCHINDEX'] = index_filename
+    return env
+
+
+def _popen(cmd, env, stderr, low_priority=False):
+    try:
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    except:
+        startupinfo = None
+    kwargs = {}
+    if low_priority:
+        cmd = background.low_priority_command(cmd)
+        kwargs = background.low_priority_popen_args()
+    return subprocess.Popen(cmd,
+                            stdout=subprocess.PIPE,
+                            stderr=stderr,
+                            env=env, startupinfo=startupinfo, **kwargs)
+
+
+def fix_windows_output(output):
+    """Normalize file paths in csearch output on windows platform.
+
+    Args:
+        output: The csearch output as bytes.
+    Returns:
+        The output with posix file paths.
+    """
+
+    result = []
+    # replace ntpaths to posix
+    r = re.compile(br"^([^:]*):([^:]*):([^:]*):(.*)$")
+    for line in output.splitlines():
+        m = r.match(line)
+        if m:
+            line = b''.join((b'/', m.group(1),
+                             m.group(2).replace(b'\\', b'/'), b':',
+                             m.group(3), b':', m.group(4)))
+        result.append(line)
+    return b'\n'.join(result)
+
+
+def run_csearch(search, path_csearch='csearch', index_filename=None,
+                job=None, profile=None, brute=False):
+    """Runs csearch for the search.
+
+    Args:
+        search: The parser.Search to run.
+        path_csearch: The location of the csearch command.
+        index_filename: An optional csearchindex file location to use.
+        job: An optional scheduler.Job running the search. csearch is killed
+            if the job is cancelled.
+        profile: An optional profiling.Run. csearch writes its CPU profile
+            for it, and the command, environment and time taken are recorded.
+        brute: If every indexed file is searched, instead of the files the
+            index says could match.
+    Returns:
+        The output of the csearch command as bytes. It's left undecoded, since
+        the matched lines can be in any encoding.
+    Raises:
+        subprocess.CalledProcessError: If csearch failed.
+    """
+    cmd = [path_csearch, '-n']
+    if brute:
+        cmd.append('-brute')
+    if profile:
+        cmd.extend(profile.args())
+    cmd.extend(search.args())
+    env = _environ(index_filename)
+    started = time.perf_counter()
+    proc = _popen(cmd, env, subprocess.PIPE)
+    if job:
+        job.add_cancel_callback(proc.kill)
+    output, stderr = proc.communicate()
+    retcode = proc.poll()
+    if profile:
+        profile.finish(proc.args, env, retcode,
+                       time.perf_counter() - started,
+                       lines=output.count(b'\n'), brute=brute)
+    if retcode and stderr and not (job and job.cancelled):
+        error = subprocess.CalledProcessError(retcode, cmd)
+        error.output = stderr
+        raise error
+    if platform.system() == 'Windows':
+        return fix_windows_output(output)
+    return output
+
+
+def search(query, path_csearch='csearch', index_filename=None,
+           context_lines=0, timings=None, group=False, profile=None):
+    """Runs a search and parses its results.
+
+    Args:
+        query: The query string, as typed into the search panel, or a
+            parser.Search.
+        path_csearch: The location of the csearch command.
+        index_filename: An optional csearchindex file location to use.
+        context_lines: The number of lines to add around each match.
+        timings: An optional dict to store the seconds each phase of the
+            search took in, keyed by the phase names in stats.PHASES.
+        group: If files with the same matches are grouped together.
+        profile: An optional profiling.Run to profile csearch for.
+    Returns:
+        A list of parser.FileResults.
+    Raises:
+        subprocess.CalledProcessError: If csearch failed.
+    """
+    if not isinstance(query, parser.Search):
+        query = parser.parse_query(query)
+    with stats.timed(timings, 'total'):
+        (path_filter, candidates) = pathclass.scope(
+            query, index.index_path(index_filename))
+        if candidates == 0:
+            return []
+        with stats.timed(timings, 'csearch'):
+            output = run_csearch(query, path_csearch=path_csearch,
+                                 index_filename=index_filename,
+                                 profile=profile)
+        with stats.timed(timings, 'parse'):
+            results = parser.parse_search_output(output,
+                                                 path_filter=path_filter,
+                                                 group=group)
+        with stats.timed(timings, 'context'):
+            context.add_context(results, context_lines)
+    return results
+
+
+def _index_paths(index_filename):
+    try:
+        reader = index.IndexReader(index.index_path(index_filename))
+    except (OSError, IOError, ValueError, index.CorruptIndexError):
+        return []
+    try:
+        return reader.paths()
+    finally:
+        # cindex replaces the file, so it can't be left mapped.
+        reader.close()
+
+
+def _file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+def run_cindex(path_cindex='cindex', index_filename=None, paths_to_index=None,
+               on_progress=None, job=None, low_priority=False, on_start=None,
+               profile=None):
+    """Runs cindex to update or create an index.
+
+    While cindex runs, the files it will read are counted in the background,
+    so that the progress can show how much is left.
+
+    Args:
+        path_cindex: The location of the cindex command.
+        index_filename: An optional csearchindex file location to use.
+        paths_to_index: An optional list of paths to index. If supplied,
+            replaces the paths currently used in the csearchindex file.
+        on_progress: An optional callback, called every so often with the
+            progress.IndexProgress.
+        job: An optional scheduler.Job running the indexing. cindex is killed
+            if the job is cancelled.
+        low_priority: If cindex should run with a low CPU and IO priority.
+        on_start: An optional callback, called with the subprocess.Popen for
+            cindex and the progress.IndexProgress once cindex starts.
+        profile: An optional profiling.Run. cindex writes its CPU profile
+            for it, and the command, environment and time taken are recorded.
+    Returns:
+        The final progress.IndexProgress.
+    Raises:
+        subprocess.CalledProcessError: If cindex failed.
+    """
+    cmd = [path_cindex, '-verbose']
+    if profile:
+        cmd.extend(profile.args())
+    if paths_to_index:
+        cmd.append('-reset')
+        cmd.extend(paths_to_index)
+    filename = index.index_path(index_filename)
+    state = progress.IndexProgress(index_bytes_before=_file_size(filename))
+    walk_paths = paths_to_index or _index_paths(index_filename)
+    # Indexing doesn't wait for the count if it takes longer.
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        totals = executor.submit(progress.count_files, walk_paths)
+        env = _environ(index_filename)
+        started = time.perf_counter()
+        proc = _popen(cmd, env, subprocess.STDOUT, low_priority=low_priority)
+        if job:
+            job.add_cancel_callback(proc.kill)
+        if on_start:
+            on_start(proc, state)
+        fd = proc.stdout.fileno()
+        last_report = time.perf_counter()
+        pending = b''
+        while True:
+            chunk = os.read(fd, _READ_SIZE)
+            if not chunk:
+                break
+            data = pending + chunk
+            end = data.rfind(b'\n') + 1
+            pending = data[end:]
+            for m in _FILE_LINE_RE.finditer(data, 0, end):
+                state.files += 1
+                state.bytes += int(m.group(1))
+            # Report every so often on what was processed.
+            now = time.perf_counter()
+            if now - last_report > _PROGRESS_INTERVAL:
+                last_report = now
+                if state.total_files is None and totals.done():
+                    (state.total_files, state.total_bytes) = totals.result()
+                if on_progress:
+                    on_progress(state)
+        proc.stdout.close()
+        retcode = proc.wait()
+        if profile:
+            profile.finish(proc.args, env, retcode,
+                           time.perf_counter() - started, files=state.files,
+                           bytes=state.bytes)
+        if totals.done() and state.total_files is None:
+            (state.total_files, state.total_bytes) = totals.result()
+    finally:
+        executor.shutdown(wait=False)
+    if retcode and not (job and job.cancelled):
+        raise subprocess.CalledProcessError(retcode, cmd)
+    state.index_bytes_after = _file_size(filename)
+    if on_progress:
+        on_progress(state)
+    return state
+
+
+def format_results(matches):
+    """Formats search results a file at a time.
+
+    Args:
+        matches: A non-empty list of FileResults.
+    Yields:
+        The strings that make up the results.
+    """
+    for file_results in matches:
+        yield str(file_results)
+        yield '\n\n'
+    yield delta.footer(matches)
+
+
+def format_batch(terms, per_term):
+    """Formats batch search results a file at a time, grouped by term.
+
+    Args:
+        terms: The list of terms that were searched for.
+        per_term: A list with a list of FileResults for each term.
+    Yields:
+        The strings that make up the results.
+    """
+    all_files = set()
+    total_matches = 0
+    for (term, results) in zip(terms, per_term):
+        num_matches = sum(len(r.matches) for r in results)
+        total_matches += num_matches
+        all_files.update(r.filename for r in results)
+        yield 'Term "{0}": {1} matches across {2} files\n\n'.format(
+            term, num_matches, len(results))
+        for file_results in results:
+            yield str(file_results)
+            yield '\n\n'
+    yield '{0} terms, {1} matches across {2} files\n'.format(
+        len(terms), total_matches, len(all_files))
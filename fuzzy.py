@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+
+_SEGMENT_STARTS = '/\\_-. '
+
+# Turns a string of 0 and 1 bytes into ASCII digits for int(x, 2).
+_BINARY_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+_NONZERO_BYTE_RE = re.compile(b'[^\x00]+')
+
+# How many paths to score between checks of the deadline.
+_DEADLINE_CHECK = 256
+
+
+def _bitset(flags):
+    """Packs an iterable of booleans into an int, with bit i set if flag i is.
+
+    The booleans are turned into bytes and then parsed as a binary number, so
+    the loop over the flags stays in C.
+    """
+    digits = bytes(flags).translate(_BINARY_DIGITS)
+    return int(digits[::-1] or b'0', 2)
+
+
+def _bits(bitset):
+    """Yields the positions of the set bits, lowest first."""
+    data = bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')
+    for m in _NONZERO_BYTE_RE.finditer(data):
+        for (n, byte) in enumerate(m.group(), m.start()):
+            while byte:
+                low = byte & -byte
+                yield n * 8 + low.bit_length() - 1
+                byte ^= low
+
+
+def _basename(path):
+    return path[max(path.rfind('/'), path.rfind('\\')) + 1:]
+
+
+def score(query, path):
+    """Scores how well the path matches the query as a subsequence.
+
+    A path that contains the query as a substring always scores higher than
+    one that only contains the characters of the query in order.
+
+    Args:
+        query: The lower case query.
+        path: The lower case path.
+    Returns:
+        An integer score, higher is better, or None if the characters in the
+        query do not appear in order in the path.
+    """
+    basename_start = max(path.rfind('/'), path.rfind('\\')) + 1
+    total = 0
+    substr = path.rfind(query)
+    if substr >= 0:
+        total += 12 * len(query)
+        if substr >= basename_start:
+            total += 12 * len(query)
+        if substr == 0 or path[substr - 1] in _SEGMENT_STARTS:
+            total += 12
+    else:
+        # Match from the end, so the match leans towards the basename.
+        pos = len(path)
+        prev = pos + 1
+        for c in reversed(query):
+            pos = path.rfind(c, 0, pos)
+            if pos < 0:
+                return None
+            if pos == prev - 1:
+                total += 5
+            if pos == 0 or path[pos - 1] in _SEGMENT_STARTS:
+                total += 4
+            if pos >= basename_start:
+                total += 2
+            prev = pos
+    # Prefer shorter paths when everything else is equal.
+    return total * 1024 - min(len(path), 1023)
+
+
+class _Scan(object):
+    """The progress of scoring the candidates for one query."""
+
+    def __init__(self, query, candidates):
+        self.query = query
+        self.candidates = candidates
+        # Each match is packed into one int, score * len(paths) + index, so
+        # that a million of them are not a million tuples for the garbage
+        # collector to walk.
+        self.matched = []
+        self.complete = False
+        # The best matches so far, enough for the largest limit asked for.
+        self.best = []
+        self.limit = 0
+
+
+class PathMatcher(object):
+    """Fuzzy matches a query against a large, fixed list of paths.
+
+    For a character, a bitset of the paths that contain it can be computed
+    with index_chars. A path can only match if it contains every character of
+    the query, so the candidates for a query are the AND of a few bitsets, and
+    only those get scored. The same bitsets are kept for the basenames, and
+    paths whose basename has every character are scored first since they
+    score the highest. That way a timeout still leaves the likely best paths.
+
+    Computing the bitsets takes a while for a large list, so it is meant to
+    happen in the background while the matcher is already in use. Characters
+    without a bitset yet are just left out of the candidate filter; score
+    still checks every character.
+
+    A query that runs out of time is resumed by the next top call for it, and
+    the matches of the last complete query are kept so that typing more
+    characters only rescans the previous matches.
+
+    Attributes:
+        paths: The list of paths being matched against.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self._lower = [p.lower() for p in paths]
+        self._basenames = None
+        self._char_bits = {}
+        self._basename_char_bits = {}
+        self._index_lock = threading.Lock()
+        self._scan = None
+        self._last_complete = None
+
+    def missing_chars(self, query):
+        """Gets the characters of the query that have no bitset yet.
+
+        Args:
+            query: The fuzzy query.
+        Returns:
+            A sorted string of the characters.
+        """
+        return ''.join(sorted(set(query.lower()) - set(self._char_bits)))
+
+    def index_chars(self, chars):
+        """Computes the bitsets for the characters that do not have them yet.
+
+        Args:
+            chars: A string of the characters to compute bitsets for.
+        """
+        with self._index_lock:
+            if self._basenames is None:
+                self._basenames = [_basename(p) for p in self._lower]
+            for c in chars.lower():
+                if c in self._char_bits:
+                    continue
+                # The basename bitset goes first, so a character with a path
+                # bitset always has both.
+                self._basename_char_bits[c] = _bitset(
+                    map(str.__contains__, self._basenames,
+                        itertools.repeat(c)))
+                self._char_bits[c] = _bitset(
+                    map(str.__contains__, self._lower, itertools.repeat(c)))
+
+    def _candidates(self, query):
+        last = self._last_complete
+        if last is not None and query.startswith(last.query):
+            n = len(self.paths)
+            return iter(sorted(m % n for m in last.matched))
+        bitset = basename_bitset = (1 << len(self.paths)) - 1
+        for c in set(query):
+            bits = self._char_bits.get(c)
+            if bits is not None:
+                bitset &= bits
+                basename_bitset &= self._basename_char_bits[c]
+        return itertools.chain(_bits(bitset & basename_bitset),
+                               _bits(bitset & ~basename_bitset))
+
+    def top(self, query, limit=50, timeout=None):
+        """Finds the best matching paths for the query.
+
+        Args:
+            query: The fuzzy query to match.
+            limit: The maximum number of paths to return.
+            timeout: An optional number of seconds to spend scoring. When it
+                runs out, the best paths found so far are returned, and the
+                next call for the same query carries on from there.
+        Returns:
+            A tuple of the matched paths, best first, and a boolean for if all
+            of the paths were considered.
+        """
+        query = query.lower().strip()
+        if not query:
+            return (self.paths[:limit], True)
+        deadline = None
+        if timeout is not None:
+            deadline = time.perf_counter() + timeout
+        scan = self._scan
+        if scan is None or scan.query != query:
+            scan = self._scan = _Scan(query, self._candidates(query))
+        if limit > scan.limit:
+            scan.best = heapq.nlargest(limit, scan.matched)
+            scan.limit = limit
+        lower = self._lower
+        n = len(self.paths)
+        start = len(scan.matched)
+        while not scan.complete:
+            chunk = list(itertools.islice(scan.candidates, _DEADLINE_CHECK))
+            for i in chunk:
+                s = score(query, lower[i])
+                if s is not None:
+                    scan.matched.append(s * n + i)
+            if len(chunk) < _DEADLINE_CHECK:
+                scan.complete = True
+                self._last_complete = scan
+            elif deadline is not None and time.perf_counter() > deadline:
+                break
+        scan.best = heapq.nlargest(
+            scan.limit, itertools.chain(scan.best, scan.matched[start:]))
+        return ([self.paths[m % n] for m in scan.best[:limit]],
+                scan.complete)
@@ -0,0 +1,75 @@
+import sublime
+import sublime_plugin
+
+import functools
+
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import settings
+from YetAnotherCodeSearch import symbols
+
+# The most symbols to show in the quick panel.
+_MAX_RESULTS = 200
+
+
+class CodeSearchGoToSymbolCommand(sublime_plugin.WindowCommand):
+    """A window command to jump to a definition in the symbol table."""
+
+    def run(self, symbol=None):
+        """Runs the go to symbol command.
+
+        Args:
+            symbol: An optional symbol name, or the start of one. If not set,
+                it is read from an input panel.
+        """
+        try:
+            s = settings.get_window_settings(self.window)
+        except Exception as e:
+            sublime.error_message(str(e))
+            return
+        self._table_filename = symbols.table_path(
+            index.index_path(s.index_filename))
+        if symbol:
+            self._on_done(symbol)
+            return
+        self.window.show_input_panel('Go to symbol', self._word(),
+                                     self._on_done, None, None)
+
+    def _word(self):
+        view = self.window.active_view()
+        if not view or not view.sel():
+            return ''
+        return view.substr(view.word(view.sel()[0])).strip()
+
+    def _on_done(self, prefix):
+        if not prefix:
+            return
+        try:
+            table = symbols.open_table(self._table_filename)
+        except (OSError, IOError, ValueError, symbols.CorruptTableError):
+            sublime.error_message(
+                'No symbol table found. Turn on the "symbol_index" setting '
+                'and refresh the index.')
+            return
+        found = table.lookup(prefix, limit=_MAX_RESULTS)
+        if not found:
+            sublime.status_message(
+                'Code Search: no symbols start with "{0}"'.format(prefix))
+            return
+        exact = [symbol for symbol in found if symbol.name == prefix]
+        if len(exact) == 1:
+            self._open(exact[0])
+            return
+        items = [['{0} ({1})'.format(symbol.name, symbol.kind),
+                  '{0}:{1}'.format(symbol.path, symbol.line)]
+                 for symbol in found]
+        self.window.show_quick_panel(
+            items, functools.partial(self._on_select, found))
+
+    def _on_select(self, found, i):
+        if i < 0:
+            return
+        self._open(found[i])
+
+    def _open(self, symbol):
+        self.window.open_file('{0}:{1}'.format(symbol.path, symbol.line),
+                              sublime.ENCODED_POSITION)
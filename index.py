@@ -0,0 +1,239 @@
+import mmap
+import os
+import platform
+import struct
+import threading
+
+# The layout of a csearchindex file, as written by cindex, is:
+#
+#     "csearch index 1\n"
+#     list of paths, each NUL terminated, followed by an empty path
+#     list of names, each NUL terminated
+#     list of posting lists
+#     name index: a uint32 offset into the name list per name, plus an end
+#         offset
+#     posting list index: a (trigram, file count, offset) entry per trigram
+#     trailer: uint32 offsets of the sections above, then "\ncsearch trailr\n"
+#
+# All integers are big endian.
+_MAGIC = b'csearch index 1\n'
+_TRAILER_MAGIC = b'\ncsearch trailr\n'
+_POST_ENTRY_SIZE = 3 + 4 + 4
+
+# Windows can't rename a file over one that is memory mapped, so cindex would
+# fail to replace an index that is open. There, the parts of the file that
+# are used are read into memory instead.
+_USE_MMAP = platform.system() != 'Windows'
+
+
+def index_path(index_filename=None):
+    """Resolves the location of the csearchindex file.
+
+    This mirrors how csearch and cindex pick the file when it is not set in
+    the project.
+
+    Args:
+        index_filename: An optional csearchindex file location.
+    Returns:
+        The path to the csearchindex file that will be used.
+    """
+    if index_filename:
+        return index_filename
+    if os.environ.get('CSEARCHINDEX'):
+        return os.environ['CSEARCHINDEX']
+    return os.path.join(os.path.expanduser('~'), '.csearchindex')
+
+
+def index_generation(index_filename):
+    """Returns a value that changes whenever the index file is rewritten.
+
+    Args:
+        index_filename: The csearchindex file location.
+    Returns:
+        A (mtime, size) tuple, or None if the file does not exist.
+    """
+    try:
+        st = os.stat(index_filename)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+class CorruptIndexError(Exception):
+    """Exception class when the index file can't be read."""
+    pass
+
+
+class IndexReader(object):
+    """Read-only, memory mapped view of a csearchindex file.
+
+    The file is split in two: the head, with the paths and names, and the
+    tail, with the name and posting list indexes. The posting lists between
+    them are never read. Where the file isn't memory mapped, only the head
+    and tail are read into memory.
+
+    Attributes:
+        filename: The location of the index file.
+        generation: The (mtime, size) of the file when it was opened.
+        num_names: The number of indexed files.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._mmap = None
+        with open(filename, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self.generation = (st.st_mtime, st.st_size)
+            trailer_size = 5 * 4 + len(_TRAILER_MAGIC)
+            if st.st_size < len(_MAGIC) + trailer_size:
+                raise CorruptIndexError(
+                    '{0} is not a csearchindex'.format(filename))
+            if _USE_MMAP:
+                self._mmap = mmap.mmap(f.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+                magic = self._mmap[:len(_MAGIC)]
+                trailer = self._mmap[-trailer_size:]
+            else:
+                magic = f.read(len(_MAGIC))
+                f.seek(-trailer_size, os.SEEK_END)
+                trailer = f.read()
+            if (magic != _MAGIC or
+                    trailer[-len(_TRAILER_MAGIC):] != _TRAILER_MAGIC):
+                self.close()
+                raise CorruptIndexError(
+                    '{0} is not a csearchindex'.format(filename))
+            (self._path_data, self._name_data, self._post_data,
+             self._name_index, self._post_index) = struct.unpack_from(
+                 '>5I', trailer)
+            if self._mmap is not None:
+                self._head = self._tail = self._mmap
+                self._tail_start = 0
+            else:
+                f.seek(0)
+                self._head = f.read(self._post_data)
+                f.seek(self._name_index)
+                self._tail = f.read()
+                self._tail_start = self._name_index
+        n = st.st_size - trailer_size
+        self.num_names = (self._post_index - self._name_index) // 4 - 1
+        self._num_post = (n - self._post_index) // _POST_ENTRY_SIZE
+
+    def close(self):
+        """Releases the memory map, if the file is mapped."""
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def paths(self):
+        """Returns the list of root paths that were indexed."""
+        data = self._head[self._path_data:self._name_data]
+        return [_decode(p) for p in data.split(b'\0') if p]
+
+    def name(self, fileid):
+        """Returns the file name for a file id.
+
+        Args:
+            fileid: The index of the file, from 0 to num_names.
+        """
+        return _decode(self.name_bytes(fileid))
+
+    def name_bytes(self, fileid):
+        """Returns the file name for a file id, as it is stored."""
+        (start, end) = struct.unpack_from(
+            '>2I', self._tail,
+            self._name_index - self._tail_start + 4 * fileid)
+        start += self._name_data
+        end += self._name_data - 1  # Drop the NUL terminator.
+        return self._head[start:end]
+
+    def names(self, decode=True):
+        """Returns the list of all indexed file names, in file id order.
+
+        Args:
+            decode: If false, the names are left as the bytes stored.
+        """
+        data = self._head[self._name_data:self._post_data]
+        names = data.split(b'\0')[:self.num_names]
+        if not decode:
+            return names
+        return [_decode(name) for name in names]
+
+    def posting_count(self, trigram):
+        """Returns the number of files that contain the trigram.
+
+        Args:
+            trigram: The trigram as 3 bytes.
+        """
+        lo = 0
+        hi = self._num_post
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off = self._post_index - self._tail_start + mid * _POST_ENTRY_SIZE
+            tri = self._tail[off:off + 3]
+            if tri < trigram:
+                lo = mid + 1
+            elif tri > trigram:
+                hi = mid
+            else:
+                return struct.unpack_from('>I', self._tail, off + 3)[0]
+        return 0
+
+
+def _decode(name):
+    return name.decode('utf-8', 'surrogateescape')
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def open_index(index_filename):
+    """Opens the index file, reusing an open reader when it is unchanged.
+
+    Args:
+        index_filename: The csearchindex file location.
+    Returns:
+        An IndexReader for the current generation of the file.
+    Raises:
+        CorruptIndexError: If the file is not a csearchindex.
+        OSError: If the file can't be read.
+    """
+    with _readers_lock:
+        reader = _readers.get(index_filename)
+        if reader and reader.generation == index_generation(index_filename):
+            return reader
+        # Old readers are left for the garbage collector, since other threads
+        # may still be reading from them.
+        reader = IndexReader(index_filename)
+        _readers[index_filename] = reader
+        return reader
+
+
+def prefetch(filename, max_bytes=None, chunk_size=1024 * 1024):
+    """Pulls a file into the operating system's page cache.
+
+    On systems with posix_fadvise the kernel reads the file ahead in the
+    background. Elsewhere, the file is read through once.
+
+    Args:
+        filename: The file to prefetch.
+        max_bytes: An optional limit on how much of the file to prefetch.
+        chunk_size: How much to read at a time, when reading through.
+    Returns:
+        The number of bytes prefetched.
+    Raises:
+        OSError: If the file can't be read.
+    """
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if max_bytes is not None:
+            size = min(size, max_bytes)
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+            return size
+        remaining = size
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+        return size - remaining
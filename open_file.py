@@ -0,0 +1,202 @@
+import sublime
+import sublime_plugin
+
+import functools
+import os
+import threading
+import time
+
+from YetAnotherCodeSearch import fuzzy
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import scheduler
+from YetAnotherCodeSearch import settings
+
+# Time to spend matching at once, to stay within a frame.
+_TYPING_TIMEOUT = 0.012
+
+# Milliseconds to give back to the UI between rounds of matching.
+_TICK_DELAY = 10
+
+# Total time to spend ranking before showing the quick panel. A query that
+# matches too many files to rank in time shows the best of those it got to.
+_RANK_TIMEOUT = 0.5
+
+# The most files to show in the quick panel.
+_MAX_RESULTS = 200
+
+# The number of files shown in the status bar while typing.
+_PREVIEW_RESULTS = 3
+
+# The characters to build matcher bitsets for as soon as the file list is
+# loaded. Others are built when a query uses them.
+_PREBUILT_CHARS = 'etaoinsrlcdmuphgbfywkvxzjq_.-0123456789'
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def _get_matcher(index_filename):
+    """Gets the PathMatcher for the files in the index.
+
+    The matcher is built once per index file and kept until the file changes.
+
+    Args:
+        index_filename: The csearchindex file location.
+    Returns:
+        A fuzzy.PathMatcher over the indexed file names.
+    """
+    generation = index.index_generation(index_filename)
+    with _matchers_lock:
+        cached = _matchers.get(index_filename)
+        if cached and cached[0] == generation:
+            return cached[1]
+    reader = index.open_index(index_filename)
+    matcher = fuzzy.PathMatcher(reader.names())
+    with _matchers_lock:
+        _matchers[index_filename] = (reader.generation, matcher)
+    return matcher
+
+
+class _PathMatcherJob(object):
+    """Loads the PathMatcher for an index as a scheduler job."""
+
+    def __init__(self, index_filename):
+        self._index_filename = index_filename
+
+    def run(self, job):
+        return _get_matcher(self._index_filename)
+
+
+class _IndexCharsJob(object):
+    """Builds the bitsets of a PathMatcher as a background job."""
+
+    def __init__(self, matcher, chars):
+        self._matcher = matcher
+        self._chars = chars
+
+    def run(self, job):
+        for c in self._chars:
+            if job.cancelled:
+                return
+            self._matcher.index_chars(c)
+
+
+class CodeSearchOpenFileCommand(sublime_plugin.WindowCommand):
+    """A window command to open any file in the csearchindex."""
+
+    def run(self):
+        """Runs the open file command."""
+        try:
+            s = settings.get_window_settings(self.window)
+        except Exception as e:
+            sublime.error_message(str(e))
+            return
+        self._matcher = None
+        self._query = None
+        self._typed = None
+        self._set_status('loading file list...')
+        self._index_filename = index.index_path(s.index_filename)
+        job = scheduler.get_scheduler().submit(
+            _PathMatcherJob(self._index_filename),
+            key=('open_file', self._index_filename),
+            index_filename=self._index_filename)
+        job.add_done_callback(lambda job: sublime.set_timeout(
+            functools.partial(self._on_loaded, job.result, err=job.error)))
+        self.window.show_input_panel('Open file', '', self._on_done,
+                                     self._on_change, self._on_cancel)
+
+    def _set_status(self, msg):
+        view = self.window.active_view()
+        if view:
+            view.set_status('YetAnotherCodeSearch', 'Open file: ' + msg)
+
+    def _erase_status(self):
+        view = self.window.active_view()
+        if view:
+            view.erase_status('YetAnotherCodeSearch')
+
+    def _on_loaded(self, matcher, err=None):
+        if err:
+            self._erase_status()
+            sublime.error_message(str(err))
+            return
+        self._matcher = matcher
+        self._index_chars(_PREBUILT_CHARS)
+        if self._query is not None:
+            self._show_results(self._query)
+        elif self._typed:
+            self._on_change(self._typed)
+        else:
+            self._set_status('{0} files'.format(len(matcher.paths)))
+
+    def _index_chars(self, chars):
+        chars = self._matcher.missing_chars(chars)
+        if chars:
+            scheduler.get_scheduler().submit(
+                _IndexCharsJob(self._matcher, chars),
+                key=('open_file_chars', self._index_filename, chars),
+                priority=scheduler.BACKGROUND)
+
+    def _on_change(self, query):
+        self._typed = query
+        if not self._matcher or not query:
+            return
+        self._index_chars(''.join(
+            set(query.lower()).difference(_PREBUILT_CHARS)))
+        self._refine(query)
+
+    def _refine(self, query):
+        """Previews the best matches, carrying on in later frames."""
+        if query != self._typed or self._query is not None:
+            return
+        (paths, complete) = self._matcher.top(query, limit=_PREVIEW_RESULTS,
+                                              timeout=_TYPING_TIMEOUT)
+        if paths:
+            msg = paths[0]
+            if len(paths) > 1:
+                msg += ' (also {0})'.format(
+                    ', '.join(os.path.basename(p) for p in paths[1:]))
+            self._set_status(msg + ('' if complete else ' ...'))
+        else:
+            self._set_status('no matches' if complete else '...')
+        if not complete:
+            sublime.set_timeout(functools.partial(self._refine, query),
+                                _TICK_DELAY)
+
+    def _on_done(self, query):
+        self._query = query
+        if self._matcher:
+            self._show_results(query)
+
+    def _on_cancel(self):
+        self._typed = None
+        self._erase_status()
+
+    def _show_results(self, query):
+        self._rank(query, time.perf_counter() + _RANK_TIMEOUT)
+
+    def _rank(self, query, deadline):
+        """Ranks the files a frame at a time, then shows the quick panel."""
+        (paths, complete) = self._matcher.top(query, limit=_MAX_RESULTS,
+                                              timeout=_TYPING_TIMEOUT)
+        if not complete and time.perf_counter() < deadline:
+            self._set_status('ranking...')
+            sublime.set_timeout(
+                functools.partial(self._rank, query, deadline), _TICK_DELAY)
+            return
+        self._erase_status()
+        if not paths:
+            sublime.status_message('Open file: no matches')
+            return
+        if not complete:
+            sublime.status_message(
+                'Open file: too many matches to rank them all, '
+                'showing the best found')
+        items = [[os.path.basename(p), p] for p in paths]
+        self.window.show_quick_panel(
+            items, functools.partial(self._on_select, paths))
+
+    def _on_select(self, paths, i):
+        if i < 0:
+            return
+        self.window.open_file(paths[i])
@@ -1,9 +1,78 @@
 from itertools import zip_longest
 import math
+import re
 import string
 
 _EOF = '\0'
 
+# The encoding to try for a file's matched lines when they aren't UTF-8.
+_FALLBACK_ENCODING = 'cp1252'
+
+# How the other files with the same matches are written after a file's
+# results. They are indented past the line numbers, so the syntax can tell
+# them apart from the lines.
+_DUPLICATES_TMPL = '  (same matches in {0} more files)'
+_DUPLICATE_TMPL = '      {0}'
+
+# The flags a search can have, as "flag:value".
+_FLAGS = ('file', '-file', 'lang', 'kind', '-kind', 'case')
+
+# The kinds of files that kind: knows, by the patterns of their paths.
+_KINDS = {
+    'test': (r'(^|[\\/])(tests?|__tests__|spec)[\\/]|_test\.[^\\/]*$|'
+             r'(^|[\\/])test_[^\\/]*$|\.(spec|test)\.[^\\/]*$|'
+             r'Tests?\.[^\\/]*$'),
+    'vendor': (r'(^|[\\/])(vendor|third_party|node_modules|'
+               r'bower_components)[\\/]'),
+    'generated': (r'(^|[\\/])(gen|generated|build|dist)[\\/]|\.pb\.[^\\/]*$|'
+                  r'_pb2(_grpc)?\.py$|\.min\.(js|css)$|\.g\.dart$|'
+                  r'\.designer\.cs$'),
+}
+
+# The file extensions of each language that lang: knows.
+_LANGUAGES = {
+    'c': ('c', 'h'),
+    'cpp': ('cc', 'cpp', 'cxx', 'c++', 'h', 'hh', 'hpp', 'hxx', 'inl'),
+    'csharp': ('cs',),
+    'css': ('css', 'less', 'sass', 'scss'),
+    'go': ('go',),
+    'html': ('htm', 'html'),
+    'java': ('java',),
+    'javascript': ('js', 'jsx', 'mjs'),
+    'json': ('json',),
+    'kotlin': ('kt', 'kts'),
+    'lua': ('lua',),
+    'markdown': ('md', 'markdown'),
+    'objc': ('h', 'm', 'mm'),
+    'perl': ('pl', 'pm'),
+    'php': ('php',),
+    'proto': ('proto',),
+    'python': ('py', 'pyi', 'pyw'),
+    'ruby': ('rb',),
+    'rust': ('rs',),
+    'scala': ('scala',),
+    'shell': ('sh', 'bash', 'zsh'),
+    'sql': ('sql',),
+    'swift': ('swift',),
+    'typescript': ('ts', 'tsx'),
+    'xml': ('xml',),
+    'yaml': ('yaml', 'yml'),
+}
+
+# Other names for the languages.
+_LANGUAGE_ALIASES = {
+    'c++': 'cpp',
+    'cs': 'csharp',
+    'js': 'javascript',
+    'md': 'markdown',
+    'py': 'python',
+    'rb': 'ruby',
+    'rs': 'rust',
+    'sh': 'shell',
+    'ts': 'typescript',
+    'yml': 'yaml',
+}
+
 
 def _search_text_state(lex):
     """Lex state for handling text.
@@ -27,7 +96,7 @@ def _search_text_state(lex):
         if lex.peek() == ':':
             # TODO(pope): Remove this out of here and make this the job of the
             # parser.
-            if lex.curstr().lower() in ('file', 'case'):
+            if lex.curstr().lower() in _FLAGS:
                 lex.emit('flag')
                 lex.next()  # advance the ':'.
                 lex.ignore()  # drop it.
@@ -274,20 +343,95 @@ class Search(object):
 
     Used to organize phrases to search and for while files.
 
+    csearch can only limit a search to the files matching one pattern, so the
+    first file: pattern, or the lang: extensions if there is none, is passed
+    to it and the rest of the file flags are checked by path_filter while the
+    output is parsed.
+
     Attributes:
         query: A list of search terms to hunt down.
-        file: A string pattern for files to limit the search to.
+        files: A list of string patterns that the files searched must all
+            match.
+        exclude_files: A list of string patterns for files to leave out.
+        langs: A list of the languages, as keys of _LANGUAGES, of the files
+            to limit the search to.
+        kinds: A list of the kinds of files, as keys of _KINDS, that the files
+            searched must all be.
+        exclude_kinds: A list of the kinds of files to leave out.
         case: A boolean value for if the search is case sensitive or not.
     """
 
-    def __init__(self, query=None, file=None, case=True):
+    def __init__(self, query=None, file=None, case=True, files=None,
+                 exclude_files=None, langs=None, kinds=None,
+                 exclude_kinds=None):
         if query:
             self.query = query
         else:
             self.query = []
-        self.file = file
+        self.files = list(files or [])
+        if file:
+            self.files.insert(0, file)
+        self.exclude_files = list(exclude_files or [])
+        self.langs = list(langs or [])
+        self.kinds = list(kinds or [])
+        self.exclude_kinds = list(exclude_kinds or [])
         self.case = case
 
+    @property
+    def file(self):
+        """The first pattern of files to limit the search to, or None."""
+        return self.files[0] if self.files else None
+
+    def path_flags(self):
+        """Returns the file flags as they would be typed, like "lang:go"."""
+        return (['file:{0}'.format(f) for f in self.files] +
+                ['-file:{0}'.format(f) for f in self.exclude_files] +
+                ['lang:{0}'.format(lang) for lang in self.langs] +
+                ['kind:{0}'.format(kind) for kind in self.kinds] +
+                ['-kind:{0}'.format(kind) for kind in self.exclude_kinds])
+
+    def lang_extensions(self):
+        """Returns the set of file extensions the lang: flags allow."""
+        extensions = set()
+        for lang in self.langs:
+            extensions.update(_LANGUAGES[lang])
+        return extensions
+
+    def _lang_re(self):
+        if not self.langs:
+            return None
+        return r'\.({0})$'.format('|'.join(
+            re.escape(ext) for ext in sorted(self.lang_extensions())))
+
+    def _csearch_file_re(self):
+        if self.files:
+            return self.files[0]
+        return self._lang_re()
+
+    def path_filter(self):
+        """Makes a check for the file flags that csearch can't do itself.
+
+        Returns:
+            A function that takes a file name and returns if its matches are
+            kept, or None if csearch already leaves out every other file.
+        Raises:
+            re.error: If a file pattern isn't a valid regex.
+        """
+        include = [re.compile(f) for f in self.files[1:]]
+        if self.files and self.langs:
+            include.append(re.compile(self._lang_re()))
+        include.extend(re.compile(_KINDS[kind]) for kind in self.kinds)
+        exclude = [re.compile(f) for f in self.exclude_files]
+        exclude.extend(re.compile(_KINDS[kind])
+                       for kind in self.exclude_kinds)
+        if not include and not exclude:
+            return None
+
+        def keep(filename):
+            return (all(r.search(filename) for r in include) and
+                    not any(r.search(filename) for r in exclude))
+        return keep
+
     def args(self):
         """Prints out the command arguments for csearch.
 
@@ -299,8 +443,9 @@ class Search(object):
         if not self.query:
             raise AttributeError('No query to run')
         args = []
-        if self.file:
-            args.extend(['-f', self.file])
+        file_re = self._csearch_file_re()
+        if file_re:
+            args.extend(['-f', file_re])
         if not self.case:
             args.append('-i')
         args.append(self.query_re())
@@ -315,7 +460,11 @@ class Search(object):
     def __eq__(self, other):
         return (isinstance(other, self.__class__) and
                 self.query == other.query and
-                self.file == other.file and
+                self.files == other.files and
+                self.exclude_files == other.exclude_files and
+                self.langs == other.langs and
+                self.kinds == other.kinds and
+                self.exclude_kinds == other.exclude_kinds and
                 self.case == other.case)
 
     def __ne__(self, other):
@@ -326,10 +475,11 @@ class Search(object):
         return 42
 
     def __repr__(self):
-        return '{0}(query={1}; file={2}; case={3})'.format(self.__class__,
-                                                           self.query,
-                                                           self.file,
-                                                           self.case)
+        msg = ('{0}(query={1}; files={2}; exclude_files={3}; langs={4}; '
+               'kinds={5}; exclude_kinds={6}; case={7})')
+        return msg.format(self.__class__, self.query, self.files,
+                          self.exclude_files, self.langs, self.kinds,
+                          self.exclude_kinds, self.case)
 
 
 def parse_query(text):
@@ -341,6 +491,10 @@ def parse_query(text):
         ^.*someRegex.*$
         MyClass file:.*c$
         myclass case:no
+        MyClass lang:go -file:_test\\.go$
+        MyClass -kind:test -kind:vendor
+
+    file: can be given more than once, and each pattern must match.
 
     Args:
         text: The search query string to parse.
@@ -369,7 +523,24 @@ def parse_query(text):
                         res.case = True
                 elif flag == 'file':
                     if value != '*':
-                        res.file = value
+                        res.files.append(value)
+                elif flag == '-file':
+                    if value != '*':
+                        res.exclude_files.append(value)
+                elif flag == 'lang':
+                    lang = value.lower()
+                    lang = _LANGUAGE_ALIASES.get(lang, lang)
+                    if lang not in _LANGUAGES:
+                        raise Exception('Unknown language: {0}'.format(value))
+                    if lang not in res.langs:
+                        res.langs.append(lang)
+                elif flag in ('kind', '-kind'):
+                    kind = value.lower()
+                    if kind not in _KINDS:
+                        raise Exception('Unknown kind: {0}'.format(value))
+                    kinds = res.kinds if flag == 'kind' else res.exclude_kinds
+                    if kind not in kinds:
+                        kinds.append(kind)
                 else:
                     raise Exception('Unsupported flag value: {0}'.format(flag))
             else:
@@ -384,22 +555,78 @@ class FileResults(object):
 
     Used to organize all of the matched lines for a particular file.
 
+    The filename and lines can be given as the raw bytes from csearch, in
+    which case they are only decoded when they are first used.
+
     Attributes:
         filename: The location of the file.
         matches: A list of tuple pairs where the first item is the line number,
             and the second value is the matched line.
+        context: A list of line number and line pairs for the lines around the
+            matches, not counting the matched lines.
+        duplicates: A list of the other files with exactly the same matches,
+            which are shown once, with this file.
     """
 
-    def __init__(self, filename, matches):
+    def __init__(self, filename, matches, context=None, duplicates=None):
         assert matches
         assert filename
-        self.filename = filename
-        self.matches = matches
+        self._filename = filename
+        self._matches = matches
+        self._context = context or []
+        self._duplicates = duplicates or []
+
+    @property
+    def filename(self):
+        if isinstance(self._filename, bytes):
+            self._filename = decode_filename(self._filename)
+        return self._filename
+
+    @filename.setter
+    def filename(self, filename):
+        self._filename = filename
+
+    @property
+    def matches(self):
+        if isinstance(self._matches[0][1], bytes):
+            self._matches = _decode_matches(self._matches)
+        return self._matches
+
+    @matches.setter
+    def matches(self, matches):
+        self._matches = matches
+
+    @property
+    def context(self):
+        if self._context and isinstance(self._context[0][1], bytes):
+            self._context = _decode_matches(self._context)
+        return self._context
+
+    @context.setter
+    def context(self, context):
+        self._context = context
+
+    @property
+    def duplicates(self):
+        if any(isinstance(name, bytes) for name in self._duplicates):
+            self._duplicates = [
+                decode_filename(name) if isinstance(name, bytes) else name
+                for name in self._duplicates]
+        return self._duplicates
+
+    @duplicates.setter
+    def duplicates(self, duplicates):
+        self._duplicates = duplicates
+
+    def linenums(self):
+        """Gets the matched line numbers, without decoding the lines."""
+        return [linenum for (linenum, unused_line) in self._matches]
 
     def __eq__(self, other):
         return (isinstance(other, self.__class__) and
                 self.filename == other.filename and
-                self.matches == other.matches)
+                self.matches == other.matches and
+                self.duplicates == other.duplicates)
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -413,22 +640,228 @@ class FileResults(object):
         return msg.format(self.__class__, self.filename, self.matches)
 
     def __str__(self):
-        line_tmpl = '{0: >5}: {1}'
+        match_tmpl = '{0: >5}: {1}'
+        context_tmpl = '{0: >5}  {1}'
+        lines = [(linenum, match_tmpl, line)
+                 for (linenum, line) in self.matches]
+        if self.context:
+            lines.extend((linenum, context_tmpl, line)
+                         for (linenum, line) in self.context)
+            lines.sort(key=lambda line: line[0])
         res_matches = []
-        matches = iter(self.matches)
-        (linenum, line) = next(matches)
-        res_matches.append(line_tmpl.format(linenum, line))
-        prev_linenum = linenum
-        for (linenum, line) in matches:
-            if prev_linenum + 1 != linenum:
+        prev_linenum = None
+        for (linenum, tmpl, line) in lines:
+            if prev_linenum is not None and prev_linenum + 1 != linenum:
                 num_digits = int(math.log10(prev_linenum)) + 1
                 res_matches.append('{0: >5}'.format('.' * num_digits))
-            res_matches.append(line_tmpl.format(linenum, line))
+            res_matches.append(tmpl.format(linenum, line))
             prev_linenum = linenum
+        if self.duplicates:
+            res_matches.append(_DUPLICATES_TMPL.format(len(self.duplicates)))
+            res_matches.extend(_DUPLICATE_TMPL.format(name)
+                               for name in self.duplicates)
         return '{0}:\n{1}'.format(self.filename, '\n'.join(res_matches))
 
 
-def parse_search_output(text):
+class SearchResults(list):
+    """The list of FileResults parsed from search output.
+
+    Attributes:
+        skipped: The number of output lines that could not be parsed.
+    """
+
+    skipped = 0
+
+
+def count_results(results):
+    """Counts the files and matches in search results.
+
+    The files with the same matches as another file are counted too.
+
+    Args:
+        results: A list of FileResults.
+    Returns:
+        A (number of files, number of matches) pair.
+    """
+    num_files = 0
+    num_matches = 0
+    for file_results in results:
+        copies = 1 + len(file_results.duplicates)
+        num_files += copies
+        num_matches += copies * len(file_results.matches)
+    return (num_files, num_matches)
+
+
+def expand_duplicates(results):
+    """Gives each file its own FileResults again.
+
+    Args:
+        results: A list of FileResults, with files with the same matches
+            grouped together.
+    Returns:
+        A list of FileResults with no duplicates. The other files come right
+        after the file they were grouped with.
+    """
+    res = []
+    for file_results in results:
+        if not file_results.duplicates:
+            res.append(file_results)
+            continue
+        res.append(FileResults(file_results.filename, file_results.matches,
+                               context=file_results.context))
+        res.extend(FileResults(name, file_results.matches,
+                               context=file_results.context)
+                   for name in file_results.duplicates)
+    return res
+
+
+class _Grouper(object):
+    """Collects the FileResults of search output as it is parsed.
+
+    When duplicates are grouped, a file whose line numbers and lines are the
+    same as an earlier file's is added to that file's duplicates, instead of
+    getting its own FileResults. The matches themselves are the key, so this
+    takes a dict lookup per file and no second pass over the output.
+    """
+
+    def __init__(self, group_duplicates):
+        self.results = SearchResults()
+        self._first = {} if group_duplicates else None
+
+    def add(self, filename, matches, duplicates=None):
+        if self._first is not None:
+            key = tuple(matches)
+            first = self._first.get(key)
+            if first is not None:
+                first._duplicates.append(filename)
+                first._duplicates.extend(duplicates or [])
+                return
+        file_results = FileResults(filename, matches,
+                                   duplicates=list(duplicates or []))
+        if self._first is not None:
+            self._first[key] = file_results
+        self.results.append(file_results)
+
+
+def group_duplicates(results):
+    """Groups the files with the same matches together.
+
+    Args:
+        results: A list of FileResults, without their context.
+    Returns:
+        A new list of FileResults, where each file with the same line numbers
+        and lines as an earlier one is one of its duplicates.
+    """
+    grouper = _Grouper(True)
+    for file_results in results:
+        grouper.add(file_results.filename, file_results.matches,
+                    duplicates=file_results.duplicates)
+    return grouper.results
+
+
+def decode_filename(data):
+    """Decodes a file name from csearch output.
+
+    Undecodable bytes are kept as surrogates, so the name can still be used to
+    open the file.
+
+    Args:
+        data: The file name as bytes.
+    Returns:
+        The file name as a string.
+    """
+    return data.decode('utf-8', 'surrogateescape')
+
+
+def _decode_matches(matches):
+    """Decodes the matched lines of a file.
+
+    The lines of a file are decoded as UTF-8 if they all can be, else with the
+    fallback encoding. If that fails too, the bytes that can't be decoded are
+    shown as replacement characters.
+
+    Args:
+        matches: A list of (line number, bytes) pairs.
+    Returns:
+        A list of (line number, string) pairs.
+    """
+    for (encoding, errors) in (('utf-8', 'strict'),
+                               (_FALLBACK_ENCODING, 'strict'),
+                               ('utf-8', 'replace')):
+        try:
+            return [(linenum, line.decode(encoding, errors))
+                    for (linenum, line) in matches]
+        except UnicodeDecodeError:
+            pass
+
+
+def _parse_search_output_bytes(data, path_filter=None, group=False):
+    """Parses the raw output of a search command.
+
+    Lines are split with bytes.find, and the file names and lines are kept as
+    bytes until the FileResults are used. The lines of files that the path
+    filter leaves out are skipped without being kept.
+
+    A file name can have colons in it, so the line number is the first run of
+    digits between two colons after the name. Lines without one, like a
+    warning csearch printed, are skipped and counted instead of failing the
+    whole search.
+
+    Args:
+        data: The search output as bytes.
+        path_filter: An optional function that takes a file name and returns
+            if its matches are kept, like the one from Search.path_filter.
+        group: If files with the same matches are grouped together.
+    Returns:
+        A SearchResults list of FileResults objects.
+    """
+    res = _Grouper(group)
+    cur_filename = None
+    cur_name = None
+    cur_matches = None
+    pos = 0
+    end = len(data)
+    while pos < end:
+        eol = data.find(b'\n', pos)
+        if eol < 0:
+            eol = end
+        name_end = data.find(b':', pos + 1, eol)
+        num_end = -1
+        while name_end >= 0:
+            num_end = data.find(b':', name_end + 1, eol)
+            if num_end < 0 or data[name_end + 1:num_end].isdigit():
+                break
+            name_end = num_end
+        if name_end < 0 or num_end < 0:
+            res.results.skipped += 1
+            pos = eol + 1
+            continue
+        linenum = data[name_end + 1:num_end]
+        filename = data[pos:name_end]
+        if filename != cur_filename:
+            if cur_matches:
+                res.add(cur_name, cur_matches)
+            cur_filename = cur_name = filename
+            cur_matches = []
+            if path_filter:
+                # Decoded once here, so FileResults needn't decode it again.
+                cur_name = decode_filename(filename)
+                if not path_filter(cur_name):
+                    cur_matches = None
+        if cur_matches is None:
+            pos = eol + 1
+            continue
+        line = data[num_end + 1:eol]
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        cur_matches.append((int(linenum), line))
+        pos = eol + 1
+    if cur_matches:
+        res.add(cur_name, cur_matches)
+    return res.results
+
+
+def parse_search_output(text, path_filter=None, group=False):
     """Parse the output text from a search command.
 
     The format of the text should be:
@@ -439,12 +872,21 @@ def parse_search_output(text):
         b.txt:34:How to cook
 
     Args:
-        text: The search output string.
+        text: The search output, as a string or as the raw bytes. Bytes are
+            decoded lazily, and lines that aren't valid in any encoding tried
+            are still shown.
+        path_filter: An optional function that takes a file name and returns
+            if its matches are kept, like the one from Search.path_filter.
+        group: If files with the same line numbers and lines are grouped
+            together, so copied and generated files are only shown once.
     Returns:
-        A list of FileResults objects.
+        A list of FileResults objects. For bytes, it is a SearchResults with
+        the number of lines that could not be parsed.
     Raises:
-        Exception: If there was a problem parsing the output.
+        Exception: If there was a problem parsing the output text.
     """
+    if isinstance(text, bytes):
+        return _parse_search_output_bytes(text, path_filter, group)
     res = []
     lex = _Lexer(text, _output_start_state)
     tokens = lex.run()
@@ -466,6 +908,10 @@ def parse_search_output(text):
         else:
             cur_matches.append((linenum, line))
     res.append(FileResults(cur_filename, cur_matches))
+    if path_filter:
+        res = [r for r in res if path_filter(r.filename)]
+    if group:
+        res = group_duplicates(res)
     return res
 
 
@@ -0,0 +1,242 @@
+import array
+import bisect
+import collections
+import re
+import threading
+import zlib
+
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import parser
+
+# The most file: patterns to keep the matching files of, per index.
+_MAX_PATTERNS = 64
+
+# The extensions that lang: flags use, which get a bitset up front.
+_LANGUAGE_EXTENSIONS = frozenset(
+    ext for exts in parser._LANGUAGES.values() for ext in exts)
+
+_classes = {}
+_classes_lock = threading.Lock()
+
+
+def _bits(fileids, num_names):
+    """Makes a bitset, as an int, with the bits of the file ids set."""
+    data = bytearray((num_names + 7) // 8)
+    for fileid in fileids:
+        data[fileid >> 3] |= 1 << (fileid & 7)
+    return int.from_bytes(bytes(data), 'little')
+
+
+def count(bits):
+    """Returns the number of files in a bitset."""
+    return bin(bits).count('1')
+
+
+def _extension(name):
+    base = name[max(name.rfind('/'), name.rfind('\\')) + 1:]
+    dot = base.rfind('.')
+    return base[dot + 1:] if dot >= 0 else ''
+
+
+class PathClasses(object):
+    """Bitsets of the indexed files, by the kinds of paths they have.
+
+    Each bitset is an int with bit i set for file id i, so the files allowed by
+    a search's file flags are found with a few ands, without matching a regex
+    against every indexed path. The bitsets are built once for a generation of
+    the index. The files matching each file: pattern are found with a single
+    pass over the names the first time the pattern is used, and then kept.
+
+    Only the extensions of parser._LANGUAGES get a bitset up front. An index
+    can have thousands of other extensions, each with a few files, and a
+    bitset is as large as the index for every one of them. Their files are
+    kept as sorted lists of file ids instead, and made into a bitset when the
+    extension is asked for.
+
+    Attributes:
+        generation: The generation of the index the bitsets are for.
+        num_names: The number of indexed files.
+        all: The bitset of every file.
+        kinds: A dict of the bitset of the files of each of parser._KINDS.
+    """
+
+    def __init__(self, reader):
+        """Initializes the PathClasses.
+
+        Args:
+            reader: The index.IndexReader to classify the files of.
+        """
+        self._reader = reader
+        self.generation = reader.generation
+        self.num_names = reader.num_names
+        self.all = (1 << self.num_names) - 1
+        self._patterns = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        raw_names = reader.names(decode=False)
+        names = [parser.decode_filename(name) for name in raw_names]
+        by_extension = collections.defaultdict(lambda: array.array('I'))
+        for (fileid, name) in enumerate(names):
+            by_extension[_extension(name)].append(fileid)
+        self._extensions = {}
+        self._other_extensions = {}
+        for (ext, fileids) in by_extension.items():
+            if ext in _LANGUAGE_EXTENSIONS:
+                self._extensions[ext] = _bits(fileids, self.num_names)
+            else:
+                self._other_extensions[ext] = fileids
+        self.kinds = dict(
+            (kind, self._match(re.compile(pattern), names))
+            for (kind, pattern) in parser._KINDS.items())
+
+        # File names are looked up by their CRC, so only 8 bytes are kept per
+        # file instead of the names themselves.
+        pairs = sorted((zlib.crc32(name), fileid)
+                       for (fileid, name) in enumerate(raw_names))
+        self._crcs = array.array('I', (crc for (crc, unused) in pairs))
+        self._fileids = array.array('I', (fileid for (unused, fileid)
+                                          in pairs))
+
+    def _match(self, regex, names=None):
+        if names is None:
+            names = self._reader.names()
+        return _bits((fileid for (fileid, name) in enumerate(names)
+                      if regex.search(name)), self.num_names)
+
+    def extension(self, ext):
+        """Returns the bitset of the files with an extension."""
+        bits = self._extensions.get(ext)
+        if bits is not None:
+            return bits
+        fileids = self._other_extensions.get(ext)
+        return _bits(fileids, self.num_names) if fileids else 0
+
+    def pattern(self, pattern):
+        """Returns the bitset of the files a file: pattern matches.
+
+        Raises:
+            re.error: If the pattern isn't a valid regex.
+        """
+        with self._lock:
+            bits = self._patterns.pop(pattern, None)
+            if bits is not None:
+                self._patterns[pattern] = bits
+                return bits
+        bits = self._match(re.compile(pattern))
+        with self._lock:
+            self._patterns[pattern] = bits
+            while len(self._patterns) > _MAX_PATTERNS:
+                self._patterns.popitem(last=False)
+        return bits
+
+    def allowed(self, search):
+        """Works out which files a search's file flags allow.
+
+        Args:
+            search: A parser.Search.
+        Returns:
+            The bitset of the allowed files, or None if the search has no file
+            flags.
+        Raises:
+            re.error: If a file pattern isn't a valid regex.
+        """
+        if not search.path_flags():
+            return None
+        bits = self.all
+        for pattern in search.files:
+            bits &= self.pattern(pattern)
+        for pattern in search.exclude_files:
+            bits &= ~self.pattern(pattern)
+        if search.langs:
+            lang_bits = 0
+            for ext in search.lang_extensions():
+                lang_bits |= self.extension(ext)
+            bits &= lang_bits
+        for kind in search.kinds:
+            bits &= self.kinds[kind]
+        for kind in search.exclude_kinds:
+            bits &= ~self.kinds[kind]
+        return bits
+
+    def fileid(self, filename):
+        """Returns the file id of an indexed file name, or None."""
+        name = filename.encode('utf-8', 'surrogateescape')
+        crc = zlib.crc32(name)
+        i = bisect.bisect_left(self._crcs, crc)
+        while i < len(self._crcs) and self._crcs[i] == crc:
+            fileid = self._fileids[i]
+            if self._reader.name_bytes(fileid) == name:
+                return fileid
+            i += 1
+        return None
+
+    def path_filter(self, bits, fallback=None):
+        """Makes a check for the files in a bitset.
+
+        Args:
+            bits: The bitset of the files to keep.
+            fallback: An optional check, like the one from
+                parser.Search.path_filter, for file names that aren't in the
+                index. Without it, those files are kept.
+        Returns:
+            A function that takes a file name and returns if it is kept.
+        """
+        data = bits.to_bytes((self.num_names + 7) // 8, 'little')
+
+        def keep(filename):
+            fileid = self.fileid(filename)
+            if fileid is None:
+                return fallback(filename) if fallback else True
+            return bool(data[fileid >> 3] & (1 << (fileid & 7)))
+        return keep
+
+
+def get_path_classes(index_filename):
+    """Gets the PathClasses for the files in the index.
+
+    The bitsets are built once per index file and kept until the file changes.
+
+    Args:
+        index_filename: The csearchindex file location.
+    Returns:
+        A PathClasses for the current generation of the index.
+    Raises:
+        index.CorruptIndexError: If the file is not a csearchindex.
+        OSError: If the file can't be read.
+    """
+    generation = index.index_generation(index_filename)
+    with _classes_lock:
+        classes = _classes.get(index_filename)
+        if classes and classes.generation == generation:
+            return classes
+    classes = PathClasses(index.open_index(index_filename))
+    with _classes_lock:
+        _classes[index_filename] = classes
+    return classes
+
+
+def scope(search, index_filename):
+    """Works out which files a search has to look at.
+
+    The bitsets are only used when the search has file flags that csearch
+    can't check itself, so a plain search doesn't wait for them to be built.
+
+    Args:
+        search: The parser.Search to run.
+        index_filename: The csearchindex file location.
+    Returns:
+        A (path_filter, candidates) tuple. path_filter is the check to pass to
+        parser.parse_search_output, or None. candidates is the number of
+        indexed files the search can match, or None if it isn't known.
+    Raises:
+        re.error: If a file pattern isn't a valid regex.
+    """
+    fallback = search.path_filter()
+    if fallback is None:
+        return (None, None)
+    try:
+        classes = get_path_classes(index_filename)
+    except (OSError, IOError, ValueError, index.CorruptIndexError):
+        return (fallback, None)
+    bits = classes.allowed(search)
+    return (classes.path_filter(bits, fallback), count(bits))
@@ -0,0 +1,356 @@
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+# The most strings to track exactly before falling back to trigrams.
+_MAX_EXACT = 16
+
+# The most characters a class can have and still be tracked exactly.
+_MAX_CLASS = 8
+
+# The most sets of trigrams to keep in a query.
+_MAX_CLAUSES = 64
+
+_REPEATS = tuple(getattr(sre_constants, name) for name in
+                 ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                 if hasattr(sre_constants, name))
+_ZERO_WIDTH = tuple(getattr(sre_constants, name) for name in
+                    ('AT', 'ASSERT', 'ASSERT_NOT')
+                    if hasattr(sre_constants, name))
+_GROUPS = tuple(getattr(sre_constants, name) for name in
+                ('SUBPATTERN', 'ATOMIC_GROUP')
+                if hasattr(sre_constants, name))
+
+
+class _Info(object):
+    """What is known about the text a piece of a regex matches.
+
+    Attributes:
+        exact: A set of every string matched, as bytes, or None if there are
+            too many.
+        prefix: A set of the first two bytes of the matched strings, or None
+            if they aren't known. Shorter strings are whole matches.
+        suffix: A set of the last two bytes of the matched strings, or None.
+        match: The trigram query that any match satisfies, when exact is None.
+    """
+
+    def __init__(self, exact=None, prefix=None, suffix=None, match=()):
+        self.exact = exact
+        if exact is not None:
+            prefix = set(s[:2] for s in exact)
+            suffix = set(s[-2:] for s in exact)
+        self.prefix = prefix
+        self.suffix = suffix
+        self.match = match
+
+    def query(self):
+        """Returns the trigram query for everything this matches."""
+        if self.exact is None:
+            return self.match
+        return _exact_query(self.exact)
+
+
+def _anything():
+    return _Info()
+
+
+def _empty():
+    return _Info(exact=set([b'']))
+
+
+def _trigrams(s):
+    return [s[i:i + 3] for i in range(len(s) - 2)]
+
+
+def _and(q1, q2):
+    """ANDs two trigram queries.
+
+    A query is a tuple of frozensets of trigrams; a file satisfies it when it
+    has at least one trigram from every set. The empty query matches every
+    file.
+    """
+    clauses = set(q1) | set(q2)
+    # A set that contains another set adds nothing.
+    kept = [c for c in clauses if not any(o < c for o in clauses)]
+    kept.sort(key=lambda c: (len(c), sorted(c)))
+    return tuple(kept[:_MAX_CLAUSES])
+
+
+def _or(q1, q2):
+    """ORs two trigram queries."""
+    if not q1 or not q2:
+        return ()
+    # Dropping sets only makes a query match more files, so it is safe to
+    # keep the product small.
+    limit = max(1, int(_MAX_CLAUSES ** .5))
+    clauses = [a | b for a in q1[:limit] for b in q2[:limit]]
+    return _and((), clauses)
+
+
+def _exact_query(strings):
+    query = None
+    for s in strings:
+        trigrams = _trigrams(s)
+        if not trigrams:
+            return ()
+        q = tuple(frozenset([t]) for t in trigrams)
+        query = q if query is None else _or(query, q)
+    return query or ()
+
+
+def _affix(first, second, take):
+    """Combines the prefixes or suffixes of two pieces of a concatenation."""
+    if first is None:
+        return None
+    result = set()
+    for a in first:
+        if len(a) >= 2:
+            result.add(a)
+            continue
+        if second is None:
+            return None
+        result.update(take(a, b) for b in second)
+    if len(result) > _MAX_EXACT:
+        return None
+    return result
+
+
+def _concat(x, y):
+    if (x.exact is not None and y.exact is not None and
+            len(x.exact) * len(y.exact) <= _MAX_EXACT):
+        return _Info(exact=set(a + b for a in x.exact for b in y.exact))
+    match = _and(x.query(), y.query())
+    # Trigrams that span the two pieces.
+    if (x.suffix is not None and y.prefix is not None and
+            len(x.suffix) * len(y.prefix) <= _MAX_EXACT):
+        match = _and(match, _exact_query(
+            set(a + b for a in x.suffix for b in y.prefix)))
+    return _Info(prefix=_affix(x.prefix, y.prefix, lambda a, b: (a + b)[:2]),
+                 suffix=_affix(y.suffix, x.suffix, lambda b, a: (a + b)[-2:]),
+                 match=match)
+
+
+def _alternate(x, y):
+    if (x.exact is not None and y.exact is not None and
+            len(x.exact) + len(y.exact) <= _MAX_EXACT):
+        return _Info(exact=x.exact | y.exact)
+    prefix = suffix = None
+    if x.prefix is not None and y.prefix is not None:
+        prefix = x.prefix | y.prefix
+    if x.suffix is not None and y.suffix is not None:
+        suffix = x.suffix | y.suffix
+    return _Info(prefix=prefix, suffix=suffix,
+                 match=_or(x.query(), y.query()))
+
+
+def _char(c, fold):
+    c = chr(c)
+    if fold:
+        c = c.lower()
+    return c.encode('utf-8', 'surrogatepass')
+
+
+def _class_info(items, fold):
+    chars = set()
+    for (op, av) in items:
+        if op == sre_constants.LITERAL:
+            chars.add(_char(av, fold))
+        elif op == sre_constants.RANGE and av[1] - av[0] < _MAX_CLASS:
+            chars.update(_char(c, fold) for c in range(av[0], av[1] + 1))
+        else:
+            return _anything()
+        if len(chars) > _MAX_CLASS:
+            return _anything()
+    return _Info(exact=chars)
+
+
+def _analyze(pattern, fold):
+    # Runs of exact pieces, like the characters of a literal, are joined
+    # first so that their trigrams aren't lost next to unknown pieces.
+    pieces = []
+    for (op, av) in pattern:
+        info = _analyze_node(op, av, fold)
+        if (pieces and pieces[-1].exact is not None and
+                info.exact is not None and
+                len(pieces[-1].exact) * len(info.exact) <= _MAX_EXACT):
+            info = _concat(pieces.pop(), info)
+        pieces.append(info)
+    info = _empty()
+    for piece in pieces:
+        info = _concat(info, piece)
+    return info
+
+
+def _analyze_node(op, av, fold):
+    if op == sre_constants.LITERAL:
+        return _Info(exact=set([_char(av, fold)]))
+    if op == sre_constants.IN:
+        return _class_info(av, fold)
+    if op in _GROUPS:
+        # (group, pattern) before Python 3.6, (group, flags, flags, pattern)
+        # since, and just the pattern for atomic groups.
+        return _analyze(av[-1] if isinstance(av, tuple) else av, fold)
+    if op == sre_constants.BRANCH:
+        info = None
+        for branch in av[1]:
+            branch_info = _analyze(branch, fold)
+            info = branch_info if info is None else _alternate(info,
+                                                               branch_info)
+        return info
+    if op in _REPEATS:
+        (lo, hi, sub) = av
+        sub_info = _analyze(sub, fold)
+        if lo == 0:
+            if hi == 1:
+                return _alternate(_empty(), sub_info)
+            return _anything()
+        info = sub_info
+        for _ in range(1, min(lo, 3)):
+            info = _concat(info, sub_info)
+        if hi != lo:
+            info = _concat(info, _anything())
+        return info
+    if op in _ZERO_WIDTH:
+        return _empty()
+    return _anything()
+
+
+def _is_folded(parsed):
+    state = getattr(parsed, 'state', None) or getattr(parsed, 'pattern')
+    return bool(state.flags & sre_constants.SRE_FLAG_IGNORECASE)
+
+
+def _required(regex, case):
+    parsed = sre_parse.parse(regex)
+    fold = not case or _is_folded(parsed)
+    return (_analyze(parsed, fold).query(), fold)
+
+
+def required_trigrams(regex, case=True):
+    """Works out which trigrams a file needs to have to match a regex.
+
+    This is the same kind of analysis csearch does to pick the files to read
+    from the index. It works on the Python reading of the regex, which is
+    close enough to the RE2 syntax csearch uses for the queries people type.
+
+    Args:
+        regex: The regex string.
+        case: If the regex is case sensitive. If not, the trigrams are
+            lowercase.
+    Returns:
+        A tuple of frozensets of trigrams, as bytes. A file can only match if
+        it has at least one trigram from each set. An empty tuple means that
+        any file can match, so every file is read.
+    Raises:
+        re.error: If the regex can't be parsed.
+    """
+    return _required(regex, case)[0]
+
+
+def _case_variants(trigram):
+    variants = [b'']
+    for c in trigram:
+        c = bytes([c])
+        options = set([c, c.upper()])
+        variants = [v + o for v in variants for o in options]
+    return variants
+
+
+class Plan(object):
+    """The plan for running a search.
+
+    Attributes:
+        search: The parser.Search the plan is for.
+        trigrams: The required trigrams, as from required_trigrams, or None
+            if the query couldn't be analyzed.
+        estimate: The most files csearch will read, or None if it isn't
+            known.
+        total: The number of files in the index, or None if it isn't known.
+        unselective_terms: The terms of the search that have no required
+            trigrams on their own.
+    """
+
+    def __init__(self, search, trigrams, estimate=None, total=None,
+                 unselective_terms=None):
+        self.search = search
+        self.trigrams = trigrams
+        self.estimate = estimate
+        self.total = total
+        self.unselective_terms = unselective_terms or []
+
+    @property
+    def full_scan(self):
+        """If csearch has to read every indexed file."""
+        return self.trigrams is not None and not self.trigrams
+
+    @property
+    def needs_confirmation(self):
+        """If the search reads every file and isn't limited to some files."""
+        return self.full_scan and not (self.search.files or
+                                       self.search.langs)
+
+    def suggestion(self):
+        """Returns a way to rewrite the search so it reads fewer files."""
+        if self.unselective_terms and len(self.search.query) > 1:
+            return ('each term needs 3 or more literal characters; '
+                    'try rewriting or dropping {0}'.format(', '.join(
+                        '"{0}"'.format(t) for t in self.unselective_terms)))
+        return ('add a file: or lang: flag, or 3 or more literal characters '
+                'that every match has')
+
+    def describe(self):
+        """Returns a one line description of the plan."""
+        if self.trigrams is None:
+            return 'Plan: unknown'
+        if self.full_scan:
+            if self.search.files or self.search.langs:
+                return 'Plan: reads every file that matches {0}'.format(
+                    ' '.join(self.search.path_flags()))
+            files = 'every file'
+            if self.total is not None:
+                files = 'all {0} files'.format(self.total)
+            return 'Plan: reads {0}; {1}'.format(files, self.suggestion())
+        desc = 'Plan: looks up {0} trigrams'.format(
+            len(frozenset().union(*self.trigrams)))
+        if self.estimate is not None and self.total is not None:
+            desc += ', reads at most {0} of {1} files'.format(
+                self.estimate, self.total)
+        return desc
+
+
+def _estimate(trigrams, reader, fold):
+    estimate = reader.num_names
+    for clause in trigrams:
+        count = 0
+        for trigram in clause:
+            variants = _case_variants(trigram) if fold else [trigram]
+            count += sum(reader.posting_count(v) for v in variants)
+        estimate = min(estimate, count)
+    return estimate
+
+
+def make_plan(search, reader=None):
+    """Plans a search.
+
+    Args:
+        search: The parser.Search to plan.
+        reader: An optional index.IndexReader, used to estimate the number of
+            files that are read.
+    Returns:
+        A Plan. If the query can't be analyzed, the plan's trigrams are None.
+    """
+    try:
+        (trigrams, fold) = _required(search.query_re(), search.case)
+        unselective = [term for term in search.query
+                       if not required_trigrams(term, search.case)]
+    except Exception:
+        return Plan(search, None)
+    estimate = total = None
+    if reader is not None:
+        total = reader.num_names
+        estimate = _estimate(trigrams, reader, fold)
+    return Plan(search, trigrams, estimate=estimate, total=total,
+                unselective_terms=unselective)
@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+# The file each tool writes its CPU profile to, in the run's directory.
+PROFILE_NAME = 'cpu.pprof'
+
+# The file the command, environment and timings of a run are written to.
+RUN_NAME = 'run.json'
+
+
+class Run(object):
+    """A run of csearch or cindex with its CPU profiled.
+
+    Attributes:
+        tool: The name of the tool, like "csearch" or "cindex".
+        directory: Where the files of the run are kept.
+        profile_path: Where the tool writes its CPU profile.
+        cmd: The command that ran, once it has finished.
+        env: The environment it ran with, once it has finished.
+        returncode: The exit status of the command.
+        seconds: How long the command took to run.
+        details: A dict of what else is known about the run, like the number
+            of lines it matched.
+    """
+
+    def __init__(self, tool, directory):
+        self.tool = tool
+        self.directory = directory
+        self.profile_path = os.path.join(directory, PROFILE_NAME)
+        self.cmd = None
+        self.env = None
+        self.returncode = None
+        self.seconds = None
+        self.details = {}
+
+    def args(self):
+        """Gets the flags that make the tool write its CPU profile."""
+        return ['-cpuprofile', self.profile_path]
+
+    def finish(self, cmd, env, returncode, seconds, **details):
+        """Records how the run went, next to its profile.
+
+        Args:
+            cmd: The command that ran, as a list.
+            env: The environment it ran with, as a dict.
+            returncode: The exit status of the command.
+            seconds: How long the command took to run.
+            **details: What else is known about the run, written as JSON.
+        """
+        self.cmd = list(cmd)
+        self.env = dict(env)
+        self.returncode = returncode
+        self.seconds = seconds
+        self.details.update(details)
+        run = {'tool': self.tool,
+               'cmd': self.cmd,
+               'env': self.env,
+               'cwd': os.getcwd(),
+               'returncode': returncode,
+               'seconds': seconds,
+               'profile': self.profile_path}
+        run.update(self.details)
+        try:
+            with open(os.path.join(self.directory, RUN_NAME), 'w') as f:
+                json.dump(run, f, indent=2, sort_keys=True)
+        except (OSError, IOError) as e:
+            print('Code Search: could not record the {0} run: {1}'.format(
+                self.tool, e))
+
+    def has_profile(self):
+        return os.path.isfile(self.profile_path)
+
+
+class Profiler(object):
+    """Keeps the CPU profiles of recent csearch and cindex runs.
+
+    Each run gets its own directory, named by when it started, with the
+    profile the tool wrote and a run.json with the exact command and
+    environment it ran with. Only the newest runs are kept.
+
+    Attributes:
+        directory: Where the runs are kept.
+        max_runs: The number of runs to keep.
+        brute: If searches are run again with -brute, to compare them with
+            searching the index.
+    """
+
+    def __init__(self, directory, max_runs=20, brute=False):
+        self.directory = directory
+        self.max_runs = max_runs
+        self.brute = brute
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def start(self, tool):
+        """Makes a directory for a run that is about to start.
+
+        Args:
+            tool: The name of the tool, like "csearch" or "cindex".
+        Returns:
+            A Run.
+        """
+        with self._lock:
+            self._count += 1
+            name = '{0}-{1:03d}-{2}'.format(
+                time.strftime('%Y%m%d-%H%M%S'), self._count % 1000, tool)
+            directory = os.path.join(self.directory, name)
+            os.makedirs(directory, exist_ok=True)
+            self._prune()
+        return Run(tool, directory)
+
+    def runs(self):
+        """Gets the directories of the kept runs, the newest last."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in sorted(names)
+                if os.path.isdir(os.path.join(self.directory, name))]
+
+    def _prune(self):
+        runs = self.runs()
+        for directory in runs[:max(0, len(runs) - self.max_runs)]:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def format_findings(run, brute_run=None):
+    """Describes a profiled search or indexing run, for the results footer.
+
+    Args:
+        run: The Run that was profiled.
+        brute_run: An optional Run of the same search with -brute.
+    Returns:
+        The lines to show, as a string.
+    """
+    if run.seconds is None:
+        # No indexed file could match, so there was nothing to run.
+        return '{0} did not need to run\n'.format(run.tool)
+    lines = ['{0} took {1:.3f}s'.format(run.tool, run.seconds)]
+    if run.has_profile():
+        lines[0] += ', CPU profile in {0}'.format(run.profile_path)
+    else:
+        lines[0] += ', but wrote no CPU profile'
+    lines.append('Command and environment in {0}'.format(
+        os.path.join(run.directory, RUN_NAME)))
+    if brute_run is not None and brute_run.seconds is not None:
+        text = 'Without the index (-brute): {0:.3f}s'.format(
+            brute_run.seconds)
+        if run.seconds:
+            text += ', {0:.1f}x as long'.format(brute_run.seconds /
+                                                run.seconds)
+        lines.append(text)
+        matched = run.details.get('lines')
+        brute_matched = brute_run.details.get('lines')
+        if (matched is not None and brute_matched is not None and
+                matched != brute_matched):
+            lines.append('The index found {0} lines, but -brute found {1}. '
+                         'The index may be out of date.'.format(
+                             matched, brute_matched))
+    return ''.join(line + '\n' for line in lines)
@@ -0,0 +1,196 @@
+import concurrent.futures
+import os
+import stat
+import time
+
+_MB = 1024 * 1024
+
+
+def _skipped(name):
+    # cindex skips the same names.
+    return not name or name[0] in '.#~' or name[-1] == '~'
+
+
+def _walk(directory):
+    """Counts the regular files under a directory, without following links.
+
+    Returns:
+        A (files, bytes) tuple.
+    """
+    files = size = 0
+    stack = [directory]
+    while stack:
+        directory = stack.pop()
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            if _skipped(name):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                stack.append(path)
+            elif stat.S_ISREG(st.st_mode):
+                files += 1
+                size += st.st_size
+    return (files, size)
+
+
+def count_files(paths, max_workers=4):
+    """Counts the files cindex will read for some paths.
+
+    The directories right under each path are walked in parallel.
+
+    Args:
+        paths: The list of files and directories to index.
+        max_workers: The most directories to walk at once.
+    Returns:
+        A (files, bytes) tuple.
+    """
+    files = size = 0
+    directories = []
+    for path in paths:
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            files += 1
+            size += st.st_size
+            continue
+        if not stat.S_ISDIR(st.st_mode):
+            continue
+        try:
+            names = os.listdir(path)
+        except OSError:
+            continue
+        for name in names:
+            if _skipped(name):
+                continue
+            child = os.path.join(path, name)
+            try:
+                st = os.lstat(child)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                directories.append(child)
+            elif stat.S_ISREG(st.st_mode):
+                files += 1
+                size += st.st_size
+    if directories:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers) as executor:
+            for (n, nbytes) in executor.map(_walk, directories):
+                files += n
+                size += nbytes
+    return (files, size)
+
+
+def _format_bytes(n):
+    return '{0:.1f} MB'.format(n / _MB)
+
+
+def _format_duration(seconds):
+    seconds = int(seconds + .5)
+    if seconds >= 3600:
+        return '{0}:{1:02}:{2:02}'.format(seconds // 3600,
+                                          seconds // 60 % 60, seconds % 60)
+    return '{0}:{1:02}'.format(seconds // 60, seconds % 60)
+
+
+class IndexProgress(object):
+    """How far along indexing is.
+
+    Attributes:
+        files: The number of files indexed so far.
+        bytes: The number of bytes indexed so far.
+        total_files: The number of files to index, or None until counted.
+        total_bytes: The number of bytes to index, or None until counted.
+        index_bytes_before: The size of the index file before indexing.
+        index_bytes_after: The size of the index file after indexing, or None
+            until it is done.
+        paused: If indexing is paused.
+    """
+
+    def __init__(self, index_bytes_before=0, start=None):
+        self.files = 0
+        self.bytes = 0
+        self.total_files = None
+        self.total_bytes = None
+        self.index_bytes_before = index_bytes_before
+        self.index_bytes_after = None
+        self.paused = False
+        self._start = time.perf_counter() if start is None else start
+        self._paused_at = None
+        self._paused_seconds = 0
+
+    def pause(self, now=None):
+        """Marks indexing as paused, so the time paused isn't counted."""
+        if not self.paused:
+            self.paused = True
+            self._paused_at = time.perf_counter() if now is None else now
+
+    def resume(self, now=None):
+        """Marks paused indexing as running again."""
+        if self.paused:
+            self.paused = False
+            now = time.perf_counter() if now is None else now
+            self._paused_seconds += now - self._paused_at
+
+    def elapsed(self, now=None):
+        """Returns the seconds spent indexing, not counting pauses."""
+        if now is None:
+            now = time.perf_counter()
+        if self.paused:
+            now = self._paused_at
+        return max(now - self._start - self._paused_seconds, 1e-9)
+
+    def fraction(self):
+        """Returns how much of the indexing is done, from 0 to 1, or None."""
+        if self.total_bytes:
+            return min(1., self.bytes / self.total_bytes)
+        if self.total_files:
+            return min(1., self.files / self.total_files)
+        return None
+
+    def eta(self, now=None):
+        """Returns the seconds indexing has left, or None if not known."""
+        fraction = self.fraction()
+        if not fraction:
+            return None
+        return self.elapsed(now) * (1 - fraction) / fraction
+
+    def describe(self, now=None):
+        """Returns a short description of the progress, for the status bar."""
+        elapsed = self.elapsed(now)
+        parts = ['{0} files'.format(self.files)]
+        if self.total_files is not None:
+            parts[0] = '{0}/{1} files'.format(self.files, self.total_files)
+        parts.append('{0:.0f} files/s'.format(self.files / elapsed))
+        parts.append('{0}/s'.format(_format_bytes(self.bytes / elapsed)))
+        eta = self.eta(now)
+        if eta is not None:
+            parts.append('{0} left'.format(_format_duration(eta)))
+        fraction = self.fraction()
+        prefix = 'cindex'
+        if fraction is not None:
+            prefix = 'cindex {0:.0f}%'.format(fraction * 100)
+        if self.paused:
+            prefix += ' paused'
+        return '{0} ({1})'.format(prefix, ', '.join(parts))
+
+    def summary(self, now=None):
+        """Returns a description of the finished indexing."""
+        text = 'indexed {0} files ({1}) in {2:.1f}s'.format(
+            self.files, _format_bytes(self.bytes), self.elapsed(now))
+        if self.index_bytes_after is not None:
+            delta = self.index_bytes_after - self.index_bytes_before
+            text += '; index is {0} ({1}{2})'.format(
+                _format_bytes(self.index_bytes_after),
+                '+' if delta >= 0 else '-', _format_bytes(abs(delta)))
+        return text
@@ -0,0 +1,199 @@
+import bisect
+import re
+
+from YetAnotherCodeSearch import context
+from YetAnotherCodeSearch import parser
+
+
+class Refinement(object):
+    """A filter over search results.
+
+    Attributes:
+        pattern: The regex to look for.
+        exclude: If the lines or files that match are dropped, instead of
+            kept.
+        path: If the pattern is matched against file names, instead of the
+            matched lines.
+        case: If the pattern is case sensitive.
+    """
+
+    def __init__(self, pattern, exclude=False, path=False, case=True):
+        self.pattern = pattern
+        self.exclude = exclude
+        self.path = path
+        self.case = case
+
+    def compile(self):
+        """Compiles the pattern.
+
+        Raises:
+            re.error: If the pattern isn't a valid regex.
+        """
+        flags = re.MULTILINE
+        if not self.case:
+            flags |= re.IGNORECASE
+        return re.compile(self.pattern, flags)
+
+    def describe(self):
+        """Returns a short description, like 'paths not matching "vendor"'."""
+        return '{0} {1}matching "{2}"'.format(
+            'paths' if self.path else 'lines',
+            'not ' if self.exclude else '', self.pattern)
+
+    def __eq__(self, other):
+        return (isinstance(other, self.__class__) and
+                self.pattern == other.pattern and
+                self.exclude == other.exclude and
+                self.path == other.path and
+                self.case == other.case)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        # Not really needed, so a very dumb implementation to just be correct.
+        return 42
+
+    def __repr__(self):
+        return '{0}(pattern={1}; exclude={2}; path={3}; case={4})'.format(
+            self.__class__, self.pattern, self.exclude, self.path, self.case)
+
+
+def parse_refinement(text, case=True):
+    """Parses a refinement as typed.
+
+    A leading "-" drops what matches instead of keeping it, and a "path:"
+    prefix matches file names instead of lines, so "-path:_test\\.go$" drops
+    the results in Go tests.
+
+    Args:
+        text: The refinement string.
+        case: If the pattern is case sensitive.
+    Returns:
+        A Refinement.
+    Raises:
+        ValueError: If there is no pattern.
+    """
+    exclude = text.startswith('-')
+    if exclude:
+        text = text[1:]
+    path = text.startswith('path:')
+    if path:
+        text = text[len('path:'):]
+    if not text:
+        raise ValueError('No pattern to refine the results with')
+    return Refinement(text, exclude=exclude, path=path, case=case)
+
+
+class _LineStore(object):
+    """The matched lines of a result set, joined into one string.
+
+    This lets a pattern be run over every line with a single regex search
+    loop, instead of a search per line.
+    """
+
+    def __init__(self, results):
+        lines = []
+        self.file_starts = []
+        for file_results in results:
+            self.file_starts.append(len(lines))
+            lines.extend(line for (unused_linenum, line)
+                         in file_results.matches)
+        self.num_lines = len(lines)
+        self.line_starts = [0] * len(lines)
+        offset = 0
+        for (i, line) in enumerate(lines):
+            self.line_starts[i] = offset
+            offset += len(line) + 1
+        self.lines = lines
+        self.text = '\n'.join(lines)
+
+    def matching_lines(self, regex):
+        """Returns the indexes of the lines the regex matches, in order."""
+        if not self.num_lines:
+            return []
+        text = self.text
+        starts = self.line_starts
+        hits = []
+        pos = 0
+        while pos <= len(text):
+            m = regex.search(text, pos)
+            if not m:
+                break
+            i = bisect.bisect_right(starts, m.start()) - 1
+            if i + 1 < len(starts):
+                line_end = starts[i + 1] - 1
+            else:
+                line_end = len(text)
+            # A match can run into the next line, so check the line alone.
+            if m.end() <= line_end or regex.search(self.lines[i]):
+                hits.append(i)
+            pos = line_end + 1
+        return hits
+
+
+def _trim_context(file_results, matches, context_lines):
+    if not file_results.context or not context_lines:
+        return None
+    wanted = set(context.context_linenums(
+        [linenum for (linenum, unused_line) in matches], context_lines))
+    return [(linenum, line) for (linenum, line) in file_results.context
+            if linenum in wanted]
+
+
+def _refine_paths(results, regex, exclude):
+    refined = []
+    for file_results in results:
+        if not file_results.duplicates:
+            if bool(regex.search(file_results.filename)) != exclude:
+                refined.append(file_results)
+            continue
+        # Each of the files with the same matches is kept or dropped on its
+        # own, and the first one kept shows the matches.
+        names = [name for name
+                 in [file_results.filename] + file_results.duplicates
+                 if bool(regex.search(name)) != exclude]
+        if names:
+            refined.append(parser.FileResults(
+                names[0], file_results.matches, context=file_results.context,
+                duplicates=names[1:]))
+    return refined
+
+
+def refine(results, refinement, context_lines=0):
+    """Filters search results.
+
+    Args:
+        results: A list of parser.FileResults.
+        refinement: The Refinement to apply.
+        context_lines: The number of lines of context the results have. The
+            context around dropped lines is dropped too.
+    Returns:
+        A new list of parser.FileResults. The original results are left as
+        they were.
+    Raises:
+        re.error: If the pattern isn't a valid regex.
+    """
+    regex = refinement.compile()
+    if refinement.path:
+        return _refine_paths(results, regex, refinement.exclude)
+    store = _LineStore(results)
+    hits = store.matching_lines(regex)
+    if refinement.exclude:
+        hits = sorted(set(range(store.num_lines)) - set(hits))
+    refined = []
+    h = 0
+    for (f, file_results) in enumerate(results):
+        end = (store.file_starts[f + 1] if f + 1 < len(results)
+               else store.num_lines)
+        start = store.file_starts[f]
+        kept = []
+        while h < len(hits) and hits[h] < end:
+            kept.append(file_results.matches[hits[h] - start])
+            h += 1
+        if kept:
+            refined.append(parser.FileResults(
+                file_results.filename, kept,
+                context=_trim_context(file_results, kept, context_lines),
+                duplicates=file_results.duplicates))
+    return refined
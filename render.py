@@ -0,0 +1,144 @@
+import sublime
+
+import collections
+import threading
+import time
+
+# The number of characters appended to the view at a time.
+_CHUNK_SIZE = 64 * 1024
+
+# How long to spend appending chunks before giving the UI thread back.
+_TICK_BUDGET = 0.008
+
+# How many chunks can wait to be appended before the writer blocks.
+_MAX_PENDING = 8
+
+
+class ChunkedRenderer(object):
+    """Appends text to a view a chunk at a time.
+
+    Text is written from a worker thread and grouped into fixed size chunks,
+    which are handed to the main thread with sublime.set_timeout. Each tick
+    on the main thread only appends chunks for a short time budget, so typing
+    and scrolling stay responsive while a large result set streams in. The
+    writer blocks while too many chunks are waiting, so the text is never held
+    in memory all at once.
+
+    Cancelling drops the chunks that are still waiting and makes the writer
+    stop.
+    """
+
+    def __init__(self, view, on_done=None, chunk_size=_CHUNK_SIZE,
+                 tick_budget=_TICK_BUDGET, max_pending=_MAX_PENDING):
+        """Initializes the ChunkedRenderer.
+
+        Args:
+            view: The view to append text to.
+            on_done: An optional callback, run on the main thread once all of
+                the text has been appended. Not called if cancelled.
+            chunk_size: The number of characters to append at a time.
+            tick_budget: The seconds to spend appending chunks per tick.
+            max_pending: The number of chunks that can wait to be appended.
+        """
+        self._view = view
+        self._on_done = on_done
+        self._chunk_size = chunk_size
+        self._tick_budget = tick_budget
+        self._max_pending = max_pending
+        self._buffer = []
+        self._buffer_size = 0
+        self._chunks = collections.deque()
+        self._cond = threading.Condition()
+        self._scheduled = False
+        self._closed = False
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def write(self, text):
+        """Adds text to append to the view. Called from the worker thread.
+
+        Args:
+            text: The text to append.
+        Returns:
+            False if the renderer was cancelled and nothing more should be
+            written.
+        """
+        self._buffer.append(text)
+        self._buffer_size += len(text)
+        if self._buffer_size >= self._chunk_size:
+            return self._flush()
+        return not self._cancelled
+
+    def close(self):
+        """Marks the end of the text. Called from the worker thread."""
+        self._flush()
+        with self._cond:
+            self._closed = True
+            self._schedule()
+
+    def cancel(self):
+        """Stops appending to the view and drops the waiting chunks."""
+        with self._cond:
+            self._cancelled = True
+            self._chunks.clear()
+            self._cond.notify_all()
+
+    def _flush(self):
+        if not self._buffer:
+            return not self._cancelled
+        chunk = ''.join(self._buffer)
+        self._buffer = []
+        self._buffer_size = 0
+        with self._cond:
+            while (len(self._chunks) >= self._max_pending and
+                   not self._cancelled):
+                self._cond.wait()
+            if self._cancelled:
+                return False
+            self._chunks.append(chunk)
+            self._schedule()
+        return True
+
+    def _schedule(self):
+        # Must hold the lock.
+        if not self._scheduled:
+            self._scheduled = True
+            sublime.set_timeout(self._tick, 0)
+
+    def _tick(self):
+        with self._cond:
+            self._scheduled = False
+        deadline = time.perf_counter() + self._tick_budget
+        while True:
+            with self._cond:
+                if self._cancelled:
+                    return
+                if not self._chunks:
+                    done = self._closed
+                    break
+                chunk = self._chunks.popleft()
+                self._cond.notify_all()
+            if not self._view.is_valid():
+                self.cancel()
+                return
+            self._append(chunk)
+            if time.perf_counter() > deadline:
+                with self._cond:
+                    if ((self._chunks or self._closed) and
+                            not self._scheduled):
+                        # Let other UI work run before the next chunk.
+                        self._scheduled = True
+                        sublime.set_timeout(self._tick, 1)
+                return
+        if done and self._on_done:
+            on_done = self._on_done
+            self._on_done = None
+            on_done()
+
+    def _append(self, chunk):
+        self._view.set_read_only(False)
+        self._view.run_command('append', {'characters': chunk})
+        self._view.set_read_only(True)
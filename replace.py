@@ -0,0 +1,258 @@
+import concurrent.futures
+import mmap
+import os
+import re
+import tempfile
+
+from YetAnotherCodeSearch import context
+from YetAnotherCodeSearch import parser
+
+# How many files to read or write at once.
+_MAX_WORKERS = 4
+
+
+class ConflictError(Exception):
+    """The file changed after the replacement was planned."""
+    pass
+
+
+class FileEdit(object):
+    """The planned replacements in one file.
+
+    Attributes:
+        filename: The file name from the search results.
+        generation: The (mtime, size) of the file when it was planned.
+        changes: A list of (line number, old line, new line) tuples, with the
+            lines as bytes.
+    """
+
+    def __init__(self, filename, generation, changes):
+        self.filename = filename
+        self.generation = generation
+        self.changes = changes
+
+
+def compile_pattern(pattern, case=True):
+    """Compiles a search pattern to run over the raw bytes of files.
+
+    Args:
+        pattern: The regex as a string.
+        case: If the pattern is case sensitive.
+    Returns:
+        A compiled bytes regex.
+    """
+    return re.compile(pattern.encode('utf-8'), 0 if case else re.IGNORECASE)
+
+
+def _line_spans(data, linenums):
+    """Finds where lines are in the data.
+
+    Args:
+        data: The file contents.
+        linenums: A sorted list of line numbers.
+    Yields:
+        (line number, start, end) tuples, where end is before the line ending.
+    """
+    wanted = iter(linenums)
+    target = next(wanted, None)
+    pos = 0
+    linenum = 1
+    while target is not None:
+        newline = data.find(b'\n', pos)
+        if linenum == target:
+            end = newline if newline >= 0 else len(data)
+            if end > pos and data[end - 1:end] == b'\r':
+                end -= 1
+            yield (linenum, pos, end)
+            target = next(wanted, None)
+        if newline < 0:
+            break
+        pos = newline + 1
+        linenum += 1
+
+
+def _edit(data, regex, replacement, linenums):
+    """Replaces the pattern on the given lines.
+
+    Args:
+        data: The file contents.
+        regex: The compiled bytes regex.
+        replacement: The bytes to replace each match with, as for re.sub.
+        linenums: A sorted list of the line numbers to replace on.
+    Returns:
+        A tuple of the list of changes, as for FileEdit, and the new contents.
+    """
+    changes = []
+    pieces = []
+    last = 0
+    for (linenum, start, end) in _line_spans(data, linenums):
+        old = data[start:end]
+        new = regex.sub(replacement, old)
+        if new != old:
+            changes.append((linenum, old, new))
+            pieces.append(data[last:start])
+            pieces.append(new)
+            last = end
+    pieces.append(data[last:])
+    return (changes, b''.join(pieces))
+
+
+def _read(path):
+    """Reads a file through mmap.
+
+    Returns:
+        A tuple of the mmap, or b'' for an empty file, and the (mtime, size).
+    """
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        generation = (st.st_mtime, st.st_size)
+        if not st.st_size:
+            return (b'', generation)
+        return (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), generation)
+
+
+def _plan_file(regex, replacement, file_results):
+    (data, generation) = _read(context.local_path(file_results.filename))
+    try:
+        (changes, unused_data) = _edit(data, regex, replacement,
+                                       file_results.linenums())
+    finally:
+        if data:
+            data.close()
+    if not changes:
+        return None
+    return FileEdit(file_results.filename, generation, changes)
+
+
+def plan(results, regex, replacement, max_workers=_MAX_WORKERS):
+    """Finds the changes a replacement would make, without making them.
+
+    Only the matched lines of the files in the results are looked at. Files
+    grouped with another for having the same matches are changed too.
+
+    Args:
+        results: A list of parser.FileResults.
+        regex: The compiled bytes regex to replace.
+        replacement: The replacement bytes, as for re.sub.
+        max_workers: The number of files to read at once.
+    Returns:
+        A tuple of the list of FileEdits for the files that would change, and
+        a list of (file name, error) pairs for the files that couldn't be
+        read.
+    """
+    edits = []
+    errors = []
+    results = parser.expand_duplicates(results)
+
+    def plan_file(file_results):
+        try:
+            return (_plan_file(regex, replacement, file_results), None)
+        except (OSError, IOError, ValueError) as e:
+            return (None, e)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for (file_results, (edit, err)) in zip(
+                results, executor.map(plan_file, results)):
+            if err:
+                errors.append((file_results.filename, err))
+            elif edit:
+                edits.append(edit)
+    return (edits, errors)
+
+
+def _apply_file(regex, replacement, edit):
+    path = context.local_path(edit.filename)
+    (data, generation) = _read(path)
+    try:
+        if generation != edit.generation:
+            raise ConflictError('{0} changed since the preview'.format(path))
+        linenums = [linenum for (linenum, unused_old, unused_new)
+                    in edit.changes]
+        (changes, new_data) = _edit(data, regex, replacement, linenums)
+    finally:
+        if data:
+            data.close()
+    if changes != edit.changes:
+        raise ConflictError('{0} changed since the preview'.format(path))
+    # Write the file a symlink points to, rather than replacing the link.
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    if st.st_nlink > 1:
+        # Replacing the file would split it from its other hard links.
+        with open(path, 'r+b') as f:
+            f.write(new_data)
+            f.truncate()
+        return
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(new_data)
+        os.chmod(tmp, st.st_mode)
+        os.replace(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+
+
+def apply(edits, regex, replacement, max_workers=_MAX_WORKERS):
+    """Makes the planned changes.
+
+    Each file is written to a temporary file that then replaces it, so a file
+    is never left half written. Symlinks are followed, and a file with other
+    hard links is written in place instead, so the links keep sharing it.
+    Files that changed since they were planned are left alone.
+
+    Args:
+        edits: The list of FileEdits from plan.
+        regex: The compiled bytes regex to replace.
+        replacement: The replacement bytes, as for re.sub.
+        max_workers: The number of files to write at once.
+    Returns:
+        A tuple of the list of FileEdits that were written, and a list of
+        (file name, error) pairs for the files that weren't.
+    """
+    written = []
+    errors = []
+
+    def apply_file(edit):
+        try:
+            _apply_file(regex, replacement, edit)
+        except (OSError, IOError, ValueError, ConflictError) as e:
+            return e
+        return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for (edit, err) in zip(edits, executor.map(apply_file, edits)):
+            if err:
+                errors.append((edit.filename, err))
+            else:
+                written.append(edit)
+    return (written, errors)
+
+
+def _decode(line):
+    return line.decode('utf-8', 'replace')
+
+
+def format_preview(edits, errors):
+    """Formats the planned changes like a diff, a file at a time.
+
+    Args:
+        edits: The list of FileEdits.
+        errors: The list of (file name, error) pairs for unreadable files.
+    Yields:
+        The strings that make up the preview.
+    """
+    num_changes = 0
+    for edit in edits:
+        num_changes += len(edit.changes)
+        lines = ['{0}:'.format(edit.filename)]
+        for (linenum, old, new) in edit.changes:
+            lines.append('-{0: >5}: {1}'.format(linenum, _decode(old)))
+            lines.append('+{0: >5}: {1}'.format(linenum, _decode(new)))
+        yield '\n'.join(lines)
+        yield '\n\n'
+    for (filename, err) in errors:
+        yield 'Could not read {0}: {1}\n'.format(filename, err)
+    yield '{0} lines to change across {1} files\n'.format(
+        num_changes, len(edits))
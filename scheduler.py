@@ -0,0 +1,460 @@
+import heapq
+import itertools
+import threading
+
+# Worker pools. Searches and indexing get their own workers, so a long
+# indexing run can never hold up a search. Work on results that were already
+# found, like refining or replacing in them, gets its own worker too, so it
+# never queues behind searches.
+SEARCH = 'search'
+INDEX = 'index'
+RESULTS = 'results'
+
+_DEFAULT_POOLS = {SEARCH: 2, INDEX: 1, RESULTS: 1}
+
+# Priorities within a pool; lower runs first.
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# How a job uses its index file.
+READ = 'read'
+UPDATE = 'update'
+REBUILD = 'rebuild'
+
+
+class IndexLock(object):
+    """Coordinates the jobs that use one index file.
+
+    Searches read the index and share the lock. When cindex updates an
+    existing index, it writes a new file and renames it into place, so an
+    update only has to exclude other writers. When cindex rebuilds an index
+    from scratch (-reset), it writes the index file in place, so a rebuild
+    excludes searches too. Rebuilds waiting for searches to finish are let in
+    ahead of new searches.
+
+    The lock never blocks; the Scheduler only starts a job once it gets the
+    lock, and calls it with its own lock held.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writing = False
+        self._rebuilding = False
+        self._rebuilds_waiting = set()
+
+    def try_acquire(self, access, job=None):
+        """Acquires the lock if it is free for the access.
+
+        Args:
+            access: READ, UPDATE or REBUILD.
+            job: The job acquiring the lock. A rebuild that is kept out by
+                searches is remembered, and keeps out new searches until it
+                gets the lock or is forgotten.
+        Returns:
+            True if the lock was acquired.
+        """
+        if access == READ:
+            if self._rebuilding or self._rebuilds_waiting:
+                return False
+            self._readers += 1
+            return True
+        if self._writing:
+            return False
+        if access == REBUILD:
+            if self._readers:
+                self._rebuilds_waiting.add(job)
+                return False
+            self._rebuilds_waiting.discard(job)
+            self._rebuilding = True
+        self._writing = True
+        return True
+
+    def forget(self, job):
+        """Stops a rebuild that will no longer run from keeping searches out.
+
+        Args:
+            job: The job that passed to try_acquire.
+        """
+        self._rebuilds_waiting.discard(job)
+
+    def release(self, access):
+        """Releases the lock.
+
+        Args:
+            access: The access it was acquired with.
+        """
+        if access == READ:
+            self._readers -= 1
+        else:
+            self._writing = False
+            self._rebuilding = False
+
+
+class Job(object):
+    """Work submitted to the Scheduler.
+
+    The same Job can be shared by every caller that submitted identical work;
+    each caller gets its own Subscription to it.
+
+    Attributes:
+        key: The key used to find identical pending jobs, or None.
+        runnable: The object whose run(job) method does the work.
+        result: What run returned, once the job is done.
+        error: The exception run raised, if any, once the job is done.
+    """
+
+    def __init__(self, scheduler, key, runnable, pool, priority,
+                 index_filename, access):
+        self.key = key
+        self.runnable = runnable
+        self.result = None
+        self.error = None
+        self._scheduler = scheduler
+        self._pool = pool
+        self._priority = priority
+        self._index_filename = index_filename
+        self._access = access
+        self._lock = threading.Lock()
+        self._started = False
+        self._cancelled = False
+        self._subscribers = 1
+        self._done = threading.Event()
+        self._done_callbacks = []
+        self._cancel_callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Waits for the job to be done.
+
+        Args:
+            timeout: An optional number of seconds to wait.
+        Returns:
+            True if the job is done.
+        """
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        """Cancels the job.
+
+        A pending job will not run. A running job is told through its cancel
+        callbacks, and is expected to stop soon after.
+        """
+        with self._lock:
+            if self._cancelled or self.done:
+                return
+            self._cancelled = True
+            started = self._started
+            callbacks = self._cancel_callbacks
+            self._cancel_callbacks = []
+        for callback in callbacks:
+            callback()
+        if not started:
+            self._scheduler._forget(self)
+            self._finish()
+
+    def add_cancel_callback(self, callback):
+        """Adds a callback for when the job is cancelled while running.
+
+        If the job is already cancelled, the callback is called right away.
+
+        Args:
+            callback: A function that takes no arguments.
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def remove_cancel_callback(self, callback):
+        """Removes a cancel callback, once what it would stop is done.
+
+        Args:
+            callback: A function passed to add_cancel_callback.
+        Returns:
+            False if the job was cancelled, so the callback was or is being
+            called.
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._cancel_callbacks.remove(callback)
+            return True
+
+    def add_done_callback(self, callback):
+        """Adds a callback for when the job is done or cancelled.
+
+        Callbacks are called from the worker thread, or right away if the job
+        is already done.
+
+        Args:
+            callback: A function that takes the job.
+        """
+        with self._lock:
+            if not self.done:
+                self._done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self):
+        with self._lock:
+            callbacks = self._done_callbacks
+            self._done_callbacks = []
+            self._cancel_callbacks = []
+            self._done.set()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print('Code Search: job callback failed: {0}'.format(e))
+
+    def _subscribe(self):
+        """Adds a subscriber, unless the job is cancelled or being cancelled.
+
+        Returns:
+            True if the subscriber was added.
+        """
+        with self._lock:
+            if self._cancelled or not self._subscribers:
+                return False
+            self._subscribers += 1
+            return True
+
+    def _unsubscribe(self):
+        """Removes a subscriber, cancelling the job after the last one."""
+        with self._lock:
+            self._subscribers -= 1
+            if self._subscribers:
+                return
+        self.cancel()
+
+    def __lt__(self, other):
+        # Only used to break ties in the queue; see Scheduler.submit.
+        return id(self) < id(other)
+
+
+class Subscription(object):
+    """One caller's handle on a Job, which may be shared with other callers.
+
+    Cancelling a Subscription only cancels the Job once every subscriber has
+    cancelled, so one caller giving up never stops work another still wants.
+
+    Attributes:
+        job: The Job.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self._cancelled = False
+
+    @property
+    def key(self):
+        return self.job.key
+
+    @property
+    def runnable(self):
+        return self.job.runnable
+
+    @property
+    def result(self):
+        return self.job.result
+
+    @property
+    def error(self):
+        return self.job.error
+
+    @property
+    def cancelled(self):
+        return self._cancelled or self.job.cancelled
+
+    @property
+    def done(self):
+        return self.job.done
+
+    def wait(self, timeout=None):
+        """Waits for the job to be done; see Job.wait."""
+        return self.job.wait(timeout)
+
+    def cancel(self):
+        """Cancels this subscription, and the job if it was the last one."""
+        if self._cancelled:
+            return
+        self._cancelled = True
+        self.job._unsubscribe()
+
+    def add_cancel_callback(self, callback):
+        """Adds a callback for when the job is cancelled; see Job."""
+        self.job.add_cancel_callback(callback)
+
+    def remove_cancel_callback(self, callback):
+        """Removes a cancel callback; see Job."""
+        return self.job.remove_cancel_callback(callback)
+
+    def add_done_callback(self, callback):
+        """Adds a callback for when the job is done or cancelled.
+
+        Args:
+            callback: A function that takes this Subscription.
+        """
+        self.job.add_done_callback(lambda unused_job: callback(self))
+
+
+class Scheduler(object):
+    """Runs csearch and cindex work on a fixed set of worker threads.
+
+    Work is split into pools, each with a bounded number of workers and a
+    priority queue. Jobs that touch an index file hold that index's IndexLock
+    while they run. A job whose index is locked stays queued while the worker
+    runs the next job it can, so a worker never waits on a lock. Submitting
+    a job with the same key as a job that has not started yet subscribes to
+    the pending job instead of queueing the work twice.
+    """
+
+    def __init__(self, pools=None):
+        """Initializes the Scheduler and starts its workers.
+
+        Args:
+            pools: An optional dict of pool names to the number of workers.
+        """
+        pools = pools or _DEFAULT_POOLS
+        self._cond = threading.Condition()
+        self._queues = dict((pool, []) for pool in pools)
+        self._pending = {}
+        self._seq = itertools.count()
+        self._locks = {}
+        for (pool, num_workers) in pools.items():
+            for unused_i in range(num_workers):
+                worker = threading.Thread(target=self._work, args=(pool,))
+                worker.daemon = True
+                worker.start()
+
+    def submit(self, runnable, key=None, pool=SEARCH, priority=INTERACTIVE,
+               index_filename=None, access=READ):
+        """Queues work to run.
+
+        Args:
+            runnable: An object with a run(job) method. The result of run is
+                saved on the job.
+            key: An optional hashable key identifying the work. If a job with
+                the same key is still waiting to run, it is subscribed to
+                instead.
+            pool: The pool to run the job in.
+            priority: The priority of the job within the pool.
+            index_filename: An optional index file that the job uses.
+            access: How the job uses the index file; READ, UPDATE or REBUILD.
+        Returns:
+            A Subscription to the Job. Check its runnable to see if it was
+            deduplicated.
+        """
+        with self._cond:
+            job = self._pending.get(key) if key is not None else None
+            if job and job._subscribe():
+                return Subscription(job)
+            job = Job(self, key, runnable, pool, priority, index_filename,
+                      access)
+            if key is not None:
+                self._pending[key] = job
+            heapq.heappush(self._queues[pool],
+                           (priority, next(self._seq), job))
+            self._cond.notify_all()
+            return Subscription(job)
+
+    def index_lock(self, index_filename):
+        """Gets the IndexLock for an index file.
+
+        Args:
+            index_filename: The index file location.
+        """
+        with self._cond:
+            lock = self._locks.get(index_filename)
+            if lock is None:
+                lock = self._locks[index_filename] = IndexLock()
+            return lock
+
+    def _forget(self, job):
+        with self._cond:
+            if job.key is not None and self._pending.get(job.key) is job:
+                del self._pending[job.key]
+            if job._index_filename:
+                # A cancelled rebuild could be keeping searches out.
+                self.index_lock(job._index_filename).forget(job)
+                self._cond.notify_all()
+
+    def _start(self, job):
+        """Starts a job if its index lock is free.
+
+        Returns:
+            True if the job was started.
+        """
+        lock = None
+        if job._index_filename:
+            lock = self.index_lock(job._index_filename)
+            if not lock.try_acquire(job._access, job):
+                return False
+        with job._lock:
+            if job._cancelled:
+                # It's dropped from the queue on the next pass.
+                if lock:
+                    lock.release(job._access)
+                return False
+            job._started = True
+        return True
+
+    def _next(self, pool):
+        with self._cond:
+            queue = self._queues[pool]
+            while True:
+                blocked = []
+                job = None
+                while queue:
+                    entry = heapq.heappop(queue)
+                    if entry[2].cancelled:
+                        continue
+                    if self._start(entry[2]):
+                        job = entry[2]
+                        break
+                    blocked.append(entry)
+                for entry in blocked:
+                    heapq.heappush(queue, entry)
+                if job:
+                    if job.key is not None and self._pending.get(
+                            job.key) is job:
+                        del self._pending[job.key]
+                    return job
+                self._cond.wait()
+
+    def _work(self, pool):
+        while True:
+            job = self._next(pool)
+            try:
+                if not job.cancelled:
+                    job.result = job.runnable.run(job)
+            except Exception as e:
+                job.error = e
+            finally:
+                if job._index_filename:
+                    with self._cond:
+                        self.index_lock(job._index_filename).release(
+                            job._access)
+                        self._cond.notify_all()
+            job._finish()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Gets the process wide Scheduler, starting it if needed."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
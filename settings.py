@@ -1,6 +1,49 @@
 import sublime
 
 import os.path
+import shutil
+import threading
+import time
+
+from YetAnotherCodeSearch import daemon
+from YetAnotherCodeSearch import profiling
+
+_SETTINGS_FILE = 'YetAnotherCodeSearch.sublime-settings'
+
+# The Settings for each window, by (window id, index_project_folders), along
+# with the project they were made from.
+_window_settings = {}
+
+# Where each configured csearch and cindex command was found.
+_binaries = {}
+
+_cache_lock = threading.Lock()
+
+# How long to wait before trying to start the daemon again after it failed to
+# start, in seconds.
+_DAEMON_RETRY_SECONDS = 60
+
+# How long to wait for each reply from the daemon, in seconds. It sends a line
+# every second while it works, so this only runs out if it hangs.
+_DAEMON_REPLY_TIMEOUT = 30
+
+# The daemon.Client, and when the daemon last failed to start.
+_daemon_client = None
+_daemon_failed_at = None
+_daemon_lock = threading.Lock()
+
+# The profiling.Profiler, once profiling has been turned on.
+_profiler = None
+
+
+def get(name, default=None):
+    """Gets a value from the YetAnotherCodeSearch settings.
+
+    Args:
+        name: The name of the setting.
+        default: The value to use if the setting is not set.
+    """
+    return sublime.load_settings(_SETTINGS_FILE).get(name, default)
 
 
 def fix_path(path, project_dir=None):
@@ -68,7 +111,7 @@ def get_project_settings(project_data,
         Exception: If an index file was set, but it doesn't exist or if the
             index file is missing.
     """
-    settings = sublime.load_settings('YetAnotherCodeSearch.sublime-settings')
+    settings = sublime.load_settings(_SETTINGS_FILE)
     path_cindex = settings.get('path_cindex')
     path_csearch = settings.get('path_csearch')
     index_filename = None
@@ -88,3 +131,150 @@ def get_project_settings(project_data,
     return Settings(path_csearch, path_cindex,
                     index_filename=index_filename,
                     paths_to_index=paths_to_index)
+
+
+def find_binary(path):
+    """Finds a command the way it will be run.
+
+    The result is remembered until the settings change.
+
+    Args:
+        path: The command name or path, as set in the settings.
+    Returns:
+        The full path to the command, or None if it can't be run.
+    """
+    with _cache_lock:
+        if path in _binaries:
+            return _binaries[path]
+    expanded = os.path.expanduser(path)
+    if os.path.dirname(expanded):
+        found = None
+        if os.path.isfile(expanded) and os.access(expanded, os.X_OK):
+            found = os.path.abspath(expanded)
+    else:
+        found = shutil.which(expanded)
+    with _cache_lock:
+        _binaries[path] = found
+    return found
+
+
+def get_window_settings(window, index_project_folders=False):
+    """Gets the Code Search settings for a window's project.
+
+    This is get_project_settings, remembered for the window until its project
+    or the Code Search settings change. The csearch and cindex paths are
+    resolved to the commands that will run, when they can be found.
+
+    Args:
+        window: The sublime.Window.
+        index_project_folders: A boolean which specifies if we should use the
+            project's folders as our starting points for indexing files.
+    Returns:
+        A Settings object describing the code search settings.
+    Raises:
+        Exception: As for get_project_settings.
+    """
+    key = (window.id(), index_project_folders)
+    project = (window.project_file_name(), window.project_data())
+    with _cache_lock:
+        cached = _window_settings.get(key)
+    if cached and cached[0] == project:
+        return cached[1]
+    s = get_project_settings(project[1], project[0],
+                             index_project_folders=index_project_folders)
+    s.csearch_path = find_binary(s.csearch_path) or s.csearch_path
+    s.cindex_path = find_binary(s.cindex_path) or s.cindex_path
+    with _cache_lock:
+        _window_settings[key] = (project, s)
+    return s
+
+
+def clear_cache():
+    """Forgets the remembered window settings and commands."""
+    with _cache_lock:
+        _window_settings.clear()
+        _binaries.clear()
+
+
+def watch(on_change=None):
+    """Clears the remembered settings whenever the settings file changes.
+
+    Args:
+        on_change: An optional callback, run after the settings are cleared.
+    """
+    def changed():
+        clear_cache()
+        if on_change:
+            on_change()
+    sublime.load_settings(_SETTINGS_FILE).add_on_change(
+        'YetAnotherCodeSearch', changed)
+
+
+def unwatch():
+    """Stops watching the settings file."""
+    sublime.load_settings(_SETTINGS_FILE).clear_on_change(
+        'YetAnotherCodeSearch')
+
+
+def get_daemon():
+    """Gets a client for the search daemon, starting the daemon if needed.
+
+    This can wait for the daemon to start, so it should only be called from a
+    worker thread.
+
+    Returns:
+        A daemon.Client, or None if the daemon is turned off or can't be
+        started.
+    """
+    global _daemon_client, _daemon_failed_at
+    if not get('use_daemon', False) or not daemon.supported():
+        return None
+    socket_path = os.path.expanduser(get('daemon_socket', '') or
+                                     daemon.default_socket_path())
+    with _daemon_lock:
+        if _daemon_client and _daemon_client.socket_path == socket_path:
+            return _daemon_client
+        if (_daemon_failed_at is not None and
+                time.monotonic() - _daemon_failed_at < _DAEMON_RETRY_SECONDS):
+            return None
+        cache_dir = os.path.join(sublime.cache_path(), 'YetAnotherCodeSearch')
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            _daemon_client = daemon.start(
+                get('daemon_python', 'python3'),
+                socket_path=socket_path,
+                cache_dir=os.path.join(cache_dir, 'daemon-results'),
+                cache_mb=get('result_cache_size_mb', 64),
+                idle_minutes=get('daemon_idle_minutes', 60),
+                log_filename=os.path.join(cache_dir, 'daemon.log'),
+                timeout=_DAEMON_REPLY_TIMEOUT)
+        except (OSError, daemon.DaemonError) as e:
+            print('Code Search: could not start the daemon: {0}'.format(e))
+            _daemon_client = None
+            _daemon_failed_at = time.monotonic()
+        return _daemon_client
+
+
+def forget_daemon():
+    """Forgets the daemon client, so the daemon is started again if needed."""
+    global _daemon_client
+    with _daemon_lock:
+        _daemon_client = None
+
+
+def get_profiler():
+    """Gets the keeper of csearch and cindex CPU profiles.
+
+    Returns:
+        A profiling.Profiler, or None if profiling is turned off.
+    """
+    global _profiler
+    if not get('profile', False):
+        return None
+    if _profiler is None:
+        _profiler = profiling.Profiler(
+            os.path.join(sublime.cache_path(), 'YetAnotherCodeSearch',
+                         'profiles'))
+    _profiler.max_runs = get('profile_max_runs', 20)
+    _profiler.brute = get('profile_brute', False)
+    return _profiler
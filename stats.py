@@ -0,0 +1,261 @@
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+from YetAnotherCodeSearch import parser
+
+# An escaped character, which is kept, or a quote, which gets escaped.
+_QUOTE_RE = re.compile(r'(\\.)|"')
+
+# The phases of a search that are timed, in the order they run.
+PHASES = ('csearch', 'parse', 'context', 'render', 'total')
+
+# The percentiles shown in reports.
+PERCENTILES = (50, 95, 99)
+
+
+@contextlib.contextmanager
+def timed(timings, phase):
+    """Times a block of code.
+
+    Args:
+        timings: A dict to store the seconds taken in, or None to not time
+            anything.
+        phase: The key to store the time under.
+    """
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - start
+
+
+def normalize_query(search):
+    """Writes a search the same way, however it was typed.
+
+    Each term is quoted. A quote in a term is escaped, so the query parses
+    back to a term with the same regex meaning, and normalizing that gives
+    the same query again.
+
+    Args:
+        search: A parser.Search.
+    Returns:
+        The search as a query string.
+    """
+    parts = ['"{0}"'.format(_QUOTE_RE.sub(
+        lambda m: m.group(1) or '\\"', term)) for term in search.query]
+    parts.extend(search.path_flags())
+    if not search.case:
+        parts.append('case:no')
+    return ' '.join(parts)
+
+
+def make_record(search, results, timings, index_bytes=None, cached=False):
+    """Makes a stats record for a search that ran.
+
+    Args:
+        search: The parser.Search that ran.
+        results: The list of parser.FileResults that were found.
+        timings: A dict of the seconds each of the PHASES took.
+        index_bytes: The size of the index file, if known.
+        cached: If the results came from the result cache.
+    Returns:
+        The record, as a dict that can be written as JSON.
+    """
+    results = results or []
+    # Results with their counts, like worker.LazyResults, aren't read.
+    counts = getattr(results, 'counts', None)
+    if counts is None:
+        counts = parser.count_results(results)
+    return {'time': time.time(),
+            'query': normalize_query(search),
+            'terms': search.query,
+            'file': search.file,
+            'file_patterns': search.files,
+            'exclude_files': search.exclude_files,
+            'langs': search.langs,
+            'kinds': search.kinds,
+            'exclude_kinds': search.exclude_kinds,
+            'case': search.case,
+            'index_bytes': index_bytes,
+            'files': counts[0],
+            'matches': counts[1],
+            'cached': cached,
+            'timings': dict(timings)}
+
+
+def record_search(record):
+    """Gets the parser.Search a record was made for.
+
+    Args:
+        record: A record from make_record.
+    Returns:
+        A parser.Search.
+    """
+    # Records from before the other file flags only have "file".
+    files = record.get('file_patterns',
+                       [record['file']] if record['file'] else [])
+    return parser.Search(query=list(record['terms']), files=files,
+                         exclude_files=record.get('exclude_files'),
+                         langs=record.get('langs'),
+                         kinds=record.get('kinds'),
+                         exclude_kinds=record.get('exclude_kinds'),
+                         case=record['case'])
+
+
+class StatsLog(object):
+    """A bounded log of search stats, stored as JSON lines.
+
+    New records are appended to the file. Once it has twice as many records
+    as it keeps, it is rewritten with just the newest ones, so adding a record
+    stays cheap.
+
+    Attributes:
+        filename: Where the log is stored.
+        max_records: The number of records to keep.
+    """
+
+    def __init__(self, filename, max_records=1000):
+        self.filename = filename
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._count = None
+
+    def add(self, record):
+        """Appends a record to the log.
+
+        Args:
+            record: A record from make_record.
+        """
+        line = json.dumps(record, sort_keys=True) + '\n'
+        with self._lock:
+            if self._count is None:
+                self._count = len(self._read_lines())
+            directory = os.path.dirname(self.filename)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.filename, 'a', encoding='utf-8',
+                      errors='surrogateescape') as f:
+                f.write(line)
+            self._count += 1
+            if self._count > 2 * self.max_records:
+                self._compact()
+
+    def records(self):
+        """Returns the newest records, oldest first."""
+        with self._lock:
+            lines = self._read_lines()
+        records = []
+        for line in lines[-self.max_records:]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass  # A line cut short by a crash.
+        return records
+
+    def clear(self):
+        """Removes every record."""
+        with self._lock:
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+            self._count = 0
+
+    def _read_lines(self):
+        try:
+            with open(self.filename, encoding='utf-8',
+                      errors='surrogateescape') as f:
+                return f.readlines()
+        except (OSError, IOError):
+            return []
+
+    def _compact(self):
+        # Must hold the lock.
+        lines = self._read_lines()[-self.max_records:]
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            f.writelines(lines)
+        os.replace(tmp, self.filename)
+        self._count = len(lines)
+
+
+def percentile(values, p):
+    """Returns the p-th percentile of the values, by nearest rank.
+
+    Args:
+        values: A non-empty list of numbers.
+        p: The percentile, from 0 to 100.
+    """
+    values = sorted(values)
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def latencies(records):
+    """Works out the latency percentiles of each phase.
+
+    Args:
+        records: A list of records from make_record.
+    Returns:
+        A list of (phase, count, [percentile seconds]) tuples, one for each
+        of the PHASES that was timed, with the PERCENTILES in order.
+    """
+    table = []
+    for phase in PHASES:
+        values = [r['timings'][phase] for r in records
+                  if phase in r.get('timings', {})]
+        if values:
+            table.append((phase, len(values),
+                          [percentile(values, p) for p in PERCENTILES]))
+    return table
+
+
+def slowest(records, limit=10):
+    """Returns the records that took the longest, slowest first."""
+    timed_records = [r for r in records if 'total' in r.get('timings', {})]
+    timed_records.sort(key=lambda r: r['timings']['total'], reverse=True)
+    return timed_records[:limit]
+
+
+def _ms(seconds):
+    return '{0:.0f}ms'.format(seconds * 1000)
+
+
+def format_report(records, limit=10):
+    """Formats a latency report.
+
+    Args:
+        records: A list of records from make_record.
+        limit: The number of slowest searches to list.
+    Yields:
+        The lines of the report.
+    """
+    if not records:
+        yield 'No searches recorded\n'
+        return
+    num_cached = sum(1 for r in records if r.get('cached'))
+    yield '{0} searches, {1} from the cache\n\n'.format(len(records),
+                                                        num_cached)
+    yield '{0: <10}{1: >8}'.format('phase', 'count')
+    yield ''.join('{0: >10}'.format('p{0}'.format(p)) for p in PERCENTILES)
+    yield '\n'
+    for (phase, count, values) in latencies(records):
+        yield '{0: <10}{1: >8}'.format(phase, count)
+        yield ''.join('{0: >10}'.format(_ms(v)) for v in values)
+        yield '\n'
+    yield '\nSlowest searches:\n'
+    for r in slowest(records, limit):
+        index_mb = ''
+        if r.get('index_bytes') is not None:
+            index_mb = ', {0:.1f} MB index'.format(
+                r['index_bytes'] / (1024 * 1024))
+        yield '{0: >10}  {1}  ({2} matches in {3} files{4}{5})\n'.format(
+            _ms(r['timings']['total']), r['query'], r['matches'], r['files'],
+            index_mb, ', cached' if r.get('cached') else '')
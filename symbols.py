@@ -0,0 +1,437 @@
+import bisect
+import collections
+import concurrent.futures
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+
+_MAGIC = b'YACSSYM1'
+_SUFFIX = '.symbols'
+
+# Files bigger than this are most likely generated, and are skipped.
+_MAX_FILE_SIZE = 4 * 1024 * 1024
+
+# How many files to read at once, when read by threads.
+_MAX_WORKERS = 4
+
+# How many files a process pool worker is sent at a time.
+_PROCESS_CHUNK = 64
+
+# magic, number of files, number of symbols, and the offsets of the file
+# table, symbol table and string pool.
+_HEADER = struct.Struct('>8sIIIII')
+# name offset, name length, mtime, size
+_FILE = struct.Struct('>IIdQ')
+# name offset, name length, kind, file id, line number
+_SYMBOL = struct.Struct('>IHBxII')
+
+KINDS = ('function', 'method', 'class', 'type')
+
+_FUNCTION, _METHOD, _CLASS, _TYPE = range(len(KINDS))
+
+
+def _patterns(*patterns):
+    return [(kind, re.compile(pattern, re.MULTILINE))
+            for (kind, pattern) in patterns]
+
+
+_C_LIKE = _patterns(
+    (_CLASS, br'^[ \t]*(?:typedef[ \t]+)?(?:class|struct|union|enum)[ \t]+'
+             br'(\w+)[^;\n]*$'),
+    (_FUNCTION, br'^(?:[\w*&:<>,]+[ \t]+)+[*&]*(?:\w+::)*(\w+)[ \t]*'
+                br'\([^;\n]*$'))
+
+_LANGUAGES = {
+    'python': _patterns(
+        (_FUNCTION, br'^(?:async[ \t]+)?def[ \t]+(\w+)'),
+        (_METHOD, br'^[ \t]+(?:async[ \t]+)?def[ \t]+(\w+)'),
+        (_CLASS, br'^[ \t]*class[ \t]+(\w+)')),
+    'go': _patterns(
+        (_FUNCTION, br'^func[ \t]+(\w+)'),
+        (_METHOD, br'^func[ \t]*\([^)]*\)[ \t]*(\w+)'),
+        (_TYPE, br'^type[ \t]+(\w+)')),
+    'javascript': _patterns(
+        (_FUNCTION, br'^[ \t]*(?:export[ \t]+)?(?:default[ \t]+)?'
+                    br'(?:async[ \t]+)?function\*?[ \t]+(\w+)'),
+        (_CLASS, br'^[ \t]*(?:export[ \t]+)?(?:default[ \t]+)?'
+                 br'(?:abstract[ \t]+)?class[ \t]+(\w+)'),
+        (_TYPE, br'^[ \t]*(?:export[ \t]+)?(?:interface|type)[ \t]+(\w+)')),
+    'java': _patterns(
+        (_CLASS, br'^[ \t]*(?:(?:public|protected|private|static|final|'
+                 br'abstract|sealed|internal|partial)[ \t]+)*'
+                 br'(?:class|interface|enum|record|struct)[ \t]+(\w+)')),
+    'ruby': _patterns(
+        (_METHOD, br'^[ \t]*def[ \t]+(?:self\.)?(\w+[?!=]?)'),
+        (_CLASS, br'^[ \t]*(?:class|module)[ \t]+(?:\w+::)*(\w+)')),
+    'rust': _patterns(
+        (_FUNCTION, br'^[ \t]*(?:pub(?:\([^)]*\))?[ \t]+)?(?:const[ \t]+)?'
+                    br'(?:async[ \t]+)?(?:unsafe[ \t]+)?fn[ \t]+(\w+)'),
+        (_TYPE, br'^[ \t]*(?:pub(?:\([^)]*\))?[ \t]+)?'
+                br'(?:struct|enum|trait|type|union)[ \t]+(\w+)')),
+    'php': _patterns(
+        (_FUNCTION, br'^[ \t]*(?:(?:public|protected|private|static|'
+                    br'abstract|final)[ \t]+)*function[ \t]+&?(\w+)'),
+        (_CLASS, br'^[ \t]*(?:(?:abstract|final)[ \t]+)*'
+                 br'(?:class|interface|trait)[ \t]+(\w+)')),
+    'c': _C_LIKE,
+}
+
+_EXTENSIONS = {
+    '.py': 'python',
+    '.go': 'go',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript',
+    '.ts': 'javascript', '.tsx': 'javascript',
+    '.java': 'java', '.cs': 'java', '.kt': 'java', '.scala': 'java',
+    '.rb': 'ruby',
+    '.rs': 'rust',
+    '.php': 'php',
+    '.c': 'c', '.h': 'c', '.cc': 'c', '.cpp': 'c', '.cxx': 'c', '.hh': 'c',
+    '.hpp': 'c', '.m': 'c', '.mm': 'c',
+}
+
+Symbol = collections.namedtuple('Symbol', ['name', 'path', 'line', 'kind'])
+
+
+def table_path(index_filename):
+    """Gets where the symbol table for an index is kept.
+
+    Args:
+        index_filename: The csearchindex file location.
+    """
+    return index_filename + _SUFFIX
+
+
+def extract(data, language):
+    """Finds the definitions in a file.
+
+    Args:
+        data: The file contents as bytes.
+        language: The language of the file, one of the _LANGUAGES keys.
+    Returns:
+        A list of (name bytes, line number, kind) tuples, in line order.
+    """
+    found = []
+    for (kind, pattern) in _LANGUAGES[language]:
+        found.extend((m.start(), m.group(1), kind)
+                     for m in pattern.finditer(data))
+    found.sort()
+    res = []
+    linenum = 1
+    pos = 0
+    for (start, name, kind) in found:
+        linenum += data.count(b'\n', pos, start)
+        pos = start
+        res.append((name, linenum, kind))
+    return res
+
+
+def _extract_file(path, st):
+    """Finds the definitions in a file on disk.
+
+    Args:
+        path: The file to read.
+        st: The os.stat result for the file.
+    Returns:
+        The list of definitions, or None if the file couldn't be read.
+    """
+    language = _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if not language or st.st_size > _MAX_FILE_SIZE:
+        return []
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (OSError, IOError):
+        return None
+    return extract(data, language)
+
+
+def _extract_path(path):
+    """Finds the definitions in a file on disk, in a pool worker.
+
+    Args:
+        path: The file to read.
+    Returns:
+        A tuple of the file's (mtime, size) and its list of definitions, or
+        None if the file couldn't be read.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    definitions = _extract_file(path, st)
+    if definitions is None:
+        return None
+    return ((st.st_mtime, st.st_size), definitions)
+
+
+def _fold(name):
+    return name.lower()
+
+
+def write_table(filename, files):
+    """Writes a symbol table.
+
+    Args:
+        filename: Where to write the table.
+        files: A list of (path, (mtime, size), definitions) tuples, where
+            definitions is as returned by extract.
+    """
+    pool = bytearray()
+    strings = {}
+
+    def add_string(data):
+        offset = strings.get(data)
+        if offset is None:
+            offset = strings[data] = len(pool)
+            pool.extend(data)
+        return (offset, len(data))
+
+    file_table = bytearray()
+    entries = []
+    for (file_id, (path, generation, definitions)) in enumerate(files):
+        (offset, length) = add_string(
+            path.encode('utf-8', 'surrogateescape'))
+        file_table += _FILE.pack(offset, length, generation[0], generation[1])
+        for (name, linenum, kind) in definitions:
+            entries.append((_fold(name), name, file_id, linenum, kind))
+    entries.sort()
+    symbol_table = bytearray()
+    for (unused_key, name, file_id, linenum, kind) in entries:
+        (offset, length) = add_string(name)
+        symbol_table += _SYMBOL.pack(offset, length, kind, file_id, linenum)
+    files_offset = _HEADER.size
+    symbols_offset = files_offset + len(file_table)
+    pool_offset = symbols_offset + len(symbol_table)
+    header = _HEADER.pack(_MAGIC, len(files), len(entries), files_offset,
+                          symbols_offset, pool_offset)
+    directory = os.path.dirname(os.path.abspath(filename))
+    (fd, tmp) = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(file_table)
+            f.write(symbol_table)
+            f.write(pool)
+        os.replace(tmp, filename)
+    except:
+        os.remove(tmp)
+        raise
+
+
+class CorruptTableError(Exception):
+    """The symbol table file can't be read."""
+    pass
+
+
+class SymbolTable(object):
+    """Reads a symbol table written by write_table.
+
+    The table is mmap'd, and the symbols are sorted by their case folded name,
+    so a lookup is a binary search.
+
+    Attributes:
+        filename: The symbol table file.
+        num_files: The number of files in the table.
+        num_symbols: The number of symbols in the table.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, self.num_files, self.num_symbols, self._files_offset,
+             self._symbols_offset, self._pool_offset) = _HEADER.unpack_from(
+                self._data)
+        except struct.error:
+            magic = None
+        if magic != _MAGIC:
+            self._data.close()
+            raise CorruptTableError('{0} is not a symbol table'.format(
+                filename))
+        self.generation = (os.stat(filename).st_mtime, len(self._data))
+        self._keys = _Keys(self)
+
+    def close(self):
+        self._data.close()
+
+    def _string(self, offset, length):
+        start = self._pool_offset + offset
+        return self._data[start:start + length]
+
+    def _symbol_entry(self, i):
+        return _SYMBOL.unpack_from(self._data,
+                                   self._symbols_offset + i * _SYMBOL.size)
+
+    def _file_entry(self, file_id):
+        return _FILE.unpack_from(self._data,
+                                 self._files_offset + file_id * _FILE.size)
+
+    def _key(self, i):
+        (offset, length, unused_kind, unused_file_id,
+         unused_line) = self._symbol_entry(i)
+        return _fold(self._string(offset, length))
+
+    def path(self, file_id):
+        (offset, length, unused_mtime, unused_size) = self._file_entry(
+            file_id)
+        return self._string(offset, length).decode('utf-8', 'surrogateescape')
+
+    def files(self):
+        """Yields (path, (mtime, size), file id) for each file."""
+        for file_id in range(self.num_files):
+            (offset, length, mtime, size) = self._file_entry(file_id)
+            path = self._string(offset, length).decode('utf-8',
+                                                       'surrogateescape')
+            yield (path, (mtime, size), file_id)
+
+    def symbol(self, i):
+        """Gets the i-th symbol, in name order.
+
+        Returns:
+            A Symbol.
+        """
+        (offset, length, kind, file_id, linenum) = self._symbol_entry(i)
+        return Symbol(self._string(offset, length).decode('utf-8', 'replace'),
+                      self.path(file_id), linenum, KINDS[kind])
+
+    def definitions(self):
+        """Yields (file id, (name, line number, kind)) for each symbol."""
+        for i in range(self.num_symbols):
+            (offset, length, kind, file_id, linenum) = self._symbol_entry(i)
+            yield (file_id, (self._string(offset, length), linenum, kind))
+
+    def lookup(self, prefix, limit=None):
+        """Finds the symbols that start with a prefix, ignoring case.
+
+        Exact matches come first.
+
+        Args:
+            prefix: The start of the symbol names to find.
+            limit: The most symbols to return.
+        Returns:
+            A list of Symbols.
+        """
+        key = _fold(prefix.encode('utf-8'))
+        lo = bisect.bisect_left(self._keys, key)
+        res = []
+        for i in range(lo, self.num_symbols):
+            if limit is not None and len(res) >= limit:
+                break
+            if not self._key(i).startswith(key):
+                break
+            res.append(self.symbol(i))
+        res.sort(key=lambda symbol: symbol.name.lower() != prefix.lower())
+        return res
+
+
+class _Keys(object):
+    """A sequence view of the folded symbol names, for bisect."""
+
+    def __init__(self, table):
+        self._table = table
+
+    def __len__(self):
+        return self._table.num_symbols
+
+    def __getitem__(self, i):
+        return self._table._key(i)
+
+
+def build_table(filename, paths, max_workers=_MAX_WORKERS, processes=False):
+    """Builds the symbol table for the indexed files.
+
+    Files that haven't changed since the last table was written keep their
+    symbols without being read again.
+
+    The regexes hold the GIL, so threads mostly help with reading the files.
+    A process pool extracts in parallel, but can only be used from a
+    standalone Python; inside the editor, sys.executable is the editor.
+
+    Args:
+        filename: Where the symbol table is kept.
+        paths: The list of indexed file paths.
+        max_workers: The number of files to read at once, or None for the
+            number of CPUs with processes.
+        processes: If the files are read by a process pool instead of
+            threads.
+    Returns:
+        The number of symbols found.
+    """
+    previous = {}
+    try:
+        old = SymbolTable(filename)
+    except (OSError, IOError, ValueError, CorruptTableError):
+        old = None
+    if old:
+        try:
+            definitions = collections.defaultdict(list)
+            for (file_id, definition) in old.definitions():
+                definitions[file_id].append(definition)
+            for (path, generation, file_id) in old.files():
+                previous[path] = (generation, definitions[file_id])
+        finally:
+            old.close()
+
+    extracted = {}
+    changed = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        cached = previous.get(path)
+        if cached and cached[0] == (st.st_mtime, st.st_size):
+            extracted[path] = cached
+        else:
+            changed.append(path)
+
+    if processes:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+        map_args = {'chunksize': _PROCESS_CHUNK}
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        map_args = {}
+    with executor:
+        extracted.update(zip(changed, executor.map(_extract_path, changed,
+                                                   **map_args)))
+
+    files = []
+    for path in paths:
+        if extracted.get(path) is not None:
+            (generation, definitions) = extracted[path]
+            # Keep the definitions in line order.
+            definitions.sort(key=lambda definition: definition[1])
+            files.append((path, generation, definitions))
+    write_table(filename, files)
+    return sum(len(definitions) for (unused_path, unused_generation,
+                                     definitions) in files)
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def open_table(filename):
+    """Opens a symbol table, reusing it until the file changes.
+
+    Args:
+        filename: The symbol table file.
+    Returns:
+        A SymbolTable.
+    Raises:
+        OSError: If the table doesn't exist.
+        CorruptTableError: If the file isn't a symbol table.
+    """
+    st = os.stat(filename)
+    with _tables_lock:
+        table = _tables.get(filename)
+        if table and table.generation == (st.st_mtime, st.st_size):
+            return table
+        # Old tables are left for the garbage collector, since other threads
+        # may still be reading from them.
+        table = _tables[filename] = SymbolTable(filename)
+        return table
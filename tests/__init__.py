@@ -2,6 +2,7 @@ import sublime
 
 import os
 import os.path
+import struct
 import unittest
 
 
@@ -13,6 +14,43 @@ def _get_index_path():
     return '{0}/test_csearchindex'.format(_get_project_path())
 
 
+def write_index(filename, paths, names, trigrams=None):
+    """Writes a minimal csearchindex file.
+
+    The posting lists themselves are left empty, since only the file list and
+    the posting list sizes are read by the plugin.
+
+    Args:
+        filename: Where to write the index.
+        paths: The list of indexed root paths.
+        names: The sorted list of indexed file names.
+        trigrams: An optional dict of 3 byte trigrams to their file count.
+    """
+    data = bytearray(b'csearch index 1\n')
+    path_data = len(data)
+    for path in paths:
+        data += path.encode('utf-8') + b'\0'
+    data += b'\0'
+    name_data = len(data)
+    offsets = []
+    for name in names:
+        offsets.append(len(data) - name_data)
+        data += name.encode('utf-8') + b'\0'
+    offsets.append(len(data) - name_data)
+    post_data = len(data)
+    name_index = len(data)
+    for off in offsets:
+        data += struct.pack('>I', off)
+    post_index = len(data)
+    for (trigram, count) in sorted((trigrams or {}).items()):
+        data += trigram + struct.pack('>2I', count, 0)
+    data += struct.pack('>5I', path_data, name_data, post_data, name_index,
+                        post_index)
+    data += b'\ncsearch trailr\n'
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
 class CommandTestCase(unittest.TestCase):
 
     def setUp(self):
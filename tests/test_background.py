@@ -0,0 +1,85 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import unittest
+
+from YetAnotherCodeSearch import background
+from YetAnotherCodeSearch import progress
+
+
+class _FakeClock(object):
+
+    def __init__(self):
+        self.now = 100
+
+    def __call__(self):
+        return self.now
+
+
+class IdleTrackerTest(unittest.TestCase):
+
+    def test_idle_seconds(self):
+        clock = _FakeClock()
+        tracker = background.IdleTracker(clock=clock)
+        clock.now += 7
+        self.assertEquals(7, tracker.idle_seconds())
+        tracker.touch()
+        self.assertEquals(0, tracker.idle_seconds())
+
+
+class LowPriorityTest(unittest.TestCase):
+
+    def test_low_priority_command(self):
+        cmd = background.low_priority_command(['cindex', '-verbose'])
+        self.assertEquals(['cindex', '-verbose'], cmd[-2:])
+
+    def test_low_priority_process(self):
+        proc = subprocess.Popen(
+            [sys.executable, '-c', 'print("ok")'], stdout=subprocess.PIPE,
+            **background.low_priority_popen_args())
+        self.assertEquals(b'ok', proc.communicate()[0].strip())
+
+    @unittest.skipUnless(hasattr(os, 'nice') and shutil.which('nice'),
+                         'needs nice')
+    def test_low_priority_niceness(self):
+        cmd = background.low_priority_command(
+            [sys.executable, '-c', 'import os; print(os.nice(0))'])
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                **background.low_priority_popen_args())
+        self.assertEquals(min(19, os.nice(0) + 19),
+                          int(proc.communicate()[0]))
+
+
+@unittest.skipUnless(hasattr(signal, 'SIGSTOP'), 'needs SIGSTOP')
+class ProcessPauserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-c', 'import time; time.sleep(30)'])
+
+    def tearDown(self):
+        self.proc.kill()
+        self.proc.wait()
+
+    def test_pause_and_resume(self):
+        state = progress.IndexProgress()
+        pauser = background.ProcessPauser(self.proc, state)
+        pauser.pause()
+        self.assertTrue(pauser.paused)
+        self.assertTrue(state.paused)
+        background.resume_all()
+        self.assertFalse(pauser.paused)
+        self.assertFalse(state.paused)
+
+    def test_exited_process(self):
+        pauser = background.ProcessPauser(self.proc)
+        self.proc.kill()
+        self.proc.wait()
+        pauser.pause()
+        self.assertFalse(pauser.paused)
+
+
+if __name__ == '__main__':
+    unittest.main()
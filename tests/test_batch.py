@@ -0,0 +1,83 @@
+import unittest
+
+from YetAnotherCodeSearch import batch
+from YetAnotherCodeSearch import parser
+
+
+class ChunkTermsTest(unittest.TestCase):
+
+    def test_single_chunk(self):
+        self.assertEquals([['foo', 'bar']],
+                          batch.chunk_terms(['foo', 'bar'], 100))
+
+    def test_split(self):
+        self.assertEquals([['foo', 'bar'], ['baz']],
+                          batch.chunk_terms(['foo', 'bar', 'baz'], 10))
+
+    def test_long_term(self):
+        self.assertEquals([['foo'], ['a_very_long_term'], ['bar']],
+                          batch.chunk_terms(['foo', 'a_very_long_term', 'bar'],
+                                            10))
+
+
+class TermMatcherTest(unittest.TestCase):
+
+    def test_match(self):
+        matcher = batch.TermMatcher(['foo', 'bar', 'baz'])
+        self.assertEquals([0, 2], matcher.match('foo = baz()'))
+        self.assertEquals([], matcher.match('nothing here'))
+
+    def test_match_overlapping_terms(self):
+        matcher = batch.TermMatcher(['foo', 'foobar', 'o+b'])
+        self.assertEquals([0, 1, 2], matcher.match('x = foobar'))
+
+    def test_match_with_groups_in_terms(self):
+        matcher = batch.TermMatcher(['(a|b)c', 'x(y)'])
+        self.assertEquals([0, 1], matcher.match('bc xy'))
+
+    def test_match_backreferences(self):
+        matcher = batch.TermMatcher(['foo', r'(\w)\1', 'bar'])
+        self.assertEquals([0, 1], matcher.match('foo aa'))
+        self.assertEquals([2], matcher.match('ab bar'))
+
+    def test_match_named_groups(self):
+        matcher = batch.TermMatcher(['(?P<x>a)b', '(?P<x>c)(?P=x)'])
+        self.assertEquals([0, 1], matcher.match('ab cc'))
+        self.assertEquals([], matcher.match('cd'))
+
+    def test_match_inline_flags(self):
+        matcher = batch.TermMatcher(['(?i)foo', 'bar'])
+        self.assertEquals([0, 1], matcher.match('FOO bar'))
+        self.assertEquals([], matcher.match('BAR'))
+
+    def test_match_case_insensitive(self):
+        matcher = batch.TermMatcher(['foo'], case=False)
+        self.assertEquals([0], matcher.match('FOO'))
+        matcher = batch.TermMatcher(['foo'])
+        self.assertEquals([], matcher.match('FOO'))
+
+
+class DemultiplexTest(unittest.TestCase):
+
+    def test_demultiplex(self):
+        results = [
+            parser.FileResults('a.txt', [(1, 'foo'), (2, 'foo bar')]),
+            parser.FileResults('b.txt', [(3, 'bar')])]
+        matcher = batch.TermMatcher(['foo', 'bar', 'baz'])
+        expected = [
+            [parser.FileResults('a.txt', [(1, 'foo'), (2, 'foo bar')])],
+            [parser.FileResults('a.txt', [(2, 'foo bar')]),
+             parser.FileResults('b.txt', [(3, 'bar')])],
+            []]
+        self.assertEquals(expected, batch.demultiplex(results, matcher))
+
+
+class BatchSearchesTest(unittest.TestCase):
+
+    def test_batch_searches(self):
+        search = parser.Search(query=['foo', 'bar', 'baz'], file='.*py$',
+                               case=False)
+        expected = [
+            parser.Search(query=['foo', 'bar'], file='.*py$', case=False),
+            parser.Search(query=['baz'], file='.*py$', case=False)]
+        self.assertEquals(expected, batch.batch_searches(search, 10))
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from YetAnotherCodeSearch import bench
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import plan
+from YetAnotherCodeSearch import progress
+
+
+def read_tree(root):
+    tree = {}
+    for (dirpath, unused_dirnames, filenames) in os.walk(root):
+        for name in filenames:
+            filename = os.path.join(dirpath, name)
+            with open(filename, 'rb') as f:
+                tree[os.path.relpath(filename, root)] = f.read()
+    return tree
+
+
+class GenerateRepoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spec = bench.RepoSpec(files=50, median_bytes=512, max_depth=6,
+                                   minified=1, minified_bytes=20000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_spec_same_tree(self):
+        first = os.path.join(self.directory, 'first')
+        second = os.path.join(self.directory, 'second')
+        self.assertEquals(bench.generate_repo(first, self.spec),
+                          bench.generate_repo(second, self.spec))
+        self.assertEquals(read_tree(first), read_tree(second))
+
+    def test_tree(self):
+        (num_files, unused_bytes) = bench.generate_repo(self.directory,
+                                                        self.spec)
+        tree = read_tree(self.directory)
+        self.assertEquals(51, num_files)
+        self.assertEquals(set(['py', 'go', 'js', 'java', 'c']),
+                          set(name.rsplit('.', 1)[1] for name in tree))
+        self.assertLessEqual(max(name.count(os.sep) for name in tree), 6)
+        minified = tree[os.path.join('static', 'bundle0.min.js')]
+        self.assertEquals(1, minified.count(b'\n'))
+        self.assertGreaterEqual(len(minified), 20000)
+        needles = [name for (name, data) in tree.items()
+                   if bench.NEEDLE.encode('ascii') in data]
+        self.assertTrue(any(name.endswith('.go') for name in needles))
+
+    def test_touch_repo(self):
+        bench.generate_repo(self.directory, self.spec)
+        before = read_tree(self.directory)
+        self.assertEquals(3, bench.touch_repo(self.directory, 3))
+        after = read_tree(self.directory)
+        self.assertEquals(3, sum(1 for name in before
+                                 if before[name] != after[name]))
+
+    def test_unknown_language(self):
+        with self.assertRaises(ValueError):
+            bench.RepoSpec(languages=['cobol'])
+
+
+class QueriesTest(unittest.TestCase):
+
+    def test_kinds(self):
+        for (kind, query) in bench.QUERIES:
+            search = parser.parse_query(query)
+            trigrams = plan.required_trigrams(search.query_re(), search.case)
+            self.assertEquals(kind == 'full-scan', not trigrams, query)
+
+
+class RunBenchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @patch('YetAnotherCodeSearch.engine.run_csearch', autospec=True)
+    @patch('YetAnotherCodeSearch.engine.run_cindex', autospec=True)
+    def test_report(self, mock_run_cindex, mock_run_csearch):
+        mock_run_cindex.return_value = progress.IndexProgress()
+        mock_run_csearch.return_value = (b'/a.go:2:return x\n'
+                                         b'/a.go:4:return y\n'
+                                         b'/b.py:1:return z\n')
+        spec = bench.RepoSpec(files=10, median_bytes=256, minified=0)
+        report = bench.run_benchmark(self.directory, spec, repeat=2,
+                                     changed_files=2,
+                                     queries=[('broad', 'return')])
+        self.assertEquals(2, mock_run_cindex.call_count)
+        self.assertEquals([os.path.join(self.directory, 'repo')],
+                          mock_run_cindex.call_args_list[0][1][
+                              'paths_to_index'])
+        self.assertEquals(2, mock_run_csearch.call_count)
+        self.assertEquals(10, report['repo']['files'])
+        self.assertEquals(2, report['index']['changed_files'])
+        (query,) = report['queries']
+        self.assertEquals(3, query['matches'])
+        self.assertEquals(2, query['files'])
+        self.assertEquals(3, query['highlights'])
+        self.assertEquals(set(bench.PHASES), set(query['timings']))
+
+        text = ''.join(bench.format_report(report))
+        self.assertIn('10 files', text)
+        self.assertIn('broad     return', text)
+        text = ''.join(bench.compare(report, report))
+        self.assertIn('1.00x', text)
+        self.assertNotIn('different trees', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from YetAnotherCodeSearch import cache
+from YetAnotherCodeSearch import parser
+
+_RESULTS = [
+    parser.FileResults('a.txt', [(1, 'Too many cooks'),
+                                 (2, 'TOO MANY cooks')]),
+    parser.FileResults('b/世界.txt', [(34, 'How to cook 世')])]
+
+
+class DumpResultsTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = cache.dump_results(_RESULTS)
+        self.assertEquals(_RESULTS, cache.load_results(data))
+
+    def test_empty(self):
+        self.assertEquals([], cache.load_results(cache.dump_results([])))
+
+    def test_round_trip_with_duplicates(self):
+        results = [parser.FileResults('a.txt', [(1, 'cooks')],
+                                      duplicates=['b.txt', 'c/世界.txt'])]
+        data = cache.dump_results(results)
+        self.assertEquals(results, cache.load_results(data))
+
+    def test_bad_data(self):
+        with self.assertRaises(ValueError):
+            cache.load_results(b'definitely not results')
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = os.path.join(self.tmpdir, 'csearchindex')
+        self._write_index(b'generation 1')
+        self.cache = cache.ResultCache(os.path.join(self.tmpdir, 'cache'),
+                                       1024 * 1024)
+        self.search = parser.Search(query=['cook', 'how'], case=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write_index(self, data, mtime=1000):
+        with open(self.index, 'wb') as f:
+            f.write(data)
+        os.utime(self.index, (mtime, mtime))
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get(self.search, self.index))
+
+    def test_hit(self):
+        self.cache.put(self.search, self.index, _RESULTS)
+        self.assertEquals(_RESULTS, self.cache.get(self.search, self.index))
+
+    def test_hit_grouped_or_not(self):
+        results = [parser.FileResults('a.txt', [(1, 'cooks')],
+                                      duplicates=['b.txt'])]
+        self.cache.put(self.search, self.index, results)
+        self.assertEquals(results, self.cache.get(self.search, self.index,
+                                                  group=True))
+        self.assertEquals([parser.FileResults('a.txt', [(1, 'cooks')]),
+                           parser.FileResults('b.txt', [(1, 'cooks')])],
+                          self.cache.get(self.search, self.index))
+
+    def test_hit_with_reordered_terms(self):
+        self.cache.put(self.search, self.index, _RESULTS)
+        search = parser.Search(query=['how', 'cook'], case=False)
+        self.assertEquals(_RESULTS, self.cache.get(search, self.index))
+
+    def test_miss_with_different_options(self):
+        self.cache.put(self.search, self.index, _RESULTS)
+        search = parser.Search(query=['cook', 'how'], case=True)
+        self.assertIsNone(self.cache.get(search, self.index))
+        search = parser.Search(query=['cook', 'how'], file='.*txt',
+                               case=False)
+        self.assertIsNone(self.cache.get(search, self.index))
+
+    def test_index_rebuild_invalidates(self):
+        self.cache.put(self.search, self.index, _RESULTS)
+        self._write_index(b'generation 2, rebuilt', mtime=2000)
+        self.assertIsNone(self.cache.get(self.search, self.index))
+        self.cache.put(self.search, self.index, _RESULTS[:1])
+        self.assertEquals(1, len(os.listdir(self.cache.directory)))
+        self.assertEquals(_RESULTS[:1],
+                          self.cache.get(self.search, self.index))
+
+    def test_eviction(self):
+        entry_size = len(cache.dump_results(_RESULTS))
+        self.cache.max_bytes = entry_size * 2
+        searches = [parser.Search(query=[str(i)]) for i in range(3)]
+        for (i, search) in enumerate(searches):
+            self.cache.put(search, self.index, _RESULTS)
+            for name in os.listdir(self.cache.directory):
+                path = os.path.join(self.cache.directory, name)
+                os.utime(path, (os.stat(path).st_mtime - 10,) * 2)
+        self.assertIsNone(self.cache.get(searches[0], self.index))
+        self.assertEquals(_RESULTS, self.cache.get(searches[1], self.index))
+        self.assertEquals(_RESULTS, self.cache.get(searches[2], self.index))
+
+    def test_clear(self):
+        self.cache.put(self.search, self.index, _RESULTS)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(self.search, self.index))
+
+    def test_put_failure(self):
+        with patch('os.replace', side_effect=OSError('disk full')):
+            self.cache.put(self.search, self.index, _RESULTS)
+        self.assertEquals([], os.listdir(self.cache.directory))
+        self.assertIsNone(self.cache.get(self.search, self.index))
+
+    def test_put_unwritable_directory(self):
+        with open(self.cache.directory, 'w'):
+            pass
+        self.cache.put(self.search, self.index, _RESULTS)
+        self.assertIsNone(self.cache.get(self.search, self.index))
@@ -0,0 +1,62 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from YetAnotherCodeSearch import cli
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import stats
+
+
+class WriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.results = [parser.FileResults('a.txt', [(2, 'cooks')],
+                                           context=[(1, 'too'), (3, 'many')])]
+
+    def test_write_text(self):
+        out = io.StringIO()
+        cli.write_text(self.results, out)
+        self.assertEquals(
+            'a.txt:\n'
+            '    1  too\n'
+            '    2: cooks\n'
+            '    3  many\n'
+            '\n'
+            '1 matches across 1 files\n', out.getvalue())
+
+    def test_write_text_no_matches(self):
+        out = io.StringIO()
+        cli.write_text([], out)
+        self.assertEquals('No matches found\n', out.getvalue())
+
+    def test_write_json_lines(self):
+        out = io.StringIO()
+        cli.write_json_lines(self.results, out)
+        self.assertEquals(
+            [{'file': 'a.txt', 'line': 1, 'text': 'too', 'match': False},
+             {'file': 'a.txt', 'line': 2, 'text': 'cooks', 'match': True},
+             {'file': 'a.txt', 'line': 3, 'text': 'many', 'match': False}],
+            [json.loads(line) for line in out.getvalue().splitlines()])
+
+
+class MainTest(unittest.TestCase):
+
+    def test_missing_csearch(self):
+        out = io.StringIO()
+        self.assertEquals(2, cli.main(['search', '--csearch',
+                                       '/does/not/exist', 'foo'], out=out))
+
+    def test_stats(self):
+        directory = tempfile.mkdtemp()
+        try:
+            log = os.path.join(directory, 'stats.jsonl')
+            stats.StatsLog(log).add(stats.make_record(
+                parser.parse_query('foo'), [], {'total': .25}))
+            out = io.StringIO()
+            self.assertEquals(0, cli.main(['stats', log], out=out))
+            self.assertIn('250ms  "foo"', out.getvalue())
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from YetAnotherCodeSearch import context
+from YetAnotherCodeSearch import parser
+
+
+class ContextLinenumsTest(unittest.TestCase):
+
+    def test_merges_overlapping(self):
+        self.assertEquals([1, 3, 4, 6, 7, 9, 10],
+                          context.context_linenums([2, 5, 8], 2))
+
+    def test_start_of_file(self):
+        self.assertEquals([2, 3], context.context_linenums([1], 2))
+
+
+class LineCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = context.LineCache(max_files=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_lines(self):
+        path = self._write('a.txt', b'one\ntwo\r\nthree\nfour')
+        self.assertEquals(
+            [(1, b'one'), (2, b'two'), (4, b'four')],
+            self.cache.lines(path, [1, 2, 4, 5]))
+
+    def test_trailing_newline(self):
+        path = self._write('a.txt', b'one\ntwo\n')
+        self.assertEquals([(2, b'two')], self.cache.lines(path, [2, 3]))
+
+    def test_empty_file(self):
+        path = self._write('a.txt', b'')
+        self.assertEquals([], self.cache.lines(path, [1]))
+
+    def test_more_lines_later(self):
+        path = self._write('a.txt', b'\n'.join(
+            str(i).encode('ascii') for i in range(1, 101)))
+        self.assertEquals([(2, b'2')], self.cache.lines(path, [2]))
+        self.assertEquals([(1, b'1'), (99, b'99'), (100, b'100')],
+                          self.cache.lines(path, [1, 99, 100]))
+
+    def test_file_changed(self):
+        path = self._write('a.txt', b'one\ntwo\n')
+        self.assertEquals([(2, b'two')], self.cache.lines(path, [2]))
+        self._write('a.txt', b'uno\ndos\ntres\n')
+        os.utime(path, (0, 0))
+        self.assertEquals([(2, b'dos')], self.cache.lines(path, [2]))
+
+    def test_files_scanned_in_parallel(self):
+        path_a = self._write('a.txt', b'one\ntwo\n')
+        path_b = self._write('b.txt', b'uno\ndos\n')
+        self.cache.lines(path_a, [1])
+        read = threading.Event()
+
+        def read_b():
+            self.cache.lines(path_b, [2])
+            read.set()
+        # While a.txt is being scanned, b.txt can still be read.
+        with self.cache._files[path_a].lock:
+            threading.Thread(target=read_b).start()
+            self.assertTrue(read.wait(5))
+
+
+class AddContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_add_context(self):
+        path = os.path.join(self.dir, 'a.txt')
+        with open(path, 'wb') as f:
+            f.write(b'\n'.join(('line {0}'.format(i).encode('ascii')
+                                for i in range(1, 21))))
+        results = [parser.FileResults(path, [(3, 'line 3'), (5, 'line 5'),
+                                             (12, 'line 12')]),
+                   parser.FileResults(os.path.join(self.dir, 'gone.txt'),
+                                      [(1, 'line 1')])]
+        context.add_context(results, 1)
+        self.assertEquals([(2, 'line 2'), (4, 'line 4'), (6, 'line 6'),
+                           (11, 'line 11'), (13, 'line 13')],
+                          results[0].context)
+        self.assertEquals([], results[1].context)
+        self.assertEquals('\n'.join([
+            path + ':',
+            '    2  line 2',
+            '    3: line 3',
+            '    4  line 4',
+            '    5: line 5',
+            '    6  line 6',
+            '    .',
+            '   11  line 11',
+            '   12: line 12',
+            '   13  line 13']), str(results[0]))
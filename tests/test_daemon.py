@@ -0,0 +1,215 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from YetAnotherCodeSearch import cache
+from YetAnotherCodeSearch import daemon
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import progress
+
+
+@unittest.skipUnless(daemon.supported(), 'needs Unix sockets')
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'daemon.sock')
+        self.daemon = daemon.Daemon(self.socket_path)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+        self.client = daemon.Client(self.socket_path, timeout=10)
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.socket_path):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(.01)
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def test_ping(self):
+        self.assertEquals(os.getpid(), self.client.ping())
+
+    def test_search_to_json(self):
+        search = parser.parse_query('foo -file:vendor lang:go case:no')
+        self.assertEquals(
+            search, daemon.search_from_json(daemon.search_to_json(search)))
+
+    @patch('YetAnotherCodeSearch.engine.search', autospec=True)
+    def test_search(self, mock_search):
+        mock_search.return_value = [
+            parser.FileResults('a.txt', [(2, 'foo bar'), (4, 'foo')]),
+            parser.FileResults(b'b\xff.txt', [(1, 'foo\udcff')])]
+        search = parser.parse_query('foo file:txt')
+        (results, cached, unused_timings) = self.client.search(
+            search, index_filename='/x/index', path_csearch='/x/csearch')
+        self.assertEquals(
+            [parser.FileResults('a.txt', [(2, 'foo bar'), (4, 'foo')]),
+             parser.FileResults('b\udcff.txt', [(1, 'foo\udcff')])],
+            results)
+        self.assertFalse(cached)
+        self.assertEquals(search, mock_search.call_args[0][0])
+        self.assertEquals('/x/csearch',
+                          mock_search.call_args[1]['path_csearch'])
+        self.assertEquals('/x/index',
+                          mock_search.call_args[1]['index_filename'])
+
+    @patch('YetAnotherCodeSearch.engine.search', autospec=True)
+    def test_search_without_cache(self, mock_search):
+        self.daemon._result_cache = cache.ResultCache(
+            os.path.join(self.directory, 'results'), 1024 * 1024)
+        index_filename = os.path.join(self.directory, 'index')
+        with open(index_filename, 'wb'):
+            pass
+        search = parser.parse_query('foo')
+        mock_search.return_value = [parser.FileResults('a.txt', [(1, 'foo')])]
+        self.client.search(search, index_filename=index_filename)
+        (unused, cached, unused) = self.client.search(
+            search, index_filename=index_filename)
+        self.assertTrue(cached)
+        mock_search.return_value = [parser.FileResults('b.txt', [(1, 'foo')])]
+        (results, cached, unused) = self.client.search(
+            search, index_filename=index_filename, use_cache=False)
+        self.assertFalse(cached)
+        self.assertEquals([parser.FileResults('b.txt', [(1, 'foo')])],
+                          results)
+        # The new results replace the cached ones.
+        (results, cached, unused) = self.client.search(
+            search, index_filename=index_filename)
+        self.assertTrue(cached)
+        self.assertEquals([parser.FileResults('b.txt', [(1, 'foo')])],
+                          results)
+        self.client.invalidate()
+        (unused, cached, unused) = self.client.search(
+            search, index_filename=index_filename)
+        self.assertFalse(cached)
+
+    @patch('YetAnotherCodeSearch.daemon._KEEPALIVE_INTERVAL', .01)
+    @patch('YetAnotherCodeSearch.engine.search', autospec=True)
+    def test_slow_search(self, mock_search):
+        def search(*args, **kwargs):
+            time.sleep(.2)
+            return [parser.FileResults('a.txt', [(1, 'foo')])]
+        mock_search.side_effect = search
+        client = daemon.Client(self.socket_path, timeout=.1)
+        (results, unused, unused) = client.search(parser.parse_query('foo'))
+        self.assertEquals([parser.FileResults('a.txt', [(1, 'foo')])],
+                          results)
+
+    def test_socket_of_other_user(self):
+        uid = os.getuid()
+        with patch('os.getuid', return_value=uid + 1):
+            with self.assertRaisesRegex(daemon.DaemonError, 'another user'):
+                self.client.ping()
+
+    @patch('YetAnotherCodeSearch.engine.search', autospec=True)
+    def test_search_error(self, mock_search):
+        mock_search.side_effect = subprocess.CalledProcessError(2, 'csearch')
+        with self.assertRaises(daemon.DaemonError):
+            self.client.search(parser.parse_query('foo'))
+        # The daemon carries on.
+        self.client.ping()
+
+    @patch('YetAnotherCodeSearch.engine.run_cindex', autospec=True)
+    def test_index_is_shared(self, mock_run_cindex):
+        release = threading.Event()
+
+        def run_cindex(**kwargs):
+            state = progress.IndexProgress()
+            kwargs['on_start'](None, state)
+            state.files = 3
+            release.wait(10)
+            state.index_bytes_after = 0
+            return state
+        mock_run_cindex.side_effect = run_cindex
+
+        summaries = []
+        seen = []
+
+        def index():
+            summaries.append(self.client.index(
+                index_filename='/x/index', paths_to_index=['/src'],
+                on_progress=lambda state: seen.append(state.files)))
+        first = threading.Thread(target=index)
+        first.start()
+        deadline = time.monotonic() + 5
+        while not self.daemon._indexing:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(.01)
+        second = threading.Thread(target=index)
+        second.start()
+        time.sleep(.5)
+        release.set()
+        first.join()
+        second.join()
+        self.assertEquals(1, mock_run_cindex.call_count)
+        self.assertEquals(2, len(summaries))
+        self.assertTrue(summaries[0].startswith('indexed 3 files'))
+        self.assertIn(3, seen)
+
+    def test_unknown_request(self):
+        with self.assertRaises(daemon.DaemonError):
+            list(self.client._request({'op': 'nope'}))
+
+    def test_second_daemon(self):
+        with self.assertRaises(daemon.DaemonError):
+            daemon.Daemon(self.socket_path).serve_forever()
+
+
+@unittest.skipUnless(daemon.supported(), 'needs Unix sockets')
+class SocketDirTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = patch.dict(os.environ,
+                             {'XDG_RUNTIME_DIR': self.directory})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.socket_dir = os.path.join(self.directory, 'yetanothercodesearch')
+
+    def test_default_socket_path(self):
+        self.assertEquals(os.path.join(self.socket_dir, 'daemon.sock'),
+                          daemon.default_socket_path())
+
+    def test_private_dir(self):
+        d = daemon.Daemon(daemon.default_socket_path())
+        thread = threading.Thread(target=d.serve_forever)
+        thread.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not os.path.exists(daemon.default_socket_path()):
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(.01)
+            self.assertEquals(0o700, os.stat(self.socket_dir).st_mode & 0o777)
+        finally:
+            d.shutdown()
+            thread.join()
+
+    def test_shared_dir(self):
+        os.mkdir(self.socket_dir, 0o755)
+        os.chmod(self.socket_dir, 0o755)
+        with self.assertRaises(daemon.DaemonError):
+            daemon.Daemon(daemon.default_socket_path()).serve_forever()
+
+
+class ClientTest(unittest.TestCase):
+
+    def test_no_daemon(self):
+        directory = tempfile.mkdtemp()
+        try:
+            client = daemon.Client(os.path.join(directory, 'missing.sock'))
+            with self.assertRaises(daemon.DaemonError):
+                client.ping()
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
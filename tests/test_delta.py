@@ -0,0 +1,134 @@
+import unittest
+
+from YetAnotherCodeSearch import delta
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import parser
+
+
+def _apply(patch):
+    text = patch.old_text
+    for (begin, end, new_text) in reversed(patch.edits):
+        text = text[:begin] + new_text + text[end:]
+    return text
+
+
+class LayoutTest(unittest.TestCase):
+
+    def test_matches_format_results(self):
+        results = [parser.FileResults('a.txt', [(1, 'foo'), (9, 'foo')],
+                                      context=[(2, 'bar')]),
+                   parser.FileResults('b.txt', [(3, 'foo')])]
+        self.assertEquals(''.join(engine.format_results(results)),
+                          delta.Layout(results).text())
+
+    def test_footer_counts_duplicates(self):
+        results = [parser.FileResults('a.txt', [(1, 'foo'), (9, 'foo')],
+                                      duplicates=['b.txt', 'c.txt'])]
+        self.assertEquals(
+            '6 matches across 3 files (2 identical files collapsed)\n',
+            delta.footer(results))
+
+    def test_footer_skipped_lines(self):
+        results = parser.parse_search_output(b'a.txt:1:foo\nbad line\n')
+        self.assertEquals(
+            '1 matches across 1 files (1 unreadable output lines skipped)\n',
+            delta.footer(results))
+
+
+class DiffResultsTest(unittest.TestCase):
+
+    def test_diff(self):
+        old = [parser.FileResults('a', [(1, 'foo')]),
+               parser.FileResults('b', [(2, 'foo')]),
+               parser.FileResults('c', [(3, 'foo')])]
+        new = [parser.FileResults('a', [(1, 'foo'), (4, 'foo 2')]),
+               parser.FileResults('c', [(3, 'foo')]),
+               parser.FileResults('d', [(1, 'foo')])]
+        self.assertEquals(
+            [('a', delta.CHANGED), ('b', delta.REMOVED), ('c', delta.SAME),
+             ('d', delta.ADDED)],
+            [(d.filename, d.status) for d in delta.diff_results(old, new)])
+
+    def test_changed_lines_ignores_moved_lines(self):
+        file_delta = delta.FileDelta(
+            'a', parser.FileResults('a', [(1, 'foo'), (5, 'foo bar')]),
+            parser.FileResults('a', [(2, 'foo'), (6, 'foo bar'),
+                                     (9, 'foo baz')]))
+        self.assertEquals(({9}, []), file_delta.changed_lines())
+
+    def test_changed_lines_removed(self):
+        file_delta = delta.FileDelta(
+            'a', parser.FileResults('a', [(1, 'foo'), (5, 'foo bar')]),
+            parser.FileResults('a', [(1, 'foo')]))
+        self.assertEquals((set(), [(5, 'foo bar')]),
+                          file_delta.changed_lines())
+
+
+class MakePatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.old = [parser.FileResults('a', [(1, 'foo'), (5, 'foo bar')]),
+                    parser.FileResults('b', [(2, 'foo')]),
+                    parser.FileResults('c', [(3, 'foo')])]
+        self.new = [parser.FileResults('a', [(1, 'foo'), (5, 'foo bar'),
+                                             (6, 'new foo')]),
+                    parser.FileResults('c', [(3, 'foo')]),
+                    parser.FileResults('d', [(1, 'foo')])]
+
+    def _patch(self, layout, old, new):
+        return delta.make_patch(layout, delta.diff_results(old, new), new)
+
+    def test_patch(self):
+        patch = self._patch(delta.Layout(self.old), self.old, self.new)
+        text = _apply(patch)
+        self.assertEquals(
+            'a:\n'
+            '    1: foo\n'
+            '    .\n'
+            '    5: foo bar\n'
+            '    6: new foo\n'
+            '\n'
+            'b:\n'
+            '    2- foo\n'
+            '\n'
+            'c:\n'
+            '    3: foo\n'
+            '\n'
+            'd:\n'
+            '    1: foo\n'
+            '\n'
+            '5 matches across 3 files (2 added, 1 removed since the last '
+            'run)\n', text)
+        self.assertEquals(text, patch.layout.text())
+        self.assertEquals(['    6: new foo', '    1: foo'],
+                          [text[b:e] for (b, e) in patch.added])
+        self.assertEquals(['    2- foo'],
+                          [text[b:e] for (b, e) in patch.removed])
+        self.assertEquals((2, 1), (patch.num_added, patch.num_removed))
+
+    def test_unchanged_blocks_left_alone(self):
+        patch = self._patch(delta.Layout(self.old), self.old, self.new)
+        c_start = patch.old_text.index('c:\n')
+        c_end = c_start + len('c:\n    3: foo\n\n')
+        for (begin, end, unused_text) in patch.edits:
+            self.assertTrue(end <= c_start or begin >= c_end)
+
+    def test_refresh_again_drops_marks(self):
+        first = self._patch(delta.Layout(self.old), self.old, self.new)
+        second = self._patch(first.layout, self.new, self.new)
+        self.assertEquals(
+            ''.join(engine.format_results(self.new)).replace(
+                'files\n', 'files (0 added, 0 removed since the last run)\n'),
+            _apply(second))
+        self.assertEquals([], second.added)
+        self.assertEquals([], second.removed)
+
+    def test_all_gone(self):
+        patch = self._patch(delta.Layout(self.old), self.old, [])
+        text = _apply(patch)
+        self.assertIn('b:\n    2- foo\n', text)
+        self.assertEquals((0, 4), (patch.num_added, patch.num_removed))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import parser
+
+
+class FixWindowsOutputTest(unittest.TestCase):
+
+    def test_fix(self):
+        self.assertEquals(
+            b'/C/Users/me/a.txt:12:cooks: many\n/C/b.txt:1:x',
+            engine.fix_windows_output(
+                b'C:\\Users\\me\\a.txt:12:cooks: many\r\n'
+                b'C:\\b.txt:1:x'))
+
+
+class FormatResultsTest(unittest.TestCase):
+
+    def test_format_results(self):
+        results = [parser.FileResults('a.txt', [(1, 'Too many cooks')]),
+                   parser.FileResults('b.txt', [(2, 'cooks'), (3, 'cook')])]
+        self.assertEquals(
+            'a.txt:\n'
+            '    1: Too many cooks\n'
+            '\n'
+            'b.txt:\n'
+            '    2: cooks\n'
+            '    3: cook\n'
+            '\n'
+            '3 matches across 2 files\n',
+            ''.join(engine.format_results(results)))
+
+    def test_format_batch(self):
+        per_term = [[parser.FileResults('a.txt', [(1, 'foo')])],
+                    [parser.FileResults('a.txt', [(2, 'bar')]),
+                     parser.FileResults('b.txt', [(3, 'bar')])]]
+        self.assertEquals(
+            'Term "foo": 1 matches across 1 files\n'
+            '\n'
+            'a.txt:\n'
+            '    1: foo\n'
+            '\n'
+            'Term "bar": 2 matches across 2 files\n'
+            '\n'
+            'a.txt:\n'
+            '    2: bar\n'
+            '\n'
+            'b.txt:\n'
+            '    3: bar\n'
+            '\n'
+            '2 terms, 3 matches across 2 files\n',
+            ''.join(engine.format_batch(['foo', 'bar'], per_term)))
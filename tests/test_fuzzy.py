@@ -0,0 +1,94 @@
+import unittest
+
+from unittest.mock import patch
+
+from YetAnotherCodeSearch import fuzzy
+
+
+class ScoreTest(unittest.TestCase):
+
+    def test_no_match(self):
+        self.assertIsNone(fuzzy.score('xyz', 'src/foo.py'))
+
+    def test_out_of_order(self):
+        self.assertIsNone(fuzzy.score('oof', 'src/foo.py'))
+
+    def test_substring_beats_subsequence(self):
+        self.assertGreater(fuzzy.score('foo', 'src/lib/foo.py'),
+                           fuzzy.score('foo', 'f/o/o.py'))
+
+    def test_basename_beats_directory(self):
+        self.assertGreater(fuzzy.score('parser', 'src/parser.py'),
+                           fuzzy.score('parser', 'parser/main.py'))
+
+    def test_shorter_path_wins(self):
+        self.assertGreater(fuzzy.score('main', 'src/main.py'),
+                           fuzzy.score('main', 'src/lib/main.py'))
+
+
+class PathMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = fuzzy.PathMatcher([
+            '/src/csearch.py',
+            '/src/cindex.py',
+            '/src/parser.py',
+            '/src/tests/test_parser.py',
+            '/src/README.md'])
+        self.matcher.index_chars('abcdefghijklmnopqrstuvwxyz.')
+
+    def test_top(self):
+        (paths, complete) = self.matcher.top('parser')
+        self.assertTrue(complete)
+        self.assertEquals(['/src/parser.py', '/src/tests/test_parser.py'],
+                          paths)
+
+    def test_top_subsequence(self):
+        (paths, complete) = self.matcher.top('cschpy')
+        self.assertEquals(['/src/csearch.py'], paths)
+
+    def test_top_is_case_insensitive(self):
+        (paths, complete) = self.matcher.top('readme')
+        self.assertEquals(['/src/README.md'], paths)
+
+    def test_top_limit(self):
+        (paths, complete) = self.matcher.top('py', limit=2)
+        self.assertEquals(2, len(paths))
+
+    def test_top_no_matches(self):
+        (paths, complete) = self.matcher.top('zzz')
+        self.assertTrue(complete)
+        self.assertEquals([], paths)
+
+    def test_top_narrowing(self):
+        self.matcher.top('c')
+        (paths, complete) = self.matcher.top('cin')
+        self.assertEquals(['/src/cindex.py'], paths)
+        (paths, complete) = self.matcher.top('p')
+        self.assertEquals(4, len(paths))
+
+    def test_top_empty_query(self):
+        (paths, complete) = self.matcher.top('', limit=2)
+        self.assertEquals(['/src/csearch.py', '/src/cindex.py'], paths)
+
+    def test_top_without_bitsets(self):
+        matcher = fuzzy.PathMatcher(['/src/parser.py', '/src/cindex.py'])
+        self.assertEquals('aeprs', matcher.missing_chars('Parser'))
+        (paths, complete) = matcher.top('parser')
+        self.assertTrue(complete)
+        self.assertEquals(['/src/parser.py'], paths)
+
+    def test_missing_chars(self):
+        self.assertEquals('', self.matcher.missing_chars('parser'))
+        self.assertEquals('/3', self.matcher.missing_chars('src/py3'))
+
+    @patch('YetAnotherCodeSearch.fuzzy._DEADLINE_CHECK', 1)
+    def test_top_resumes(self):
+        (paths, complete) = self.matcher.top('py', timeout=0)
+        self.assertFalse(complete)
+        self.assertEquals(1, len(paths))
+        (paths, complete) = self.matcher.top('py', timeout=0)
+        self.assertEquals(2, len(paths))
+        (paths, complete) = self.matcher.top('py')
+        self.assertTrue(complete)
+        self.assertEquals(4, len(paths))
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch.tests import write_index
+
+
+class IndexReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'csearchindex')
+        write_index(self.filename, ['/src'],
+                    ['/src/a.py', '/src/b/c.go', '/src/d.txt'],
+                    {b'abc': 2, b'foo': 7, b'zzz': 1})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_paths(self):
+        reader = index.IndexReader(self.filename)
+        self.assertEquals(['/src'], reader.paths())
+        reader.close()
+
+    def test_names(self):
+        reader = index.IndexReader(self.filename)
+        self.assertEquals(3, reader.num_names)
+        self.assertEquals(['/src/a.py', '/src/b/c.go', '/src/d.txt'],
+                          reader.names())
+        self.assertEquals('/src/b/c.go', reader.name(1))
+        reader.close()
+
+    def test_posting_count(self):
+        reader = index.IndexReader(self.filename)
+        self.assertEquals(2, reader.posting_count(b'abc'))
+        self.assertEquals(7, reader.posting_count(b'foo'))
+        self.assertEquals(1, reader.posting_count(b'zzz'))
+        self.assertEquals(0, reader.posting_count(b'xyz'))
+        reader.close()
+
+    def test_not_an_index(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'not an index file, just some bytes in a file')
+        with self.assertRaises(index.CorruptIndexError):
+            index.IndexReader(self.filename)
+
+    def test_open_index_reuses_reader(self):
+        reader = index.open_index(self.filename)
+        self.assertIs(reader, index.open_index(self.filename))
+        write_index(self.filename, ['/src'], ['/src/a.py'])
+        os.utime(self.filename, (0, 0))
+        reader = index.open_index(self.filename)
+        self.assertEquals(['/src/a.py'], reader.names())
+
+    def test_prefetch(self):
+        size = os.path.getsize(self.filename)
+        self.assertEquals(size, index.prefetch(self.filename))
+        self.assertEquals(10, index.prefetch(self.filename, max_bytes=10))
+
+
+class UnmappedIndexReaderTest(IndexReaderTest):
+    """The same tests, reading the index as it is read on Windows."""
+
+    def setUp(self):
+        super(UnmappedIndexReaderTest, self).setUp()
+        patcher = patch.object(index, '_USE_MMAP', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rename_over_open_index(self):
+        reader = index.IndexReader(self.filename)
+        self.assertIsNone(reader._mmap)
+        new_filename = self.filename + '~'
+        write_index(new_filename, ['/src'], ['/src/a.py'])
+        os.replace(new_filename, self.filename)
+        self.assertEquals('/src/b/c.go', reader.name(1))
+
+
+class IndexPathTest(unittest.TestCase):
+
+    def test_index_path(self):
+        self.assertEquals('/foo/index', index.index_path('/foo/index'))
+
+    def test_index_path_default(self):
+        self.assertTrue(index.index_path().endswith('csearchindex'))
@@ -45,6 +45,26 @@ class ParseQueryTest(unittest.TestCase):
     def test_parse_with_escape_parens(self):
         self.assertParse(r'method\(', query=[r'method\('])
 
+    def test_file_flags(self):
+        self.assertEquals(
+            parser.Search(query=['Foo'], files=['^src/', r'\.go$'],
+                          exclude_files=['_test', 'vendor/'],
+                          langs=['go', 'python']),
+            parser.parse_query(r'Foo file:^src/ -file:_test lang:go '
+                               r'file:\.go$ -file:vendor/ lang:py'))
+
+    def test_kind_flags(self):
+        self.assertEquals(
+            parser.Search(query=['Foo'], kinds=['vendor'],
+                          exclude_kinds=['test', 'generated']),
+            parser.parse_query('Foo kind:vendor -kind:test -kind:GENERATED'))
+        with self.assertRaises(Exception):
+            parser.parse_query('Foo kind:weird')
+
+    def test_unknown_lang(self):
+        with self.assertRaises(Exception):
+            parser.parse_query('Foo lang:cobol')
+
 
 class SearchTest(unittest.TestCase):
 
@@ -67,6 +87,25 @@ class SearchTest(unittest.TestCase):
         self.assertEquals(parser.Search(query=['Hello, world']).args(),
                           ['Hello, world'])
 
+    def test_args_with_lang(self):
+        self.assertEquals(
+            parser.Search(query=['hello'], langs=['c']).args(),
+            ['-f', r'\.(c|h)$', 'hello'])
+        self.assertEquals(
+            parser.Search(query=['hello'], file='src/', langs=['c']).args(),
+            ['-f', 'src/', 'hello'])
+
+    def test_path_filter(self):
+        self.assertIsNone(parser.Search(query=['hello'],
+                                        file='src/').path_filter())
+        keep = parser.Search(query=['hello'], files=['src/', 'lib'],
+                             exclude_files=['_test'],
+                             langs=['go']).path_filter()
+        self.assertTrue(keep('src/lib/a.go'))
+        self.assertFalse(keep('src/a.go'))
+        self.assertFalse(keep('src/lib/a_test.go'))
+        self.assertFalse(keep('src/lib/a.py'))
+
 
 class ParseSearchOutputTest(unittest.TestCase):
 
@@ -102,6 +141,103 @@ class ParseSearchOutputTest(unittest.TestCase):
             parser.parse_search_output('a.txt:12bleh:Match')
 
 
+class ParseSearchOutputBytesTest(unittest.TestCase):
+
+    def test_parse(self):
+        output = (b'a.txt:1:Too many cooks\n'
+                  b'a.txt:2:TOO MANY cooks\n'
+                  b'b/\xe4\xb8\x96.txt:34:How to cook: \xe4\xb8\x96\n')
+        expected = [
+            parser.FileResults('a.txt', [(1, 'Too many cooks'),
+                                         (2, 'TOO MANY cooks')]),
+            parser.FileResults('b/世.txt', [(34, 'How to cook: 世')])
+        ]
+        self.assertEquals(expected, parser.parse_search_output(output))
+
+    def test_parse_without_trailing_newline(self):
+        expected = [parser.FileResults('a.txt', [(1, 'Too many cooks')])]
+        actual = parser.parse_search_output(b'a.txt:1:Too many cooks')
+        self.assertEquals(expected, actual)
+
+    def test_parse_empty_and_crlf_lines(self):
+        expected = [parser.FileResults('a.txt', [(1, ''), (2, 'cooks')])]
+        actual = parser.parse_search_output(b'a.txt:1:\na.txt:2:cooks\r\n')
+        self.assertEquals(expected, actual)
+
+    def test_parse_with_no_results(self):
+        self.assertEquals([], parser.parse_search_output(b''))
+
+    def test_fallback_encoding(self):
+        (res,) = parser.parse_search_output(b'a.txt:1:caf\xe9\na.txt:2:ok\n')
+        self.assertEquals([(1, 'café'), (2, 'ok')], res.matches)
+
+    def test_undecodable_line(self):
+        (res,) = parser.parse_search_output(b'a.txt:1:\x81cooks\n')
+        self.assertEquals([(1, '\ufffdcooks')], res.matches)
+
+    def test_undecodable_filename(self):
+        (res,) = parser.parse_search_output(b'caf\xe9.txt:1:cooks\n')
+        self.assertEquals(b'caf\xe9.txt',
+                          res.filename.encode('utf-8', 'surrogateescape'))
+
+    def test_decoding_is_lazy(self):
+        (res,) = parser.parse_search_output(b'a.txt:1:cooks\n')
+        self.assertEquals(b'a.txt', res._filename)
+        self.assertEquals([(1, b'cooks')], res._matches)
+
+    def test_parse_skips_bad_lines(self):
+        actual = parser.parse_search_output(b'I am a bad line.\n'
+                                            b'a.txt:1:cooks\n'
+                                            b'a.txt:12bleh:Match\n')
+        self.assertEquals([parser.FileResults('a.txt', [(1, 'cooks')])],
+                          actual)
+        self.assertEquals(2, actual.skipped)
+
+    def test_parse_filename_with_colons(self):
+        actual = parser.parse_search_output(b'a:b.txt:3:x\n'
+                                            b'c:\\d.txt:4:at 12:30:00\n')
+        self.assertEquals([parser.FileResults('a:b.txt', [(3, 'x')]),
+                           parser.FileResults('c:\\d.txt',
+                                              [(4, 'at 12:30:00')])],
+                          actual)
+        self.assertEquals(0, actual.skipped)
+
+    def test_path_filter(self):
+        output = (b'a.go:1:foo\n'
+                  b'a_test.go:1:foo\n'
+                  b'a_test.go:2:foo\n'
+                  b'b.go:3:foo\n')
+        actual = parser.parse_search_output(
+            output, path_filter=lambda name: '_test' not in name)
+        self.assertEquals([parser.FileResults('a.go', [(1, 'foo')]),
+                           parser.FileResults('b.go', [(3, 'foo')])], actual)
+
+    def test_group(self):
+        output = (b'a/x.js:1:foo\n'
+                  b'a/x.js:2:foo()\n'
+                  b'b/x.js:1:foo\n'
+                  b'b/x.js:2:foo()\n'
+                  b'c/x.js:1:foo\n'
+                  b'd/x.js:1:foo\n'
+                  b'd/x.js:2:foo()\n')
+        actual = parser.parse_search_output(output, group=True)
+        self.assertEquals(
+            [parser.FileResults('a/x.js', [(1, 'foo'), (2, 'foo()')],
+                                duplicates=['b/x.js', 'd/x.js']),
+             parser.FileResults('c/x.js', [(1, 'foo')])], actual)
+        self.assertEquals((4, 7), parser.count_results(actual))
+        self.assertEquals(parser.parse_search_output(output),
+                          sorted(parser.expand_duplicates(actual),
+                                 key=lambda r: r.filename))
+        self.assertEquals(actual, parser.parse_search_output(
+            output.decode('ascii'), group=True))
+
+    def test_group_needs_same_line_numbers(self):
+        output = b'a.txt:1:foo\nb.txt:2:foo\n'
+        self.assertEquals(2, len(parser.parse_search_output(output,
+                                                            group=True)))
+
+
 class FileResultsTest(unittest.TestCase):
 
     def test_str(self):
@@ -119,3 +255,14 @@ class FileResultsTest(unittest.TestCase):
               502: Too many cooks""")
         actual = str(res)
         self.assertEquals(expected, actual)
+
+    def test_str_with_duplicates(self):
+        res = parser.FileResults('a.txt', [(1, 'Too many cooks')],
+                                 duplicates=['b.txt', 'c.txt'])
+        expected = textwrap.dedent("""\
+            a.txt:
+                1: Too many cooks
+              (same matches in 2 more files)
+                  b.txt
+                  c.txt""")
+        self.assertEquals(expected, str(res))
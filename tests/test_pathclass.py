@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import pathclass
+from YetAnotherCodeSearch.tests import write_index
+
+_NAMES = ['/src/a.go', '/src/a_test.go', '/src/b.py', '/src/tests/c.py',
+          '/src/vendor/d.go', '/src/x.pb.go', '/src/e.zzz']
+
+
+class PathClassesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'csearchindex')
+        write_index(self.filename, ['/src'], _NAMES)
+        self.classes = pathclass.get_path_classes(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _allowed(self, query):
+        bits = self.classes.allowed(parser.parse_query(query))
+        return [name for (i, name) in enumerate(_NAMES) if bits >> i & 1]
+
+    def test_no_flags(self):
+        self.assertIsNone(self.classes.allowed(parser.parse_query('foo')))
+
+    def test_lang(self):
+        self.assertEquals(['/src/b.py', '/src/tests/c.py'],
+                          self._allowed('foo lang:python'))
+
+    def test_extension(self):
+        self.assertEquals(0b1, self.classes.extension('go') & 0b1)
+        self.assertEquals(1 << 6, self.classes.extension('zzz'))
+        self.assertEquals(0, self.classes.extension('none'))
+
+    def test_kinds(self):
+        self.assertEquals(['/src/a.go'],
+                          self._allowed('foo lang:go -kind:test '
+                                        '-kind:vendor -kind:generated'))
+        self.assertEquals(['/src/a_test.go', '/src/tests/c.py'],
+                          self._allowed('foo kind:test'))
+
+    def test_patterns(self):
+        self.assertEquals(['/src/a.go', '/src/a_test.go'],
+                          self._allowed('foo file:^/src/a -file:\\.py$'))
+        self.assertEquals([], self._allowed('foo file:a file:b'))
+
+    def test_fileid(self):
+        self.assertEquals(3, self.classes.fileid('/src/tests/c.py'))
+        self.assertIsNone(self.classes.fileid('/src/missing.py'))
+
+    def test_cached_per_generation(self):
+        self.assertIs(self.classes,
+                      pathclass.get_path_classes(self.filename))
+        write_index(self.filename, ['/src'], _NAMES + ['/src/z.go'])
+        os.utime(self.filename, (0, 0))
+        classes = pathclass.get_path_classes(self.filename)
+        self.assertIsNot(self.classes, classes)
+        self.assertEquals(len(_NAMES) + 1, classes.num_names)
+
+    def test_scope(self):
+        search = parser.parse_query('foo lang:go -kind:test')
+        (path_filter, candidates) = pathclass.scope(search, self.filename)
+        self.assertEquals(3, candidates)
+        self.assertTrue(path_filter('/src/a.go'))
+        self.assertFalse(path_filter('/src/a_test.go'))
+        self.assertFalse(path_filter('/src/b.py'))
+        # Names that aren't indexed are checked with the regexes.
+        self.assertTrue(path_filter('/other/e.go'))
+        self.assertFalse(path_filter('/other/e_test.go'))
+
+    def test_scope_without_filter(self):
+        self.assertEquals((None, None), pathclass.scope(
+            parser.parse_query('foo file:\\.go$'), self.filename))
+
+    def test_scope_without_index(self):
+        search = parser.parse_query('foo -kind:test')
+        (path_filter, candidates) = pathclass.scope(
+            search, os.path.join(self.tmpdir, 'missing'))
+        self.assertIsNone(candidates)
+        self.assertFalse(path_filter('/src/a_test.go'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import plan
+
+
+class _FakeReader(object):
+
+    def __init__(self, num_names, counts):
+        self.num_names = num_names
+        self.counts = counts
+
+    def posting_count(self, trigram):
+        return self.counts.get(trigram, 0)
+
+
+def _sets(*sets):
+    return set(frozenset(s) for s in sets)
+
+
+class RequiredTrigramsTest(unittest.TestCase):
+
+    def test_literal(self):
+        self.assertEquals(_sets([b'hel'], [b'ell'], [b'llo']),
+                          set(plan.required_trigrams('hello')))
+
+    def test_short_literal(self):
+        self.assertEquals((), plan.required_trigrams('ab'))
+
+    def test_wildcards_around_literal(self):
+        self.assertEquals(_sets([b'foo']), set(plan.required_trigrams(
+            '.*foo')))
+        self.assertEquals(_sets([b'foo'], [b'bar']), set(
+            plan.required_trigrams('foo.*bar')))
+        self.assertEquals(_sets([b'fun'], [b'unc'], [b'mai'], [b'ain']),
+                          set(plan.required_trigrams(r'func\s+main')))
+
+    def test_alternation(self):
+        self.assertEquals((), plan.required_trigrams('a|b'))
+        self.assertEquals((), plan.required_trigrams('foo|b'))
+        self.assertIn(frozenset([b'foo', b'bar']),
+                      plan.required_trigrams('foo|bar'))
+
+    def test_small_class(self):
+        self.assertIn(frozenset([b'foo', b'fox']),
+                      plan.required_trigrams('fo[ox]'))
+
+    def test_optional(self):
+        self.assertEquals((), plan.required_trigrams('abc?'))
+        self.assertEquals(_sets([b'abc']), set(plan.required_trigrams(
+            'abcd*')))
+
+    def test_case_insensitive(self):
+        self.assertEquals(_sets([b'foo']), set(plan.required_trigrams(
+            'Foo', case=False)))
+        self.assertEquals(_sets([b'foo']), set(plan.required_trigrams(
+            '(?i)Foo')))
+
+    def test_anchors(self):
+        self.assertEquals(_sets([b'the']), set(plan.required_trigrams(
+            r'^\bthe\b')))
+
+
+class MakePlanTest(unittest.TestCase):
+
+    def test_full_scan(self):
+        query_plan = plan.make_plan(parser.parse_query('.*'))
+        self.assertTrue(query_plan.full_scan)
+        self.assertTrue(query_plan.needs_confirmation)
+
+    def test_full_scan_with_file(self):
+        query_plan = plan.make_plan(parser.parse_query(r'.* file:\.py$'))
+        self.assertTrue(query_plan.full_scan)
+        self.assertFalse(query_plan.needs_confirmation)
+
+    def test_unselective_terms(self):
+        query_plan = plan.make_plan(parser.parse_query('hello a.b'))
+        self.assertTrue(query_plan.full_scan)
+        self.assertEquals(['a.b'], query_plan.unselective_terms)
+        self.assertIn('"a.b"', query_plan.suggestion())
+
+    def test_estimate(self):
+        reader = _FakeReader(100, {b'foo': 40, b'bar': 7, b'baz': 2})
+        query_plan = plan.make_plan(parser.parse_query('foo.*ba[rz]'),
+                                    reader)
+        self.assertFalse(query_plan.full_scan)
+        self.assertEquals(9, query_plan.estimate)
+        self.assertEquals(100, query_plan.total)
+        self.assertEquals(
+            'Plan: looks up 3 trigrams, reads at most 9 of 100 files',
+            query_plan.describe())
+
+    def test_estimate_case_insensitive(self):
+        reader = _FakeReader(100, {b'foo': 4, b'Foo': 3, b'FOO': 2})
+        query_plan = plan.make_plan(parser.parse_query('foo case:no'),
+                                    reader)
+        self.assertEquals(9, query_plan.estimate)
+
+    def test_bad_regex(self):
+        query_plan = plan.make_plan(parser.parse_query('foo('))
+        self.assertIsNone(query_plan.trigrams)
+        self.assertFalse(query_plan.full_scan)
+
+
+if __name__ == '__main__':
+    unittest.main()
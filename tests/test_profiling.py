@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import profiling
+
+# Writes its arguments and a profile, and finds one more line with -brute.
+_FAKE_CSEARCH = '''#!/bin/sh
+printf '%s\\n' "$*" >> "$(dirname "$0")/args"
+brute=
+while [ $# -gt 0 ]; do
+  case "$1" in
+    -cpuprofile) echo profile > "$2"; shift;;
+    -brute) brute=1;;
+  esac
+  shift
+done
+printf '/a.txt:2:foo\\n'
+if [ -n "$brute" ]; then printf '/b.txt:3:foo\\n'; fi
+'''
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_keeps_newest_runs(self):
+        profiler = profiling.Profiler(self.directory, max_runs=2)
+        runs = [profiler.start('csearch') for unused in range(3)]
+        self.assertEquals([run.directory for run in runs[1:]],
+                          profiler.runs())
+
+    def test_finish(self):
+        run = profiling.Profiler(self.directory).start('cindex')
+        run.finish(['cindex', '-verbose'], {'CSEARCHINDEX': 'x'}, 0, 1.5,
+                   files=3)
+        with open(os.path.join(run.directory, profiling.RUN_NAME)) as f:
+            recorded = json.load(f)
+        self.assertEquals(['cindex', '-verbose'], recorded['cmd'])
+        self.assertEquals({'CSEARCHINDEX': 'x'}, recorded['env'])
+        self.assertEquals(3, recorded['files'])
+        self.assertIn('cindex took 1.500s, but wrote no CPU profile',
+                      profiling.format_findings(run))
+
+
+@unittest.skipIf(sys.platform == 'win32', 'needs a shell script')
+class ProfileCsearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csearch = os.path.join(self.directory, 'csearch')
+        with open(self.csearch, 'w') as f:
+            f.write(_FAKE_CSEARCH)
+        os.chmod(self.csearch, 0o755)
+        self.profiler = profiling.Profiler(os.path.join(self.directory,
+                                                        'profiles'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_profile_and_brute(self):
+        search = parser.parse_query('foo')
+        run = self.profiler.start('csearch')
+        engine.run_csearch(search, path_csearch=self.csearch,
+                           index_filename='/tmp/index', profile=run)
+        brute = self.profiler.start('csearch-brute')
+        engine.run_csearch(search, path_csearch=self.csearch,
+                           index_filename='/tmp/index', profile=brute,
+                           brute=True)
+        with open(os.path.join(self.directory, 'args')) as f:
+            args = f.read().splitlines()
+        self.assertEquals(
+            ['-n -cpuprofile {0} foo'.format(run.profile_path),
+             '-n -brute -cpuprofile {0} foo'.format(brute.profile_path)],
+            args)
+        self.assertEquals([self.csearch] + args[0].split(), run.cmd)
+        self.assertEquals('/tmp/index', run.env['CSEARCHINDEX'])
+        self.assertTrue(run.has_profile())
+
+        findings = profiling.format_findings(run, brute)
+        self.assertIn('CPU profile in ' + run.profile_path, findings)
+        self.assertIn('Without the index (-brute)', findings)
+        self.assertIn('The index found 1 lines, but -brute found 2',
+                      findings)
+
+
+if __name__ == '__main__':
+    unittest.main()
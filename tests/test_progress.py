@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from YetAnotherCodeSearch import progress
+
+
+class CountFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, size):
+        path = os.path.join(self.dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_count_files(self):
+        self._write('top.txt', 10)
+        self._write(os.path.join('a', 'b', 'deep.txt'), 20)
+        self._write(os.path.join('c', 'other.txt'), 30)
+        self.assertEquals((3, 60), progress.count_files([self.dir]))
+
+    def test_skips_what_cindex_skips(self):
+        self._write('kept.txt', 10)
+        self._write('backup.txt~', 10)
+        self._write('#autosave#', 10)
+        self._write(os.path.join('.git', 'HEAD'), 10)
+        self.assertEquals((1, 10), progress.count_files([self.dir]))
+
+    def test_files_and_missing_paths(self):
+        path = self._write('file.txt', 10)
+        self.assertEquals((1, 10), progress.count_files(
+            [path, os.path.join(self.dir, 'missing')]))
+
+
+class IndexProgressTest(unittest.TestCase):
+
+    def test_before_counting(self):
+        state = progress.IndexProgress(start=0)
+        state.files = 100
+        state.bytes = 2 * 1024 * 1024
+        self.assertIsNone(state.fraction())
+        self.assertIsNone(state.eta(now=2))
+        self.assertEquals('cindex (100 files, 50 files/s, 1.0 MB/s)',
+                          state.describe(now=2))
+
+    def test_eta(self):
+        state = progress.IndexProgress(start=0)
+        state.files = 100
+        state.bytes = 25
+        state.total_files = 200
+        state.total_bytes = 100
+        self.assertEquals(.25, state.fraction())
+        self.assertEquals(30, state.eta(now=10))
+        self.assertEquals(
+            'cindex 25% (100/200 files, 10 files/s, 0.0 MB/s, 0:30 left)',
+            state.describe(now=10))
+
+    def test_paused_time_is_not_counted(self):
+        state = progress.IndexProgress(start=0)
+        state.pause(now=2)
+        self.assertTrue(state.paused)
+        self.assertEquals(2, state.elapsed(now=10))
+        self.assertEquals('cindex paused (0 files, 0 files/s, 0.0 MB/s)',
+                          state.describe(now=10))
+        state.resume(now=10)
+        self.assertEquals(3, state.elapsed(now=11))
+
+    def test_summary(self):
+        state = progress.IndexProgress(index_bytes_before=3 * 1024 * 1024,
+                                       start=0)
+        state.files = 10
+        state.bytes = 1024 * 1024
+        state.index_bytes_after = 2 * 1024 * 1024
+        self.assertEquals(
+            'indexed 10 files (1.0 MB) in 4.0s; index is 2.0 MB (-1.0 MB)',
+            state.summary(now=4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import refine
+
+
+def _results():
+    return [
+        parser.FileResults('/src/foo.go', [(1, 'func Foo() {'),
+                                           (5, 'return foo')]),
+        parser.FileResults('/src/foo_test.go', [(3, 'func TestFoo() {')]),
+        parser.FileResults('/src/bar.go', [(2, '// foo bar')]),
+    ]
+
+
+class ParseRefinementTest(unittest.TestCase):
+
+    def test_include(self):
+        self.assertEquals(refine.Refinement('foo'),
+                          refine.parse_refinement('foo'))
+
+    def test_exclude_path(self):
+        self.assertEquals(
+            refine.Refinement(r'_test\.go$', exclude=True, path=True,
+                              case=False),
+            refine.parse_refinement(r'-path:_test\.go$', case=False))
+
+    def test_empty(self):
+        self.assertRaises(ValueError, refine.parse_refinement, '-')
+        self.assertRaises(ValueError, refine.parse_refinement, 'path:')
+
+    def test_describe(self):
+        self.assertEquals('paths not matching "vendor"',
+                          refine.parse_refinement('-path:vendor').describe())
+        self.assertEquals('lines matching "foo"',
+                          refine.parse_refinement('foo').describe())
+
+
+class RefineTest(unittest.TestCase):
+
+    def test_include_lines(self):
+        self.assertEquals(
+            [parser.FileResults('/src/foo.go', [(1, 'func Foo() {')]),
+             parser.FileResults('/src/foo_test.go',
+                                [(3, 'func TestFoo() {')])],
+            refine.refine(_results(), refine.Refinement('^func')))
+
+    def test_exclude_lines(self):
+        self.assertEquals(
+            [parser.FileResults('/src/foo.go', [(5, 'return foo')]),
+             parser.FileResults('/src/bar.go', [(2, '// foo bar')])],
+            refine.refine(_results(), refine.Refinement('^func',
+                                                        exclude=True)))
+
+    def test_paths(self):
+        results = _results()
+        self.assertEquals(
+            [results[0], results[2]],
+            refine.refine(results, refine.Refinement(
+                r'_test\.go$', exclude=True, path=True)))
+        self.assertEquals(
+            [results[1]],
+            refine.refine(results, refine.Refinement(r'_test\.go$',
+                                                     path=True)))
+
+    def test_paths_with_duplicates(self):
+        results = [parser.FileResults(
+            '/vendor/a/foo.go', [(1, 'func Foo() {')],
+            duplicates=['/src/foo.go', '/vendor/b/foo.go'])]
+        self.assertEquals(
+            [parser.FileResults('/src/foo.go', [(1, 'func Foo() {')])],
+            refine.refine(results, refine.Refinement(
+                'vendor', exclude=True, path=True)))
+        self.assertEquals(
+            results[0].duplicates,
+            refine.refine(results, refine.Refinement('Foo'))[0].duplicates)
+
+    def test_match_does_not_cross_lines(self):
+        # "foo\nfunc" spans the end of one line and the start of the next.
+        self.assertEquals(
+            [], refine.refine(_results(), refine.Refinement(r'foo\s+func')))
+        self.assertEquals(
+            [parser.FileResults('/src/foo.go', [(5, 'return foo')])],
+            refine.refine(_results(), refine.Refinement(r'foo\s*$')))
+
+    def test_case_insensitive(self):
+        self.assertEquals(
+            [parser.FileResults('/src/foo.go', [(5, 'return foo')])],
+            refine.refine(_results(), refine.Refinement('RETURN',
+                                                        case=False)))
+
+    def test_context_trimmed(self):
+        results = [parser.FileResults(
+            '/src/foo.go', [(2, 'foo'), (10, 'bar')],
+            context=[(1, 'a'), (3, 'b'), (9, 'c'), (11, 'd')])]
+        refined = refine.refine(results, refine.Refinement('bar'),
+                                context_lines=1)
+        self.assertEquals([(10, 'bar')], refined[0].matches)
+        self.assertEquals([(9, 'c'), (11, 'd')], refined[0].context)
+
+    def test_leaves_original(self):
+        results = _results()
+        refine.refine(results, refine.Refinement('^func'))
+        self.assertEquals(_results(), results)
+
+    def test_empty(self):
+        self.assertEquals([], refine.refine([], refine.Refinement('foo')))
+
+
+if __name__ == '__main__':
+    unittest.main()
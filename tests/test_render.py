@@ -0,0 +1,46 @@
+import sublime
+
+import threading
+import time
+import unittest
+
+from YetAnotherCodeSearch import render
+
+
+class ChunkedRendererTest(unittest.TestCase):
+
+    def setUp(self):
+        self.view = sublime.active_window().new_file()
+        self.view.set_scratch(True)
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.view.close()
+
+    def _write(self, renderer, texts):
+        def write():
+            for text in texts:
+                if not renderer.write(text):
+                    return
+            renderer.close()
+        threading.Thread(target=write).start()
+
+    def _contents(self):
+        return self.view.substr(sublime.Region(0, self.view.size()))
+
+    def test_render(self):
+        renderer = render.ChunkedRenderer(self.view, on_done=self.done.set,
+                                          chunk_size=10, max_pending=2)
+        texts = ['line {0}\n'.format(i) for i in range(1000)]
+        self._write(renderer, texts)
+        self.assertTrue(self.done.wait(10))
+        self.assertEquals(''.join(texts), self._contents())
+
+    def test_cancel(self):
+        renderer = render.ChunkedRenderer(self.view, on_done=self.done.set,
+                                          chunk_size=10, max_pending=2)
+        renderer.cancel()
+        self._write(renderer, ['line {0}\n'.format(i) for i in range(1000)])
+        time.sleep(0.2)
+        self.assertFalse(self.done.is_set())
+        self.assertEquals('', self._contents())
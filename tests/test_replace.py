@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import replace
+
+
+class ReplaceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.a = self._write('a.txt', b'foo bar\nbar\r\nfoo foo\nlast foo')
+        self.b = self._write('b.txt', b'caf\xe9 foo\n')
+        self.results = [
+            parser.FileResults(self.a, [(1, 'foo bar'), (3, 'foo foo')]),
+            parser.FileResults(self.b, [(1, 'café foo')])]
+        self.regex = replace.compile_pattern('(f)oo')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_plan(self):
+        (edits, errors) = replace.plan(self.results, self.regex, b'\\1um')
+        self.assertEquals([], errors)
+        self.assertEquals([self.a, self.b], [e.filename for e in edits])
+        self.assertEquals([(1, b'foo bar', b'fum bar'),
+                           (3, b'foo foo', b'fum fum')], edits[0].changes)
+        self.assertEquals([(1, b'caf\xe9 foo', b'caf\xe9 fum')],
+                          edits[1].changes)
+        # Nothing is written yet.
+        self.assertEquals(b'caf\xe9 foo\n', self._read(self.b))
+
+    def test_apply(self):
+        (edits, unused_errors) = replace.plan(self.results, self.regex,
+                                              b'\\1um')
+        (written, errors) = replace.apply(edits, self.regex, b'\\1um')
+        self.assertEquals([], errors)
+        self.assertEquals(2, len(written))
+        # Only the matched lines change.
+        self.assertEquals(b'fum bar\nbar\r\nfum fum\nlast foo',
+                          self._read(self.a))
+        self.assertEquals(b'caf\xe9 fum\n', self._read(self.b))
+
+    def test_apply_skips_changed_files(self):
+        (edits, unused_errors) = replace.plan(self.results, self.regex, b'x')
+        self._write('b.txt', b'foo was changed\n')
+        (written, errors) = replace.apply(edits, self.regex, b'x')
+        self.assertEquals([self.a], [e.filename for e in written])
+        self.assertEquals([self.b], [filename for (filename, err) in errors])
+        self.assertEquals(b'foo was changed\n', self._read(self.b))
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'needs symlinks')
+    def test_apply_through_symlink(self):
+        link = os.path.join(self.dir, 'link.txt')
+        os.symlink(self.b, link)
+        results = [parser.FileResults(link, [(1, 'café foo')])]
+        (edits, unused_errors) = replace.plan(results, self.regex, b'x')
+        (written, errors) = replace.apply(edits, self.regex, b'x')
+        self.assertEquals([], errors)
+        self.assertTrue(os.path.islink(link))
+        self.assertEquals(b'caf\xe9 x\n', self._read(self.b))
+
+    def test_apply_to_hard_link(self):
+        link = os.path.join(self.dir, 'link.txt')
+        os.link(self.b, link)
+        results = [parser.FileResults(link, [(1, 'café foo')])]
+        (edits, unused_errors) = replace.plan(results, self.regex, b'x')
+        (written, errors) = replace.apply(edits, self.regex, b'x')
+        self.assertEquals([], errors)
+        self.assertEquals(os.stat(self.b).st_ino, os.stat(link).st_ino)
+        self.assertEquals(b'caf\xe9 x\n', self._read(self.b))
+
+    def test_missing_file(self):
+        results = [parser.FileResults(os.path.join(self.dir, 'gone.txt'),
+                                      [(1, 'foo')])]
+        (edits, errors) = replace.plan(results, self.regex, b'x')
+        self.assertEquals([], edits)
+        self.assertEquals(1, len(errors))
+
+    def test_format_preview(self):
+        (edits, errors) = replace.plan(self.results[:1], self.regex, b'\\1um')
+        self.assertEquals(
+            '{0}:\n'
+            '-    1: foo bar\n'
+            '+    1: fum bar\n'
+            '-    3: foo foo\n'
+            '+    3: fum fum\n'
+            '\n'
+            '2 lines to change across 1 files\n'.format(self.a),
+            ''.join(replace.format_preview(edits, errors)))
@@ -0,0 +1,267 @@
+import threading
+import time
+import unittest
+
+from YetAnotherCodeSearch import scheduler
+
+
+class _Runnable(object):
+
+    def __init__(self, result=None, error=None, gate=None, log=None):
+        self.result = result
+        self.error = error
+        self.gate = gate
+        self.log = log
+        self.started = threading.Event()
+
+    def run(self, job):
+        self.started.set()
+        if self.gate:
+            self.gate.wait(5)
+        if self.log is not None:
+            self.log.append(self.result)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_result(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        job = s.submit(_Runnable(result=42))
+        self.assertTrue(job.wait(5))
+        self.assertEquals(42, job.result)
+        self.assertIsNone(job.error)
+
+    def test_error(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        err = ValueError('oops')
+        job = s.submit(_Runnable(error=err))
+        self.assertTrue(job.wait(5))
+        self.assertIs(err, job.error)
+
+    def test_done_callback(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        done = []
+        job = s.submit(_Runnable(result=1))
+        job.add_done_callback(done.append)
+        job.wait(5)
+        job.add_done_callback(done.append)  # Called right away.
+        self.assertEquals([job, job], done)
+
+    def test_priority(self):
+        s = scheduler.Scheduler({scheduler.INDEX: 1})
+        gate = threading.Event()
+        log = []
+        first = _Runnable(result='first', gate=gate, log=log)
+        s.submit(first, pool=scheduler.INDEX)
+        first.started.wait(5)
+        background = s.submit(_Runnable(result='background', log=log),
+                              pool=scheduler.INDEX,
+                              priority=scheduler.BACKGROUND)
+        interactive = s.submit(_Runnable(result='interactive', log=log),
+                               pool=scheduler.INDEX)
+        gate.set()
+        background.wait(5)
+        interactive.wait(5)
+        self.assertEquals(['first', 'interactive', 'background'], log)
+
+    def test_pools_are_separate(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1, scheduler.INDEX: 1})
+        gate = threading.Event()
+        indexing = s.submit(_Runnable(gate=gate), pool=scheduler.INDEX)
+        search = s.submit(_Runnable(result='found'))
+        self.assertTrue(search.wait(5))
+        self.assertFalse(indexing.done)
+        gate.set()
+        self.assertTrue(indexing.wait(5))
+
+    def test_dedupe_pending(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        gate = threading.Event()
+        blocker = _Runnable(gate=gate)
+        s.submit(blocker)
+        blocker.started.wait(5)
+        first = s.submit(_Runnable(result=1), key='same')
+        second = s.submit(_Runnable(result=2), key='same')
+        self.assertIs(first.job, second.job)
+        self.assertIs(first.runnable, second.runnable)
+        gate.set()
+        first.wait(5)
+        self.assertEquals(1, first.result)
+        self.assertEquals(1, second.result)
+        # Once the job has run, the key can be used again.
+        third = s.submit(_Runnable(result=3), key='same')
+        self.assertIsNot(first.job, third.job)
+        third.wait(5)
+        self.assertEquals(3, third.result)
+
+    def test_cancel_pending(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        gate = threading.Event()
+        blocker = _Runnable(gate=gate)
+        s.submit(blocker)
+        blocker.started.wait(5)
+        log = []
+        job = s.submit(_Runnable(result='cancelled', log=log), key='k')
+        job.cancel()
+        self.assertTrue(job.done)
+        self.assertTrue(job.cancelled)
+        self.assertIsNot(job.job, s.submit(_Runnable(), key='k').job)
+        gate.set()
+        s.submit(_Runnable()).wait(5)
+        self.assertEquals([], log)
+
+    def test_cancel_shared(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        gate = threading.Event()
+        blocker = _Runnable(gate=gate)
+        s.submit(blocker)
+        blocker.started.wait(5)
+        log = []
+        first = s.submit(_Runnable(result='shared', log=log), key='k')
+        second = s.submit(_Runnable(), key='k')
+        done = []
+        second.add_done_callback(done.append)
+        # The job still runs for the second subscriber.
+        first.cancel()
+        first.cancel()
+        self.assertTrue(first.cancelled)
+        self.assertFalse(second.cancelled)
+        gate.set()
+        self.assertTrue(second.wait(5))
+        self.assertEquals('shared', second.result)
+        self.assertEquals(['shared'], log)
+        self.assertEquals([second], done)
+
+    def test_cancel_all_subscribers(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        gate = threading.Event()
+        blocker = _Runnable(gate=gate)
+        s.submit(blocker)
+        blocker.started.wait(5)
+        log = []
+        first = s.submit(_Runnable(log=log), key='k')
+        second = s.submit(_Runnable(), key='k')
+        first.cancel()
+        second.cancel()
+        self.assertTrue(second.job.cancelled)
+        # A cancelled job is not shared with new subscribers.
+        third = s.submit(_Runnable(result='new'), key='k')
+        self.assertIsNot(first.job, third.job)
+        gate.set()
+        self.assertTrue(third.wait(5))
+        self.assertEquals('new', third.result)
+        self.assertEquals([], log)
+
+    def test_cancel_running(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        gate = threading.Event()
+        runnable = _Runnable(gate=gate)
+        job = s.submit(runnable)
+        runnable.started.wait(5)
+        job.add_cancel_callback(gate.set)
+        job.cancel()
+        self.assertTrue(job.wait(5))
+        self.assertTrue(job.cancelled)
+
+    def test_remove_cancel_callback(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1})
+        gate = threading.Event()
+        runnable = _Runnable(gate=gate)
+        job = s.submit(runnable)
+        runnable.started.wait(5)
+        called = []
+
+        def removed():
+            called.append('removed')
+        job.add_cancel_callback(removed)
+        self.assertTrue(job.remove_cancel_callback(removed))
+        job.add_cancel_callback(gate.set)
+        job.cancel()
+        self.assertFalse(job.remove_cancel_callback(gate.set))
+        self.assertTrue(job.wait(5))
+        self.assertEquals([], called)
+
+
+class IndexLockTest(unittest.TestCase):
+
+    def test_readers_share(self):
+        lock = scheduler.IndexLock()
+        self.assertTrue(lock.try_acquire(scheduler.READ))
+        self.assertTrue(lock.try_acquire(scheduler.READ))
+
+    def test_update_allows_readers(self):
+        lock = scheduler.IndexLock()
+        self.assertTrue(lock.try_acquire(scheduler.UPDATE))
+        self.assertTrue(lock.try_acquire(scheduler.READ))
+        self.assertFalse(lock.try_acquire(scheduler.UPDATE))
+        lock.release(scheduler.UPDATE)
+        self.assertTrue(lock.try_acquire(scheduler.UPDATE))
+
+    def test_rebuild_excludes_readers(self):
+        lock = scheduler.IndexLock()
+        self.assertTrue(lock.try_acquire(scheduler.READ))
+        self.assertFalse(lock.try_acquire(scheduler.REBUILD, 'rebuild'))
+        # New readers wait behind the rebuild.
+        self.assertFalse(lock.try_acquire(scheduler.READ))
+        lock.release(scheduler.READ)
+        self.assertTrue(lock.try_acquire(scheduler.REBUILD, 'rebuild'))
+        self.assertFalse(lock.try_acquire(scheduler.READ))
+        lock.release(scheduler.REBUILD)
+        self.assertTrue(lock.try_acquire(scheduler.READ))
+
+    def test_forget_waiting_rebuild(self):
+        lock = scheduler.IndexLock()
+        self.assertTrue(lock.try_acquire(scheduler.READ))
+        self.assertFalse(lock.try_acquire(scheduler.REBUILD, 'rebuild'))
+        lock.forget('rebuild')
+        self.assertTrue(lock.try_acquire(scheduler.READ))
+
+    def test_job_holds_lock(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1, scheduler.INDEX: 1})
+        gate = threading.Event()
+        rebuild = _Runnable(gate=gate)
+        s.submit(rebuild, pool=scheduler.INDEX, index_filename='idx',
+                 access=scheduler.REBUILD)
+        rebuild.started.wait(5)
+        search = s.submit(_Runnable(), index_filename='idx')
+        time.sleep(0.05)
+        self.assertFalse(search.done)
+        gate.set()
+        self.assertTrue(search.wait(5))
+
+    def test_locked_job_does_not_hold_worker(self):
+        s = scheduler.Scheduler({scheduler.SEARCH: 1, scheduler.INDEX: 1})
+        gate = threading.Event()
+        rebuild = _Runnable(gate=gate)
+        s.submit(rebuild, pool=scheduler.INDEX, index_filename='idx',
+                 access=scheduler.REBUILD)
+        rebuild.started.wait(5)
+        search = s.submit(_Runnable(), index_filename='idx')
+        other = s.submit(_Runnable(result='other'), index_filename='other')
+        self.assertTrue(other.wait(5))
+        self.assertFalse(search.done)
+        # A cancelled job waiting for its index is dropped right away.
+        search.cancel()
+        self.assertTrue(search.done)
+        gate.set()
+
+    def test_refine_during_rebuild(self):
+        s = scheduler.Scheduler()
+        gate = threading.Event()
+        rebuild = _Runnable(gate=gate)
+        s.submit(rebuild, pool=scheduler.INDEX, index_filename='idx',
+                 access=scheduler.REBUILD)
+        rebuild.started.wait(5)
+        searches = [s.submit(_Runnable(), index_filename='idx')
+                    for unused_i in range(3)]
+        refine = s.submit(_Runnable(result='refined'),
+                          pool=scheduler.RESULTS)
+        self.assertTrue(refine.wait(5))
+        self.assertEquals('refined', refine.result)
+        self.assertFalse(any(search.done for search in searches))
+        gate.set()
+        for search in searches:
+            self.assertTrue(search.wait(5))
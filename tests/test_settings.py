@@ -1,4 +1,5 @@
 import os.path
+import sys
 import unittest
 from unittest.mock import patch
 
@@ -69,3 +70,52 @@ class GetProjectSettingsTest(unittest.TestCase):
         self.assertIsNone(s.index_filename)
         self.assertEquals(os.path.basename(s.cindex_path), 'cindex')
         self.assertEquals(os.path.basename(s.csearch_path), 'csearch')
+
+
+class _FakeWindow(object):
+
+    def __init__(self, project_data):
+        self.data = project_data
+
+    def id(self):
+        return 1
+
+    def project_file_name(self):
+        return '/abs/project/test.project'
+
+    def project_data(self):
+        return self.data
+
+
+class GetWindowSettingsTest(unittest.TestCase):
+
+    def setUp(self):
+        settings.clear_cache()
+
+    def tearDown(self):
+        settings.clear_cache()
+
+    @patch('YetAnotherCodeSearch.settings.get_project_settings',
+           autospec=True)
+    def test_remembers_settings(self, mock_get_project_settings):
+        mock_get_project_settings.side_effect = (
+            lambda data, name, index_project_folders: settings.Settings(
+                'csearch', 'cindex', index_filename=data['index']))
+        window = _FakeWindow({'index': '/abs/a'})
+        s = settings.get_window_settings(window)
+        self.assertEquals('/abs/a', s.index_filename)
+        self.assertIs(s, settings.get_window_settings(window))
+        self.assertEquals(1, mock_get_project_settings.call_count)
+
+        window.data = {'index': '/abs/b'}
+        self.assertEquals('/abs/b',
+                          settings.get_window_settings(window).index_filename)
+        settings.clear_cache()
+        settings.get_window_settings(window)
+        self.assertEquals(3, mock_get_project_settings.call_count)
+
+    def test_find_binary(self):
+        self.assertIsNone(settings.find_binary('/does/not/exist/csearch'))
+        self.assertIsNone(settings.find_binary('no-such-csearch-command'))
+        python = settings.find_binary(sys.executable)
+        self.assertEquals(os.path.abspath(sys.executable), python)
@@ -0,0 +1,125 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import stats
+
+
+def _record(query, total, cached=False):
+    return stats.make_record(parser.parse_query(query),
+                             [parser.FileResults('a.txt', [(1, 'cooks')])],
+                             {'csearch': total / 2, 'total': total},
+                             index_bytes=1024 * 1024, cached=cached)
+
+
+class StatsTest(unittest.TestCase):
+
+    def test_normalize_query(self):
+        self.assertEquals('"foo" "bar baz" file:\\.py case:no',
+                          stats.normalize_query(parser.parse_query(
+                              'foo "bar baz" case:no file:\\.py')))
+
+    def test_normalize_query_round_trip(self):
+        search = parser.Search(query=['say "hi"', r'\\"\"', 'x'])
+        query = stats.normalize_query(search)
+        parsed = parser.parse_query(query)
+        self.assertEquals(3, len(parsed.query))
+        for (term, parsed_term) in zip(search.query, parsed.query):
+            self.assertEquals(re.findall(term, 'say "hi" \\"" x'),
+                              re.findall(parsed_term, 'say "hi" \\"" x'))
+        self.assertEquals(query, stats.normalize_query(parsed))
+
+    def test_record_search(self):
+        search = parser.parse_query('foo "bar baz" case:no file:\\.py')
+        record = stats.make_record(search, [], {})
+        self.assertEquals(search, stats.record_search(record))
+        self.assertEquals(0, record['files'])
+
+    def test_record_search_with_file_flags(self):
+        search = parser.parse_query('foo lang:go -file:_test file:a file:b')
+        record = stats.make_record(search, [], {})
+        self.assertEquals(search, stats.record_search(record))
+        self.assertEquals('"foo" file:a file:b -file:_test lang:go',
+                          record['query'])
+
+    def test_timed(self):
+        timings = {}
+        with stats.timed(timings, 'parse'):
+            pass
+        self.assertIn('parse', timings)
+        with stats.timed(None, 'parse'):
+            pass
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEquals(50, stats.percentile(values, 50))
+        self.assertEquals(95, stats.percentile(values, 95))
+        self.assertEquals(100, stats.percentile(values, 100))
+        self.assertEquals(7, stats.percentile([7], 99))
+
+    def test_latencies(self):
+        records = [_record('foo', t / 100) for t in range(1, 101)]
+        self.assertEquals(
+            [('csearch', 100, [.25, .475, .495]),
+             ('total', 100, [.5, .95, .99])],
+            stats.latencies(records))
+
+    def test_format_report(self):
+        records = [_record('foo', .5), _record('bar', 2, cached=True)]
+        report = ''.join(stats.format_report(records, limit=1))
+        self.assertIn('2 searches, 1 from the cache', report)
+        self.assertIn('2000ms  "bar"  (1 matches in 1 files, 1.0 MB index, '
+                      'cached)', report)
+        self.assertNotIn('"foo"', report)
+
+    def test_format_report_empty(self):
+        self.assertEquals('No searches recorded\n',
+                          ''.join(stats.format_report([])))
+
+
+class StatsLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'stats', 'stats.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_add_and_read(self):
+        log = stats.StatsLog(self.filename)
+        log.add(_record('foo', 1))
+        log.add(_record('bar', 2))
+        self.assertEquals(['"foo"', '"bar"'],
+                          [r['query'] for r in log.records()])
+        self.assertEquals(['"foo"', '"bar"'], [
+            r['query'] for r in stats.StatsLog(self.filename).records()])
+
+    def test_bounded(self):
+        log = stats.StatsLog(self.filename, max_records=3)
+        for i in range(10):
+            log.add(_record('q{0}'.format(i), 1))
+        self.assertEquals(['"q7"', '"q8"', '"q9"'],
+                          [r['query'] for r in log.records()])
+        with open(self.filename) as f:
+            self.assertLessEqual(len(f.readlines()), 6)
+
+    def test_skips_bad_lines(self):
+        log = stats.StatsLog(self.filename)
+        log.add(_record('foo', 1))
+        with open(self.filename, 'a') as f:
+            f.write('{"query": ')
+        self.assertEquals(['"foo"'], [r['query'] for r in log.records()])
+
+    def test_clear(self):
+        log = stats.StatsLog(self.filename)
+        log.add(_record('foo', 1))
+        log.clear()
+        self.assertEquals([], log.records())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+
+from YetAnotherCodeSearch import symbols
+
+
+class ExtractTest(unittest.TestCase):
+
+    def test_python(self):
+        data = textwrap.dedent("""\
+            import os
+
+            class Cooks(object):
+
+                def count(self):
+                    pass
+
+            async def main():
+                pass
+        """).encode('utf-8')
+        self.assertEquals([(b'Cooks', 3, symbols.KINDS.index('class')),
+                           (b'count', 5, symbols.KINDS.index('method')),
+                           (b'main', 8, symbols.KINDS.index('function'))],
+                          symbols.extract(data, 'python'))
+
+    def test_go(self):
+        data = textwrap.dedent("""\
+            package main
+
+            type Cook struct{}
+
+            func (c *Cook) Cook() {}
+
+            func main() {}
+        """).encode('utf-8')
+        self.assertEquals([(b'Cook', 3, symbols.KINDS.index('type')),
+                           (b'Cook', 5, symbols.KINDS.index('method')),
+                           (b'main', 7, symbols.KINDS.index('function'))],
+                          symbols.extract(data, 'go'))
+
+
+class SymbolTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.table = os.path.join(self.dir, 'index.symbols')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent(text))
+        return path
+
+    def test_build_and_lookup(self):
+        a = self._write('a.py', """\
+            def too_many_cooks():
+                pass
+
+            class Cook(object):
+                pass
+        """)
+        b = self._write('b.go', """\
+            package b
+
+            func CookAll() {}
+        """)
+        c = self._write('c.txt', 'def not_code():\n')
+        self.assertEquals(3, symbols.build_table(self.table, [a, b, c]))
+        table = symbols.SymbolTable(self.table)
+        self.addCleanup(table.close)
+        self.assertEquals(
+            [symbols.Symbol('Cook', a, 4, 'class'),
+             symbols.Symbol('CookAll', b, 3, 'function')],
+            table.lookup('cook'))
+        self.assertEquals([symbols.Symbol('too_many_cooks', a, 1,
+                                          'function')],
+                          table.lookup('TOO_'))
+        self.assertEquals([], table.lookup('nope'))
+        self.assertEquals(1, len(table.lookup('c', limit=1)))
+
+    def test_build_with_processes(self):
+        a = self._write('a.py', 'def cook():\n    pass\n')
+        b = self._write('b.go', 'package b\n\nfunc Cook() {}\n')
+        missing = os.path.join(self.dir, 'gone.py')
+        self.assertEquals(2, symbols.build_table(
+            self.table, [a, missing, b], max_workers=2, processes=True))
+        table = symbols.SymbolTable(self.table)
+        self.addCleanup(table.close)
+        self.assertEquals([symbols.Symbol('Cook', b, 3, 'function'),
+                           symbols.Symbol('cook', a, 1, 'function')],
+                          table.lookup('cook'))
+
+    def test_exact_match_first(self):
+        a = self._write('a.py', """\
+            def cookbook():
+                pass
+
+            def Cook():
+                pass
+        """)
+        symbols.build_table(self.table, [a])
+        table = symbols.SymbolTable(self.table)
+        self.addCleanup(table.close)
+        self.assertEquals(['Cook', 'cookbook'],
+                          [symbol.name for symbol in table.lookup('Cook')])
+
+    def test_rebuild_keeps_unchanged_files(self):
+        a = self._write('a.py', 'def cook():\n    pass\n')
+        symbols.build_table(self.table, [a])
+        # Symbols of unchanged files come from the old table, so make the old
+        # table say something the file doesn't.
+        table = symbols.SymbolTable(self.table)
+        ((path, generation, unused_id),) = list(table.files())
+        table.close()
+        symbols.write_table(self.table, [(path, generation,
+                                          [(b'stale', 1, 0)])])
+        b = self._write('b.py', 'def fresh():\n    pass\n')
+        symbols.build_table(self.table, [a, b])
+        table = symbols.SymbolTable(self.table)
+        self.addCleanup(table.close)
+        self.assertEquals(['stale'],
+                          [symbol.name for symbol in table.lookup('stale')])
+        self.assertEquals(['fresh'],
+                          [symbol.name for symbol in table.lookup('fresh')])
+
+    def test_not_a_table(self):
+        self._write('index.symbols', 'nope')
+        with self.assertRaises(symbols.CorruptTableError):
+            symbols.SymbolTable(self.table)
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from YetAnotherCodeSearch import vocab
+
+
+class ExtractTest(unittest.TestCase):
+
+    def test_extract(self):
+        self.assertEquals(
+            set([b'def', b'parse_query', b'text', b'return', b'_private']),
+            vocab.extract(b'def parse_query(text):\n'
+                          b'    return _private(text, 42, x1)\n'))
+
+
+class VocabularyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'index.vocab')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_build_and_complete(self):
+        paths = []
+        for (i, text) in enumerate([b'parse_query parseQuery ParseError',
+                                    b'parse_query parser',
+                                    b'parse_query parser']):
+            path = os.path.join(self.directory, 'f{0}.py'.format(i))
+            with open(path, 'wb') as f:
+                f.write(text)
+            paths.append(path)
+        paths.append(os.path.join(self.directory, 'missing.py'))
+        self.assertEquals(4, vocab.build_table(self.filename, paths))
+        table = vocab.open_table(self.filename)
+        self.assertIs(table, vocab.open_table(self.filename))
+        self.assertEquals(
+            [('parse_query', 3), ('parser', 2)],
+            table.complete('PARSE', limit=2))
+        self.assertEquals(
+            set([('parseQuery', 1), ('ParseError', 1)]),
+            set(table.complete('parsee', limit=10) +
+                table.complete('parseq', limit=10)))
+        self.assertEquals([], table.complete('xyz'))
+
+    def test_suggest(self):
+        vocab.write_table(self.filename, {b'CsearchCommand': 4,
+                                          b'CindexCommand': 2,
+                                          b'ChunkedRenderer': 9,
+                                          b'format_results': 3})
+        table = vocab.Vocabulary(self.filename)
+        try:
+            self.assertEquals('CsearchCommand',
+                              table.suggest('CsaerchCommand')[0][0])
+            self.assertEquals('format_results',
+                              table.suggest('formatresults')[0][0])
+            self.assertNotIn('CindexCommand',
+                             [t for (t, unused) in table.suggest(
+                                 'CindexCommand')])
+            self.assertEquals([], table.suggest('zz'))
+        finally:
+            table.close()
+
+    def test_fast(self):
+        counts = dict((('ident{0}x{1}'.format(i, i * 7)).encode('ascii'), i)
+                      for i in range(100000))
+        vocab.write_table(self.filename, counts)
+        table = vocab.Vocabulary(self.filename)
+        try:
+            start = time.perf_counter()
+            table.complete('ident', limit=10)
+            table.suggest('idnet512x3584', limit=5)
+            self.assertLess(time.perf_counter() - start, .1)
+        finally:
+            table.close()
+
+    def test_corrupt(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'not a table at all')
+        with self.assertRaises(vocab.CorruptTableError):
+            vocab.Vocabulary(self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import stats
+from YetAnotherCodeSearch import worker
+
+
+def read_frames(data):
+    stream = io.BytesIO(data)
+    frames = []
+    while True:
+        frame = worker.read_frame(stream)
+        if frame is None:
+            return frames
+        frames.append(frame)
+
+
+class FrameTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        out = io.BytesIO()
+        worker.write_frame(out, b'T', b'hello')
+        worker.write_frame(out, b'D', b'')
+        self.assertEquals([(b'T', b'hello'), (b'D', b'')],
+                          read_frames(out.getvalue()))
+
+    def test_truncated(self):
+        out = io.BytesIO()
+        worker.write_frame(out, b'T', b'hello')
+        with self.assertRaises(worker.WorkerError):
+            read_frames(out.getvalue()[:-1])
+
+    def test_highlights(self):
+        spans = [(0, 3), (10, 70000)]
+        self.assertEquals(spans, worker.decode_highlights(
+            worker.encode_highlights(spans)))
+
+
+class LazyResultsTest(unittest.TestCase):
+
+    def test_lazy(self):
+        results = [parser.FileResults('a\udcff.txt', [(2, 'foo')],
+                                      context=[(1, 'bar')])]
+        lazy = worker.LazyResults(worker.dump_results(results), 1, (1, 1))
+        self.assertEquals(1, len(lazy))
+        self.assertIsNone(lazy._results)
+        self.assertEquals(results, list(lazy))
+        self.assertEquals([(1, 'bar')], lazy[0].context)
+
+    def test_stats_without_reading(self):
+        results = [parser.FileResults('a.txt', [(2, 'foo'), (3, 'foo')]),
+                   parser.FileResults('b.txt', [(1, 'foo')])]
+        lazy = worker.LazyResults(worker.dump_results(results), 2, (2, 3))
+        record = stats.make_record(parser.parse_query('foo'), lazy,
+                                   {'csearch': .1})
+        self.assertEquals(2, record['files'])
+        self.assertEquals(3, record['matches'])
+        self.assertIsNone(lazy._results)
+
+
+class RunRequestTest(unittest.TestCase):
+
+    @patch('YetAnotherCodeSearch.engine.search', autospec=True)
+    def test_run_request(self, mock_search):
+        results = [parser.FileResults('a.txt', [(1, 'Too many cooks')]),
+                   parser.FileResults('b.txt', [(2, 'cooks')])]
+        mock_search.return_value = results
+        out = io.BytesIO()
+        worker.run_request({'search': {'query': ['cooks']}}, out)
+        frames = read_frames(out.getvalue())
+        self.assertEquals([b'T', b'H', b'R', b'D'],
+                          [kind for (kind, unused) in frames])
+        text = frames[0][1].decode('utf-8')
+        self.assertEquals(''.join(engine.format_results(results)), text)
+        self.assertEquals(
+            ['cooks', 'cooks'],
+            [text[b:e] for (b, e) in worker.decode_highlights(frames[1][1])])
+
+    @patch('YetAnotherCodeSearch.engine.search', autospec=True)
+    def test_error(self, mock_search):
+        error = subprocess.CalledProcessError(2, ['csearch'])
+        error.output = b'bad regex'
+        mock_search.side_effect = error
+        out = io.BytesIO()
+        worker.run_request({'search': {'query': ['(']}}, out)
+        (kind, payload) = read_frames(out.getvalue())[-1]
+        self.assertEquals(b'D', kind)
+        self.assertIn(b'bad regex', payload)
+
+
+@unittest.skipIf(sys.platform == 'win32', 'needs a shell script')
+class WorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csearch = os.path.join(self.directory, 'csearch')
+        with open(self.csearch, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    'printf "/a.txt:2:foo bar\\n/a.txt:4:foo\\n"\n')
+        os.chmod(self.csearch, 0o755)
+
+    def tearDown(self):
+        worker.shutdown()
+        shutil.rmtree(self.directory)
+
+    def test_search(self):
+        proc = worker.acquire(sys.executable)
+        try:
+            reply = proc.search(parser.parse_query('foo'),
+                                path_csearch=self.csearch)
+        finally:
+            worker.release(proc)
+        text = ''.join(reply.texts)
+        self.assertEquals(len(text), reply.text_length)
+        self.assertTrue(text.endswith('2 matches across 1 files\n'))
+        self.assertEquals(['foo', 'foo'],
+                          [text[b:e] for (b, e) in reply.highlights])
+        self.assertEquals([parser.FileResults('/a.txt', [(2, 'foo bar'),
+                                                         (4, 'foo')])],
+                          list(reply.results))
+        # The worker is kept for the next search.
+        self.assertIs(proc, worker.acquire(sys.executable))
+        worker.release(proc)
+
+    def test_csearch_fails(self):
+        proc = worker.acquire(sys.executable)
+        try:
+            with open(self.csearch, 'w') as f:
+                f.write('#!/bin/sh\necho bad regex >&2\nexit 2\n')
+            with self.assertRaises(subprocess.CalledProcessError) as cm:
+                proc.search(parser.parse_query('foo'),
+                            path_csearch=self.csearch)
+            self.assertEquals(2, cm.exception.returncode)
+        finally:
+            worker.release(proc)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,329 @@
+import array
+import bisect
+import collections
+import concurrent.futures
+import heapq
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+
+_MAGIC = b'YACSVOC1'
+_SUFFIX = '.vocab'
+
+# Files bigger than this are most likely generated, and are skipped.
+_MAX_FILE_SIZE = 4 * 1024 * 1024
+
+# How many files to read at once.
+_MAX_WORKERS = 4
+
+# The most identifiers to keep. The ones in the fewest files are dropped.
+_MAX_TOKENS = 1 << 20
+
+# The most entries to look at for a prefix, so a short prefix stays fast.
+_MAX_PREFIX_SCAN = 5000
+
+# The most postings to count for a suggestion, so it takes a few milliseconds
+# at most. The rarest trigrams are counted first.
+_MAX_POSTINGS = 50000
+
+# The most identifiers sharing the most trigrams with a word to score.
+_MAX_CANDIDATES = 500
+
+# Identifiers from 3 to 64 characters long.
+_TOKEN_RE = re.compile(br'\b[A-Za-z_]\w{2,63}\b')
+
+# magic, number of identifiers, number of trigrams, and the offsets of the
+# identifier table, trigram table, postings and string pool.
+_HEADER = struct.Struct('>8sIIIIII')
+# name offset, name length, number of files
+_TOKEN = struct.Struct('>IBI')
+# trigram, first posting, number of postings
+_TRIGRAM = struct.Struct('>3sII')
+
+
+def table_path(index_filename):
+    """Gets where the identifier table for an index is kept.
+
+    Args:
+        index_filename: The csearchindex file location.
+    """
+    return index_filename + _SUFFIX
+
+
+def extract(data):
+    """Finds the identifiers in a file.
+
+    Args:
+        data: The file contents as bytes.
+    Returns:
+        The set of identifiers, as bytes.
+    """
+    return set(_TOKEN_RE.findall(data))
+
+
+def _fold(token):
+    return token.lower()
+
+
+def _trigrams(key):
+    return set(key[i:i + 3] for i in range(len(key) - 2))
+
+
+def write_table(filename, counts):
+    """Writes an identifier table.
+
+    Args:
+        filename: Where to write the table.
+        counts: A dict of the number of files each identifier, as bytes, is
+            in.
+    """
+    tokens = sorted(counts, key=lambda token: (_fold(token), token))
+    pool = bytearray()
+    token_table = bytearray()
+    postings = collections.defaultdict(list)
+    for (token_id, token) in enumerate(tokens):
+        token_table += _TOKEN.pack(len(pool), len(token), counts[token])
+        pool.extend(token)
+        for trigram in _trigrams(_fold(token)):
+            postings[trigram].append(token_id)
+    trigram_table = bytearray()
+    posting_data = array.array('I')
+    for trigram in sorted(postings):
+        ids = postings[trigram]
+        trigram_table += _TRIGRAM.pack(trigram, len(posting_data), len(ids))
+        posting_data.extend(ids)
+    if sys.byteorder == 'big':
+        posting_data.byteswap()
+    tokens_offset = _HEADER.size
+    trigrams_offset = tokens_offset + len(token_table)
+    postings_offset = trigrams_offset + len(trigram_table)
+    pool_offset = postings_offset + len(posting_data) * 4
+    header = _HEADER.pack(_MAGIC, len(tokens), len(postings), tokens_offset,
+                          trigrams_offset, postings_offset, pool_offset)
+    directory = os.path.dirname(os.path.abspath(filename))
+    (fd, tmp) = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(token_table)
+            f.write(trigram_table)
+            f.write(posting_data.tobytes())
+            f.write(pool)
+        os.replace(tmp, filename)
+    except:
+        os.remove(tmp)
+        raise
+
+
+class CorruptTableError(Exception):
+    """The identifier table file can't be read."""
+    pass
+
+
+class Vocabulary(object):
+    """Reads an identifier table written by write_table.
+
+    The table is mmap'd. The identifiers are sorted by their case folded
+    name, so completing a prefix is a binary search, and each trigram of the
+    folded names has a list of the identifiers that have it, so identifiers
+    spelled like a word are found by counting the trigrams they share.
+
+    Attributes:
+        filename: The identifier table file.
+        num_tokens: The number of identifiers in the table.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, self.num_tokens, self._num_trigrams, self._tokens_offset,
+             self._trigrams_offset, self._postings_offset,
+             self._pool_offset) = _HEADER.unpack_from(self._data)
+        except struct.error:
+            magic = None
+        if magic != _MAGIC:
+            self._data.close()
+            raise CorruptTableError('{0} is not an identifier table'.format(
+                filename))
+        self.generation = (os.stat(filename).st_mtime, len(self._data))
+        self._keys = _Keys(self.num_tokens, self._key)
+        self._trigram_keys = _Keys(self._num_trigrams, self._trigram)
+
+    def close(self):
+        self._data.close()
+
+    def _entry(self, i):
+        return _TOKEN.unpack_from(self._data,
+                                  self._tokens_offset + i * _TOKEN.size)
+
+    def _token(self, i):
+        (offset, length, unused_count) = self._entry(i)
+        start = self._pool_offset + offset
+        return self._data[start:start + length]
+
+    def _key(self, i):
+        return _fold(self._token(i))
+
+    def _trigram(self, i):
+        start = self._trigrams_offset + i * _TRIGRAM.size
+        return self._data[start:start + 3]
+
+    def token(self, i):
+        """Gets the i-th identifier, in name order.
+
+        Returns:
+            An (identifier, number of files) pair.
+        """
+        (offset, length, count) = self._entry(i)
+        start = self._pool_offset + offset
+        return (self._data[start:start + length].decode('ascii'), count)
+
+    def complete(self, prefix, limit=10):
+        """Finds the identifiers that start with a prefix, ignoring case.
+
+        Args:
+            prefix: The start of the identifiers to find.
+            limit: The most identifiers to return.
+        Returns:
+            A list of (identifier, number of files) pairs, the identifiers in
+            the most files first.
+        """
+        key = _fold(prefix.encode('ascii', 'ignore'))
+        lo = bisect.bisect_left(self._keys, key)
+        hi = min(self.num_tokens, lo + _MAX_PREFIX_SCAN)
+        hi = bisect.bisect_left(self._keys, key + b'\xff', lo, hi)
+        found = heapq.nlargest(
+            limit, range(lo, hi), key=lambda i: self._entry(i)[2])
+        return [self.token(i) for i in found]
+
+    def _postings(self, i):
+        (unused, start, count) = _TRIGRAM.unpack_from(
+            self._data, self._trigrams_offset + i * _TRIGRAM.size)
+        start = self._postings_offset + start * 4
+        ids = array.array('I')
+        ids.frombytes(self._data[start:start + count * 4])
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return ids
+
+    def suggest(self, word, limit=5):
+        """Finds the identifiers spelled most like a word.
+
+        The identifiers are scored by the trigrams they share with the word,
+        so typos and missing or swapped letters still find them.
+
+        Args:
+            word: The word, as typed.
+            limit: The most identifiers to return.
+        Returns:
+            A list of (identifier, number of files) pairs, the closest first.
+            The word itself isn't included.
+        """
+        key = _fold(word.encode('ascii', 'ignore'))
+        wanted = _trigrams(key)
+        if not wanted:
+            return []
+        lists = []
+        for trigram in wanted:
+            i = bisect.bisect_left(self._trigram_keys, trigram)
+            if i < self._num_trigrams and self._trigram(i) == trigram:
+                lists.append(self._postings(i))
+        lists.sort(key=len)
+        shared = collections.Counter()
+        budget = _MAX_POSTINGS
+        for ids in lists:
+            if len(ids) > budget:
+                break
+            shared.update(ids)
+            budget -= len(ids)
+        # A candidate needs to share about half of the word's trigrams.
+        least = max(1, len(wanted) // 2)
+
+        def score(item):
+            (i, common) = item
+            (unused, length, count) = self._entry(i)
+            return (2. * common / (len(wanted) + max(1, length - 2)), count)
+        candidates = [(i, common) for (i, common)
+                      in shared.most_common(_MAX_CANDIDATES)
+                      if common >= least]
+        res = []
+        for (i, unused) in heapq.nlargest(limit + 1, candidates, key=score):
+            if self._key(i) != key:
+                res.append(self.token(i))
+        return res[:limit]
+
+
+class _Keys(object):
+    """A sequence view of a table's keys, for bisect."""
+
+    def __init__(self, length, get):
+        self._length = length
+        self._get = get
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        return self._get(i)
+
+
+def _extract_file(path):
+    try:
+        if os.path.getsize(path) > _MAX_FILE_SIZE:
+            return set()
+        with open(path, 'rb') as f:
+            return extract(f.read())
+    except (OSError, IOError):
+        return set()
+
+
+def build_table(filename, paths, max_workers=_MAX_WORKERS):
+    """Builds the identifier table for the indexed files.
+
+    Args:
+        filename: Where the identifier table is kept.
+        paths: The list of indexed file paths.
+        max_workers: The number of files to read at once.
+    Returns:
+        The number of identifiers found.
+    """
+    counts = collections.Counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for tokens in executor.map(_extract_file, paths):
+            counts.update(tokens)
+    if len(counts) > _MAX_TOKENS:
+        counts = dict(counts.most_common(_MAX_TOKENS))
+    write_table(filename, counts)
+    return len(counts)
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def open_table(filename):
+    """Opens an identifier table, reusing it until the file changes.
+
+    Args:
+        filename: The identifier table file.
+    Returns:
+        A Vocabulary.
+    Raises:
+        OSError: If the table doesn't exist.
+        CorruptTableError: If the file isn't an identifier table.
+    """
+    st = os.stat(filename)
+    with _tables_lock:
+        table = _tables.get(filename)
+        if table and table.generation == (st.st_mtime, st.st_size):
+            return table
+        # Old tables are left for the garbage collector, since other threads
+        # may still be reading from them.
+        table = _tables[filename] = Vocabulary(filename)
+        return table
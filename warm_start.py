@@ -0,0 +1,111 @@
+import sublime
+import sublime_plugin
+
+import os
+
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import pathclass
+from YetAnotherCodeSearch import scheduler
+from YetAnotherCodeSearch import settings
+
+# The project each window was last warmed up for, by window id.
+_warmed = {}
+
+
+class _PrefetchJob(object):
+    """Pulls files into the page cache as a scheduler job."""
+
+    def __init__(self, index_filename, filenames, max_bytes):
+        """Initializes the _PrefetchJob.
+
+        Args:
+            index_filename: The csearchindex file to prefetch and open.
+            filenames: Other files to prefetch, like the csearch command.
+            max_bytes: The most bytes to prefetch of each file.
+        """
+        self._index_filename = index_filename
+        self._filenames = filenames
+        self._max_bytes = max_bytes
+
+    def run(self, job):
+        total = 0
+        for filename in [self._index_filename] + self._filenames:
+            if job.cancelled:
+                break
+            try:
+                total += index.prefetch(filename, max_bytes=self._max_bytes)
+            except (OSError, IOError):
+                pass
+        try:
+            # Later lookups reuse the open reader and the path bitsets.
+            index.open_index(self._index_filename)
+            pathclass.get_path_classes(self._index_filename)
+        except (OSError, IOError, ValueError, index.CorruptIndexError):
+            pass
+        return total
+
+
+def warm_up(window, force=False):
+    """Gets a window ready to search, so the first search is fast.
+
+    The window's settings are loaded and remembered, the csearch and cindex
+    commands are checked, and the index file is prefetched in the background.
+
+    Args:
+        window: The sublime.Window.
+        force: If true, warm up even if the window's project was already
+            warmed up.
+    """
+    if window is None:
+        return
+    project = window.project_file_name()
+    if not force and _warmed.get(window.id(), ()) == project:
+        return
+    _warmed[window.id()] = project
+    try:
+        s = settings.get_window_settings(window)
+    except Exception:
+        return  # The error is shown when a search is run.
+    missing = [name for (name, path) in (('path_csearch', s.csearch_path),
+                                         ('path_cindex', s.cindex_path))
+               if not settings.find_binary(path)]
+    for name in missing:
+        print('Code Search: the {0} command "{1}" was not found'.format(
+            name, settings.get(name)))
+    if missing:
+        sublime.status_message('Code Search: set {0} in the settings'.format(
+            ' and '.join(missing)))
+    max_mb = settings.get('prefetch_index_max_mb', 1024)
+    if not max_mb:
+        return
+    index_filename = index.index_path(s.index_filename)
+    filenames = [path for path in (s.csearch_path,) if os.path.isabs(path)]
+    scheduler.get_scheduler().submit(
+        _PrefetchJob(index_filename, filenames, max_mb * 1024 * 1024),
+        key=('prefetch', index_filename),
+        pool=scheduler.SEARCH,
+        priority=scheduler.BACKGROUND,
+        index_filename=index_filename,
+        access=scheduler.READ)
+
+
+def _on_settings_change():
+    _warmed.clear()
+    warm_up(sublime.active_window(), force=True)
+
+
+def plugin_loaded():
+    settings.watch(on_change=_on_settings_change)
+    for window in sublime.windows():
+        warm_up(window)
+
+
+def plugin_unloaded():
+    settings.unwatch()
+
+
+class CodeSearchWarmStartListener(sublime_plugin.EventListener):
+    """Warms up windows as they are used, and when their project changes."""
+
+    def on_activated(self, view):
+        warm_up(view.window())
@@ -0,0 +1,450 @@
+import array
+import collections.abc
+import json
+import os
+import re
+import struct
+import subprocess
+import sys
+import threading
+
+from YetAnotherCodeSearch import cache
+from YetAnotherCodeSearch import context
+from YetAnotherCodeSearch import daemon
+from YetAnotherCodeSearch import engine
+from YetAnotherCodeSearch import index
+from YetAnotherCodeSearch import parser
+from YetAnotherCodeSearch import stats
+
+# Each frame is its length, a byte for its kind, and then the payload.
+_FRAME = struct.Struct('>Ic')
+
+# The kinds of frames. A request is a single _REQUEST frame. The reply is
+# _TEXT and _HIGHLIGHTS frames as the results are formatted, then a _RESULTS
+# frame and a _DONE frame.
+_REQUEST = b'Q'
+_TEXT = b'T'
+_HIGHLIGHTS = b'H'
+_RESULTS = b'R'
+_DONE = b'D'
+
+# The number of characters of results text to send at a time.
+_CHUNK_SIZE = 64 * 1024
+
+# The most worker processes to keep around for later searches.
+_MAX_IDLE = 2
+
+# The result cache of the worker process, once a request asks for one.
+_result_cache = None
+
+
+class WorkerError(Exception):
+    """Exception class when the worker process can't be run, or fails."""
+    pass
+
+
+def write_frame(out, kind, payload):
+    """Writes a frame to a binary stream.
+
+    Args:
+        out: The stream.
+        kind: The kind of frame, one byte.
+        payload: The bytes of the frame.
+    """
+    out.write(_FRAME.pack(len(payload), kind))
+    out.write(payload)
+
+
+def read_frame(stream):
+    """Reads a frame from a binary stream.
+
+    Returns:
+        A (kind, payload) pair, or None at the end of the stream.
+    Raises:
+        WorkerError: If the stream ends in the middle of a frame.
+    """
+    header = stream.read(_FRAME.size)
+    if not header:
+        return None
+    if len(header) < _FRAME.size:
+        raise WorkerError('The worker stopped in the middle of a frame')
+    (length, kind) = _FRAME.unpack(header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise WorkerError('The worker stopped in the middle of a frame')
+    return (kind, payload)
+
+
+def _json(data):
+    # Lines that aren't valid UTF-8 are kept as escaped surrogates.
+    return json.dumps(data).encode('ascii')
+
+
+def encode_highlights(spans):
+    """Packs (begin, end) offsets into bytes, 4 bytes for each offset."""
+    offsets = array.array('I', (n for span in spans for n in span))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def decode_highlights(data):
+    """Unpacks the (begin, end) offsets from encode_highlights."""
+    offsets = array.array('I')
+    offsets.frombytes(data)
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return list(zip(offsets[::2], offsets[1::2]))
+
+
+def dump_results(results):
+    """Serializes search results, with their context, for LazyResults."""
+    return _json([[r.filename, r.matches, r.context, r.duplicates]
+                  for r in results])
+
+
+class LazyResults(collections.abc.Sequence):
+    """Search results that are only parsed when they are first used.
+
+    The number of files and matches are known up front, so the results can be
+    counted and shown without being parsed.
+
+    Attributes:
+        num_files: The number of FileResults.
+        counts: The (number of files, number of matches) pair, as from
+            parser.count_results.
+        skipped: The number of csearch output lines that could not be parsed.
+    """
+
+    def __init__(self, data, num_files, counts):
+        """Initializes the LazyResults.
+
+        Args:
+            data: The results, as written by dump_results.
+            num_files: The number of FileResults.
+            counts: The (number of files, number of matches) pair, as from
+                parser.count_results.
+        """
+        self.num_files = num_files
+        self.counts = counts
+        self.skipped = 0
+        self._data = data
+        self._results = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._results is None:
+                self._results = [
+                    parser.FileResults(
+                        filename, [tuple(match) for match in matches],
+                        context=[tuple(line) for line in lines],
+                        duplicates=duplicates)
+                    for (filename, matches, lines, duplicates)
+                    in json.loads(self._data.decode('ascii'))]
+                self._data = None
+            return self._results
+
+    def __len__(self):
+        return self.num_files
+
+    def __getitem__(self, i):
+        return self._load()[i]
+
+    def __iter__(self):
+        return iter(self._load())
+
+
+def _get_result_cache(directory, max_bytes):
+    global _result_cache
+    if _result_cache is None or _result_cache.directory != directory:
+        _result_cache = cache.ResultCache(directory, max_bytes)
+    _result_cache.max_bytes = max_bytes
+    return _result_cache
+
+
+def _compile(search):
+    try:
+        return re.compile(search.query_re(),
+                          0 if search.case else re.IGNORECASE)
+    except re.error:
+        # csearch takes RE2 syntax Python doesn't, so the editor finds the
+        # matches itself.
+        return None
+
+
+def _send_text(out, regex, texts, offset):
+    text = ''.join(texts)
+    write_frame(out, _TEXT, text.encode('utf-8', 'surrogateescape'))
+    if regex:
+        spans = [(offset + m.start(), offset + m.end())
+                 for m in regex.finditer(text)]
+        if spans:
+            write_frame(out, _HIGHLIGHTS, encode_highlights(spans))
+    return offset + len(text)
+
+
+def run_request(request, out):
+    """Runs a search and writes its formatted results as frames.
+
+    The text is sent a chunk of whole files at a time, followed by the
+    offsets in the text of the matches to highlight in it, so the editor
+    doesn't have to search its view for them.
+
+    Args:
+        request: The request, as a dict. It has the "search" as from
+            daemon.search_to_json, and optionally "index", "csearch",
+            "context", "group", "cache_dir" and "cache_bytes".
+        out: The binary stream to write the frames to.
+    """
+    timings = {}
+    done = {'cached': False}
+    try:
+        search = daemon.search_from_json(request['search'])
+        index_filename = request.get('index')
+        result_cache = None
+        if request.get('cache_dir') and request.get('cache_bytes'):
+            result_cache = _get_result_cache(request['cache_dir'],
+                                             request['cache_bytes'])
+        group = request.get('group', False)
+        results = None
+        if result_cache:
+            results = result_cache.get(search, index.index_path(
+                index_filename), group=group)
+            done['cached'] = results is not None
+        if results is None:
+            results = engine.search(
+                search, path_csearch=request.get('csearch', 'csearch'),
+                index_filename=index_filename, timings=timings, group=group)
+            timings.pop('total', None)
+            if result_cache:
+                result_cache.put(search, index.index_path(index_filename),
+                                 results)
+        with stats.timed(timings, 'context'):
+            context.add_context(results, request.get('context', 0))
+        regex = _compile(search)
+        done['highlighted'] = regex is not None
+        if results:
+            with stats.timed(timings, 'format'):
+                offset = 0
+                texts = []
+                size = 0
+                for text in engine.format_results(results):
+                    texts.append(text)
+                    size += len(text)
+                    # Only whole files are sent, so a match is never split.
+                    if size >= _CHUNK_SIZE and text == '\n\n':
+                        offset = _send_text(out, regex, texts, offset)
+                        texts = []
+                        size = 0
+                offset = _send_text(out, regex, texts, offset)
+            done['text_length'] = offset
+        write_frame(out, _RESULTS, dump_results(results))
+        done['files'] = len(results)
+        done['counts'] = parser.count_results(results)
+        done['skipped'] = getattr(results, 'skipped', 0)
+    except subprocess.CalledProcessError as e:
+        output = e.output or b''
+        if isinstance(output, bytes):
+            output = output.decode('utf-8', 'replace')
+        done['error'] = {'returncode': e.returncode, 'cmd': e.cmd,
+                         'output': output}
+    except Exception as e:
+        done['error'] = {'message': str(e)}
+    done['timings'] = timings
+    write_frame(out, _DONE, _json(done))
+    out.flush()
+
+
+def serve(stdin=None, stdout=None):
+    """Runs searches for the editor until stdin is closed.
+
+    Args:
+        stdin: The binary stream to read requests from. Defaults to stdin.
+        stdout: The binary stream to write replies to. Defaults to stdout.
+    """
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    while True:
+        frame = read_frame(stdin)
+        if frame is None:
+            return
+        (kind, payload) = frame
+        if kind == _REQUEST:
+            run_request(json.loads(payload.decode('ascii')), stdout)
+
+
+class Reply(object):
+    """The reply to a search run in a worker.
+
+    Attributes:
+        texts: The list of chunks of formatted results text.
+        text_length: The number of characters in the texts.
+        highlights: The (begin, end) offsets in the text of the matches to
+            highlight, or None if the worker couldn't find them.
+        results: The LazyResults.
+        cached: If the results came from the result cache.
+        timings: The seconds each phase of the search took in the worker.
+    """
+
+    def __init__(self):
+        self.texts = []
+        self.text_length = 0
+        self.highlights = []
+        self.results = None
+        self.cached = False
+        self.timings = {}
+
+
+class Worker(object):
+    """A worker process that runs searches and formats their results.
+
+    Parsing csearch's output and formatting the results hold the GIL for a
+    long time on big result sets, so doing it in another process keeps the
+    editor's plugins responsive.
+    """
+
+    def __init__(self, python):
+        """Starts the worker process.
+
+        Args:
+            python: The Python 3 command to run the worker with.
+        Raises:
+            WorkerError: If the process can't be started.
+        """
+        self.python = python
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        try:
+            self._proc = subprocess.Popen(
+                [python, '-m', os.path.basename(package_dir), 'worker'],
+                cwd=os.path.dirname(package_dir), stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE)
+        except OSError as e:
+            raise WorkerError('Could not start the worker: {0}'.format(e))
+
+    def kill(self):
+        """Stops the worker, even in the middle of a search."""
+        try:
+            self._proc.kill()
+        except OSError:
+            pass
+        for stream in (self._proc.stdin, self._proc.stdout):
+            try:
+                stream.close()
+            except (OSError, IOError):
+                pass
+        self._proc.wait()
+
+    @property
+    def alive(self):
+        return self._proc.poll() is None
+
+    def search(self, search, path_csearch='csearch', index_filename=None,
+               context_lines=0, result_cache=None, group=False):
+        """Runs a search in the worker.
+
+        Args:
+            search: The parser.Search to run.
+            path_csearch: The location of the csearch command.
+            index_filename: An optional csearchindex file location to use.
+            context_lines: The number of lines to add around each match.
+            result_cache: An optional cache.ResultCache for the worker to use.
+            group: If files with the same matches are grouped together.
+        Returns:
+            A Reply.
+        Raises:
+            WorkerError: If the worker stopped, or failed.
+            subprocess.CalledProcessError: If csearch failed.
+        """
+        request = {'search': daemon.search_to_json(search),
+                   'index': index_filename,
+                   'csearch': path_csearch,
+                   'context': context_lines,
+                   'group': group}
+        if result_cache:
+            request['cache_dir'] = result_cache.directory
+            request['cache_bytes'] = result_cache.max_bytes
+        try:
+            write_frame(self._proc.stdin, _REQUEST, _json(request))
+            self._proc.stdin.flush()
+        except (OSError, IOError, ValueError) as e:
+            raise WorkerError('Lost the worker: {0}'.format(e))
+        reply = Reply()
+        results = None
+        while True:
+            try:
+                frame = read_frame(self._proc.stdout)
+            except (OSError, IOError, ValueError) as e:
+                raise WorkerError('Lost the worker: {0}'.format(e))
+            if frame is None:
+                raise WorkerError('The worker stopped')
+            (kind, payload) = frame
+            if kind == _TEXT:
+                text = payload.decode('utf-8', 'surrogateescape')
+                reply.texts.append(text)
+                reply.text_length += len(text)
+            elif kind == _HIGHLIGHTS:
+                reply.highlights.extend(decode_highlights(payload))
+            elif kind == _RESULTS:
+                results = payload
+            elif kind == _DONE:
+                done = json.loads(payload.decode('ascii'))
+                break
+        error = done.get('error')
+        if error and 'returncode' in error:
+            e = subprocess.CalledProcessError(error['returncode'],
+                                              error['cmd'])
+            e.output = error['output']
+            raise e
+        elif error:
+            raise WorkerError(error['message'])
+        reply.results = LazyResults(results, done['files'],
+                                    tuple(done['counts']))
+        reply.results.skipped = done.get('skipped', 0)
+        if not done.get('highlighted'):
+            reply.highlights = None
+        reply.cached = done['cached']
+        reply.timings = done['timings']
+        return reply
+
+
+_idle = []
+_idle_lock = threading.Lock()
+
+
+def acquire(python):
+    """Gets a worker that isn't running a search.
+
+    Args:
+        python: The Python 3 command to run the worker with.
+    Returns:
+        A Worker. It should be given back with release once the search is
+        done, or killed if the search was cancelled.
+    Raises:
+        WorkerError: If a new worker can't be started.
+    """
+    with _idle_lock:
+        while _idle:
+            worker = _idle.pop()
+            if worker.python == python and worker.alive:
+                return worker
+            worker.kill()
+    return Worker(python)
+
+
+def release(worker):
+    """Keeps a worker that finished its search, for the next search."""
+    with _idle_lock:
+        if worker.alive and len(_idle) < _MAX_IDLE:
+            _idle.append(worker)
+            return
+    worker.kill()
+
+
+def shutdown():
+    """Stops the workers that are kept."""
+    with _idle_lock:
+        workers = list(_idle)
+        del _idle[:]
+    for worker in workers:
+        worker.kill()